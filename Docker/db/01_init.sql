@@ -80,6 +80,32 @@ COMMENT ON COLUMN the_guardian.article_content_bow_preprocessed.id IS 'Unique id
 COMMENT ON COLUMN the_guardian.article_content_bow_preprocessed.processed_content IS 'Processed text content of article';
 
 
+-- Progress of crawling the content of each article
+CREATE TABLE the_guardian.crawl_state
+(
+    article_id        CHAR(32) PRIMARY KEY,
+    url               VARCHAR,
+    priority          TIMESTAMP,
+    state             VARCHAR,
+    attempts          INTEGER,
+    last_error        VARCHAR,
+    updated_timestamp TIMESTAMP,
+    leased_by         VARCHAR,
+    lease_expires     TIMESTAMP
+);
+
+COMMENT ON TABLE the_guardian.crawl_state IS 'Progress of crawling article content so interrupted crawls can resume.';
+COMMENT ON COLUMN the_guardian.crawl_state.article_id IS 'Unique identifier of the article, matching article_content.id';
+COMMENT ON COLUMN the_guardian.crawl_state.url IS 'URL of the raw content';
+COMMENT ON COLUMN the_guardian.crawl_state.priority IS 'When the article was published, if known, so newer articles are crawled first';
+COMMENT ON COLUMN the_guardian.crawl_state.state IS 'One of pending, fetched, parsed, or failed';
+COMMENT ON COLUMN the_guardian.crawl_state.attempts IS 'Number of times crawling the article has been attempted';
+COMMENT ON COLUMN the_guardian.crawl_state.last_error IS 'Error encountered on the most recent failed attempt';
+COMMENT ON COLUMN the_guardian.crawl_state.updated_timestamp IS 'When the state was last updated';
+COMMENT ON COLUMN the_guardian.crawl_state.leased_by IS 'Crawler worker which has currently claimed the article';
+COMMENT ON COLUMN the_guardian.crawl_state.lease_expires IS 'When the claim lapses and other workers may claim the article';
+
+
 ---------------------------------------------------
 -- THE DAILY MAIL ARTICLES
 ---------------------------------------------------
@@ -147,6 +173,50 @@ COMMENT ON COLUMN daily_mail.article_content_bow_preprocessed.id IS 'Unique iden
 COMMENT ON COLUMN daily_mail.article_content_bow_preprocessed.processed_content IS 'Processed text content of article';
 
 
+-- Validators of pages which have been crawled, used to make conditional requests
+CREATE TABLE daily_mail.http_cache
+(
+    url              VARCHAR PRIMARY KEY,
+    etag             VARCHAR,
+    last_modified    VARCHAR,
+    content_length   INTEGER,
+    download_seconds FLOAT
+);
+
+COMMENT ON TABLE daily_mail.http_cache IS 'ETag/Last-Modified validators of crawled pages for conditional GET requests.';
+COMMENT ON COLUMN daily_mail.http_cache.url IS 'URL of the crawled page';
+COMMENT ON COLUMN daily_mail.http_cache.etag IS 'ETag header returned the last time the page was downloaded';
+COMMENT ON COLUMN daily_mail.http_cache.last_modified IS 'Last-Modified header returned the last time the page was downloaded';
+COMMENT ON COLUMN daily_mail.http_cache.content_length IS 'Size of the page in bytes the last time it was downloaded';
+COMMENT ON COLUMN daily_mail.http_cache.download_seconds IS 'Seconds taken to download the page the last time it was downloaded';
+
+
+-- Progress of crawling the content of each article
+CREATE TABLE daily_mail.crawl_state
+(
+    article_id        CHAR(32) PRIMARY KEY,
+    url               VARCHAR,
+    priority          TIMESTAMP,
+    state             VARCHAR,
+    attempts          INTEGER,
+    last_error        VARCHAR,
+    updated_timestamp TIMESTAMP,
+    leased_by         VARCHAR,
+    lease_expires     TIMESTAMP
+);
+
+COMMENT ON TABLE daily_mail.crawl_state IS 'Progress of crawling article content so interrupted crawls can resume.';
+COMMENT ON COLUMN daily_mail.crawl_state.article_id IS 'Unique identifier of the article, matching article_content.id';
+COMMENT ON COLUMN daily_mail.crawl_state.url IS 'Link to the article';
+COMMENT ON COLUMN daily_mail.crawl_state.priority IS 'When the article was published, if known, so newer articles are crawled first';
+COMMENT ON COLUMN daily_mail.crawl_state.state IS 'One of pending, fetched, parsed, or failed';
+COMMENT ON COLUMN daily_mail.crawl_state.attempts IS 'Number of times crawling the article has been attempted';
+COMMENT ON COLUMN daily_mail.crawl_state.last_error IS 'Error encountered on the most recent failed attempt';
+COMMENT ON COLUMN daily_mail.crawl_state.updated_timestamp IS 'When the state was last updated';
+COMMENT ON COLUMN daily_mail.crawl_state.leased_by IS 'Crawler worker which has currently claimed the article';
+COMMENT ON COLUMN daily_mail.crawl_state.lease_expires IS 'When the claim lapses and other workers may claim the article';
+
+
 ---------------------------------------------------
 -- I NEWS ARTICLES
 ---------------------------------------------------
@@ -214,6 +284,50 @@ COMMENT ON COLUMN i_news.article_content_bow_preprocessed.id IS 'Unique identifi
 COMMENT ON COLUMN i_news.article_content_bow_preprocessed.processed_content IS 'Processed text content of article';
 
 
+-- Validators of pages which have been crawled, used to make conditional requests
+CREATE TABLE i_news.http_cache
+(
+    url              VARCHAR PRIMARY KEY,
+    etag             VARCHAR,
+    last_modified    VARCHAR,
+    content_length   INTEGER,
+    download_seconds FLOAT
+);
+
+COMMENT ON TABLE i_news.http_cache IS 'ETag/Last-Modified validators of crawled pages for conditional GET requests.';
+COMMENT ON COLUMN i_news.http_cache.url IS 'URL of the crawled page';
+COMMENT ON COLUMN i_news.http_cache.etag IS 'ETag header returned the last time the page was downloaded';
+COMMENT ON COLUMN i_news.http_cache.last_modified IS 'Last-Modified header returned the last time the page was downloaded';
+COMMENT ON COLUMN i_news.http_cache.content_length IS 'Size of the page in bytes the last time it was downloaded';
+COMMENT ON COLUMN i_news.http_cache.download_seconds IS 'Seconds taken to download the page the last time it was downloaded';
+
+
+-- Progress of crawling the content of each article
+CREATE TABLE i_news.crawl_state
+(
+    article_id        CHAR(32) PRIMARY KEY,
+    url               VARCHAR,
+    priority          TIMESTAMP,
+    state             VARCHAR,
+    attempts          INTEGER,
+    last_error        VARCHAR,
+    updated_timestamp TIMESTAMP,
+    leased_by         VARCHAR,
+    lease_expires     TIMESTAMP
+);
+
+COMMENT ON TABLE i_news.crawl_state IS 'Progress of crawling article content so interrupted crawls can resume.';
+COMMENT ON COLUMN i_news.crawl_state.article_id IS 'Unique identifier of the article, matching article_content.id';
+COMMENT ON COLUMN i_news.crawl_state.url IS 'Link to the article';
+COMMENT ON COLUMN i_news.crawl_state.priority IS 'When the article was published, if known, so newer articles are crawled first';
+COMMENT ON COLUMN i_news.crawl_state.state IS 'One of pending, fetched, parsed, or failed';
+COMMENT ON COLUMN i_news.crawl_state.attempts IS 'Number of times crawling the article has been attempted';
+COMMENT ON COLUMN i_news.crawl_state.last_error IS 'Error encountered on the most recent failed attempt';
+COMMENT ON COLUMN i_news.crawl_state.updated_timestamp IS 'When the state was last updated';
+COMMENT ON COLUMN i_news.crawl_state.leased_by IS 'Crawler worker which has currently claimed the article';
+COMMENT ON COLUMN i_news.crawl_state.lease_expires IS 'When the claim lapses and other workers may claim the article';
+
+
 ---------------------------------------------------
 -- ENCODED REPRESENTATIONS OF ARTICLE CONTENT
 ---------------------------------------------------
@@ -260,6 +374,34 @@ COMMENT ON COLUMN encoded_articles.tfidf_similar_articles.similar_article_id IS
 COMMENT ON COLUMN encoded_articles.tfidf_similar_articles.similarity_score IS 'Cosine similarity between two articles';
 
 
+-- MinHash signature of each article's content, used to detect near-duplicates
+CREATE TABLE encoded_articles.minhash_signatures
+(
+    id          CHAR(32) PRIMARY KEY,
+    publication VARCHAR,
+    signature   BIGINT ARRAY
+);
+
+COMMENT ON TABLE encoded_articles.minhash_signatures IS 'MinHash signatures of article content, indexed to detect near-duplicate articles.';
+COMMENT ON COLUMN encoded_articles.minhash_signatures.id IS 'Unique identifier (hash of article URL)';
+COMMENT ON COLUMN encoded_articles.minhash_signatures.publication IS 'Schema of the publication the article belongs to';
+COMMENT ON COLUMN encoded_articles.minhash_signatures.signature IS 'Minimum hash of the word shingles in the article content for each hash function';
+
+
+-- Articles which are near-duplicates of another article
+CREATE TABLE encoded_articles.near_duplicate_articles
+(
+    id                   CHAR(32) PRIMARY KEY,
+    duplicate_of_id      CHAR(32),
+    estimated_similarity FLOAT
+);
+
+COMMENT ON TABLE encoded_articles.near_duplicate_articles IS 'Articles which are near-duplicates (e.g. syndicated or lightly re-edited) of an article ingested before them. These are skipped when preprocessing, encoding, and calculating similarities.';
+COMMENT ON COLUMN encoded_articles.near_duplicate_articles.id IS 'Unique identifier of the near-duplicate article';
+COMMENT ON COLUMN encoded_articles.near_duplicate_articles.duplicate_of_id IS 'Unique identifier of the original article in the cluster of near-duplicates';
+COMMENT ON COLUMN encoded_articles.near_duplicate_articles.estimated_similarity IS 'Jaccard similarity of word shingles, estimated from MinHash signatures';
+
+
 -- Unioned view of all articles metadata
 CREATE VIEW encoded_articles.VW_article_metadata AS
     SELECT
@@ -270,6 +412,14 @@ CREATE VIEW encoded_articles.VW_article_metadata AS
     FROM
         daily_mail.article_content
     UNION
+    SELECT
+        id,
+        title,
+        url,
+        'i News' AS publication
+    FROM
+        i_news.article_content
+    UNION
     SELECT
         id,
         web_title      AS title,
@@ -296,4 +446,222 @@ CREATE VIEW encoded_articles.VW_tfidf_similar_articles AS
             LEFT JOIN encoded_articles.VW_article_metadata b
                       ON a.id = b.id
             LEFT JOIN encoded_articles.VW_article_metadata c
-                      ON a.similar_article_id = c.id;
\ No newline at end of file
+                      ON a.similar_article_id = c.id;
+
+
+---------------------------------------------------
+-- PREPROCESSING
+---------------------------------------------------
+
+CREATE SCHEMA preprocessing;
+GRANT ALL PRIVILEGES ON SCHEMA preprocessing TO $POSTGRES_USER;
+
+-- Preprocessed text cached by its raw content, so identical text is only passed through spaCy once
+CREATE TABLE preprocessing.bow_cache
+(
+    cache_key            CHAR(32) PRIMARY KEY,
+    pipeline_fingerprint CHAR(32),
+    processed_content    VARCHAR,
+    last_used            TIMESTAMP
+);
+
+CREATE INDEX bow_cache_last_used_idx ON preprocessing.bow_cache (last_used);
+
+COMMENT ON TABLE preprocessing.bow_cache IS 'Bag of words preprocessed version of article content, reused whenever the same text is preprocessed again with the same pipeline.';
+COMMENT ON COLUMN preprocessing.bow_cache.cache_key IS 'Hash of the pipeline fingerprint and the raw content';
+COMMENT ON COLUMN preprocessing.bow_cache.pipeline_fingerprint IS 'Hash of the preprocessing configuration (spaCy model and version, stop words, token rules) which produced the entry';
+COMMENT ON COLUMN preprocessing.bow_cache.processed_content IS 'Preprocessed version of the content';
+COMMENT ON COLUMN preprocessing.bow_cache.last_used IS 'When the entry was last written or read, used to evict the least recently used entries';
+
+
+-- Preprocessed output of each whitespace-delimited chunk of text, learned from spaCy and used to skip it for known chunks
+CREATE TABLE preprocessing.token_lookup
+(
+    token                VARCHAR PRIMARY KEY,
+    pipeline_fingerprint CHAR(32),
+    processed_content    VARCHAR
+);
+
+COMMENT ON TABLE preprocessing.token_lookup IS 'Bag of words preprocessed output of every chunk of text (split on whitespace) seen so far, so chunks only pass through spaCy the first time they are seen.';
+COMMENT ON COLUMN preprocessing.token_lookup.token IS 'Chunk of text between whitespace e.g. a word with any attached punctuation';
+COMMENT ON COLUMN preprocessing.token_lookup.pipeline_fingerprint IS 'Hash of the preprocessing configuration (spaCy model and version, stop words, token rules) which produced the entry';
+COMMENT ON COLUMN preprocessing.token_lookup.processed_content IS 'Lowercased lemmas of the tokens in the chunk which are kept, separated by spaces (empty if every token is removed)';
+
+
+-- spaCy parse of each article, used to re-filter articles without parsing them again
+CREATE TABLE preprocessing.spacy_docs
+(
+    id          CHAR(32) PRIMARY KEY,
+    publication VARCHAR,
+    doc_bin     BYTEA
+);
+
+COMMENT ON TABLE preprocessing.spacy_docs IS 'Serialised spaCy doc of each preprocessed article, so the bag of words preprocessed content can be regenerated with different filtering rules without parsing the article again.';
+COMMENT ON COLUMN preprocessing.spacy_docs.id IS 'Unique identifier (hash of article URL)';
+COMMENT ON COLUMN preprocessing.spacy_docs.publication IS 'Schema of the publication the article belongs to';
+COMMENT ON COLUMN preprocessing.spacy_docs.doc_bin IS 'spaCy DocBin holding the tokens of the article and their lemmas';
+
+
+-- Fastest spaCy settings found for each host by benchmarking a sample of articles
+CREATE TABLE preprocessing.spacy_settings
+(
+    host                           VARCHAR PRIMARY KEY,
+    batch_size                     INTEGER,
+    number_of_processors           INTEGER,
+    docs_per_second                FLOAT,
+    startup_seconds                FLOAT,
+    single_process_batch_size      INTEGER,
+    single_process_docs_per_second FLOAT,
+    tuned_timestamp                TIMESTAMP
+);
+
+COMMENT ON TABLE preprocessing.spacy_settings IS 'Batch size and number of processes giving the highest spaCy throughput on each host, used by the bag of words preprocessor when they are not set explicitly.';
+COMMENT ON COLUMN preprocessing.spacy_settings.host IS 'Hostname of the machine the benchmark ran on';
+COMMENT ON COLUMN preprocessing.spacy_settings.batch_size IS 'Number of texts processed at one time in the fastest configuration';
+COMMENT ON COLUMN preprocessing.spacy_settings.number_of_processors IS 'Number of processes in the fastest configuration';
+COMMENT ON COLUMN preprocessing.spacy_settings.docs_per_second IS 'Documents processed per second by the fastest configuration, once its processes have started';
+COMMENT ON COLUMN preprocessing.spacy_settings.startup_seconds IS 'Seconds taken to start the processes of the fastest configuration (0 for a single process)';
+COMMENT ON COLUMN preprocessing.spacy_settings.single_process_batch_size IS 'Number of texts processed at one time in the fastest single process configuration';
+COMMENT ON COLUMN preprocessing.spacy_settings.single_process_docs_per_second IS 'Documents processed per second by the fastest single process configuration';
+COMMENT ON COLUMN preprocessing.spacy_settings.tuned_timestamp IS 'When the benchmark ran';
+
+
+-- Every lemma seen in preprocessed content and its integer id
+CREATE TABLE preprocessing.lemma_dictionary
+(
+    lemma    VARCHAR PRIMARY KEY,
+    lemma_id SERIAL UNIQUE
+);
+
+COMMENT ON TABLE preprocessing.lemma_dictionary IS 'Integer id of every lemma (lowercase word of two or more characters) in the bag of words preprocessed content of articles. Ids are never reassigned.';
+COMMENT ON COLUMN preprocessing.lemma_dictionary.lemma IS 'Lemma as it appears in the preprocessed content';
+COMMENT ON COLUMN preprocessing.lemma_dictionary.lemma_id IS 'Integer id of the lemma';
+
+
+-- Bag of words preprocessed content of each article as lemma ids
+CREATE TABLE preprocessing.bow_token_ids
+(
+    id          CHAR(32) PRIMARY KEY,
+    publication VARCHAR,
+    token_ids   INTEGER[]
+);
+
+COMMENT ON TABLE preprocessing.bow_token_ids IS 'Bag of words preprocessed content of each article as an array of lemma ids, so it can be counted without tokenising the text again.';
+COMMENT ON COLUMN preprocessing.bow_token_ids.id IS 'Unique identifier (hash of article URL)';
+COMMENT ON COLUMN preprocessing.bow_token_ids.publication IS 'Schema of the publication the article belongs to';
+COMMENT ON COLUMN preprocessing.bow_token_ids.token_ids IS 'Id of every lemma in the preprocessed content in the order they appear (see preprocessing.lemma_dictionary)';
+
+
+---------------------------------------------------
+-- PIPELINE PROCESSING STATE
+---------------------------------------------------
+
+CREATE SCHEMA pipeline;
+GRANT ALL PRIVILEGES ON SCHEMA pipeline TO $POSTGRES_USER;
+
+-- Which stages of the pipeline each article has been through
+CREATE TABLE pipeline.processing_state
+(
+    stage               VARCHAR,
+    article_id          CHAR(32),
+    publication         VARCHAR,
+    version             VARCHAR,
+    processed_timestamp TIMESTAMP,
+    transaction_id      XID8 DEFAULT pg_current_xact_id(),
+    PRIMARY KEY (stage, article_id)
+);
+
+-- Each stage reads its backlog as a range of the stage before it
+CREATE INDEX processing_state_backlog_idx ON pipeline.processing_state (stage, publication, transaction_id);
+
+COMMENT ON TABLE pipeline.processing_state IS 'Every article which has completed each stage of the pipeline (ingested, deduplicated, preprocessed, encoded). Downstream stages find their backlog from the rows of the stage before them.';
+COMMENT ON COLUMN pipeline.processing_state.stage IS 'Name of the stage e.g. preprocessed';
+COMMENT ON COLUMN pipeline.processing_state.article_id IS 'Unique identifier (hash of article URL)';
+COMMENT ON COLUMN pipeline.processing_state.publication IS 'Schema of the publication the article belongs to';
+COMMENT ON COLUMN pipeline.processing_state.version IS 'Version of the stage which processed the article e.g. the fingerprint of the preprocessing pipeline';
+COMMENT ON COLUMN pipeline.processing_state.processed_timestamp IS 'When the article last completed the stage';
+COMMENT ON COLUMN pipeline.processing_state.transaction_id IS 'Transaction which last marked the article as completing the stage, compared against the watermarks of downstream stages';
+
+
+-- How far each stage has read the backlog left by the stage before it
+CREATE TABLE pipeline.watermarks
+(
+    stage             VARCHAR,
+    publication       VARCHAR,
+    transaction_id    XID8,
+    updated_timestamp TIMESTAMP,
+    PRIMARY KEY (stage, publication)
+);
+
+COMMENT ON TABLE pipeline.watermarks IS 'Progress of each stage through the articles completed by the stage before it, per publication.';
+COMMENT ON COLUMN pipeline.watermarks.stage IS 'Name of the stage e.g. preprocessed';
+COMMENT ON COLUMN pipeline.watermarks.publication IS 'Schema of the publication';
+COMMENT ON COLUMN pipeline.watermarks.transaction_id IS 'Every article marked by the stage before in a transaction older than this has been processed. Taken from the oldest transaction still running when the backlog was read, so articles from transactions which commit late are never skipped.';
+COMMENT ON COLUMN pipeline.watermarks.updated_timestamp IS 'When the watermark was last advanced';
+
+
+-- Mark every article inserted by a statement as ingested, in bulk
+CREATE FUNCTION pipeline.record_ingested_articles() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO pipeline.processing_state (stage, article_id, publication, processed_timestamp)
+    SELECT 'ingested', id, TG_TABLE_SCHEMA, NOW() FROM new_articles
+    ON CONFLICT (stage, article_id) DO NOTHING;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION pipeline.record_ingested_articles() IS 'Record the articles inserted into an article_content table as having completed the ingested stage.';
+
+CREATE TRIGGER record_ingested_articles AFTER INSERT ON the_guardian.article_content
+    REFERENCING NEW TABLE AS new_articles
+    FOR EACH STATEMENT EXECUTE PROCEDURE pipeline.record_ingested_articles();
+
+CREATE TRIGGER record_ingested_articles AFTER INSERT ON daily_mail.article_content
+    REFERENCING NEW TABLE AS new_articles
+    FOR EACH STATEMENT EXECUTE PROCEDURE pipeline.record_ingested_articles();
+
+CREATE TRIGGER record_ingested_articles AFTER INSERT ON i_news.article_content
+    REFERENCING NEW TABLE AS new_articles
+    FOR EACH STATEMENT EXECUTE PROCEDURE pipeline.record_ingested_articles();
+
+
+---------------------------------------------------
+-- PIPELINE NOTIFICATIONS
+---------------------------------------------------
+
+-- Notify listening workers of each new article, with a JSON payload of its schema and id e.g.
+-- {"schema": "daily_mail", "id": "3587c1cb3b85d116d9573897437fc4db"}. Notifications are delivered when the inserting
+-- transaction commits.
+CREATE FUNCTION notify_new_article() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify(TG_ARGV[0], json_build_object('schema', TG_TABLE_SCHEMA, 'id', NEW.id)::TEXT);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION notify_new_article() IS 'Send the schema and id of a newly inserted article on the channel given as the trigger argument.';
+
+-- New article content is ready to be preprocessed
+CREATE TRIGGER notify_article_content_inserted AFTER INSERT ON the_guardian.article_content
+    FOR EACH ROW EXECUTE PROCEDURE notify_new_article('article_content_inserted');
+
+CREATE TRIGGER notify_article_content_inserted AFTER INSERT ON daily_mail.article_content
+    FOR EACH ROW EXECUTE PROCEDURE notify_new_article('article_content_inserted');
+
+CREATE TRIGGER notify_article_content_inserted AFTER INSERT ON i_news.article_content
+    FOR EACH ROW EXECUTE PROCEDURE notify_new_article('article_content_inserted');
+
+-- Articles marked as preprocessed (or preprocessed again) are ready to be encoded. This follows the processing state
+-- rather than the article_content_bow_preprocessed tables, so the articles are in the encoder's backlog once notified
+CREATE FUNCTION pipeline.notify_stage_completed() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify(TG_ARGV[0], json_build_object('schema', NEW.publication, 'id', NEW.article_id)::TEXT);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION pipeline.notify_stage_completed() IS 'Send the publication and id of an article which has completed a stage on the channel given as the trigger argument.';
+
+CREATE TRIGGER notify_article_content_preprocessed AFTER INSERT OR UPDATE ON pipeline.processing_state
+    FOR EACH ROW WHEN (NEW.stage = 'preprocessed')
+    EXECUTE PROCEDURE pipeline.notify_stage_completed('article_content_preprocessed');
@@ -11,7 +11,7 @@ GRANT ALL PRIVILEGES ON SCHEMA testing_schema TO $POSTGRES_USER;
 -- Metadata
 CREATE TABLE testing_schema.testing_table
 (
-    example_integer   INT,
+    example_integer   INT PRIMARY KEY,
     example_string    VARCHAR,
     example_timestamp TIMESTAMP
 );
@@ -62,6 +62,18 @@ COPY i_news.article_content_bow_preprocessed
     FROM '/staging_data/i_news.article_content_bow_preprocessed.csv' WITH CSV HEADER;
 
 
+---------------------------------------------------
+-- PIPELINE PROCESSING STATE
+---------------------------------------------------
+
+-- Articles copied into article_content are marked as ingested by a trigger, whereas the preprocessed content copied
+-- in above has to be marked by hand
+INSERT INTO pipeline.processing_state (stage, article_id, publication, processed_timestamp)
+    SELECT 'preprocessed', id, 'daily_mail', NOW() FROM daily_mail.article_content_bow_preprocessed
+    UNION ALL
+    SELECT 'preprocessed', id, 'i_news', NOW() FROM i_news.article_content_bow_preprocessed;
+
+
 ---------------------------------------------------
 -- ENCODED REPRESENTATIONS OF ARTICLE CONTENT
 ---------------------------------------------------
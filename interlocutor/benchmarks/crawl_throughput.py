@@ -0,0 +1,379 @@
+"""Measure how quickly each downloader crawls article content, using the local replay server instead of the network."""
+
+# Standard libraries
+import argparse
+import functools
+import hashlib
+import threading
+import time
+from typing import Callable, Dict, List
+
+# Third party libraries
+import numpy as np
+import pandas as pd
+from psycopg2 import sql as psy_sql
+import requests
+
+# Internal imports
+from interlocutor.benchmarks import replay_server
+from interlocutor.commons import rate_control
+from interlocutor.database import postgresql
+from interlocutor.get_data import crawl_state, daily_mail, i_news, the_guardian
+
+# Key: publication schema, Value: downloader module and table listing the URLs of articles to crawl
+_PUBLICATIONS = {
+    'daily_mail': (daily_mail, 'columnist_article_links'),
+    'i_news': (i_news, 'columnist_article_links'),
+    'the_guardian': (the_guardian, 'article_metadata'),
+}
+
+# Database methods which write to postgres (all of the crawl state updates and content uploads)
+_DB_WRITE_METHODS = [
+    'execute_database_operation',
+    'execute_database_operation_returning_rows',
+    'upload_new_data_only_to_existing_table',
+]
+
+# Name of the worker which parks crawl state rows that should not be crawled during the benchmark
+_PARKED_BY = 'crawl-throughput-benchmark'
+
+
+class CrawlThroughputBenchmark:
+    """
+    Crawl the content of articles served by the local replay server with each `ArticleDownloader` and report articles
+    per second, fetch latency percentiles and the time spent writing to the database.
+
+    Articles are seeded into the staging database for the benchmark and removed afterwards. Any other articles waiting
+    to be crawled are parked (claimed by the benchmark) while it runs, so nothing is requested from the real websites.
+    """
+
+    def __init__(
+            self,
+            number_of_articles: int = 200,
+            workers: int = 1,
+            latency_seconds: float = 0.05,
+            error_rate: float = 0,
+            server_requests_per_second: float = None,
+            max_requests_per_second: float = 1000
+    ):
+        """
+        Initialise attributes of class.
+
+        Parameters
+        ----------
+        number_of_articles : int (default 200)
+            Number of articles seeded for each publication.
+        workers : int (default 1)
+            Number of downloaders crawling at once, each in its own thread and claiming articles from the shared queue.
+        latency_seconds : float (default 0.05)
+            Time taken by the replay server to respond to each request.
+        error_rate : float (default 0)
+            Proportion of requests the replay server answers with `503 Service Unavailable`.
+        server_requests_per_second : float (default None)
+            Rate above which the replay server answers with `429 Too Many Requests`. Unlimited if not provided.
+        max_requests_per_second : float (default 1000)
+            Fastest rate the downloaders' rate controller may reach, so politeness towards real websites does not
+            dominate the measurements.
+        """
+
+        self._number_of_articles = number_of_articles
+        self._workers = workers
+        self._server_settings = {
+            'latency_seconds': latency_seconds,
+            'error_rate': error_rate,
+            'requests_per_second': server_requests_per_second
+        }
+        self._max_requests_per_second = max_requests_per_second
+        self._db_connection = postgresql.DatabaseConnection()
+
+        # Timings captured while crawling, which may be appended to from several threads
+        self._lock = threading.Lock()
+        self._fetch_seconds: List[float] = []
+        self._db_write_seconds: List[float] = []
+
+    def _seed_articles(self, schema: str, base_url: str) -> List[str]:
+        """
+        Add articles served by the replay server to the table listing the articles to crawl.
+
+        Parameters
+        ----------
+        schema : str
+            Publication schema e.g. 'daily_mail'.
+        base_url : str
+            Base URL of the replay server.
+
+        Returns
+        -------
+        list
+            IDs of the articles seeded.
+        """
+
+        urls = [f'{base_url}/{schema}/article/benchmark-{number}' for number in range(self._number_of_articles)]
+        article_ids = [hashlib.md5(url.encode('utf-8')).hexdigest() for url in urls]
+
+        if schema == 'the_guardian':
+            seeded_articles = pd.DataFrame(data={
+                'id': article_ids,
+                'guardian_id': [f'benchmark-{number}' for number in range(self._number_of_articles)],
+                'content_type': 'article',
+                'section_id': 'commentisfree',
+                'section_name': 'Opinion',
+                'web_publication_timestamp': pd.Timestamp('2020-10-04T10:35:19'),
+                'web_title': 'Benchmark article',
+                'web_url': urls,
+                'api_url': urls,
+                'pillar_id': 'pillar/opinion',
+                'pillar_name': 'Opinion'
+            })
+            table_name, id_column = 'article_metadata', 'id'
+        else:
+            seeded_articles = pd.DataFrame(data={'columnist': 'Benchmark', 'article_id': article_ids, 'url': urls})
+            table_name, id_column = 'columnist_article_links', 'article_id'
+
+        self._db_connection.upload_new_data_only_to_existing_table(
+            dataframe=seeded_articles,
+            table_name=table_name,
+            schema=schema,
+            id_column=id_column
+        )
+
+        return article_ids
+
+    def _park_other_articles(self, schema: str, source_table: str, id_column: str, url_column: str) -> None:
+        """
+        Register every article waiting to be crawled and claim the ones not served by the replay server for a day, so
+        the downloaders only crawl the seeded articles.
+
+        Parameters
+        ----------
+        schema : str
+            Publication schema e.g. 'daily_mail'.
+        source_table : str
+            Table listing the articles to crawl.
+        id_column : str
+            Column of `source_table` holding the ID of each article.
+        url_column : str
+            Column of `source_table` holding the URL to crawl.
+        """
+
+        db_connection = self._db_connection
+        crawl_state_table = psy_sql.Identifier(schema, 'crawl_state')
+
+        tracker = crawl_state.CrawlStateTracker(schema=schema, db_connection=db_connection)
+        tracker.register_urls(source_table=source_table, id_column=id_column, url_column=url_column)
+
+        db_connection.execute_database_operation(
+            sql_command=psy_sql.SQL("""
+                UPDATE {crawl_state}
+                SET leased_by = %(parked_by)s, lease_expires = NOW() + INTERVAL '1 day'
+                WHERE url NOT LIKE '%%/article/benchmark-%%'
+                  AND (lease_expires IS NULL OR lease_expires < NOW());
+                """).format(crawl_state=crawl_state_table),
+            params={'parked_by': _PARKED_BY}
+        )
+
+    def _tidy_up(self, schema: str, article_ids: List[str]) -> None:
+        """
+        Remove the seeded articles and release any parked ones.
+
+        Parameters
+        ----------
+        schema : str
+            Publication schema e.g. 'daily_mail'.
+        article_ids : list
+            IDs of the articles seeded.
+        """
+
+        source_table, id_column = (
+            ('article_metadata', 'id') if schema == 'the_guardian' else ('columnist_article_links', 'article_id')
+        )
+
+        for table_name, table_id_column in [
+            ('article_content', 'id'), ('crawl_state', 'article_id'), (source_table, id_column)
+        ]:
+            self._db_connection.execute_database_operation(
+                sql_command=psy_sql.SQL('DELETE FROM {table} WHERE {id_column} IN %(article_ids)s;').format(
+                    table=psy_sql.Identifier(schema, table_name),
+                    id_column=psy_sql.Identifier(table_id_column)
+                ),
+                params={'article_ids': tuple(article_ids)}
+            )
+
+        self._db_connection.execute_database_operation(
+            sql_command=psy_sql.SQL("""
+                UPDATE {crawl_state}
+                SET leased_by = NULL, lease_expires = NULL
+                WHERE leased_by = %(parked_by)s;
+                """).format(crawl_state=psy_sql.Identifier(schema, 'crawl_state')),
+            params={'parked_by': _PARKED_BY}
+        )
+
+    def _timed(self, func: Callable, timings: List[float]) -> Callable:
+        """Wrap a function so the time taken by every call is appended to `timings`."""
+
+        @functools.wraps(func)
+        def timed_func(*args, **kwargs):
+            start_time = time.perf_counter()
+
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    timings.append(time.perf_counter() - start_time)
+
+        return timed_func
+
+    def _crawl(self, schema: str, rate_controller: rate_control.RateController) -> None:
+        """
+        Crawl the seeded articles with several downloaders at once, timing every database write they make.
+
+        Parameters
+        ----------
+        schema : str
+            Publication schema e.g. 'daily_mail'.
+        rate_controller : interlocutor.commons.rate_control.RateController
+            Rate controller shared by the downloaders.
+        """
+
+        downloader_module = _PUBLICATIONS[schema][0]
+        downloaders = [
+            downloader_module.ArticleDownloader(rate_controller=rate_controller) for _ in range(self._workers)
+        ]
+
+        for downloader in downloaders:
+            for method_name in _DB_WRITE_METHODS:
+                setattr(
+                    downloader._db_connection,
+                    method_name,
+                    self._timed(getattr(downloader._db_connection, method_name), self._db_write_seconds)
+                )
+
+        if schema == 'the_guardian':
+            crawl_methods = [
+                functools.partial(downloader.record_opinion_articles_content, number_of_articles=None)
+                for downloader in downloaders
+            ]
+        else:
+            crawl_methods = [downloader.record_columnists_recent_article_content for downloader in downloaders]
+
+        threads = [threading.Thread(target=crawl_method) for crawl_method in crawl_methods]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+    def run(self, schema: str) -> Dict[str, float]:
+        """
+        Benchmark crawling the content of articles from a single publication.
+
+        Parameters
+        ----------
+        schema : str
+            Publication schema, one of 'daily_mail', 'i_news' or 'the_guardian'.
+
+        Returns
+        -------
+        dict
+            Articles crawled per second, fetch latency percentiles (milliseconds), database write time (seconds), and
+            the counters of the rate controller and replay server.
+        """
+
+        source_table = _PUBLICATIONS[schema][1]
+        id_column, url_column = ('id', 'api_url') if schema == 'the_guardian' else ('article_id', 'url')
+
+        self._fetch_seconds, self._db_write_seconds = [], []
+
+        rate_controller = rate_control.RateController(
+            initial_requests_per_second=self._max_requests_per_second,
+            max_requests_per_second=self._max_requests_per_second,
+            backoff_seconds=0.1
+        )
+
+        with replay_server.ReplayServer(**self._server_settings) as server:
+
+            article_ids = self._seed_articles(schema=schema, base_url=server.url)
+
+            try:
+                self._park_other_articles(
+                    schema=schema,
+                    source_table=source_table,
+                    id_column=id_column,
+                    url_column=url_column
+                )
+
+                # Time every request the downloaders send (the rate controller looks up `requests.get` on each call)
+                original_get = requests.get
+                requests.get = self._timed(original_get, self._fetch_seconds)
+
+                start_time = time.perf_counter()
+
+                try:
+                    self._crawl(schema=schema, rate_controller=rate_controller)
+                finally:
+                    requests.get = original_get
+
+                elapsed_seconds = time.perf_counter() - start_time
+
+                articles_crawled = self._db_connection.get_dataframe(
+                    query=psy_sql.SQL('SELECT COUNT(*) AS articles FROM {content} WHERE id IN %(article_ids)s;').format(
+                        content=psy_sql.Identifier(schema, 'article_content')
+                    ),
+                    query_params={'article_ids': tuple(article_ids)}
+                )['articles'].iloc[0]
+
+            finally:
+                self._tidy_up(schema=schema, article_ids=article_ids)
+
+        fetch_milliseconds = np.array(self._fetch_seconds or [np.nan]) * 1000
+
+        return {
+            'articles_crawled': int(articles_crawled),
+            'articles_per_second': articles_crawled / elapsed_seconds,
+            'fetch_latency_p50_ms': float(np.percentile(fetch_milliseconds, 50)),
+            'fetch_latency_p99_ms': float(np.percentile(fetch_milliseconds, 99)),
+            'db_write_seconds': sum(self._db_write_seconds),
+            'elapsed_seconds': elapsed_seconds,
+            'throttled': rate_controller.throttled,
+            'retried': rate_controller.retried,
+            'given_up': rate_controller.given_up,
+            'server_responses': dict(server.responses_sent)
+        }
+
+
+def _parse_arguments() -> argparse.Namespace:
+    """Read the benchmark settings from the command line."""
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--publications', nargs='+', default=list(_PUBLICATIONS), choices=list(_PUBLICATIONS))
+    parser.add_argument('--articles', type=int, default=200, help='Number of articles per publication')
+    parser.add_argument('--workers', type=int, default=1, help='Number of downloaders crawling at once')
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds taken to respond to each request')
+    parser.add_argument('--error-rate', type=float, default=0, help='Proportion of requests which fail with 503')
+    parser.add_argument('--server-rate-limit', type=float, default=None, help='Requests per second before 429s')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':  # pragma: no cover (exclude from testing coverage report)
+
+    arguments = _parse_arguments()
+
+    crawl_benchmark = CrawlThroughputBenchmark(
+        number_of_articles=arguments.articles,
+        workers=arguments.workers,
+        latency_seconds=arguments.latency,
+        error_rate=arguments.error_rate,
+        server_requests_per_second=arguments.server_rate_limit
+    )
+
+    for publication in arguments.publications:
+        print(f'Benchmarking crawl of {publication} with {arguments.workers} worker(s)')
+        results = crawl_benchmark.run(schema=publication)
+
+        print(f"{publication}: {results['articles_crawled']} articles in {results['elapsed_seconds']:.1f} seconds "
+              f"({results['articles_per_second']:.1f} articles/second), fetch latency "
+              f"p50 {results['fetch_latency_p50_ms']:.1f} ms / p99 {results['fetch_latency_p99_ms']:.1f} ms, "
+              f"{results['db_write_seconds']:.1f} seconds writing to the database, {results['throttled']} throttled, "
+              f"{results['retried']} retried, {results['given_up']} given up.")
@@ -0,0 +1,102 @@
+"""Measure how long each command line entry point takes to import, so commands and spawned workers start quickly."""
+
+# Standard libraries
+import argparse
+import re
+import subprocess
+import sys
+from typing import Dict, List
+
+# Modules run from the command line, or imported by every process a pipeline stage spawns
+ENTRY_POINTS = [
+    'interlocutor.get_data.daily_mail',
+    'interlocutor.get_data.i_news',
+    'interlocutor.get_data.the_guardian',
+    'interlocutor.nlp.deduplication',
+    'interlocutor.nlp.encoding',
+    'interlocutor.nlp.pipeline_tuning',
+    'interlocutor.nlp.preprocessing',
+    'interlocutor.nlp.workers',
+    'interlocutor.pipeline.orchestrator'
+]
+
+# Libraries taking seconds to import, which should only be imported once they are actually used
+DEFERRED_LIBRARIES = ['scipy', 'sklearn', 'spacy', 'sqlalchemy']
+
+# Line written by `python -X importtime` for each module imported: self time and cumulative time in microseconds
+_IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$')
+
+
+def measure_import(module: str) -> Dict:
+    """
+    Import a module in a fresh interpreter, so nothing is already cached in `sys.modules`, and record the time taken
+    by `python -X importtime`.
+
+    Parameters
+    ----------
+    module : str
+        Dotted name of the module e.g. 'interlocutor.nlp.encoding'.
+
+    Returns
+    -------
+    dict
+        'module': name of the module imported
+        'seconds': cumulative time taken to import the module and everything it imports
+        'deferred_libraries_imported': libraries in `DEFERRED_LIBRARIES` which were imported along with the module
+    """
+
+    completed_process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True
+    )
+
+    cumulative_microseconds = {}
+
+    for line in completed_process.stderr.splitlines():
+        match = _IMPORT_TIME_LINE.match(line)
+        if match:
+            cumulative_microseconds[match.group(4)] = int(match.group(2))
+
+    return {
+        'module': module,
+        'seconds': cumulative_microseconds[module] / 1e6,
+        'deferred_libraries_imported': [library for library in DEFERRED_LIBRARIES if library in cumulative_microseconds]
+    }
+
+
+def run(modules: List[str] = None) -> List[Dict]:
+    """
+    Measure the import time of each entry point.
+
+    Parameters
+    ----------
+    modules : list[str] (default None)
+        Dotted names of the modules to import. Defaults to every module in `ENTRY_POINTS`.
+
+    Returns
+    -------
+    list[dict]
+        Output of `measure_import` for each module, in the same order.
+    """
+
+    return [measure_import(module=module) for module in (modules or ENTRY_POINTS)]
+
+
+def _parse_arguments() -> argparse.Namespace:
+    """Read the benchmark settings from the command line."""
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--modules', nargs='+', default=None, help='Modules to import, defaults to every entry point')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':  # pragma: no cover (exclude from testing coverage report)
+
+    arguments = _parse_arguments()
+
+    for result in run(modules=arguments.modules):
+        deferred_libraries = ', '.join(result['deferred_libraries_imported']) or 'none'
+        print(f"{result['module']}: {result['seconds']:.2f} seconds, deferred libraries imported: {deferred_libraries}")
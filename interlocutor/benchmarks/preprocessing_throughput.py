@@ -0,0 +1,126 @@
+"""Measure how quickly articles are preprocessed by the full spaCy pipeline compared to the lookup lemmatiser."""
+
+# Standard libraries
+import argparse
+import itertools
+import time
+from typing import Callable, Dict, List, Tuple
+
+# Third party libraries
+from psycopg2 import sql as psy_sql
+
+# Internal imports
+from interlocutor.nlp import lookup_lemmatiser, preprocessing
+from interlocutor.pipeline import publications
+
+
+class PreprocessingThroughputBenchmark:
+    """
+    Preprocess the same articles with the full spaCy pipeline and with the lookup lemmatiser, reporting articles per
+    second for spaCy, for the lookup lemmatiser starting from an empty table (cold) and once it has seen the articles
+    (warm), and checking the outputs are identical.
+
+    The lookup lemmatiser's table is only held in memory, so nothing is written to the database.
+    """
+
+    def __init__(self, number_of_articles: int = 200, batch_size: int = 20):
+        """
+        Initialise attributes of class.
+
+        Parameters
+        ----------
+        number_of_articles : int (default 200)
+            Number of articles to preprocess. Articles are reused if the database holds fewer than this.
+        batch_size : int (default 20)
+            The number of texts spaCy processes at one time.
+        """
+
+        self._number_of_articles = number_of_articles
+        self._preprocessor = preprocessing.BagOfWordsPreprocessor(batch_size=batch_size, use_cache=False)
+
+    def _load_texts(self) -> List[str]:
+        """Retrieve the content of `number_of_articles` articles from across the publications."""
+
+        article_query = psy_sql.SQL(' UNION ALL ').join(
+            psy_sql.SQL("SELECT content FROM {table}").format(table=psy_sql.Identifier(schema, 'article_content'))
+            for schema in publications.get_schemas()
+        ) + psy_sql.SQL(" LIMIT %(number_of_articles)s;")
+
+        articles = self._preprocessor._db_connection.get_dataframe(
+            query=article_query,
+            query_params={'number_of_articles': self._number_of_articles}
+        )
+
+        texts = articles['content'].dropna().tolist()
+
+        if not texts:
+            raise ValueError('No article content found to preprocess.')
+
+        return list(itertools.islice(itertools.cycle(texts), self._number_of_articles))
+
+    @staticmethod
+    def _time(preprocess_texts: Callable[[List[str]], List[str]], texts: List[str]) -> Tuple[List[str], float]:
+        """Preprocess the texts, returning the output and the seconds taken."""
+
+        start_time = time.perf_counter()
+        processed_texts = preprocess_texts(texts)
+
+        return processed_texts, time.perf_counter() - start_time
+
+    def run(self) -> Dict:
+        """
+        Preprocess the articles with each engine and measure the throughput.
+
+        Returns
+        -------
+        dict
+            Articles per second for spaCy and the lookup lemmatiser (cold and warm), the number of articles whose output
+            differs from spaCy's, and the number of distinct chunks of text learned by the lookup lemmatiser.
+        """
+
+        texts = self._load_texts()
+
+        lemmatiser = lookup_lemmatiser.LookupLemmatiser(preprocess_texts=self._preprocessor._preprocess_texts)
+
+        spacy_output, spacy_seconds = self._time(self._preprocessor._preprocess_texts, texts)
+        cold_output, cold_seconds = self._time(lemmatiser.preprocess_texts, texts)
+        warm_output, warm_seconds = self._time(lemmatiser.preprocess_texts, texts)
+
+        mismatched_articles = sum(
+            cold != expected or warm != expected
+            for expected, cold, warm in zip(spacy_output, cold_output, warm_output)
+        )
+
+        return {
+            'articles': len(texts),
+            'spacy_articles_per_second': len(texts) / spacy_seconds,
+            'lookup_cold_articles_per_second': len(texts) / cold_seconds,
+            'lookup_warm_articles_per_second': len(texts) / warm_seconds,
+            'mismatched_articles': mismatched_articles,
+            'chunks_known': lemmatiser.number_of_chunks_known
+        }
+
+
+def _parse_arguments() -> argparse.Namespace:
+    """Read the benchmark settings from the command line."""
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--articles', type=int, default=200, help='Number of articles to preprocess')
+    parser.add_argument('--batch-size', type=int, default=20, help='Number of texts spaCy processes at one time')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':  # pragma: no cover (exclude from testing coverage report)
+
+    arguments = _parse_arguments()
+
+    results = PreprocessingThroughputBenchmark(
+        number_of_articles=arguments.articles,
+        batch_size=arguments.batch_size
+    ).run()
+
+    print(f"{results['articles']} articles: spaCy {results['spacy_articles_per_second']:.1f} articles/second, "
+          f"lookup lemmatiser {results['lookup_cold_articles_per_second']:.1f} articles/second cold and "
+          f"{results['lookup_warm_articles_per_second']:.1f} articles/second warm "
+          f"({results['chunks_known']} chunks known), {results['mismatched_articles']} articles differ from spaCy.")
@@ -0,0 +1,188 @@
+"""Serve recorded pages from each publication locally, so that crawling can be exercised without a network."""
+
+# Standard libraries
+import collections
+from http import server
+import os
+import random
+import threading
+import time
+from typing import Dict, Tuple
+
+# Recorded responses used by the downloader tests
+_FIXTURE_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'get_data', 'tests')
+
+# Key: (publication, page type) in the request path, Value: recorded response and its content type
+_FIXTURES = {
+    ('daily_mail', 'columnists'): ('mock_daily_mail_columnists_homepage.html', 'text/html'),
+    ('daily_mail', 'columnist'): ('mock_daily_mail_author_homepage.html', 'text/html'),
+    ('daily_mail', 'article'): ('mock_daily_mail_article.html', 'text/html'),
+    ('i_news', 'columnists'): ('mock_i_news_columnists_homepage.html', 'text/html'),
+    ('i_news', 'columnist'): ('mock_i_news_author_homepage.html', 'text/html'),
+    ('i_news', 'article'): ('mock_i_news_article.html', 'text/html'),
+    ('the_guardian', 'article'): ('mock_the_guardian_article.json', 'application/json'),
+}
+
+
+class ReplayServer:
+    """
+    Local HTTP server replaying recorded responses from each publication, with configurable latency, error rate and
+    rate limiting so the behaviour of the downloaders under different conditions can be measured.
+
+    Pages are served at `<url>/<publication>/<page type>/<anything>` e.g. `<url>/daily_mail/article/123`, where page
+    type is one of 'columnists' (the page listing columnists), 'columnist' (a columnist's homepage) or 'article'.
+    Use as a context manager so the server is shut down afterwards.
+    """
+
+    def __init__(
+            self,
+            latency_seconds: float = 0,
+            error_rate: float = 0,
+            requests_per_second: float = None,
+            seed: int = 0
+    ):
+        """
+        Initialise attributes of class.
+
+        Parameters
+        ----------
+        latency_seconds : float (default 0)
+            Time taken to respond to each request.
+        error_rate : float (default 0)
+            Proportion of requests (chosen at random) answered with `503 Service Unavailable`.
+        requests_per_second : float (default None)
+            Requests beyond this rate are answered with `429 Too Many Requests` and a `Retry-After` header. Unlimited
+            if not provided.
+        seed : int (default 0)
+            Seed for choosing which requests fail.
+        """
+
+        self.latency_seconds = latency_seconds
+        self.error_rate = error_rate
+        self.requests_per_second = requests_per_second
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._recent_request_times = collections.deque()
+        self._fixtures = self._load_fixtures()
+
+        # Number of requests answered with each status code
+        self.responses_sent = collections.Counter()
+
+        self._http_server = server.ThreadingHTTPServer(('127.0.0.1', 0), self._create_request_handler())
+        self._server_thread = None
+
+    @staticmethod
+    def _load_fixtures() -> Dict[Tuple[str, str], Tuple[bytes, str]]:
+        """Read every recorded response into memory so disk access does not affect timings."""
+
+        fixtures = {}
+
+        for route, (filename, content_type) in _FIXTURES.items():
+            with open(file=os.path.join(_FIXTURE_DIRECTORY, filename), mode='rb') as fixture:
+                fixtures[route] = (fixture.read(), content_type)
+
+        return fixtures
+
+    @property
+    def url(self) -> str:
+        """Base URL of the server e.g. 'http://127.0.0.1:54321'."""
+
+        host, port = self._http_server.server_address[:2]
+
+        return f'http://{host}:{port}'
+
+    def _is_rate_limited(self) -> bool:
+        """Check whether a request would exceed the rate limit, recording it if not."""
+
+        if self.requests_per_second is None:
+            return False
+
+        with self._lock:
+            now = time.monotonic()
+
+            while self._recent_request_times and now - self._recent_request_times[0] >= 1:
+                self._recent_request_times.popleft()
+
+            if len(self._recent_request_times) >= self.requests_per_second:
+                return True
+
+            self._recent_request_times.append(now)
+
+            return False
+
+    def _get_response(self, path: str) -> Tuple[int, Dict[str, str], bytes]:
+        """
+        Decide how to respond to a request.
+
+        Parameters
+        ----------
+        path : str
+            Path of the request e.g. '/daily_mail/article/123?page=1'.
+
+        Returns
+        -------
+        tuple
+            Status code, headers and body of the response.
+        """
+
+        time.sleep(self.latency_seconds)
+
+        if self._is_rate_limited():
+            return 429, {'Retry-After': '1'}, b''
+
+        with self._lock:
+            should_fail = self._random.random() < self.error_rate
+
+        if should_fail:
+            return 503, {}, b''
+
+        path_parts = path.split('?')[0].strip('/').split('/')
+        route = tuple(path_parts[:2])
+
+        if route not in self._fixtures:
+            return 404, {}, b''
+
+        body, content_type = self._fixtures[route]
+
+        return 200, {'Content-Type': content_type}, body
+
+    def _create_request_handler(self) -> type:
+        """Create the class which handles each request, with access to this server's settings."""
+
+        replay_server = self
+
+        class RequestHandler(server.BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                status_code, headers, body = replay_server._get_response(self.path)
+
+                with replay_server._lock:
+                    replay_server.responses_sent[status_code] += 1
+
+                self.send_response(status_code)
+
+                for header, value in headers.items():
+                    self.send_header(header, value)
+
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                """Do not log every request, as this would slow down the server."""
+
+        return RequestHandler
+
+    def __enter__(self) -> 'ReplayServer':
+        self._server_thread = threading.Thread(target=self._http_server.serve_forever, daemon=True)
+        self._server_thread.start()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        self._http_server.shutdown()
+        self._http_server.server_close()
+        self._server_thread.join()
+
+        return False
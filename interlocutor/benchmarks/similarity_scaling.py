@@ -0,0 +1,439 @@
+"""Measure how the time, memory and database writes of tf-idf encoding and article similarity grow with the corpus."""
+
+# Standard libraries
+import argparse
+from concurrent import futures
+import datetime
+import json
+import multiprocessing
+import os
+import pathlib
+import platform
+import resource
+import subprocess
+import time
+from typing import Dict, List
+
+# Third party libraries
+import numpy as np
+import pandas as pd
+
+# Internal imports
+from interlocutor.benchmarks import synthetic_corpus
+from interlocutor.database import postgresql
+
+# Stages measured, in the order they run at each corpus size
+STAGES = ['encode_articles', 'calculate_similarities', 'store_most_similar_articles']
+
+# Tables written by each stage, whose size is recorded after it runs
+_OUTPUT_TABLES = {
+    'encode_articles': ['encoded_articles.tfidf_representation', 'encoded_articles.tfidf_vocabulary'],
+    'calculate_similarities': [],
+    'store_most_similar_articles': ['encoded_articles.tfidf_similar_articles']
+}
+
+# Measurements compared between corpus sizes and between runs
+_MEASUREMENTS = ['seconds', 'peak_rss_mb', 'db_bytes_written']
+
+# Root of the repository, to find the commit being benchmarked
+_REPOSITORY_DIRECTORY = pathlib.Path(__file__).resolve().parents[2]
+
+
+def _get_peak_rss_mb() -> float:
+    """Highest resident memory of this process so far, in megabytes (ru_maxrss is in kilobytes on Linux)."""
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _get_commit() -> str:
+    """Commit of the repository being benchmarked, or None if it cannot be read (e.g. outside of a git checkout)."""
+
+    try:
+        completed_process = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=str(_REPOSITORY_DIRECTORY),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+            check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return completed_process.stdout.strip()
+
+
+def _run_stage(stage: str, similarity_threshold: float) -> Dict:
+    """
+    Run one stage in a fresh process, so its peak memory is not hidden by the peak of an earlier stage or corpus size.
+
+    Parameters
+    ----------
+    stage : str
+        One of `STAGES`.
+    similarity_threshold : float
+        Cosine similarity above which articles are stored as similar.
+
+    Returns
+    -------
+    dict
+        'seconds' taken by the stage, 'peak_rss_mb' of the process, 'baseline_rss_mb' of the process before the stage
+        started, 'db_bytes_written' to the write-ahead log by the whole database while the stage ran, and
+        'output_table_bytes' of the tables the stage writes once it has finished.
+    """
+
+    # Imported here so that the benchmark itself starts without importing scikit-learn
+    from interlocutor.nlp import encoding
+
+    db_connection = postgresql.DatabaseConnection()
+    encoder = encoding.TfidfEncoder(use_existing_vocab=False)
+
+    wal_start = db_connection.get_dataframe(query='SELECT pg_current_wal_lsn()::TEXT AS lsn;')['lsn'].iloc[0]
+    baseline_rss_mb = _get_peak_rss_mb()
+    start_time = time.perf_counter()
+
+    if stage == 'encode_articles':
+        encoder.encode_articles()
+    elif stage == 'calculate_similarities':
+        encoder._calculate_similarities()
+    else:
+        encoder.store_most_similar_articles(similarity_threshold=similarity_threshold)
+
+    seconds = time.perf_counter() - start_time
+
+    db_sizes = db_connection.get_dataframe(
+        query="""
+              SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), %(wal_start)s::PG_LSN)::BIGINT AS db_bytes_written,
+                     COALESCE(
+                         (SELECT SUM(pg_total_relation_size(output_table::REGCLASS))
+                          FROM UNNEST(%(output_tables)s::TEXT[]) AS output_table),
+                         0
+                     )::BIGINT AS output_table_bytes;
+              """,
+        query_params={'wal_start': wal_start, 'output_tables': _OUTPUT_TABLES[stage]}
+    ).iloc[0]
+
+    return {
+        'seconds': seconds,
+        'peak_rss_mb': _get_peak_rss_mb(),
+        'baseline_rss_mb': baseline_rss_mb,
+        'db_bytes_written': int(db_sizes['db_bytes_written']),
+        'output_table_bytes': int(db_sizes['output_table_bytes'])
+    }
+
+
+def fit_scaling_exponents(results: List[Dict]) -> Dict[str, Dict[str, float]]:
+    """
+    Fit how each measurement of each stage grows with the number of articles, as the exponent k of
+    `measurement ~ articles ** k` (the slope of a straight line through the log-log scaling curve). An exponent of 1
+    means the stage grows linearly and 2 means it grows quadratically.
+
+    Memory is fitted on the growth of each process during the stage rather than its peak, as the peak includes the
+    memory taken by the interpreter and its imports.
+
+    Parameters
+    ----------
+    results : list[dict]
+        Measurements of each stage at each size (see `SimilarityScalingBenchmark.run`).
+
+    Returns
+    -------
+    dict[str, dict[str, float]]
+        Key: stage, Value: exponent of each measurement. Stages measured at fewer than two sizes are left out.
+    """
+
+    df_results = pd.DataFrame(results)
+
+    if df_results.empty or 'error' not in df_results:
+        return {}
+
+    df_results = df_results[df_results['error'].isnull()].copy()
+    df_results['memory_growth_mb'] = df_results['peak_rss_mb'] - df_results['baseline_rss_mb']
+
+    exponents = {}
+
+    for stage, df_stage in df_results.groupby('stage', sort=False):
+        if df_stage['articles'].nunique() < 2:
+            continue
+
+        exponents[stage] = {}
+
+        for measurement in ['seconds', 'memory_growth_mb', 'db_bytes_written']:
+            # Measurements which round to nothing have no meaningful growth
+            df_positive = df_stage[df_stage[measurement] > 0]
+
+            if df_positive['articles'].nunique() >= 2:
+                slope, _ = np.polyfit(np.log(df_positive['articles']), np.log(df_positive[measurement]), deg=1)
+                exponents[stage][f'{measurement}_exponent'] = float(slope)
+
+    return exponents
+
+
+class SimilarityScalingBenchmark:
+    """
+    Encode a synthetic corpus with tf-idf and calculate and store the similarities between its articles at increasing
+    sizes, recording the wall time, peak memory and bytes written to the database by each stage, to show how each
+    stage scales (e.g. the similarity matrix grows with the square of the number of articles).
+
+    The corpus (see `interlocutor.benchmarks.synthetic_corpus`) is loaded into the staging database and grown from one
+    size to the next, then deleted at the end. Every stage runs in a fresh process, so a stage which runs out of memory
+    is recorded as failed and larger sizes are skipped rather than the benchmark crashing.
+    """
+
+    def __init__(
+            self,
+            sizes: List[int] = (1000, 2000, 4000),
+            seed: int = 0,
+            similarity_threshold: float = 0.5,
+            **corpus_arguments
+    ):
+        """
+        Initialise attributes of class.
+
+        Parameters
+        ----------
+        sizes : list[int] (default (1000, 2000, 4000))
+            Numbers of articles to benchmark the stages with.
+        seed : int (default 0)
+            Seed of the synthetic corpus.
+        similarity_threshold : float (default 0.5)
+            Cosine similarity above which articles are stored as similar.
+        **corpus_arguments
+            Passed to `SyntheticCorpus` e.g. `vocabulary_size=20000`.
+        """
+
+        self._sizes = sorted(sizes)
+        self._seed = seed
+        self._similarity_threshold = similarity_threshold
+        self._corpus_arguments = corpus_arguments
+        self._db_connection = postgresql.DatabaseConnection()
+
+    def _create_corpus(self, number_of_articles: int) -> synthetic_corpus.SyntheticCorpus:
+        """Synthetic corpus of the benchmark, of a given size."""
+
+        return synthetic_corpus.SyntheticCorpus(
+            number_of_articles=number_of_articles, seed=self._seed, **self._corpus_arguments
+        )
+
+    def run(self) -> Dict:
+        """
+        Benchmark every stage at every size.
+
+        Returns
+        -------
+        dict
+            'benchmark', 'commit', 'started', 'python_version', the 'parameters' of the benchmark, the 'results' of
+            each stage at each size (see `_run_stage`, along with 'articles', 'stage', 'load_seconds' taken to grow
+            the corpus to that size and any 'error'), and the 'scaling' exponents fitted to them (see
+            `fit_scaling_exponents`).
+        """
+
+        report = {
+            'benchmark': 'similarity_scaling',
+            'commit': _get_commit(),
+            'started': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python_version': platform.python_version(),
+            'parameters': {
+                'sizes': self._sizes,
+                'seed': self._seed,
+                'similarity_threshold': self._similarity_threshold,
+                **self._corpus_arguments
+            },
+            'results': []
+        }
+
+        # Remove anything left by a previous run which was interrupted
+        self._create_corpus(0).delete_from_database(db_connection=self._db_connection)
+
+        articles_loaded = 0
+
+        try:
+            for number_of_articles in self._sizes:
+                start_time = time.perf_counter()
+                self._create_corpus(number_of_articles).load_into_database(
+                    db_connection=self._db_connection, first_article=articles_loaded
+                )
+                load_seconds = time.perf_counter() - start_time
+                articles_loaded = number_of_articles
+
+                failed = self._run_stages(number_of_articles, load_seconds, report['results'])
+
+                if failed:
+                    print(f'Stopping at {number_of_articles} articles, as larger corpora would fail too')
+                    break
+
+        finally:
+            self._create_corpus(0).delete_from_database(db_connection=self._db_connection)
+
+        report['scaling'] = fit_scaling_exponents(report['results'])
+
+        return report
+
+    def _run_stages(self, number_of_articles: int, load_seconds: float, results: List[Dict]) -> bool:
+        """
+        Run every stage, one after another, on the corpus loaded, adding their measurements to the results.
+
+        Returns
+        -------
+        bool
+            Whether a stage failed, in which case the stages after it are not run as they depend on its output.
+        """
+
+        for stage in STAGES:
+            result = {'articles': number_of_articles, 'stage': stage, 'load_seconds': load_seconds, 'error': None}
+
+            with futures.ProcessPoolExecutor(
+                    max_workers=1,
+                    mp_context=multiprocessing.get_context('spawn')
+            ) as executor:
+                # A process killed for running out of memory raises BrokenProcessPool here rather than MemoryError
+                try:
+                    result.update(executor.submit(_run_stage, stage, self._similarity_threshold).result())
+                except Exception as raised_exception:  # pylint: disable=broad-except
+                    result['error'] = f'{type(raised_exception).__name__}: {raised_exception}'
+
+            results.append(result)
+
+            print(f"{number_of_articles} articles, {stage}: " + (
+                result['error'] if result['error'] else
+                f"{result['seconds']:.1f} seconds, {result['peak_rss_mb']:.0f} MB peak memory, "
+                f"{result['db_bytes_written'] / 1e6:.1f} MB written to the database"
+            ))
+
+            if result['error']:
+                return True
+
+        return False
+
+
+def write_report(report: Dict, directory: str = 'benchmark_results') -> str:
+    """
+    Save the report of a run, named after the commit benchmarked and when it started, so runs on different commits can
+    be compared (see `compare_reports`).
+
+    Parameters
+    ----------
+    report : dict
+        Report of the run (see `SimilarityScalingBenchmark.run`).
+    directory : str (default 'benchmark_results')
+        Directory to write the report to.
+
+    Returns
+    -------
+    str
+        Path of the report.
+    """
+
+    os.makedirs(directory, exist_ok=True)
+
+    started = datetime.datetime.fromisoformat(report['started']).strftime('%Y%m%dT%H%M%S')
+    report_path = os.path.join(directory, f"{report['benchmark']}_{(report['commit'] or 'unknown')[:8]}_{started}.json")
+
+    with open(report_path, 'wt') as report_file:
+        json.dump(report, report_file, indent=2)
+
+    return report_path
+
+
+def load_report(path: str) -> Dict:
+    """Read a report written by `write_report`."""
+
+    with open(path, 'rt') as report_file:
+        return json.load(report_file)
+
+
+def get_scaling_curve(report: Dict) -> pd.DataFrame:
+    """
+    Lay out the measurements of a run as a scaling curve: one row per number of articles and one column per stage and
+    measurement.
+
+    Parameters
+    ----------
+    report : dict
+        Report of the run (see `SimilarityScalingBenchmark.run`).
+
+    Returns
+    -------
+    pandas.DataFrame
+        Measurement (columns, first level) of each stage (columns, second level) at each number of articles (index).
+    """
+
+    df_results = pd.DataFrame(report['results'], columns=['articles', 'stage'] + _MEASUREMENTS)
+
+    return df_results.pivot(index='articles', columns='stage', values=_MEASUREMENTS)
+
+
+def compare_reports(before: Dict, after: Dict) -> pd.DataFrame:
+    """
+    Compare the measurements of each stage at each number of articles in two runs.
+
+    Parameters
+    ----------
+    before : dict
+        Report of the earlier run (see `SimilarityScalingBenchmark.run`).
+    after : dict
+        Report of the later run.
+
+    Returns
+    -------
+    pandas DataFrame
+        One row per number of articles and stage measured in either run, with each measurement in each run and the
+        ratio of the later measurement to the earlier one e.g. `seconds_before`, `seconds_after` and `seconds_ratio`.
+    """
+
+    df_before, df_after = (
+        pd.DataFrame(report['results'], columns=['articles', 'stage'] + _MEASUREMENTS).set_index(['articles', 'stage'])
+        for report in [before, after]
+    )
+
+    comparison = df_before.join(df_after, how='outer', lsuffix='_before', rsuffix='_after')
+
+    for measurement in _MEASUREMENTS:
+        comparison[f'{measurement}_ratio'] = comparison[f'{measurement}_after'] / comparison[f'{measurement}_before']
+
+    return comparison[[
+        f'{measurement}_{suffix}' for measurement in _MEASUREMENTS for suffix in ['before', 'after', 'ratio']
+    ]]
+
+
+def _parse_arguments() -> argparse.Namespace:
+    """Read the benchmark settings from the command line."""
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 2000, 4000], help='Numbers of articles')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic corpus')
+    parser.add_argument('--similarity-threshold', type=float, default=0.5)
+    parser.add_argument('--vocabulary-size', type=int, default=50000, help='Number of distinct words in the corpus')
+    parser.add_argument('--mean-article-length', type=int, default=500, help='Average number of words in an article')
+    parser.add_argument('--output-directory', default='benchmark_results', help='Directory to write the report to')
+    parser.add_argument(
+        '--compare',
+        nargs=2,
+        metavar=('BEFORE', 'AFTER'),
+        help='Compare the reports of two earlier runs instead of running the benchmark'
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':  # pragma: no cover (exclude from testing coverage report)
+
+    arguments = _parse_arguments()
+
+    if arguments.compare:
+        before_report, after_report = (load_report(path) for path in arguments.compare)
+        print(f"Commit {before_report['commit']} compared to {after_report['commit']}")
+        print(compare_reports(before_report, after_report).round(3).to_string())
+
+    else:
+        benchmark_report = SimilarityScalingBenchmark(
+            sizes=arguments.sizes,
+            seed=arguments.seed,
+            similarity_threshold=arguments.similarity_threshold,
+            vocabulary_size=arguments.vocabulary_size,
+            mean_article_length=arguments.mean_article_length
+        ).run()
+
+        print(get_scaling_curve(benchmark_report).round(2).to_string())
+        print(json.dumps(benchmark_report['scaling'], indent=2))
+        print(f'Report written to {write_report(benchmark_report, directory=arguments.output_directory)}')
@@ -0,0 +1,553 @@
+"""Generate a reproducible synthetic corpus of articles, to test how the NLP and similarity pipeline scales."""
+
+# Standard libraries
+import argparse
+import datetime
+import hashlib
+import os
+import time
+from typing import Dict, Iterator, List
+
+# Third party libraries
+import numpy as np
+import pandas as pd
+from psycopg2 import sql as psy_sql
+import tqdm
+
+# Internal imports
+from interlocutor.commons import commons
+from interlocutor.database import postgresql
+from interlocutor.pipeline import processing_state
+from interlocutor.pipeline import publications
+
+# Each syllable of a synthetic word is a consonant followed by a vowel
+_CONSONANTS = list('bcdfghjklmnprstvwz')
+_VOWELS = list('aeiou')
+
+# Articles are generated in chunks of a fixed size, each from its own seed, so that an article is identical however many
+# articles are generated and a corpus of any size can be streamed without holding it in memory
+_ARTICLES_PER_CHUNK = 1000
+
+# Independent random streams derived from the seed, so e.g. changing the number of topics leaves the vocabulary alone
+_VOCABULARY_STREAM, _TOPIC_STREAM, _COLUMNIST_STREAM, _ARTICLE_STREAM = range(4)
+
+# The most frequent words (the equivalent of 'the', 'say', 'people'...) appear in articles of every topic
+_SHARED_WORDS = 100
+
+# Columnists writing for each publication
+_COLUMNISTS_PER_PUBLICATION = 20
+
+# Where each article would be found, matching the format of the publication (the path of the content for The Guardian).
+# The seed is included so that corpora from different seeds can be loaded alongside one another
+_URL_TEMPLATES = {
+    'the_guardian': 'commentisfree/synthetic/{seed}/{number}',
+    'daily_mail': 'https://www.dailymail.co.uk/debate/article-synthetic-{seed}-{number}.html',
+    'i_news': 'https://inews.co.uk/opinion/synthetic-{seed}-{number}'
+}
+
+# Articles are published at random times in the year from this date
+_FIRST_PUBLICATION_TIMESTAMP = datetime.datetime(2020, 1, 1)
+
+
+class SyntheticCorpus:
+    """
+    Synthetic articles spread across the publications, whose words follow Zipf's law and are clustered into topics, so
+    that the tf-idf encoding and the similarities between articles behave as they would on real articles but at any
+    scale (e.g. 10k, 100k or 1M articles).
+
+    Every article is about one topic, chosen according to the mix of topics its publication covers. Its words are drawn
+    from the Zipfian distribution of the whole vocabulary (where the most common words are also the shortest), apart
+    from a share of words drawn from the topic's own Zipfian distribution over a few hundred words. Articles about the
+    same topic are therefore more similar to one another, and the topic of each article is kept as the ground truth.
+
+    The synthetic words are lowercase lemmas of two or more letters, so the bag of words preprocessed content of an
+    article is its words as generated, without needing to run spaCy. The raw content splits the same words into
+    sentences.
+
+    The corpus is entirely determined by its parameters and seed, so benchmarks are reproducible.
+    """
+
+    def __init__(
+            self,
+            number_of_articles: int,
+            seed: int = 0,
+            vocabulary_size: int = 50000,
+            number_of_topics: int = 50,
+            words_per_topic: int = 300,
+            mean_article_length: int = 500,
+            topic_share: float = 0.3,
+            zipf_exponent: float = 1.1,
+            schemas: List[str] = None
+    ):
+        """
+        Initialise attributes of class.
+
+        Parameters
+        ----------
+        number_of_articles : int
+            Number of articles in the corpus.
+        seed : int (default 0)
+            Seed from which the whole corpus is generated.
+        vocabulary_size : int (default 50000)
+            Number of distinct words which can appear in articles.
+        number_of_topics : int (default 50)
+            Number of topics articles are written about.
+        words_per_topic : int (default 300)
+            Number of words specific to each topic.
+        mean_article_length : int (default 500)
+            Average number of words in an article. Lengths follow a log-normal distribution.
+        topic_share : float (default 0.3)
+            Expected share of the words of an article drawn from its topic rather than the whole vocabulary.
+        zipf_exponent : float (default 1.1)
+            Exponent of Zipf's law, where the frequency of the word of rank r is proportional to 1 / r ** exponent.
+        schemas : list[str] (default None)
+            Publications the articles belong to. Defaults to every publication in the registry.
+        """
+
+        if vocabulary_size < _SHARED_WORDS + words_per_topic:
+            raise ValueError(f'vocabulary_size must be at least {_SHARED_WORDS + words_per_topic}')
+
+        self.number_of_articles = number_of_articles
+        self._seed = seed
+        self._vocabulary_size = vocabulary_size
+        self._number_of_topics = number_of_topics
+        self._mean_article_length = mean_article_length
+        self._topic_share = topic_share
+        self._schemas = schemas or publications.get_schemas()
+
+        self.vocabulary = self._build_vocabulary()
+
+        # Cumulative probability of each rank, so words can be drawn with a binary search of uniform random numbers
+        self._vocabulary_cdf = self._get_zipf_cdf(vocabulary_size, zipf_exponent)
+        self._topic_cdf = self._get_zipf_cdf(words_per_topic, zipf_exponent)
+
+        topic_rng = self._get_rng(_TOPIC_STREAM)
+
+        # Words specific to each topic (in order of how common they are within the topic), excluding the shared words
+        self._topic_words = np.stack([
+            _SHARED_WORDS + topic_rng.choice(vocabulary_size - _SHARED_WORDS, size=words_per_topic, replace=False)
+            for _ in range(number_of_topics)
+        ])
+
+        # Each publication covers its own mix of topics
+        self._publication_topic_cdfs = {
+            schema: np.cumsum(topic_rng.dirichlet(np.full(number_of_topics, 0.5))) for schema in self._schemas
+        }
+
+        self.columnists = self._build_columnists()
+
+    def _get_rng(self, stream: int, chunk_number: int = 0) -> np.random.Generator:
+        """Random number generator of one of the independent streams derived from the seed."""
+
+        return np.random.default_rng([self._seed, stream, chunk_number])
+
+    @staticmethod
+    def _get_zipf_cdf(number_of_ranks: int, zipf_exponent: float) -> np.ndarray:
+        """Cumulative probability of each rank under Zipf's law."""
+
+        weights = 1 / np.arange(1, number_of_ranks + 1) ** zipf_exponent
+
+        return np.cumsum(weights) / weights.sum()
+
+    def _build_vocabulary(self) -> np.ndarray:
+        """
+        Make up distinct words of one to four syllables, ordered from the shortest (most common) to the longest.
+
+        Returns
+        -------
+        numpy.ndarray
+            Word of each rank.
+        """
+
+        rng = self._get_rng(_VOCABULARY_STREAM)
+        syllables = [consonant + vowel for consonant in _CONSONANTS for vowel in _VOWELS]
+        words = {}
+
+        while len(words) < self._vocabulary_size:
+            syllable_counts = rng.choice([1, 2, 3, 4], size=self._vocabulary_size, p=[0.02, 0.28, 0.5, 0.2])
+            syllable_ids = rng.integers(len(syllables), size=(self._vocabulary_size, 4))
+
+            for syllable_count, word_syllable_ids in zip(syllable_counts, syllable_ids):
+                words.setdefault(''.join(syllables[index] for index in word_syllable_ids[:syllable_count]), None)
+
+        # Sorting is stable, so words of the same length keep the random order they were made up in
+        return np.array(sorted(list(words)[:self._vocabulary_size], key=len))
+
+    def _build_columnists(self) -> Dict[str, List[str]]:
+        """Make up the names of the columnists of each publication."""
+
+        rng = self._get_rng(_COLUMNIST_STREAM)
+        name_ranks = rng.choice(
+            self._vocabulary_size, size=(len(self._schemas), _COLUMNISTS_PER_PUBLICATION, 2), replace=False
+        )
+        names = self.vocabulary[name_ranks]
+
+        return {
+            schema: [f'{first_name.capitalize()} {surname.capitalize()}' for first_name, surname in schema_names]
+            for schema, schema_names in zip(self._schemas, names)
+        }
+
+    def _get_urls(self, schema: str, article_numbers: np.ndarray) -> List[str]:
+        """Where each article would be found (see `_URL_TEMPLATES`)."""
+
+        return [_URL_TEMPLATES[schema].format(seed=self._seed, number=number) for number in article_numbers]
+
+    @staticmethod
+    def _write_sentences(words: np.ndarray, sentence_lengths: np.ndarray) -> str:
+        """Punctuate words as sentences e.g. 'Bado kelu tam. Ri sofa...'."""
+
+        sentence_ends = np.cumsum(sentence_lengths)
+        sentences = np.split(words, sentence_ends[sentence_ends < len(words)])
+
+        return ' '.join(' '.join(sentence).capitalize() + '.' for sentence in sentences)
+
+    def generate_chunk(self, chunk_number: int) -> pd.DataFrame:
+        """
+        Generate one chunk of articles, which is always the same for a given seed and parameters.
+
+        Parameters
+        ----------
+        chunk_number : int
+            Position of the chunk, starting from 0.
+
+        Returns
+        -------
+        pandas.DataFrame
+            For each article, its 'id', 'publication', 'columnist', 'url', 'published_timestamp', 'title', raw
+            'content', bag of words preprocessed content ('processed_content') and 'topic'.
+        """
+
+        rng = self._get_rng(_ARTICLE_STREAM, chunk_number)
+        article_numbers = np.arange(chunk_number * _ARTICLES_PER_CHUNK, (chunk_number + 1) * _ARTICLES_PER_CHUNK)
+
+        publication_ids = rng.integers(len(self._schemas), size=len(article_numbers))
+        topic_draws = rng.random(len(article_numbers))
+        topics = np.array([
+            np.searchsorted(self._publication_topic_cdfs[self._schemas[publication_id]], draw)
+            for publication_id, draw in zip(publication_ids, topic_draws)
+        ]).clip(max=self._number_of_topics - 1)
+
+        # Log-normal lengths whose mean is `mean_article_length`
+        sigma = 0.5
+        lengths = rng.lognormal(np.log(self._mean_article_length) - sigma ** 2 / 2, sigma, size=len(article_numbers))
+        lengths = np.maximum(lengths.astype(int), 20)
+        topic_word_counts = rng.binomial(lengths, self._topic_share)
+
+        # Draw the words of every article at once, then split them up by article
+        vocabulary_ranks = np.searchsorted(self._vocabulary_cdf, rng.random(int((lengths - topic_word_counts).sum())))
+        topic_ranks = np.searchsorted(self._topic_cdf, rng.random(int(topic_word_counts.sum())))
+        topic_word_ranks = self._topic_words[np.repeat(topics, topic_word_counts), topic_ranks]
+
+        vocabulary_ranks = vocabulary_ranks.clip(max=self._vocabulary_size - 1)
+        article_vocabulary_ranks = np.split(vocabulary_ranks, np.cumsum(lengths - topic_word_counts)[:-1])
+        article_topic_ranks = np.split(topic_word_ranks, np.cumsum(topic_word_counts)[:-1])
+
+        articles = []
+
+        for article_ranks in zip(article_vocabulary_ranks, article_topic_ranks):
+            words = self.vocabulary[rng.permutation(np.concatenate(article_ranks))]
+
+            articles.append({
+                'title': ' '.join(words[:rng.integers(5, 12)]).capitalize(),
+                'content': self._write_sentences(words, rng.integers(6, 25, size=len(words))),
+                'processed_content': ' '.join(words)
+            })
+
+        df_articles = pd.DataFrame(articles)
+        df_articles['publication'] = [self._schemas[publication_id] for publication_id in publication_ids]
+        df_articles['columnist'] = [
+            self.columnists[schema][columnist_id]
+            for schema, columnist_id in zip(df_articles['publication'], rng.integers(_COLUMNISTS_PER_PUBLICATION,
+                                                                                     size=len(article_numbers)))
+        ]
+        df_articles['published_timestamp'] = _FIRST_PUBLICATION_TIMESTAMP + pd.to_timedelta(
+            rng.integers(365 * 24 * 3600, size=len(article_numbers)), unit='s'
+        )
+        df_articles['topic'] = topics
+        df_articles['url'] = None
+
+        for schema in self._schemas:
+            is_publication = df_articles['publication'] == schema
+            df_articles.loc[is_publication, 'url'] = self._get_urls(schema, article_numbers[is_publication.values])
+
+        df_articles['id'] = [hashlib.md5(url.encode('utf-8')).hexdigest() for url in df_articles['url']]
+
+        return df_articles[[
+            'id', 'publication', 'columnist', 'url', 'published_timestamp', 'title', 'content', 'processed_content',
+            'topic'
+        ]]
+
+    def iter_chunks(self, first_article: int = 0) -> Iterator[pd.DataFrame]:
+        """
+        Generate the corpus one chunk at a time, so any number of articles can be generated in constant memory.
+
+        Parameters
+        ----------
+        first_article : int (default 0)
+            Position of the first article to generate, e.g. to grow a corpus which has already been loaded.
+
+        Yields
+        ------
+        pandas.DataFrame
+            Next chunk of articles (see `generate_chunk`). The final chunk is cut short at `number_of_articles`.
+        """
+
+        number_of_chunks = -(-self.number_of_articles // _ARTICLES_PER_CHUNK)
+
+        for chunk_number in range(first_article // _ARTICLES_PER_CHUNK, number_of_chunks):
+            chunk_start = chunk_number * _ARTICLES_PER_CHUNK
+
+            yield self.generate_chunk(chunk_number).iloc[
+                max(first_article - chunk_start, 0):self.number_of_articles - chunk_start
+            ]
+
+    def get_columnist_tables(self) -> Dict[str, pd.DataFrame]:
+        """
+        Rows of the columnists table of each publication which has one.
+
+        Returns
+        -------
+        dict[str, pandas.DataFrame]
+            Key: schema and table e.g. 'daily_mail.columnists', Value: rows of the table.
+        """
+
+        return {
+            f'{schema}.columnists': pd.DataFrame({
+                'columnist': self.columnists[schema],
+                'homepage': [
+                    f"https://{schema}.example/columnist/{columnist.lower().replace(' ', '-')}"
+                    for columnist in self.columnists[schema]
+                ]
+            })
+            for schema in self._schemas if schema != 'the_guardian'
+        }
+
+    def _get_table_names(self) -> List[str]:
+        """Schema and table of every table the corpus is stored in e.g. 'daily_mail.article_content'."""
+
+        table_names = list(self.get_columnist_tables())
+
+        for schema in self._schemas:
+            first_table = 'article_metadata' if schema == 'the_guardian' else 'columnist_article_links'
+            tables = [first_table, 'article_content', 'article_content_bow_preprocessed']
+            table_names.extend(f'{schema}.{table}' for table in tables)
+
+        return table_names
+
+    @staticmethod
+    def get_article_tables(df_articles: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+        """
+        Lay out articles as rows of the tables each publication stores them in, in the order the tables have to be
+        filled to satisfy their foreign keys.
+
+        Parameters
+        ----------
+        df_articles : pandas.DataFrame
+            Chunk of articles (see `generate_chunk`).
+
+        Returns
+        -------
+        dict[str, pandas.DataFrame]
+            Key: schema and table e.g. 'daily_mail.article_content', Value: rows of the table.
+        """
+
+        tables = {}
+
+        for schema, df_publication in df_articles.groupby('publication', sort=False):
+
+            if schema == 'the_guardian':
+                api_urls = 'https://content.guardianapis.com/' + df_publication['url']
+                tables['the_guardian.article_metadata'] = pd.DataFrame({
+                    'id': df_publication['id'],
+                    'guardian_id': df_publication['url'],
+                    'content_type': 'article',
+                    'section_id': 'commentisfree',
+                    'section_name': 'Opinion',
+                    'web_publication_timestamp': df_publication['published_timestamp'],
+                    'web_title': df_publication['title'] + ' | ' + df_publication['columnist'],
+                    'web_url': 'https://www.theguardian.com/' + df_publication['url'],
+                    'api_url': api_urls,
+                    'pillar_id': 'pillar/opinion',
+                    'pillar_name': 'Opinion'
+                })
+                tables['the_guardian.article_content'] = pd.DataFrame({
+                    'id': df_publication['id'],
+                    'guardian_id': df_publication['url'],
+                    'web_publication_timestamp': df_publication['published_timestamp'],
+                    'api_url': api_urls,
+                    'content': df_publication['content']
+                })
+
+            else:
+                tables[f'{schema}.columnist_article_links'] = df_publication[['columnist', 'id', 'url']].rename(
+                    columns={'id': 'article_id'}
+                )
+                tables[f'{schema}.article_content'] = df_publication[['id', 'url', 'title', 'content']]
+
+            tables[f'{schema}.article_content_bow_preprocessed'] = df_publication[['id', 'processed_content']]
+
+        return tables
+
+    def write_csv(self, directory: str) -> None:
+        """
+        Write the corpus in the same layout as the staging data loaded into the staging database (see
+        Docker/db/staging_data), with one file per table named after its schema and table.
+
+        Parameters
+        ----------
+        directory : str
+            Directory to write the files to. It must not already hold files of the tables written.
+
+        Raises
+        ------
+        FileExistsError
+            If the file of a table already exists, as rows would otherwise be appended to it.
+        """
+
+        os.makedirs(directory, exist_ok=True)
+
+        for table in self._get_table_names():
+            if os.path.exists(os.path.join(directory, f'{table}.csv')):
+                raise FileExistsError(f'{table}.csv already exists in {directory}')
+
+        for table, df_table in self.get_columnist_tables().items():
+            commons.write_or_append_dataframe_to_csv(df_table, os.path.join(directory, f'{table}.csv'))
+
+        for df_articles in tqdm.tqdm(self.iter_chunks(), desc='Writing synthetic articles'):
+            for table, df_table in self.get_article_tables(df_articles).items():
+                commons.write_or_append_dataframe_to_csv(df_table, os.path.join(directory, f'{table}.csv'))
+
+    def load_into_database(
+            self,
+            db_connection: postgresql.DatabaseConnection,
+            mark_preprocessed: bool = True,
+            first_article: int = 0
+    ) -> None:
+        """
+        Bulk load the corpus into the database with `COPY`, one chunk at a time. Loading the articles marks them as
+        ingested, so they are picked up by deduplication and preprocessing like any other article.
+
+        Parameters
+        ----------
+        db_connection : interlocutor.database.postgresql.DatabaseConnection
+            Connection to the staging database.
+        mark_preprocessed : bool (default True)
+            Also mark the articles as preprocessed, so they can be encoded straight away from the preprocessed content
+            generated alongside them.
+        first_article : int (default 0)
+            Position of the first article to load, so a corpus already loaded can be grown to `number_of_articles`.
+
+        Raises
+        ------
+        ValueError
+            If connected to the production database.
+        """
+
+        if os.getenv('DEPLOYMENT_ENVIRONMENT') == 'prd':
+            raise ValueError('Synthetic articles must never be loaded into the production database.')
+
+        state = processing_state.ProcessingState(db_connection=db_connection)
+
+        for table, df_table in self.get_columnist_tables().items():
+            db_connection.execute_database_operation(
+                sql_command=psy_sql.SQL("""
+                    INSERT INTO {table} (columnist, homepage)
+                    SELECT UNNEST(%(columnists)s), UNNEST(%(homepages)s)
+                    ON CONFLICT (columnist) DO NOTHING;
+                    """).format(table=psy_sql.Identifier(*table.split('.'))),
+                params={'columnists': df_table['columnist'].tolist(), 'homepages': df_table['homepage'].tolist()}
+            )
+
+        for df_articles in tqdm.tqdm(self.iter_chunks(first_article=first_article), desc='Loading synthetic articles'):
+            for table, df_table in self.get_article_tables(df_articles).items():
+                schema, table_name = table.split('.')
+                db_connection.copy_dataframe_to_table(dataframe=df_table, table_name=table_name, schema=schema)
+
+            if mark_preprocessed:
+                for schema, df_publication in df_articles.groupby('publication'):
+                    state.mark_processed(
+                        stage='preprocessed',
+                        publication=schema,
+                        article_ids=df_publication['id'].tolist(),
+                        version='synthetic'
+                    )
+
+    def delete_from_database(self, db_connection: postgresql.DatabaseConnection) -> None:
+        """
+        Remove every article generated from this seed from the database, however many were loaded, along with their
+        processing state and lemma ids. The encoded representations are left to be replaced by the next encoding run.
+
+        Parameters
+        ----------
+        db_connection : interlocutor.database.postgresql.DatabaseConnection
+            Connection to the staging database.
+        """
+
+        for schema in self._schemas:
+            if schema == 'the_guardian':
+                first_table, url_column = 'article_metadata', 'guardian_id'
+            else:
+                first_table, url_column = 'columnist_article_links', 'url'
+
+            url_pattern = psy_sql.Literal(_URL_TEMPLATES[schema].format(seed=self._seed, number='%'))
+            synthetic_ids = psy_sql.SQL('SELECT id FROM {content} WHERE {url_column} LIKE {url_pattern}').format(
+                content=psy_sql.Identifier(schema, 'article_content'),
+                url_column=psy_sql.Identifier(url_column),
+                url_pattern=url_pattern
+            )
+
+            # Tables referring to the article content are emptied first, in a single transaction
+            db_connection.execute_database_operation(psy_sql.SQL("""
+                DELETE FROM pipeline.processing_state WHERE article_id IN ({synthetic_ids});
+                DELETE FROM preprocessing.bow_token_ids WHERE id IN ({synthetic_ids});
+                DELETE FROM {preprocessed} WHERE id IN ({synthetic_ids});
+                DELETE FROM {content} WHERE {url_column} LIKE {url_pattern};
+                DELETE FROM {first_table} WHERE {url_column} LIKE {url_pattern};
+                """).format(
+                synthetic_ids=synthetic_ids,
+                preprocessed=psy_sql.Identifier(schema, 'article_content_bow_preprocessed'),
+                content=psy_sql.Identifier(schema, 'article_content'),
+                url_column=psy_sql.Identifier(url_column),
+                first_table=psy_sql.Identifier(schema, first_table),
+                url_pattern=url_pattern
+            ))
+
+
+def _parse_arguments() -> argparse.Namespace:
+    """Read the corpus settings from the command line."""
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--articles', type=int, required=True, help='Number of articles to generate')
+    parser.add_argument('--seed', type=int, default=0, help='Seed from which the whole corpus is generated')
+    parser.add_argument('--vocabulary-size', type=int, default=50000, help='Number of distinct words')
+    parser.add_argument('--topics', type=int, default=50, help='Number of topics articles are written about')
+    parser.add_argument('--mean-article-length', type=int, default=500, help='Average number of words in an article')
+    parser.add_argument(
+        '--output-directory',
+        help='Write the corpus as CSV files in the layout of Docker/db/staging_data, rather than loading it into the '
+             'staging database'
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':  # pragma: no cover (exclude from testing coverage report)
+
+    arguments = _parse_arguments()
+
+    corpus = SyntheticCorpus(
+        number_of_articles=arguments.articles,
+        seed=arguments.seed,
+        vocabulary_size=arguments.vocabulary_size,
+        number_of_topics=arguments.topics,
+        mean_article_length=arguments.mean_article_length
+    )
+
+    start_time = time.perf_counter()
+
+    if arguments.output_directory:
+        corpus.write_csv(directory=arguments.output_directory)
+    else:
+        corpus.load_into_database(db_connection=postgresql.DatabaseConnection())
+
+    print(f'{arguments.articles} synthetic articles generated in {time.perf_counter() - start_time:.1f} seconds')
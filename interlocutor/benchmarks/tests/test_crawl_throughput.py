@@ -0,0 +1,34 @@
+"""Testing the benchmark of how quickly each downloader crawls article content."""
+
+# Third party libraries
+import pytest
+
+# Internal imports
+from interlocutor.benchmarks import crawl_throughput
+from interlocutor.database import postgresql
+
+
+@pytest.mark.parametrize("schema", ['daily_mail', 'i_news', 'the_guardian'])
+@pytest.mark.integration
+def test_run(schema):
+    """Every seeded article is crawled from the replay server, and the seeded articles are removed afterwards."""
+
+    crawl_benchmark = crawl_throughput.CrawlThroughputBenchmark(number_of_articles=5, workers=2, latency_seconds=0)
+
+    results = crawl_benchmark.run(schema=schema)
+
+    assert results['articles_crawled'] == 5
+    assert results['articles_per_second'] > 0
+    assert results['fetch_latency_p99_ms'] >= results['fetch_latency_p50_ms'] > 0
+    assert results['db_write_seconds'] > 0
+
+    # Nothing is left behind, and no other articles remain parked
+    db_connection = postgresql.DatabaseConnection()
+    leftover_rows = db_connection.get_dataframe(
+        query=f"""
+              SELECT COUNT(*) AS number_of_rows FROM {schema}.crawl_state
+              WHERE url LIKE '%%/article/benchmark-%%' OR leased_by = 'crawl-throughput-benchmark';
+              """
+    )
+
+    assert leftover_rows['number_of_rows'].iloc[0] == 0
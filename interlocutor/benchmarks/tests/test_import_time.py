@@ -0,0 +1,20 @@
+"""Testing the budget on how long each command line entry point takes to import."""
+
+# Third party libraries
+import pytest
+
+# Internal imports
+from interlocutor.benchmarks import import_time
+
+# Generous enough to absorb a slow machine, while still failing if a library taking seconds is imported eagerly
+_IMPORT_BUDGET_SECONDS = 1.5
+
+
+@pytest.mark.parametrize("module", import_time.ENTRY_POINTS)
+def test_entry_point_imports_within_budget(module):
+    """Entry points start without importing the libraries which are only needed once work is actually done."""
+
+    result = import_time.measure_import(module=module)
+
+    assert result['deferred_libraries_imported'] == []
+    assert result['seconds'] < _IMPORT_BUDGET_SECONDS
@@ -0,0 +1,20 @@
+"""Testing the benchmark of how quickly articles are preprocessed."""
+
+# Third party libraries
+import pytest
+
+# Internal imports
+from interlocutor.benchmarks import preprocessing_throughput
+
+
+@pytest.mark.integration
+def test_run():
+    """Articles are preprocessed by each engine, and the lookup lemmatiser matches spaCy."""
+
+    results = preprocessing_throughput.PreprocessingThroughputBenchmark(number_of_articles=5).run()
+
+    assert results['articles'] == 5
+    assert results['mismatched_articles'] == 0
+    assert results['chunks_known'] > 0
+    assert results['spacy_articles_per_second'] > 0
+    assert results['lookup_warm_articles_per_second'] > results['lookup_cold_articles_per_second']
@@ -0,0 +1,43 @@
+"""Testing the local server which replays recorded pages from each publication."""
+
+# Third party libraries
+import requests
+
+# Internal imports
+from interlocutor.benchmarks import replay_server
+from interlocutor.get_data import daily_mail, the_guardian
+
+
+def test_recorded_pages_are_served():
+    """Recorded pages are served by publication and page type, and can be parsed by the downloaders."""
+
+    with replay_server.ReplayServer() as server:
+
+        article_page = requests.get(f'{server.url}/daily_mail/article/any-article-id')
+        title, content = daily_mail.ArticleDownloader._parse_article_title_and_content(article_page.content)
+
+        api_response = requests.get(f'{server.url}/the_guardian/article/any-article-id', params={'format': 'json'})
+        guardian_content = the_guardian.ArticleDownloader._convert_html_to_text(
+            api_response.json()['response']['content']['fields']['body']
+        )
+
+        missing_page = requests.get(f'{server.url}/unknown_publication/article/any-article-id')
+
+    assert article_page.status_code == 200
+    assert title and content
+    assert guardian_content.startswith('When Conservative MPs chose their leader')
+    assert missing_page.status_code == 404
+
+
+def test_errors_and_rate_limiting():
+    """Requests fail at the configured rate, and requests beyond the rate limit are asked to retry later."""
+
+    with replay_server.ReplayServer(error_rate=1) as failing_server:
+        assert requests.get(f'{failing_server.url}/i_news/article/any-article-id').status_code == 503
+
+    with replay_server.ReplayServer(requests_per_second=2) as rate_limited_server:
+        responses = [requests.get(f'{rate_limited_server.url}/i_news/article/any-article-id') for _ in range(3)]
+
+    assert [response.status_code for response in responses] == [200, 200, 429]
+    assert responses[2].headers['Retry-After'] == '1'
+    assert rate_limited_server.responses_sent == {200: 2, 429: 1}
@@ -0,0 +1,96 @@
+"""Testing the benchmark of how encoding and article similarity scale with the number of articles."""
+
+# Standard libraries
+import os
+
+# Third party libraries
+import pandas as pd
+import pytest
+
+# Internal imports
+from interlocutor.benchmarks import similarity_scaling
+
+
+def _create_result(articles: int, stage: str, seconds: float, error: str = None) -> dict:
+    """Measurements of a stage, where memory and database writes grow linearly with the number of articles."""
+
+    return {
+        'articles': articles,
+        'stage': stage,
+        'load_seconds': 1.0,
+        'error': error,
+        'seconds': seconds,
+        'peak_rss_mb': 100 + articles / 10,
+        'baseline_rss_mb': 100,
+        'db_bytes_written': articles * 1000,
+        'output_table_bytes': articles * 500
+    }
+
+
+def test_fit_scaling_exponents():
+    """Exponents are fitted to the sizes each stage succeeded at, and stages measured at one size are left out."""
+
+    results = [
+        _create_result(articles, 'calculate_similarities', seconds=(articles / 1000) ** 2)
+        for articles in [1000, 2000, 4000]
+    ] + [
+        _create_result(8000, 'calculate_similarities', seconds=None, error='BrokenProcessPool: killed'),
+        _create_result(1000, 'encode_articles', seconds=1.0)
+    ]
+
+    exponents = similarity_scaling.fit_scaling_exponents(results)
+
+    assert list(exponents) == ['calculate_similarities']
+    assert exponents['calculate_similarities']['seconds_exponent'] == pytest.approx(2)
+    assert exponents['calculate_similarities']['memory_growth_mb_exponent'] == pytest.approx(1)
+    assert exponents['calculate_similarities']['db_bytes_written_exponent'] == pytest.approx(1)
+    assert similarity_scaling.fit_scaling_exponents([]) == {}
+
+
+def test_write_and_compare_reports(tmpdir):
+    """Reports are saved as JSON named after their commit, laid out as a scaling curve, and compared between runs."""
+
+    before = {
+        'benchmark': 'similarity_scaling',
+        'commit': '0123456789abcdef',
+        'started': '2021-02-01T10:00:00',
+        'results': [_create_result(articles, 'encode_articles', seconds=articles / 1000) for articles in [1000, 2000]]
+    }
+    after = {
+        **before,
+        'results': [_create_result(articles, 'encode_articles', seconds=articles / 2000) for articles in [1000, 4000]]
+    }
+
+    report_path = similarity_scaling.write_report(before, directory=str(tmpdir))
+
+    assert os.path.basename(report_path) == 'similarity_scaling_01234567_20210201T100000.json'
+    assert similarity_scaling.load_report(report_path) == before
+
+    scaling_curve = similarity_scaling.get_scaling_curve(before)
+
+    assert scaling_curve.index.tolist() == [1000, 2000]
+    assert scaling_curve[('seconds', 'encode_articles')].tolist() == [1, 2]
+
+    comparison = similarity_scaling.compare_reports(before, after)
+
+    assert comparison.index.get_level_values('articles').tolist() == [1000, 2000, 4000]
+    assert comparison.loc[(1000, 'encode_articles'), 'seconds_ratio'] == 0.5
+    # Sizes measured in only one of the runs are kept, without a ratio
+    assert pd.isna(comparison.loc[(2000, 'encode_articles'), 'seconds_after'])
+    assert pd.isna(comparison.loc[(4000, 'encode_articles'), 'seconds_ratio'])
+
+
+@pytest.mark.integration
+def test_run():
+    """Every stage is measured at every size, and the synthetic corpus is removed afterwards."""
+
+    report = similarity_scaling.SimilarityScalingBenchmark(
+        sizes=[40, 20], vocabulary_size=2000, number_of_topics=5, mean_article_length=50
+    ).run()
+
+    assert [(result['articles'], result['stage']) for result in report['results']] == [
+        (articles, stage) for articles in [20, 40] for stage in similarity_scaling.STAGES
+    ]
+    assert all(result['error'] is None for result in report['results'])
+    assert all(result['peak_rss_mb'] >= result['baseline_rss_mb'] > 0 for result in report['results'])
+    assert set(report['scaling']) == set(similarity_scaling.STAGES)
@@ -0,0 +1,136 @@
+"""Testing the synthetic corpus of articles used to test the pipeline at scale."""
+
+# Standard libraries
+import collections
+import itertools
+import os
+import pathlib
+
+# Third party libraries
+import numpy as np
+import pandas as pd
+import pytest
+
+# Internal imports
+from interlocutor.benchmarks import synthetic_corpus
+from interlocutor.database import postgresql
+
+# Staging data whose layout the corpus is written in
+_STAGING_DATA_DIRECTORY = pathlib.Path(__file__).parents[3] / 'Docker' / 'db' / 'staging_data'
+
+
+def _create_corpus(number_of_articles: int, seed: int = 0) -> synthetic_corpus.SyntheticCorpus:
+    """Small corpus which is quick to generate."""
+
+    return synthetic_corpus.SyntheticCorpus(
+        number_of_articles=number_of_articles, seed=seed, vocabulary_size=2000, number_of_topics=5,
+        mean_article_length=100
+    )
+
+
+def test_corpus_is_deterministic_by_seed():
+    """
+    The same seed always generates the same articles, whatever the size of the corpus or the article it starts from,
+    and other seeds do not.
+    """
+
+    small_corpus = pd.concat(_create_corpus(number_of_articles=1200).iter_chunks(), ignore_index=True)
+    large_corpus = pd.concat(_create_corpus(number_of_articles=1500).iter_chunks(), ignore_index=True)
+    grown_corpus = pd.concat(_create_corpus(number_of_articles=1500).iter_chunks(first_article=1200), ignore_index=True)
+    other_seed_corpus = pd.concat(_create_corpus(number_of_articles=1200, seed=1).iter_chunks(), ignore_index=True)
+
+    assert len(small_corpus) == 1200
+    assert small_corpus['id'].is_unique
+    pd.testing.assert_frame_equal(small_corpus, large_corpus.head(1200))
+    pd.testing.assert_frame_equal(grown_corpus, large_corpus.iloc[1200:].reset_index(drop=True))
+    assert not set(small_corpus['id']) & set(other_seed_corpus['id'])
+    assert (small_corpus['processed_content'] != other_seed_corpus['processed_content']).all()
+
+
+def test_words_are_zipfian_and_clustered_by_topic():
+    """Common words are far more frequent than rare ones, and articles share more words with articles of their topic."""
+
+    df_articles = next(_create_corpus(number_of_articles=1000).iter_chunks())
+    article_words = [set(content.split()) for content in df_articles['processed_content']]
+
+    word_counts = collections.Counter(
+        word for content in df_articles['processed_content'] for word in content.split()
+    ).most_common()
+
+    # Under Zipf's law the 10th most common word appears roughly a tenth as often as the most common one
+    assert 4 < word_counts[0][1] / word_counts[9][1] < 25
+    assert all(len(word) >= 2 and word.isalpha() and word.islower() for word, _ in word_counts)
+
+    def jaccard_similarity(first_article: int, second_article: int) -> float:
+        first_words, second_words = article_words[first_article], article_words[second_article]
+        return len(first_words & second_words) / len(first_words | second_words)
+
+    same_topic, different_topic = [], []
+
+    for first_article, second_article in itertools.combinations(range(100), 2):
+        same = df_articles['topic'].iloc[first_article] == df_articles['topic'].iloc[second_article]
+        (same_topic if same else different_topic).append(jaccard_similarity(first_article, second_article))
+
+    assert np.mean(same_topic) > 1.5 * np.mean(different_topic)
+
+
+def test_content_split_into_sentences():
+    """The raw content holds the same words as the preprocessed content, punctuated as sentences."""
+
+    article = next(_create_corpus(number_of_articles=1).iter_chunks()).iloc[0]
+
+    assert article['content'][0].isupper()
+    assert article['content'].endswith('.')
+    assert article['content'].lower().replace('.', '').split() == article['processed_content'].split()
+
+
+def test_write_csv_in_staging_layout(tmpdir):
+    """Every table is written with the same columns as the staging data, and never appended to an existing file."""
+
+    corpus = _create_corpus(number_of_articles=1100)
+    corpus.write_csv(directory=str(tmpdir))
+
+    written_files = sorted(os.listdir(str(tmpdir)))
+    content_rows = 0
+
+    for written_file in written_files:
+        df_written = pd.read_csv(os.path.join(str(tmpdir), written_file))
+        df_staging = pd.read_csv(_STAGING_DATA_DIRECTORY / written_file)
+
+        assert df_written.columns.tolist() == df_staging.columns.tolist()
+
+        if written_file.endswith('.article_content.csv'):
+            content_rows += len(df_written)
+
+    assert len(written_files) == 11
+    assert content_rows == 1100
+
+    with pytest.raises(FileExistsError):
+        corpus.write_csv(directory=str(tmpdir))
+
+
+@pytest.mark.integration
+def test_load_into_and_delete_from_database():
+    """Articles are loaded in stages into each publication's tables, marked as preprocessed, then deleted."""
+
+    corpus = _create_corpus(number_of_articles=30, seed=2021)
+    article_ids = tuple(next(corpus.iter_chunks())['id'])
+
+    db_connection = postgresql.DatabaseConnection()
+
+    def count_articles_by_stage():
+        return db_connection.get_dataframe(
+            query="SELECT stage, COUNT(*) AS articles FROM pipeline.processing_state WHERE article_id IN %(ids)s "
+                  "GROUP BY stage;",
+            query_params={'ids': article_ids}
+        ).set_index('stage')['articles'].to_dict()
+
+    _create_corpus(number_of_articles=10, seed=2021).load_into_database(db_connection=db_connection)
+    corpus.load_into_database(db_connection=db_connection, first_article=10)
+
+    articles_by_stage = count_articles_by_stage()
+
+    corpus.delete_from_database(db_connection=db_connection)
+
+    assert articles_by_stage == {'ingested': 30, 'preprocessed': 30}
+    assert count_articles_by_stage() == {}
@@ -11,6 +11,9 @@ from typing import Callable, Dict, List, Tuple, Union
 import pandas as pd
 import yaml
 
+# Internal imports
+from interlocutor.commons import metrics
+
 
 def load_docker_compose_config(yaml_filename_path: str = 'docker-compose.yml') -> Dict:
     """
@@ -81,9 +84,12 @@ def retry(
                           f'attempts.')
 
                     if attempt_number == total_attempts:
+                        metrics.RETRY_ATTEMPTS.inc(operation=func.__qualname__, outcome='given_up')
                         print('Max attempts reached. Stopping now.')
                         raise raised_exception
 
+                    metrics.RETRY_ATTEMPTS.inc(operation=func.__qualname__, outcome='retried')
+
                     if seconds_to_wait:
                         print(f'Waiting {seconds_to_wait} seconds before trying again')
                         time.sleep(seconds_to_wait)
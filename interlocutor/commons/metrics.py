@@ -0,0 +1,477 @@
+"""Expose live metrics of long-running crawlers and workers over HTTP, in the Prometheus text format."""
+
+# Standard libraries
+import bisect
+from http import server
+import math
+import threading
+import traceback
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Internal imports
+from interlocutor.commons import tracing
+
+# Default upper bounds (in seconds) of the buckets of latency histograms, matching the Prometheus client libraries
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _format_value(value: float) -> str:
+    """Write a number as it appears in the Prometheus text format e.g. '+Inf' or '1.5'."""
+
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+
+    return repr(float(value))
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    """Write labels as they appear in the Prometheus text format e.g. '{publication="daily_mail"}'."""
+
+    if not labels:
+        return ''
+
+    escaped_labels = (
+        name + '="' + str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"') + '"'
+        for name, value in labels.items()
+    )
+
+    return '{' + ','.join(escaped_labels) + '}'
+
+
+class MetricsRegistry:
+    """
+    Every metric of the process, along with collectors which update metrics that are measured rather than counted
+    (e.g. queue depths) just before the metrics are read.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: '_Metric') -> None:
+        """Add a metric to the registry."""
+
+        with self._lock:
+            self._metrics.append(metric)
+
+    def register_collector(self, collector: Callable[[], None]) -> None:
+        """
+        Add a function which is called every time the metrics are read, to update the metrics it measures.
+
+        Parameters
+        ----------
+        collector : Callable
+            Function without arguments e.g. one setting a gauge to the number of rows in a table.
+        """
+
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """
+        Run the collectors, then write every metric in the Prometheus text format. A collector which fails is reported
+        but does not stop the other metrics from being read.
+
+        Returns
+        -------
+        str
+            Current value of every metric.
+        """
+
+        with self._lock:
+            collectors, metrics = list(self._collectors), list(self._metrics)
+
+        for collector in collectors:
+            try:
+                collector()
+            except Exception:  # pylint: disable=broad-except
+                print(f'Metrics collector failed:\n{traceback.format_exc()}')
+
+        return ''.join(metric.render() for metric in metrics)
+
+
+# Registry of every metric defined in this process, served by `start_server`
+REGISTRY = MetricsRegistry()
+
+
+class _Metric:
+    """Metric with a fixed set of label names, holding a value for each combination of label values seen."""
+
+    metric_type = None
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 registry: MetricsRegistry = REGISTRY):
+        """
+        Initialise attributes of class.
+
+        Parameters
+        ----------
+        name : str
+            Name of the metric e.g. 'interlocutor_articles_processed_total'.
+        documentation : str
+            What the metric measures, shown alongside it.
+        label_names : sequence of str (default ())
+            Names of the labels distinguishing the values of the metric e.g. ('publication', 'stage').
+        registry : MetricsRegistry (default `REGISTRY`)
+            Registry the metric is read from.
+        """
+
+        self.name = name
+        self._documentation = documentation
+        self._label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+        registry.register(self)
+
+    def _get_label_values(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        """Order the values of the labels, checking every label is given."""
+
+        if set(labels) != set(self._label_names):
+            raise ValueError(f'{self.name} expects the labels {self._label_names}, not {tuple(labels)}')
+
+        return tuple(str(labels[label_name]) for label_name in self._label_names)
+
+    def _render_samples(self, label_values: Tuple[str, ...], value) -> List[str]:
+        """Lines of the text format for the value held for one combination of label values."""
+
+        return [f'{self.name}{_format_labels(dict(zip(self._label_names, label_values)))} {_format_value(value)}\n']
+
+    def render(self) -> str:
+        """Write the metric in the Prometheus text format."""
+
+        with self._lock:
+            values = {label_values: self._copy_value(value) for label_values, value in self._values.items()}
+
+        # Metrics without labels always have a value, so they can be read before anything has been recorded
+        if not self._label_names and not values:
+            values = {(): self._initial_value()}
+
+        lines = [f'# HELP {self.name} {self._documentation}\n', f'# TYPE {self.name} {self.metric_type}\n']
+
+        for label_values, value in sorted(values.items()):
+            lines.extend(self._render_samples(label_values, value))
+
+        return ''.join(lines)
+
+    @staticmethod
+    def _initial_value():
+        """Value held for a combination of label values before anything has been recorded for it."""
+
+        return 0.0
+
+    @staticmethod
+    def _copy_value(value):
+        """Copy a value so it can be written without holding the lock."""
+
+        return value
+
+    def get_value(self, **labels):
+        """
+        Current value for a combination of label values, mainly for testing.
+
+        Parameters
+        ----------
+        **labels
+            Value of every label of the metric e.g. publication='daily_mail'.
+        """
+
+        with self._lock:
+            return self._copy_value(self._values.get(self._get_label_values(labels), self._initial_value()))
+
+
+class Counter(_Metric):
+    """Total which only ever increases e.g. the number of articles fetched."""
+
+    metric_type = 'counter'
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        """
+        Increase the total.
+
+        Parameters
+        ----------
+        amount : float (default 1)
+            Amount to add, which cannot be negative.
+        **labels
+            Value of every label of the counter e.g. publication='daily_mail'.
+        """
+
+        if amount < 0:
+            raise ValueError('Counters can only increase')
+
+        label_values = self._get_label_values(labels)
+
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """Value which can go up and down e.g. the number of articles waiting to be preprocessed."""
+
+    metric_type = 'gauge'
+
+    def set(self, value: float, **labels) -> None:
+        """
+        Set the value.
+
+        Parameters
+        ----------
+        value : float
+            New value.
+        **labels
+            Value of every label of the gauge e.g. publication='daily_mail'.
+        """
+
+        label_values = self._get_label_values(labels)
+
+        with self._lock:
+            self._values[label_values] = float(value)
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observations (e.g. latencies), counted in buckets of increasing upper bounds along with their sum
+    and count, so quantiles and averages can be estimated over any time window.
+    """
+
+    metric_type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS, registry: MetricsRegistry = REGISTRY):
+        """
+        Initialise attributes of class.
+
+        Parameters
+        ----------
+        name : str
+            Name of the metric e.g. 'interlocutor_fetch_latency_seconds'.
+        documentation : str
+            What the metric measures, shown alongside it.
+        label_names : sequence of str (default ())
+            Names of the labels distinguishing the values of the metric e.g. ('host',).
+        buckets : sequence of float (default `LATENCY_BUCKETS`)
+            Upper bounds of the buckets in increasing order. A bucket for everything (+Inf) is always added.
+        registry : MetricsRegistry (default `REGISTRY`)
+            Registry the metric is read from.
+        """
+
+        self._buckets = tuple(sorted(buckets)) + (math.inf,)
+
+        super().__init__(name=name, documentation=documentation, label_names=label_names, registry=registry)
+
+    def _initial_value(self) -> Dict:
+        """Count of observations in each bucket (not cumulative), their sum and their count."""
+
+        return {'bucket_counts': [0] * len(self._buckets), 'sum': 0.0, 'count': 0}
+
+    @staticmethod
+    def _copy_value(value: Dict) -> Dict:
+        return {**value, 'bucket_counts': list(value['bucket_counts'])}
+
+    def observe(self, value: float, **labels) -> None:
+        """
+        Record an observation.
+
+        Parameters
+        ----------
+        value : float
+            Observed value e.g. seconds taken.
+        **labels
+            Value of every label of the histogram e.g. host='www.dailymail.co.uk'.
+        """
+
+        label_values = self._get_label_values(labels)
+
+        with self._lock:
+            histogram = self._values.setdefault(label_values, self._initial_value())
+            histogram['bucket_counts'][bisect.bisect_left(self._buckets, value)] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def _render_samples(self, label_values: Tuple[str, ...], value: Dict) -> List[str]:
+        labels = dict(zip(self._label_names, label_values))
+        lines = []
+        cumulative_count = 0
+
+        for upper_bound, bucket_count in zip(self._buckets, value['bucket_counts']):
+            cumulative_count += bucket_count
+            bucket_labels = _format_labels({**labels, 'le': _format_value(upper_bound)})
+            lines.append(f'{self.name}_bucket{bucket_labels} {_format_value(cumulative_count)}\n')
+
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(value['sum'])}\n")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {_format_value(value['count'])}\n")
+
+        return lines
+
+
+ARTICLES_PROCESSED = Counter(
+    name='interlocutor_articles_processed_total',
+    documentation='Articles which have completed each stage (fetched, parsed, failed, deduplicated, preprocessed, '
+                  'encoded) by publication',
+    label_names=('publication', 'stage')
+)
+
+QUEUE_DEPTH = Gauge(
+    name='interlocutor_queue_depth',
+    documentation='Articles waiting to be crawled (crawl) or in the backlog of each stage, by publication',
+    label_names=('publication', 'queue')
+)
+
+FETCH_LATENCY = Histogram(
+    name='interlocutor_fetch_latency_seconds',
+    documentation='Seconds taken for each website to respond to a request, excluding time waiting for the rate limit',
+    label_names=('host',)
+)
+
+HTTP_THROTTLED = Counter(
+    name='interlocutor_http_throttled_total',
+    documentation='Responses asking for fewer requests (429 Too Many Requests or a Retry-After header), by host',
+    label_names=('host',)
+)
+
+DATABASE_LATENCY = Histogram(
+    name='interlocutor_database_operation_seconds',
+    documentation='Seconds taken by each method of DatabaseConnection which reads or writes data',
+    label_names=('operation',)
+)
+
+CACHE_LOOKUPS = Counter(
+    name='interlocutor_cache_lookups_total',
+    documentation='Lookups of each cache (http, preprocessing, lookup_lemmatiser) by whether they were a hit or a miss',
+    label_names=('cache', 'result')
+)
+
+SIMILARITY_JOB_DURATION = Histogram(
+    name='interlocutor_similarity_job_seconds',
+    documentation='Seconds taken to score every pair of encoded articles and store the similar ones',
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+)
+
+RETRY_ATTEMPTS = Counter(
+    name='interlocutor_retry_attempts_total',
+    documentation='Failed attempts of each operation, by whether they were retried or given up on',
+    label_names=('operation', 'outcome')
+)
+
+
+def _observe_span(name: str, seconds: float, failed: bool) -> None:  # pylint: disable=unused-argument
+    """Feed the metrics timed by the spans which are already traced (see `interlocutor.commons.tracing`)."""
+
+    if name.startswith('database.'):
+        DATABASE_LATENCY.observe(seconds, operation=name[len('database.'):])
+
+    elif name == 'encoding.store_most_similar_articles':
+        SIMILARITY_JOB_DURATION.observe(seconds)
+
+
+tracing.add_listener(_observe_span)
+
+
+class MetricsServer:
+    """
+    HTTP server answering `GET /metrics` with every metric of a registry in the Prometheus text format, in a background
+    thread so it can run alongside a crawler or worker.
+    """
+
+    def __init__(self, port: int, host: str = '0.0.0.0', registry: MetricsRegistry = REGISTRY):
+        """
+        Initialise attributes of class.
+
+        Parameters
+        ----------
+        port : int
+            Port to listen on e.g. 9101. Use 0 to pick any free port.
+        host : str (default '0.0.0.0')
+            Address to listen on. Every interface by default, so Prometheus can scrape the container from another one.
+        registry : MetricsRegistry (default `REGISTRY`)
+            Registry whose metrics are served.
+        """
+
+        self._registry = registry
+        self._http_server = server.ThreadingHTTPServer((host, port), self._create_request_handler())
+        self._server_thread = None
+
+    @property
+    def url(self) -> str:
+        """URL of the metrics e.g. 'http://0.0.0.0:9101/metrics'."""
+
+        host, port = self._http_server.server_address[:2]
+
+        return f'http://{host}:{port}/metrics'
+
+    def _create_request_handler(self) -> type:
+        """Create the class which handles each request, with access to this server's registry."""
+
+        registry = self._registry
+
+        class RequestHandler(server.BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+
+                body = registry.render().encode('utf-8')
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                """Do not log every scrape."""
+
+        return RequestHandler
+
+    def start(self) -> 'MetricsServer':
+        """Start serving in a background thread, which stops when the process exits."""
+
+        self._server_thread = threading.Thread(target=self._http_server.serve_forever, daemon=True)
+        self._server_thread.start()
+
+        return self
+
+    def stop(self) -> None:
+        """Stop serving."""
+
+        self._http_server.shutdown()
+        self._http_server.server_close()
+        self._server_thread.join()
+
+    def __enter__(self) -> 'MetricsServer':
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        self.stop()
+
+        return False
+
+
+def start_server(port: int, collectors: List[Callable[[], None]] = None) -> MetricsServer:
+    """
+    Serve the metrics of this process for the rest of its life.
+
+    Parameters
+    ----------
+    port : int
+        Port to listen on e.g. 9101.
+    collectors : list[Callable] (default None)
+        Functions updating measured metrics each time the metrics are read (see `MetricsRegistry.register_collector`).
+
+    Returns
+    -------
+    MetricsServer
+        The running server.
+    """
+
+    for collector in collectors or []:
+        REGISTRY.register_collector(collector)
+
+    metrics_server = MetricsServer(port=port).start()
+
+    print(f'Serving metrics at {metrics_server.url}')
+
+    return metrics_server
@@ -0,0 +1,518 @@
+"""Adapt how quickly requests are sent to each website based on how the website responds."""
+
+# Standard libraries
+import asyncio
+from email import utils as email_utils
+import functools
+import inspect
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Tuple, Union
+from urllib import parse
+
+# Third party libraries
+import requests
+
+# Internal imports
+from interlocutor.commons import metrics
+from interlocutor.commons import tracing
+
+
+def _send_get_request(url: str, **kwargs) -> requests.Response:
+    """Send a GET request, looking up `requests.get` at call time so it can be mocked during testing."""
+
+    return requests.get(url, **kwargs)
+
+
+class _HostState:
+    """Current request rate and the next time a request can be sent to a single host."""
+
+    def __init__(self, seconds_between_requests: float):
+        self.seconds_between_requests = seconds_between_requests
+        self.next_available_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+
+class RateController:
+    """
+    Control the rate of requests sent to each host (website), adapting it to how the host responds rather than waiting
+    a fixed time between requests.
+
+    Each host starts at `initial_requests_per_second`. The rate rises gradually while responses arrive faster than
+    `target_latency_seconds`, and falls sharply when responses slow down, fail, or the host asks for fewer requests
+    (`429 Too Many Requests`, `5xx`, or a `Retry-After` header, which is always respected). Failed requests are retried
+    with exponential backoff and jitter.
+
+    The budget for each host is shared between threads, and the controller can be used as a decorator of sync or async
+    functions (`throttled`), as a sync or async context manager (`throttle`), or to send GET requests directly (`get`).
+    """
+
+    def __init__(
+            self,
+            initial_requests_per_second: float = 2,
+            min_requests_per_second: float = 0.1,
+            max_requests_per_second: float = 10,
+            target_latency_seconds: float = 1,
+            total_attempts: int = 5,
+            backoff_seconds: float = 1,
+            max_backoff_seconds: float = 60,
+            retry_statuses: Tuple[int, ...] = (429, 500, 502, 503, 504),
+            retry_exceptions: Tuple[type, ...] = (
+                    requests.exceptions.RequestException, ConnectionError, TimeoutError, asyncio.TimeoutError
+            )
+    ):
+        """
+        Parameters
+        ----------
+        initial_requests_per_second : float (default 2)
+            Rate at which requests are first sent to a host.
+        min_requests_per_second : float (default 0.1)
+            Slowest rate that a host will be throttled down to (other than when respecting `Retry-After`).
+        max_requests_per_second : float (default 10)
+            Fastest rate that requests will be sent to a single host.
+        target_latency_seconds : float (default 1)
+            Responses slower than this are taken as a sign the host is struggling and the rate is reduced.
+        total_attempts : int (default 5)
+            Number of times a decorated function is attempted before giving up.
+        backoff_seconds : float (default 1)
+            Maximum wait before the first retry, which doubles after every failed attempt. The actual wait is chosen at
+            random up to this maximum so that concurrent retries do not happen in lockstep.
+        max_backoff_seconds : float (default 60)
+            Upper limit of the wait before a retry.
+        retry_statuses : tuple of int (default (429, 500, 502, 503, 504))
+            HTTP status codes of responses which should be retried.
+        retry_exceptions : tuple of Exception types
+            Exceptions raised by the decorated function which should be retried.
+        """
+
+        self._initial_seconds_between_requests = 1 / initial_requests_per_second
+        self._max_seconds_between_requests = 1 / min_requests_per_second
+        self._min_seconds_between_requests = 1 / max_requests_per_second
+        self._target_latency_seconds = target_latency_seconds
+        self._total_attempts = total_attempts
+        self._backoff_seconds = backoff_seconds
+        self._max_backoff_seconds = max_backoff_seconds
+        self._retry_statuses = retry_statuses
+        self._retry_exceptions = retry_exceptions
+
+        self._hosts: Dict[str, _HostState] = {}
+        self._hosts_lock = threading.Lock()
+        self._counters_lock = threading.Lock()
+
+        # Number of times a host asked for fewer requests, requests were retried, and requests were abandoned
+        self.throttled = 0
+        self.retried = 0
+        self.given_up = 0
+
+        self._throttled_get = self.throttled_function(_send_get_request)
+
+    def _get_host_state(self, url: str) -> _HostState:
+        """
+        Retrieve the state of the host which a URL belongs to, creating it for hosts not seen before.
+
+        Parameters
+        ----------
+        url : str
+            URL of the request.
+
+        Returns
+        -------
+        _HostState
+            Request rate and next available slot for the host.
+        """
+
+        host = parse.urlsplit(url).netloc
+
+        with self._hosts_lock:
+            if host not in self._hosts:
+                self._hosts[host] = _HostState(seconds_between_requests=self._initial_seconds_between_requests)
+
+            return self._hosts[host]
+
+    def _reserve_slot(self, url: str) -> float:
+        """
+        Reserve the next slot for sending a request to a host.
+
+        Parameters
+        ----------
+        url : str
+            URL of the request.
+
+        Returns
+        -------
+        float
+            Number of seconds to wait before the request can be sent.
+        """
+
+        host_state = self._get_host_state(url)
+
+        # Reserve the slot while holding the lock, but leave the caller to wait outside of it so others can queue up
+        with host_state.lock:
+            now = time.monotonic()
+            reserved_slot = max(host_state.next_available_slot, now)
+            host_state.next_available_slot = reserved_slot + host_state.seconds_between_requests
+
+        return reserved_slot - now
+
+    @staticmethod
+    def _get_status_code(response: Any) -> Union[int, None]:
+        """Status code of either a `requests` (`status_code`) or `aiohttp` (`status`) response."""
+
+        return getattr(response, 'status_code', getattr(response, 'status', None))
+
+    @staticmethod
+    def _parse_retry_after(response: Any) -> Union[float, None]:
+        """
+        Number of seconds the host asked to wait via the `Retry-After` header, given as either seconds or a date.
+
+        Parameters
+        ----------
+        response : requests.Response or similar
+            Response from the host.
+
+        Returns
+        -------
+        float or None
+            Seconds to wait, or None if the header was not provided or could not be understood.
+        """
+
+        retry_after = (getattr(response, 'headers', None) or {}).get('Retry-After')
+
+        if retry_after is None:
+            return None
+
+        try:
+            return max(float(retry_after), 0)
+        except ValueError:
+            pass
+
+        try:
+            retry_datetime = email_utils.parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError):
+            return None
+
+        return max(retry_datetime.timestamp() - time.time(), 0)
+
+    def _record_outcome(self, url: str, latency_seconds: float, response: Any = None, failed: bool = False) -> None:
+        """
+        Adapt the request rate of a host based on the outcome of a request.
+
+        Parameters
+        ----------
+        url : str
+            URL of the request.
+        latency_seconds : float
+            How long the request took.
+        response : requests.Response or similar (default None)
+            Response from the host, if one was received.
+        failed : bool (default False)
+            Whether the request raised an exception before a response was received.
+        """
+
+        host = parse.urlsplit(url).netloc
+        host_state = self._get_host_state(url)
+        status_code = self._get_status_code(response)
+        retry_after = self._parse_retry_after(response) if response is not None else None
+
+        metrics.FETCH_LATENCY.observe(latency_seconds, host=host)
+
+        with host_state.lock:
+            if failed or status_code in self._retry_statuses or retry_after is not None:
+                # Back off sharply when the host is struggling or asks for fewer requests
+                host_state.seconds_between_requests = min(
+                    host_state.seconds_between_requests * 2, self._max_seconds_between_requests
+                )
+            elif latency_seconds > self._target_latency_seconds:
+                host_state.seconds_between_requests = min(
+                    host_state.seconds_between_requests * 1.5, self._max_seconds_between_requests
+                )
+            else:
+                # Speed up gradually while the host keeps up
+                host_state.seconds_between_requests = max(
+                    host_state.seconds_between_requests * 0.9, self._min_seconds_between_requests
+                )
+
+            if retry_after is not None:
+                host_state.next_available_slot = max(host_state.next_available_slot, time.monotonic() + retry_after)
+
+        if status_code == 429 or retry_after is not None:
+            metrics.HTTP_THROTTLED.inc(host=host)
+
+            with self._counters_lock:
+                self.throttled += 1
+
+    def _should_retry(self, attempt_number: int, response: Any = None, error: Exception = None) -> bool:
+        """
+        Decide whether a request should be attempted again.
+
+        Parameters
+        ----------
+        attempt_number : int
+            Number of the attempt which has just finished, starting from 1.
+        response : requests.Response or similar (default None)
+            Response from the host, if one was received.
+        error : Exception (default None)
+            Exception raised by the attempt, if any.
+
+        Returns
+        -------
+        bool
+            True if the request should be retried, False if the response should be returned.
+
+        Raises
+        ------
+        Exception
+            The exception raised by the final attempt, if every attempt failed with an exception.
+        """
+
+        if error is None and self._get_status_code(response) not in self._retry_statuses:
+            return False
+
+        if attempt_number == self._total_attempts:
+            metrics.RETRY_ATTEMPTS.inc(operation='http_request', outcome='given_up')
+
+            with self._counters_lock:
+                self.given_up += 1
+
+            if error is not None:
+                raise error
+
+            return False
+
+        metrics.RETRY_ATTEMPTS.inc(operation='http_request', outcome='retried')
+
+        with self._counters_lock:
+            self.retried += 1
+
+        return True
+
+    def _get_backoff_seconds(self, attempt_number: int) -> float:
+        """
+        Seconds to wait before retrying, growing exponentially with a random jitter.
+
+        Parameters
+        ----------
+        attempt_number : int
+            Number of the attempt which has just failed, starting from 1.
+
+        Returns
+        -------
+        float
+            Number of seconds to wait.
+        """
+
+        return random.uniform(0, min(self._backoff_seconds * 2 ** (attempt_number - 1), self._max_backoff_seconds))
+
+    def throttle(self, url: str) -> '_ThrottledRequest':
+        """
+        Context manager which waits for the next slot to send a request to a host, and adapts the rate of that host
+        based on the response recorded with `record` (or the exception raised).
+
+        Use `with controller.throttle(url) as request:` in sync code or `async with controller.throttle(url) as
+        request:` in async code, calling `request.record(response)` once the response arrives.
+
+        Parameters
+        ----------
+        url : str
+            URL of the request.
+
+        Returns
+        -------
+        _ThrottledRequest
+            Context manager for a single request.
+        """
+
+        return _ThrottledRequest(controller=self, url=url)
+
+    def throttled_function(self, func: Callable) -> Callable:
+        """
+        Decorate a sync or async function which sends a request and returns the response, so it waits for the next
+        slot for the host, adapts the rate of the host, and retries with backoff on retryable responses or exceptions.
+
+        The decorated function must accept the URL of the request as an argument named `url`. If every attempt
+        receives a retryable response, the final response is returned so the caller can handle it (e.g. with
+        `raise_for_status`), whereas if every attempt raises an exception, the final exception is raised.
+
+        Parameters
+        ----------
+        func : Callable
+            Function sending a request.
+
+        Returns
+        -------
+        Callable
+            Function with the rate of its requests controlled.
+        """
+
+        signature = inspect.signature(func)
+
+        def get_url(args: tuple, kwargs: dict) -> str:
+            return signature.bind(*args, **kwargs).arguments['url']
+
+        if asyncio.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_func_with_rate_control(*args, **kwargs):
+
+                url = get_url(args, kwargs)
+
+                for attempt_number in range(1, self._total_attempts + 1):
+
+                    response, error = None, None
+
+                    try:
+                        async with self.throttle(url) as request:
+                            response = request.record(await func(*args, **kwargs))
+                    except self._retry_exceptions as raised_exception:
+                        error = raised_exception
+
+                    if not self._should_retry(attempt_number=attempt_number, response=response, error=error):
+                        return response
+
+                    # The response is discarded, so release its connection rather than leaving it to be collected
+                    if response is not None:
+                        response.close()
+
+                    await asyncio.sleep(self._get_backoff_seconds(attempt_number))
+
+            return async_func_with_rate_control
+
+        @functools.wraps(func)
+        def func_with_rate_control(*args, **kwargs):
+
+            url = get_url(args, kwargs)
+
+            for attempt_number in range(1, self._total_attempts + 1):
+
+                response, error = None, None
+
+                try:
+                    with self.throttle(url) as request:
+                        response = request.record(func(*args, **kwargs))
+                except self._retry_exceptions as raised_exception:
+                    error = raised_exception
+
+                if not self._should_retry(attempt_number=attempt_number, response=response, error=error):
+                    return response
+
+                # The response is discarded, so release its connection rather than leaving it to be collected
+                if response is not None:
+                    response.close()
+
+                time.sleep(self._get_backoff_seconds(attempt_number))
+
+        return func_with_rate_control
+
+    @tracing.traced('http.get')
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """
+        Send a GET request with the rate controlled and retries handled (see `throttled_function`).
+
+        Parameters
+        ----------
+        url : str
+            URL of the request.
+        **kwargs
+            Further arguments passed to `requests.get` e.g. `params` or `headers`.
+
+        Returns
+        -------
+        requests.Response
+            Response from the host.
+        """
+
+        return self._throttled_get(url, **kwargs)
+
+    def get_requests_per_second(self, url: str) -> float:
+        """
+        Current rate at which requests are sent to the host of a URL.
+
+        Parameters
+        ----------
+        url : str
+            Any URL belonging to the host.
+
+        Returns
+        -------
+        float
+            Number of requests per second.
+        """
+
+        return 1 / self._get_host_state(url).seconds_between_requests
+
+    def report_statistics(self) -> None:
+        """Display how the rate of each host has adapted and how often requests were throttled or retried."""
+
+        host_rates = ', '.join(
+            f'{host}: {1 / host_state.seconds_between_requests:.2f} requests/second'
+            for host, host_state in self._hosts.items()
+        )
+
+        print(f'Rate control: {self.throttled} throttled, {self.retried} retried, {self.given_up} given up. '
+              f'Current rates: {host_rates or "none"}.')
+
+
+class _ThrottledRequest:
+    """Context manager around a single request, created by `RateController.throttle`."""
+
+    def __init__(self, controller: RateController, url: str):
+        self._controller = controller
+        self._url = url
+        self._response = None
+        self._start_time = None
+
+    def record(self, response: Any) -> Any:
+        """
+        Record the response to the request, so the rate of the host can be adapted when the context exits.
+
+        Parameters
+        ----------
+        response : requests.Response or similar
+            Response from the host.
+
+        Returns
+        -------
+        requests.Response or similar
+            The same response, for convenience.
+        """
+
+        self._response = response
+
+        return response
+
+    def _finish(self, exception_raised: bool) -> None:
+        """Adapt the rate of the host based on the outcome of the request."""
+
+        self._controller._record_outcome(
+            url=self._url,
+            latency_seconds=time.monotonic() - self._start_time,
+            response=self._response,
+            failed=exception_raised
+        )
+
+    def __enter__(self) -> '_ThrottledRequest':
+        seconds_to_wait = self._controller._reserve_slot(self._url)
+        tracing.count('throttled_seconds', seconds_to_wait)
+        time.sleep(seconds_to_wait)
+        self._start_time = time.monotonic()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        self._finish(exception_raised=exc_type is not None)
+
+        return False
+
+    async def __aenter__(self) -> '_ThrottledRequest':
+        seconds_to_wait = self._controller._reserve_slot(self._url)
+        tracing.count('throttled_seconds', seconds_to_wait)
+        await asyncio.sleep(seconds_to_wait)
+        self._start_time = time.monotonic()
+
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> bool:
+        self._finish(exception_raised=exc_type is not None)
+
+        return False
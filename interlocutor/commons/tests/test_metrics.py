@@ -0,0 +1,121 @@
+"""Testing the live metrics served to Prometheus."""
+
+# Third party libraries
+import pytest
+import requests
+
+# Internal imports
+from interlocutor.commons import commons, metrics, tracing
+
+
+def test_counters_and_gauges_rendered_with_labels():
+    """Each combination of labels has its own value, written in the Prometheus text format with labels escaped."""
+
+    registry = metrics.MetricsRegistry()
+    articles = metrics.Counter('articles_total', 'Articles processed', ('publication', 'stage'), registry=registry)
+    queue_depth = metrics.Gauge('queue_depth', 'Articles waiting', ('publication',), registry=registry)
+    unlabelled = metrics.Counter('restarts_total', 'Restarts', registry=registry)
+
+    articles.inc(publication='daily_mail', stage='parsed')
+    articles.inc(2, publication='daily_mail', stage='parsed')
+    articles.inc(publication='i_news', stage='failed')
+    queue_depth.set(5, publication='say "hi"\n')
+
+    with pytest.raises(ValueError):
+        articles.inc(-1, publication='daily_mail', stage='parsed')
+
+    with pytest.raises(ValueError):
+        articles.inc(publication='daily_mail')
+
+    assert articles.get_value(publication='daily_mail', stage='parsed') == 3
+
+    assert registry.render() == (
+        '# HELP articles_total Articles processed\n'
+        '# TYPE articles_total counter\n'
+        'articles_total{publication="daily_mail",stage="parsed"} 3.0\n'
+        'articles_total{publication="i_news",stage="failed"} 1.0\n'
+        '# HELP queue_depth Articles waiting\n'
+        '# TYPE queue_depth gauge\n'
+        'queue_depth{publication="say \\"hi\\"\\n"} 5.0\n'
+        '# HELP restarts_total Restarts\n'
+        '# TYPE restarts_total counter\n'
+        'restarts_total 0.0\n'
+    )
+    assert unlabelled.get_value() == 0
+
+
+def test_histogram_buckets_are_cumulative():
+    """Observations are counted in every bucket whose upper bound they fall within, along with their sum and count."""
+
+    registry = metrics.MetricsRegistry()
+    latency = metrics.Histogram('latency_seconds', 'Latency', ('host',), buckets=(0.1, 1), registry=registry)
+
+    for seconds in [0.05, 0.1, 0.5, 3]:
+        latency.observe(seconds, host='example.com')
+
+    rendered_lines = registry.render().splitlines()
+
+    assert rendered_lines[2:] == [
+        'latency_seconds_bucket{host="example.com",le="0.1"} 2.0',
+        'latency_seconds_bucket{host="example.com",le="1.0"} 3.0',
+        'latency_seconds_bucket{host="example.com",le="+Inf"} 4.0',
+        'latency_seconds_sum{host="example.com"} 3.65',
+        'latency_seconds_count{host="example.com"} 4.0'
+    ]
+
+
+def test_server_runs_collectors_on_each_scrape():
+    """Collectors update measured metrics whenever they are scraped, and a failing collector does not stop the rest."""
+
+    registry = metrics.MetricsRegistry()
+    queue_depth = metrics.Gauge('queue_depth', 'Articles waiting', registry=registry)
+    scrapes = []
+
+    def measure_queue():
+        scrapes.append(1)
+        queue_depth.set(len(scrapes) * 10)
+
+    def fail():
+        raise RuntimeError('Database unavailable')
+
+    registry.register_collector(fail)
+    registry.register_collector(measure_queue)
+
+    with metrics.MetricsServer(port=0, host='127.0.0.1', registry=registry) as metrics_server:
+        requests.get(metrics_server.url)
+        response = requests.get(metrics_server.url)
+        missing_response = requests.get(metrics_server.url.replace('/metrics', '/other'))
+
+    assert response.status_code == 200
+    assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+    assert 'queue_depth 20.0' in response.text
+    assert missing_response.status_code == 404
+
+
+def test_existing_components_feed_metrics():
+    """Database operations and similarity jobs are timed by their spans, and retried functions count their attempts."""
+
+    tracer = tracing.Tracer(profile=[], trace_memory=[])
+    database_calls = metrics.DATABASE_LATENCY.get_value(operation='get_dataframe')['count']
+    similarity_jobs = metrics.SIMILARITY_JOB_DURATION.get_value()['count']
+
+    with tracer.span('database.get_dataframe'):
+        pass
+
+    with tracer.span('encoding.store_most_similar_articles'):
+        pass
+
+    assert metrics.DATABASE_LATENCY.get_value(operation='get_dataframe')['count'] == database_calls + 1
+    assert metrics.SIMILARITY_JOB_DURATION.get_value()['count'] == similarity_jobs + 1
+
+    @commons.retry(total_attempts=2, exceptions_to_check=ValueError)
+    def always_fails():
+        raise ValueError('Failed')
+
+    with pytest.raises(ValueError):
+        always_fails()
+
+    operation = always_fails.__qualname__
+
+    assert metrics.RETRY_ATTEMPTS.get_value(operation=operation, outcome='retried') == 1
+    assert metrics.RETRY_ATTEMPTS.get_value(operation=operation, outcome='given_up') == 1
@@ -0,0 +1,162 @@
+"""Testing the rate control of requests sent to each website."""
+
+# Standard libraries
+import asyncio
+import threading
+import time
+
+# Third party libraries
+import pytest
+import requests
+
+# Internal imports
+from interlocutor.commons import rate_control
+
+
+class MockResponse:
+    """Mock a response from a web server."""
+
+    def __init__(self, status_code: int, headers: dict = None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_budget_shared_between_threads():
+    """Requests to the same host from several threads never exceed the number of requests per second."""
+
+    controller = rate_control.RateController(initial_requests_per_second=50, max_requests_per_second=50)
+    request_times = []
+
+    def make_requests():
+        """Make several requests, recording when each one was allowed to go ahead."""
+        for _ in range(5):
+            with controller.throttle('https://mock.website/page') as request:
+                request_times.append(time.monotonic())
+                request.record(MockResponse(status_code=200))
+
+    threads = [threading.Thread(target=make_requests) for _ in range(4)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    # 20 requests at 50 per second should take at least 19 gaps of 0.02 seconds (allow some timer imprecision)
+    assert max(request_times) - min(request_times) >= 19 * 0.02 * 0.9
+
+
+def test_rate_adapts_to_each_host():
+    """Hosts which respond quickly are sped up, whereas hosts which ask for fewer requests are slowed down."""
+
+    controller = rate_control.RateController(initial_requests_per_second=5)
+
+    for _ in range(3):
+        with controller.throttle('https://fast.website/page') as request:
+            request.record(MockResponse(status_code=200))
+
+        with controller.throttle('https://busy.website/page') as request:
+            request.record(MockResponse(status_code=429))
+
+    assert controller.get_requests_per_second('https://fast.website') > 5
+    assert controller.get_requests_per_second('https://busy.website') == pytest.approx(5 / 2 ** 3)
+    assert controller.throttled == 3
+
+
+def test_retry_after_is_respected(monkeypatch):
+    """The request is retried no sooner than the host asked via the Retry-After header."""
+
+    responses = [MockResponse(status_code=503, headers={'Retry-After': '0.3'}), MockResponse(status_code=200)]
+    request_times = []
+
+    def mock_get(url, **kwargs):
+        request_times.append(time.monotonic())
+        return responses.pop(0)
+
+    monkeypatch.setattr(requests, 'get', mock_get)
+
+    controller = rate_control.RateController(initial_requests_per_second=100, backoff_seconds=0.01)
+    response = controller.get('https://mock.website/page')
+
+    assert response.status_code == 200
+    assert request_times[1] - request_times[0] >= 0.3 * 0.9
+    assert controller.throttled == 1
+    assert controller.retried == 1
+    assert controller.given_up == 0
+
+
+def test_gives_up_after_total_attempts():
+    """The final response is returned once every attempt fails, whereas the final exception is raised."""
+
+    controller = rate_control.RateController(initial_requests_per_second=100, total_attempts=3, backoff_seconds=0.01)
+
+    @controller.throttled_function
+    def always_unavailable(url):
+        return MockResponse(status_code=500)
+
+    @controller.throttled_function
+    def always_times_out(url):
+        raise requests.exceptions.Timeout('Timed out')
+
+    assert always_unavailable(url='https://mock.website/page').status_code == 500
+
+    with pytest.raises(requests.exceptions.Timeout):
+        always_times_out('https://mock.website/page')
+
+    assert controller.retried == 4
+    assert controller.given_up == 2
+
+
+def test_async_functions_are_controlled():
+    """Async functions are throttled and retried in the same way as sync functions."""
+
+    controller = rate_control.RateController(initial_requests_per_second=100, backoff_seconds=0.01)
+    responses = [MockResponse(status_code=502), MockResponse(status_code=200)]
+
+    @controller.throttled_function
+    async def fetch(url):
+        return responses.pop(0)
+
+    response = asyncio.run(fetch('https://mock.website/page'))
+
+    assert response.status_code == 200
+    assert controller.retried == 1
+
+
+def test_retried_responses_are_closed(monkeypatch):
+    """Responses which are retried are closed, so streamed responses do not hold on to their connections."""
+
+    responses = [
+        MockResponse(status_code=503),
+        MockResponse(status_code=429, headers={'Retry-After': '0'}),
+        MockResponse(status_code=200)
+    ]
+    sent = list(responses)
+
+    def mock_get(url, **kwargs):
+        assert kwargs['stream']
+        return responses.pop(0)
+
+    monkeypatch.setattr(requests, 'get', mock_get)
+
+    controller = rate_control.RateController(initial_requests_per_second=100, backoff_seconds=0.01)
+    response = controller.get('https://mock.website/page', stream=True)
+
+    # Only the response returned is left open for the caller
+    assert response is sent[-1]
+    assert [response.closed for response in sent] == [True, True, False]
+
+    async_responses = [MockResponse(status_code=502), MockResponse(status_code=200)]
+    async_sent = list(async_responses)
+
+    @controller.throttled_function
+    async def fetch(url):
+        return async_responses.pop(0)
+
+    asyncio.run(fetch('https://mock.website/page'))
+
+    assert [response.closed for response in async_sent] == [True, False]
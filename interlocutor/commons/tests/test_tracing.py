@@ -0,0 +1,149 @@
+"""Testing the tracing of where the time and memory of a run goes."""
+
+# Standard libraries
+import json
+import os
+import threading
+
+# Third party libraries
+import pytest
+
+# Internal imports
+from interlocutor.commons import tracing
+
+
+def test_spans_aggregated_by_name():
+    """Spans with the same name are added together, with counters added to the innermost open span."""
+
+    tracer = tracing.Tracer(profile=[], trace_memory=[])
+
+    with tracer.span('stage'):
+        for number_of_rows in [2, 3]:
+            with tracer.span('database.get_dataframe'):
+                tracer.count('rows', number_of_rows)
+
+        tracer.count('articles')
+
+    with pytest.raises(ValueError):
+        with tracer.span('database.get_dataframe'):
+            raise ValueError('Query failed')
+
+    # Counters are only added to open spans
+    tracer.count('rows', 100)
+
+    spans = tracer.get_report()['spans']
+
+    assert spans['database.get_dataframe']['calls'] == 3
+    assert spans['database.get_dataframe']['failures'] == 1
+    assert spans['database.get_dataframe']['counters'] == {'rows': 5}
+    assert spans['stage']['counters'] == {'articles': 1}
+    assert spans['stage']['seconds'] >= spans['stage']['max_seconds'] > 0
+    assert spans['stage']['peak_rss_mb'] > 0
+    assert 'profile' not in spans['stage']
+    assert spans['stage']['peak_traced_mb'] is None
+
+
+def test_spans_nested_per_thread():
+    """Counters added in one thread never reach the spans open in another."""
+
+    tracer = tracing.Tracer(profile=[], trace_memory=[])
+
+    def count_in_thread():
+        with tracer.span('thread'):
+            tracer.count('items', 2)
+
+    with tracer.span('main'):
+        thread = threading.Thread(target=count_in_thread)
+        thread.start()
+        thread.join()
+
+    spans = tracer.get_report()['spans']
+
+    assert spans['thread']['counters'] == {'items': 2}
+    assert spans['main']['counters'] == {}
+
+
+def test_profile_and_memory_only_for_matching_spans():
+    """Only spans matching the patterns are profiled or have their memory traced."""
+
+    tracer = tracing.Tracer(profile=['preprocess:*'], trace_memory=['encode'])
+
+    def build_list():
+        return list(range(100000))
+
+    with tracer.span('preprocess:daily_mail'):
+        build_list()
+
+    with tracer.span('encode'):
+        build_list()
+
+    spans = tracer.get_report()['spans']
+
+    assert any('build_list' in function['function'] for function in spans['preprocess:daily_mail']['profile'])
+    assert spans['preprocess:daily_mail']['peak_traced_mb'] is None
+
+    # A list of 100,000 integers takes up more than a megabyte
+    assert 'profile' not in spans['encode']
+    assert spans['encode']['peak_traced_mb'] > 1
+
+
+def test_spans_merged_from_another_tracer():
+    """Spans taken from one tracer (e.g. in a process of a pool) are added to the totals of another."""
+
+    tracer, pool_tracer = tracing.Tracer(profile=[], trace_memory=[]), tracing.Tracer(profile=['*'], trace_memory=[])
+
+    with tracer.span('preprocess:daily_mail'):
+        tracer.count('texts', 1)
+
+    with pool_tracer.span('preprocess:daily_mail'):
+        pool_tracer.count('texts', 2)
+
+    tracer.merge_spans(pool_tracer.take_spans())
+
+    spans = tracer.get_report()['spans']
+
+    assert spans['preprocess:daily_mail']['calls'] == 2
+    assert spans['preprocess:daily_mail']['counters'] == {'texts': 3}
+    assert spans['preprocess:daily_mail']['profile']
+    assert pool_tracer.get_report()['spans'] == {}
+
+
+def test_write_and_compare_reports(tmpdir):
+    """Reports are written as JSON along with the profiles, and runs are compared span by span."""
+
+    tracer = tracing.Tracer(run_name='testing', profile=['slow'], trace_memory=[])
+
+    with tracer.span('slow'):
+        pass
+
+    report_path = tracer.write_report(directory=str(tmpdir))
+    report = tracing.load_report(report_path)
+
+    assert os.path.basename(report_path).startswith('testing_')
+    assert os.path.isfile(report_path.replace('.json', '_slow.prof'))
+    assert report['run'] == 'testing'
+    assert json.loads(json.dumps(report)) == report
+
+    before = {'spans': {'slow': {'calls': 1, 'seconds': 2.0}, 'removed': {'calls': 1, 'seconds': 1.0}}}
+    after = {'spans': {'slow': {'calls': 2, 'seconds': 5.0}, 'added': {'calls': 1, 'seconds': 0.5}}}
+
+    comparison = tracing.compare_reports(before, after)
+
+    assert comparison.index.tolist() == ['slow', 'removed', 'added']
+    assert comparison['change_seconds'].tolist() == [3.0, -1.0, 0.5]
+    assert comparison.loc['slow', 'change_ratio'] == 2.5
+
+
+def test_traced_uses_tracer_of_current_run(monkeypatch):
+    """Decorated functions are traced by whichever tracer belongs to the run in progress."""
+
+    @tracing.traced('decorated')
+    def decorated_function():
+        tracing.count('calls_inside')
+        return 'result'
+
+    run_tracer = tracing.Tracer(profile=[], trace_memory=[])
+    monkeypatch.setattr(tracing, '_tracer', run_tracer)
+
+    assert decorated_function() == 'result'
+    assert run_tracer.get_report()['spans']['decorated']['counters'] == {'calls_inside': 1}
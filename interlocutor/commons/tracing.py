@@ -0,0 +1,541 @@
+"""Trace where the time and memory of a run goes, and write a report of each run which can be compared between runs."""
+
+# Standard libraries
+import argparse
+import atexit
+import contextlib
+import copy
+import cProfile
+import datetime
+import fnmatch
+import functools
+import json
+import os
+import platform
+import pstats
+import re
+import resource
+import threading
+import time
+import tracemalloc
+from typing import Callable, Dict, Iterator, List
+
+# Third party libraries
+import pandas as pd
+
+# Comma separated patterns (e.g. 'preprocess:*,encoding.*') of the spans to profile or trace the memory of, so either
+# can be switched on for a single stage without changing any code
+PROFILE_VARIABLE = 'INTERLOCUTOR_PROFILE'
+TRACE_MEMORY_VARIABLE = 'INTERLOCUTOR_TRACE_MEMORY'
+
+# Directory in which the report of each run is written
+REPORT_DIRECTORY_VARIABLE = 'INTERLOCUTOR_REPORT_DIRECTORY'
+
+# Functions called with the name, seconds taken and failure of every span as it finishes (see `add_listener`)
+_listeners = []
+
+
+def _read_patterns(environment_variable: str) -> List[str]:
+    """Split the comma separated patterns held by an environment variable."""
+
+    return [pattern.strip() for pattern in os.environ.get(environment_variable, '').split(',') if pattern.strip()]
+
+
+def _get_peak_rss_mb() -> float:
+    """Highest resident memory of the process so far, in megabytes (`ru_maxrss` is measured in kilobytes on Linux)."""
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _add_totals(totals: Dict, other_totals: Dict) -> None:
+    """Add the totals of spans with the same name, recorded separately, to one another."""
+
+    totals['calls'] += other_totals['calls']
+    totals['failures'] += other_totals['failures']
+    totals['seconds'] += other_totals['seconds']
+    totals['max_seconds'] = max(totals['max_seconds'], other_totals['max_seconds'])
+    totals['peak_rss_mb'] = max(totals['peak_rss_mb'], other_totals['peak_rss_mb'])
+
+    if other_totals['peak_traced_mb'] is not None:
+        totals['peak_traced_mb'] = max(totals['peak_traced_mb'] or 0.0, other_totals['peak_traced_mb'])
+
+    for counter, value in other_totals['counters'].items():
+        totals['counters'][counter] = totals['counters'].get(counter, 0) + value
+
+
+class Tracer:
+    """
+    Record spans of work (e.g. downloading an article, preprocessing a chunk of texts, or running a query), each with a
+    name, how long it took, any counters added while it ran (e.g. the number of rows read) and the highest memory used
+    by the process by the time it finished.
+
+    Spans are aggregated by name as they finish, so the report of a run stays the same size however many spans there
+    are, and spans with the same name can be compared between runs. Spans are nested per thread, and counters are added
+    to the innermost span open in the calling thread.
+
+    Spans matching the `profile` patterns are run under cProfile, and spans matching the `trace_memory` patterns are
+    run with tracemalloc, which slow them down noticeably so are off unless asked for.
+    """
+
+    def __init__(self, run_name: str = None, profile: List[str] = None, trace_memory: List[str] = None,
+                 top_functions: int = 20):
+        """
+        Initialise attributes of class.
+
+        Parameters
+        ----------
+        run_name : str (default None)
+            Name of the run being traced e.g. 'orchestrator', used to name its report.
+        profile : list[str] (default None)
+            Patterns (as used by `fnmatch`) of the names of spans to run under cProfile e.g. ['preprocess:*']. Defaults
+            to the patterns in the environment variable `INTERLOCUTOR_PROFILE`.
+        trace_memory : list[str] (default None)
+            Patterns of the names of spans to run with tracemalloc, reporting the most memory allocated by Python while
+            they ran. Defaults to the patterns in the environment variable `INTERLOCUTOR_TRACE_MEMORY`.
+        top_functions : int (default 20)
+            Number of functions, by cumulative time, listed in the report of each profiled span.
+        """
+
+        self._run_name = run_name or 'interlocutor'
+        self._profile_patterns = _read_patterns(PROFILE_VARIABLE) if profile is None else profile
+        self._trace_memory_patterns = _read_patterns(TRACE_MEMORY_VARIABLE) if trace_memory is None else trace_memory
+        self._top_functions = top_functions
+
+        self._started = datetime.datetime.now()
+        self._start_seconds = time.perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._spans = {}
+        self._profiles = {}
+
+        # cProfile can only profile one span at a time, and tracemalloc is shared by every thread of the process
+        self._profiler_active = False
+        self._memory_tracing_spans = 0
+
+    def _get_open_spans(self) -> List[Dict[str, float]]:
+        """Counters of each span open in the calling thread, innermost last."""
+
+        if not hasattr(self._local, 'open_spans'):
+            self._local.open_spans = []
+
+        return self._local.open_spans
+
+    @staticmethod
+    def _matches(name: str, patterns: List[str]) -> bool:
+        """Whether the name of a span matches any of the patterns."""
+
+        return any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)
+
+    def _start_profiler(self, name: str) -> cProfile.Profile:
+        """Start profiling the calling thread if the span should be profiled and no other span is being profiled."""
+
+        if not self._matches(name, self._profile_patterns):
+            return None
+
+        with self._lock:
+            if self._profiler_active:
+                return None
+            self._profiler_active = True
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+        return profiler
+
+    def _stop_profiler(self, name: str, profiler: cProfile.Profile) -> None:
+        """Stop profiling and add the calls recorded to every other profile of spans with the same name."""
+
+        profiler.disable()
+
+        with self._lock:
+            self._profiler_active = False
+
+            if name in self._profiles:
+                self._profiles[name].add(profiler)
+            else:
+                self._profiles[name] = pstats.Stats(profiler)
+
+    def _start_tracing_memory(self, name: str) -> int:
+        """
+        Start tracing memory allocations if the span should be traced, returning the memory allocated by Python (in
+        bytes) as the span started, or None if the span is not traced.
+        """
+
+        if not self._matches(name, self._trace_memory_patterns):
+            return None
+
+        with self._lock:
+            if self._memory_tracing_spans == 0:
+                tracemalloc.start()
+            self._memory_tracing_spans += 1
+
+            return tracemalloc.get_traced_memory()[0]
+
+    def _stop_tracing_memory(self, initial_bytes: int) -> float:
+        """
+        Most memory allocated by Python while the span ran, above what was allocated as it started, in megabytes. While
+        spans overlap, the peak covers the time since the first of them started.
+        """
+
+        with self._lock:
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+            self._memory_tracing_spans -= 1
+
+            if self._memory_tracing_spans == 0:
+                tracemalloc.stop()
+
+        return max(peak_bytes - initial_bytes, 0) / 1024 ** 2
+
+    @contextlib.contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        """
+        Trace the work done within the context.
+
+        Parameters
+        ----------
+        name : str
+            Name of the span, shared by every span doing the same work e.g. 'database.get_dataframe'.
+        """
+
+        open_spans = self._get_open_spans()
+        counters = {}
+        open_spans.append(counters)
+
+        profiler = self._start_profiler(name)
+        initial_traced_bytes = self._start_tracing_memory(name)
+        start_seconds = time.perf_counter()
+        failed = False
+
+        try:
+            yield
+
+        except BaseException:
+            failed = True
+            raise
+
+        finally:
+            seconds = time.perf_counter() - start_seconds
+            open_spans.pop()
+
+            if profiler is not None:
+                self._stop_profiler(name, profiler)
+
+            peak_traced_mb = None if initial_traced_bytes is None else self._stop_tracing_memory(initial_traced_bytes)
+
+            self._record_span(name, seconds, failed, counters, peak_traced_mb)
+
+    def _record_span(self, name: str, seconds: float, failed: bool, counters: Dict[str, float],
+                     peak_traced_mb: float) -> None:
+        """Add a finished span to the totals of every span with the same name."""
+
+        span_totals = {
+            'calls': 1,
+            'failures': int(failed),
+            'seconds': seconds,
+            'max_seconds': seconds,
+            'peak_rss_mb': _get_peak_rss_mb(),
+            'peak_traced_mb': peak_traced_mb,
+            'counters': counters
+        }
+
+        with self._lock:
+            if name in self._spans:
+                _add_totals(self._spans[name], span_totals)
+            else:
+                self._spans[name] = span_totals
+
+        for listener in _listeners:
+            listener(name, seconds, failed)
+
+    def count(self, counter: str, value: float = 1) -> None:
+        """
+        Add to a counter of the innermost span open in the calling thread. Nothing is recorded if no span is open.
+
+        Parameters
+        ----------
+        counter : str
+            Name of the counter e.g. 'rows'.
+        value : float (default 1)
+            Amount to add to the counter.
+        """
+
+        open_spans = self._get_open_spans()
+
+        if open_spans:
+            open_spans[-1][counter] = open_spans[-1].get(counter, 0) + value
+
+    def take_spans(self) -> Dict:
+        """
+        Remove the totals of every span recorded so far, including the raw profile of any profiled spans, so they can be
+        sent from a process in a pool to the process running the pool and added to its run (see `merge_spans`).
+
+        Returns
+        -------
+        dict
+            'spans': totals of each span name
+            'profiles': raw `pstats` statistics of each profiled span name
+        """
+
+        with self._lock:
+            spans = {
+                'spans': self._spans,
+                'profiles': {name: profile.stats for name, profile in self._profiles.items()}
+            }
+            self._spans, self._profiles = {}, {}
+
+        return spans
+
+    def merge_spans(self, spans: Dict) -> None:
+        """
+        Add spans recorded by another tracer (see `take_spans`) to the totals of this run.
+
+        Parameters
+        ----------
+        spans : dict
+            Output of `take_spans` from the other tracer.
+        """
+
+        with self._lock:
+            for name, other_totals in spans['spans'].items():
+                if name in self._spans:
+                    _add_totals(self._spans[name], other_totals)
+                else:
+                    self._spans[name] = copy.deepcopy(other_totals)
+
+            for name, stats in spans['profiles'].items():
+                other_profile = pstats.Stats()
+                other_profile.stats = stats
+                other_profile.get_top_level_stats()
+
+                if name in self._profiles:
+                    self._profiles[name].add(other_profile)
+                else:
+                    self._profiles[name] = other_profile
+
+    def _summarise_profile(self, profile: pstats.Stats) -> List[Dict]:
+        """List the functions which took the most cumulative time in a profile."""
+
+        functions = sorted(profile.stats.items(), key=lambda item: item[1][3], reverse=True)[:self._top_functions]
+
+        return [
+            {
+                'function': f'{filename}:{line_number}({function_name})',
+                'calls': number_of_calls,
+                'own_seconds': own_seconds,
+                'cumulative_seconds': cumulative_seconds
+            }
+            for (filename, line_number, function_name), (_, number_of_calls, own_seconds, cumulative_seconds, _)
+            in functions
+        ]
+
+    def get_report(self) -> Dict:
+        """
+        Summarise the run so far.
+
+        Returns
+        -------
+        dict
+            'run': name of the run
+            'started': when the run started, in ISO 8601 format
+            'seconds': seconds since the run started
+            'peak_rss_mb': highest resident memory of the process so far
+            'python_version': version of Python running
+            'spans': for each span name, its number of `calls` and `failures`, total and longest `seconds`, highest
+            memory of the process when one finished (`peak_rss_mb`), most memory allocated by Python while one ran if
+            traced (`peak_traced_mb`), the sum of its `counters`, and the `profile` of the slowest functions if
+            profiled.
+        """
+
+        with self._lock:
+            spans = {name: {**totals, 'counters': dict(totals['counters'])} for name, totals in self._spans.items()}
+
+            for name, profile in self._profiles.items():
+                spans[name]['profile'] = self._summarise_profile(profile)
+
+        return {
+            'run': self._run_name,
+            'started': self._started.isoformat(timespec='seconds'),
+            'seconds': time.perf_counter() - self._start_seconds,
+            'peak_rss_mb': _get_peak_rss_mb(),
+            'python_version': platform.python_version(),
+            'spans': spans
+        }
+
+    def write_report(self, directory: str = None) -> str:
+        """
+        Write the report of the run so far (see `get_report`) as JSON, along with the raw profile of each profiled span
+        (readable by `pstats` or tools such as snakeviz).
+
+        Parameters
+        ----------
+        directory : str (default None)
+            Directory to write the report to. Defaults to the environment variable `INTERLOCUTOR_REPORT_DIRECTORY`, or
+            'run_reports' in the current directory if not set.
+
+        Returns
+        -------
+        str
+            Path of the report e.g. 'run_reports/orchestrator_20210101T120000.json'.
+        """
+
+        directory = directory or os.environ.get(REPORT_DIRECTORY_VARIABLE, 'run_reports')
+        os.makedirs(directory, exist_ok=True)
+
+        file_stem = os.path.join(directory, f"{self._run_name}_{self._started.strftime('%Y%m%dT%H%M%S')}")
+
+        with open(f'{file_stem}.json', 'wt') as report_file:
+            json.dump(self.get_report(), report_file, indent=2)
+
+        with self._lock:
+            for name, profile in self._profiles.items():
+                profile.dump_stats(f"{file_stem}_{re.sub(r'[^A-Za-z0-9_.-]', '_', name)}.prof")
+
+        return f'{file_stem}.json'
+
+
+# Tracer shared by every module, replaced at the start of each run (see `start_run`)
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    """Tracer of the current run."""
+
+    return _tracer
+
+
+def span(name: str) -> contextlib.AbstractContextManager:
+    """Trace the work done within the context with the tracer of the current run (see `Tracer.span`)."""
+
+    return _tracer.span(name)
+
+
+def count(counter: str, value: float = 1) -> None:
+    """Add to a counter of the innermost span open in the calling thread (see `Tracer.count`)."""
+
+    _tracer.count(counter, value)
+
+
+def traced(name: str) -> Callable:
+    """
+    Trace every call of the decorated function as a span.
+
+    Parameters
+    ----------
+    name : str
+        Name of the span e.g. 'encoding.encode_articles'.
+
+    Returns
+    -------
+    Callable
+        Decorator function which runs the decorated function within a span of the tracer of the current run.
+    """
+
+    def traced_decorator(func):
+
+        @functools.wraps(func)
+        def traced_func(*args, **kwargs):
+            with _tracer.span(name):
+                return func(*args, **kwargs)
+
+        return traced_func
+
+    return traced_decorator
+
+
+def add_listener(listener: Callable[[str, float, bool], None]) -> None:
+    """
+    Call a function every time a span finishes, whichever run it belongs to e.g. to feed live metrics.
+
+    Parameters
+    ----------
+    listener : Callable
+        Function taking the name of the span, the seconds it took and whether it failed.
+    """
+
+    _listeners.append(listener)
+
+
+def start_run(run_name: str, profile: List[str] = None, trace_memory: List[str] = None) -> Tracer:
+    """
+    Start tracing a run from scratch, and write its report when the process exits.
+
+    Parameters
+    ----------
+    run_name : str
+        Name of the run e.g. 'orchestrator', used to name its report.
+    profile : list[str] (default None)
+        Patterns of the names of spans to run under cProfile (see `Tracer`).
+    trace_memory : list[str] (default None)
+        Patterns of the names of spans to run with tracemalloc (see `Tracer`).
+
+    Returns
+    -------
+    Tracer
+        Tracer of the new run.
+    """
+
+    global _tracer
+    _tracer = Tracer(run_name=run_name, profile=profile, trace_memory=trace_memory)
+
+    run_tracer = _tracer
+
+    def write_report_on_exit():
+        print(f'Report of the run written to {run_tracer.write_report()}')
+
+    atexit.register(write_report_on_exit)
+
+    return _tracer
+
+
+def compare_reports(before: Dict, after: Dict) -> pd.DataFrame:
+    """
+    Compare how long each span took in two runs.
+
+    Parameters
+    ----------
+    before : dict
+        Report of the earlier run (see `Tracer.get_report`).
+    after : dict
+        Report of the later run.
+
+    Returns
+    -------
+    pandas DataFrame
+        One row per span in either run, with its calls and total seconds in each run, the `change_seconds` between
+        them, and the `change_ratio` of the later time to the earlier one. Sorted by the largest changes first.
+    """
+
+    comparison = pd.DataFrame({
+        'calls_before': pd.Series({name: totals['calls'] for name, totals in before['spans'].items()}, dtype=float),
+        'calls_after': pd.Series({name: totals['calls'] for name, totals in after['spans'].items()}, dtype=float),
+        'seconds_before': pd.Series({name: totals['seconds'] for name, totals in before['spans'].items()}, dtype=float),
+        'seconds_after': pd.Series({name: totals['seconds'] for name, totals in after['spans'].items()}, dtype=float)
+    })
+
+    comparison['change_seconds'] = comparison['seconds_after'].fillna(0) - comparison['seconds_before'].fillna(0)
+    comparison['change_ratio'] = comparison['seconds_after'] / comparison['seconds_before']
+
+    comparison.index.name = 'span'
+
+    return comparison.sort_values(by='change_seconds', key=abs, ascending=False)
+
+
+def load_report(path: str) -> Dict:
+    """Read a report written by `Tracer.write_report`."""
+
+    with open(path, 'rt') as report_file:
+        return json.load(report_file)
+
+
+if __name__ == '__main__':  # pragma: no cover (exclude from testing coverage report)
+
+    parser = argparse.ArgumentParser(description='Compare how long each span took in the reports of two runs.')
+    parser.add_argument('before', help='Path of the report of the earlier run')
+    parser.add_argument('after', help='Path of the report of the later run')
+    arguments = parser.parse_args()
+
+    before_report, after_report = load_report(arguments.before), load_report(arguments.after)
+
+    print(f"{before_report['run']} took {before_report['seconds']:.1f} seconds before and "
+          f"{after_report['seconds']:.1f} seconds after")
+    print(compare_reports(before_report, after_report).round(3).to_string())
@@ -1,18 +1,26 @@
 """Interact with postgres database running on database container."""
 
 # Standard libraries
+import io
+import json
 import os
 import pathlib
-from typing import Any, Dict, List, Union
+import select
+import time
+import uuid
+from typing import Any, Dict, Iterator, List, Union
 
 # Third party libraries
 import pandas as pd
 import psycopg2
 from psycopg2 import sql as psy_sql
-import sqlalchemy
 
 # Internal imports
-from interlocutor.commons import commons
+from interlocutor.commons import commons, tracing
+
+# How many times, and how many seconds apart, to try reaching a database which is not responding
+CONNECTION_ATTEMPTS = 3
+SECONDS_BETWEEN_CONNECTION_ATTEMPTS = 10
 
 
 class DatabaseConnection:
@@ -49,16 +57,29 @@ class DatabaseConnection:
         # Make sure database is available
         self.check_database_is_live()
 
-    def _create_connection(self) -> None:
-        """Establish connection to postgres database running on container."""
+    def _connect(self) -> psycopg2.extensions.connection:
+        """Open a new psycopg2 connection to postgres database running on container."""
 
-        self._conn = psycopg2.connect(
+        return psycopg2.connect(
             dbname=self._database,
             user=self._username,
             password=self._password,
             host=self._db_container_name
         )
 
+    def _create_connection(self) -> None:
+        """Establish connection to postgres database running on container."""
+
+        self._conn = self._connect()
+
+    def _create_engine(self) -> None:
+        """
+        Establish the SQLAlchemy engine needed by pandas to write to the database. SQLAlchemy is only imported here, as
+        it takes a noticeable share of the start up time of commands which never write a dataframe.
+        """
+
+        import sqlalchemy
+
         engine_connection_string = f"postgresql+psycopg2://{self._username}:{self._password}@" \
                                    f"{self._db_container_name}:{self._postgres_port}/{self._database}"
 
@@ -68,9 +89,16 @@ class DatabaseConnection:
         """Close connection to postgres database."""
 
         self._conn.close()
-        self._engine.dispose()
 
-    @commons.retry(total_attempts=3, exceptions_to_check=psycopg2.OperationalError, seconds_to_wait=10)
+        if self._engine is not None:
+            self._engine.dispose()
+            self._engine = None
+
+    @commons.retry(
+        total_attempts=CONNECTION_ATTEMPTS,
+        exceptions_to_check=psycopg2.OperationalError,
+        seconds_to_wait=SECONDS_BETWEEN_CONNECTION_ATTEMPTS
+    )
     def check_database_is_live(self):
         """Execute a simple query against the database to see if it is live."""
 
@@ -84,6 +112,7 @@ class DatabaseConnection:
         finally:
             self._close_connection()
 
+    @tracing.traced('database.execute_database_operation')
     def execute_database_operation(self, sql_command: Union[str, psy_sql.Composable], params: Dict = None) -> None:
         """
         Executes operation on database.
@@ -110,6 +139,43 @@ class DatabaseConnection:
 
         self._close_connection()
 
+    @tracing.traced('database.execute_database_operation_returning_rows')
+    def execute_database_operation_returning_rows(
+            self,
+            sql_command: Union[str, psy_sql.Composable],
+            params: Dict = None
+    ) -> pd.DataFrame:
+        """
+        Executes operation on database which also returns rows (e.g. an UPDATE ... RETURNING statement) and commits it.
+
+        Parameters
+        ----------
+        sql_command : str or psycopg2.sql.Composable
+            Database operation to be executed.
+        params : dict (default None)
+            Parameters to pass to the SQL execution. Used named placeholders in the query and then provide the argument
+            mapping in a dictionary (see `execute_database_operation`).
+
+        Returns
+        -------
+        pandas DataFrame
+            Rows returned by the operation.
+        """
+
+        self._create_connection()
+
+        with self._conn.cursor() as curs:
+            curs.execute(query=sql_command, vars=params)
+            rows = curs.fetchall()
+            columns = [column.name for column in curs.description]
+            self._conn.commit()
+
+        self._close_connection()
+
+        tracing.count('rows', len(rows))
+
+        return pd.DataFrame(data=rows, columns=columns)
+
     def _get_column_names_existing_table(
             self,
             table_name: str,
@@ -143,6 +209,7 @@ class DatabaseConnection:
 
         return existing_df.columns.values
 
+    @tracing.traced('database.get_dataframe')
     def get_dataframe(
             self,
             table_name: str = None,
@@ -204,8 +271,134 @@ class DatabaseConnection:
 
         self._close_connection()
 
+        tracing.count('rows', len(dataframe))
+
         return dataframe
 
+    def get_dataframe_in_chunks(
+            self,
+            query: Union[str, psy_sql.Composable],
+            query_params: Dict = None,
+            chunk_size: int = 1000
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Execute query against database and retrieve the result a chunk of rows at a time, so that memory use is bounded
+        by `chunk_size` rather than the size of the result.
+
+        Rows are read through a server-side cursor on a dedicated connection, which stays open until every chunk has
+        been read, so other methods of this class (e.g. uploading each processed chunk) can be used in between chunks.
+        The query sees the database as it was when the first chunk was requested.
+
+        Parameters
+        ----------
+        query : str or psycopg2.sql.Composable
+            SQL query to be executed.
+        query_params : dict (default None)
+            Parameters to pass to the SQL execution. Used named placeholders in the query and then provide the argument
+            mapping in a dictionary (see `get_dataframe`).
+        chunk_size : int (default 1000)
+            Maximum number of rows in each chunk.
+
+        Yields
+        ------
+        pandas DataFrame
+            The next `chunk_size` rows of the result of the query.
+        """
+
+        connection = self._connect()
+
+        try:
+            with connection.cursor(name=f'chunked_read_{uuid.uuid4().hex[:8]}') as curs:
+                curs.itersize = chunk_size
+                curs.execute(query=query, vars=query_params)
+
+                while True:
+                    # Only the time spent reading each chunk is traced, not the time spent processing it
+                    with tracing.span('database.get_dataframe_in_chunks'):
+                        rows = curs.fetchmany(chunk_size)
+                        tracing.count('rows', len(rows))
+
+                    if not rows:
+                        break
+
+                    yield pd.DataFrame(data=rows, columns=[column.name for column in curs.description])
+
+            connection.commit()
+
+        finally:
+            connection.close()
+
+    def listen_for_notifications(
+            self,
+            channels: List[str],
+            timeout: float = 60,
+            batch_window: float = 1,
+            max_batch_size: int = 500
+    ) -> Iterator[List[Dict]]:
+        """
+        Wait for notifications sent with NOTIFY/pg_notify on the channels, gathering them into micro-batches.
+
+        Channels are listened to on a dedicated connection which stays open while the notifications are being iterated
+        over, so other methods of this class can be used to process each batch. Notifications sent before listening
+        started, or after the connection is closed, are not received. An empty batch is yielded as soon as the channels
+        are being listened to, so the caller can then catch up on anything it missed without a gap.
+
+        Parameters
+        ----------
+        channels : list[str]
+            Names of the channels to listen to.
+        timeout : float (default 60)
+            Seconds to wait for a notification before yielding an empty batch, so the caller can carry out any periodic
+            work.
+        batch_window : float (default 1)
+            Seconds to keep gathering further notifications after the first one in a batch arrives.
+        max_batch_size : int (default 500)
+            Number of notifications after which the batch is yielded without waiting for the rest of `batch_window`.
+
+        Yields
+        ------
+        list[dict]
+            Channel (`channel`) and JSON-decoded payload (`payload`) of each notification in the batch.
+        """
+
+        connection = self._connect()
+        connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+
+        try:
+            with connection.cursor() as curs:
+                for channel in channels:
+                    curs.execute(query=psy_sql.SQL("LISTEN {channel};").format(channel=psy_sql.Identifier(channel)))
+
+            yield []
+
+            while True:
+                notifications = []
+                batch_deadline = None
+
+                while len(notifications) < max_batch_size:
+                    seconds_to_wait = timeout if batch_deadline is None else batch_deadline - time.monotonic()
+
+                    # Stop waiting once the batch window has closed, or if nothing arrives before the timeout
+                    if seconds_to_wait <= 0 or select.select([connection], [], [], seconds_to_wait) == ([], [], []):
+                        break
+
+                    connection.poll()
+
+                    while connection.notifies:
+                        notification = connection.notifies.pop(0)
+                        notifications.append({
+                            'channel': notification.channel,
+                            'payload': json.loads(notification.payload)
+                        })
+
+                    if notifications and batch_deadline is None:
+                        batch_deadline = time.monotonic() + batch_window
+
+                yield notifications
+
+        finally:
+            connection.close()
+
     def get_min_or_max_from_column(self, table_name: str, schema: str, min_or_max: str, column: str) -> Any:
         """
         Get the minimum or maximum value from a column in a postgres table.
@@ -252,6 +445,7 @@ class DatabaseConnection:
 
         return min_or_max_column[min_or_max].values[0]
 
+    @tracing.traced('database.is_value_already_in_table')
     def is_value_already_in_table(self, value: Any, table_name: str, schema: str, column: str) -> bool:
         """
         Check whether a value already exists in the column of a database table.
@@ -292,6 +486,7 @@ class DatabaseConnection:
         # Identify whether anything was returned
         return result
 
+    @tracing.traced('database.upload_dataframe')
     def upload_dataframe(
             self,
             dataframe: pd.DataFrame,
@@ -315,11 +510,104 @@ class DatabaseConnection:
         """
 
         self._create_connection()
+        self._create_engine()
 
         dataframe.to_sql(con=self._engine, name=table_name, schema=schema, **pandas_to_sql_kwargs)
 
         self._close_connection()
 
+        tracing.count('rows', len(dataframe))
+
+    @tracing.traced('database.copy_dataframe_to_table')
+    def copy_dataframe_to_table(self, dataframe: pd.DataFrame, table_name: str, schema: str) -> None:
+        """
+        Append the contents of a pandas DataFrame to an existing table with `COPY`, which streams every row in a single
+        statement and so is far quicker than `upload_dataframe` for large volumes of data. Missing values are stored as
+        NULL.
+
+        Parameters
+        ----------
+        dataframe : pandas DataFrame
+            Data to be appended, whose column names match columns of the target table.
+        table_name : str
+            Name of target table which will store the dataframe.
+        schema : str
+            Name of schema in which the target table sits.
+        """
+
+        csv_buffer = io.StringIO()
+        dataframe.to_csv(csv_buffer, index=False, header=False)
+        csv_buffer.seek(0)
+
+        sql_command = psy_sql.SQL("COPY {table} ({columns}) FROM STDIN WITH CSV;").format(
+            table=psy_sql.Identifier(schema, table_name),
+            columns=psy_sql.SQL(', ').join(psy_sql.Identifier(column) for column in dataframe.columns)
+        )
+
+        self._create_connection()
+
+        with self._conn.cursor() as curs:
+            curs.copy_expert(sql=sql_command.as_string(self._conn), file=csv_buffer)
+            self._conn.commit()
+
+        self._close_connection()
+
+        tracing.count('rows', len(dataframe))
+
+    @tracing.traced('database.upsert_dataframe_to_existing_table')
+    def upsert_dataframe_to_existing_table(
+            self,
+            dataframe: pd.DataFrame,
+            table_name: str,
+            schema: str,
+            id_column: str
+    ) -> None:
+        """
+        Write contents of a pandas DataFrame to an existing table on postgres database, inserting new rows and
+        overwriting existing rows which share the same ID.
+
+        Parameters
+        ----------
+        dataframe : pandas DataFrame
+            Data to be uploaded.
+        table_name : str
+            Name of target table which will store the dataframe.
+        schema : str (default None)
+            Name of schema in which the target table sits.
+        id_column : str
+            Primary key column in target table which identifies whether a row already exists.
+
+        Raises
+        ------
+        ValueError
+            If columns in the `dataframe` are not identical to the target `table_name`.
+        """
+
+        postgres_table_columns = self._get_column_names_existing_table(table_name=table_name, schema=schema)
+        columns_to_update = [column for column in postgres_table_columns if column != id_column]
+        staging_table_name = self._staging_table_name(table_name)
+
+        upsert_query = psy_sql.SQL("INSERT INTO {target_schema_and_table} "
+                                   "SELECT * FROM {staging_table_schema_and_table} "
+                                   "ON CONFLICT ({id_column}) DO UPDATE SET {updated_columns}").format(
+            target_schema_and_table=psy_sql.Identifier(schema, table_name),
+            staging_table_schema_and_table=psy_sql.Identifier(schema, staging_table_name),
+            id_column=psy_sql.Identifier(id_column),
+            updated_columns=psy_sql.SQL(', ').join(
+                psy_sql.SQL("{column} = EXCLUDED.{column}").format(column=psy_sql.Identifier(column))
+                for column in columns_to_update
+            )
+        )
+
+        self._transfer_dataframe_via_staging_table(
+            dataframe=dataframe,
+            table_name=table_name,
+            schema=schema,
+            staging_table_name=staging_table_name,
+            transfer_query=upsert_query
+        )
+
+    @tracing.traced('database.upload_new_data_only_to_existing_table')
     def upload_new_data_only_to_existing_table(
             self,
             dataframe: pd.DataFrame,
@@ -342,7 +630,76 @@ class DatabaseConnection:
         schema : str (default None)
             Name of schema in which the target table sits.
         id_column : str
-            Primary key column in target table which identifies whether a row already exists.
+            Primary key (or otherwise unique) column in target table which identifies whether a row already exists.
+
+        Raises
+        ------
+        ValueError
+            If columns in the `dataframe` are not identical to the target `table_name`.
+        """
+
+        staging_table_name = self._staging_table_name(table_name)
+
+        # Existing rows are skipped through the unique index on the id column, rather than comparing every new row
+        # against every id already in the table
+        insert_query = psy_sql.SQL("INSERT INTO {target_schema_and_table} "
+                                   "SELECT * FROM {staging_table_schema_and_table} "
+                                   "ON CONFLICT ({id_column}) DO NOTHING").format(
+            target_schema_and_table=psy_sql.Identifier(schema, table_name),
+            staging_table_schema_and_table=psy_sql.Identifier(schema, staging_table_name),
+            id_column=psy_sql.Identifier(id_column)
+        )
+
+        self._transfer_dataframe_via_staging_table(
+            dataframe=dataframe,
+            table_name=table_name,
+            schema=schema,
+            staging_table_name=staging_table_name,
+            transfer_query=insert_query
+        )
+
+    @staticmethod
+    def _staging_table_name(table_name: str) -> str:
+        """
+        Name of an intermediate table used to stage data before it is transferred to `table_name`. The name is unique
+        to each upload so that several processes can write to the same target table at once.
+
+        Parameters
+        ----------
+        table_name : str
+            Name of target table which will store the data.
+
+        Returns
+        -------
+        str
+            Name of the staging table.
+        """
+
+        return f"{table_name}_programmatic_staging_{uuid.uuid4().hex[:8]}"
+
+    def _transfer_dataframe_via_staging_table(
+            self,
+            dataframe: pd.DataFrame,
+            table_name: str,
+            schema: str,
+            staging_table_name: str,
+            transfer_query: psy_sql.Composable
+    ) -> None:
+        """
+        Upload a dataframe to an intermediate staging table, then move its rows into an existing target table.
+
+        Parameters
+        ----------
+        dataframe : pandas DataFrame
+            Data to be uploaded.
+        table_name : str
+            Name of target table which will store the dataframe.
+        schema : str
+            Name of schema in which the target table sits.
+        staging_table_name : str
+            Name of the intermediate table (in the same schema) used to stage the data.
+        transfer_query : psycopg2.sql.Composable
+            Statement which moves rows from the staging table into the target table.
 
         Raises
         ------
@@ -363,7 +720,6 @@ class DatabaseConnection:
         dataframe_reorganised_columns = dataframe.reindex(columns=postgres_table_columns)
 
         # Create staging table which will store data intermediately
-        staging_table_name = f"{table_name}_programmatic_staging"
         self.upload_dataframe(
             dataframe=dataframe_reorganised_columns,
             table_name=staging_table_name,
@@ -372,20 +728,11 @@ class DatabaseConnection:
         )
 
         try:
-            # Transfer new rows from staging to target table
-            insert_query = psy_sql.SQL("INSERT INTO {target_schema_and_table} "
-                                       "SELECT * FROM {staging_table_schema_and_table} "
-                                       "WHERE {id_column} NOT IN "
-                                       "(SELECT DISTINCT {id_column} FROM {target_schema_and_table})").format(
-                target_schema_and_table=psy_sql.Identifier(schema, table_name),
-                staging_table_schema_and_table=psy_sql.Identifier(schema, staging_table_name),
-                id_column=psy_sql.Identifier(id_column)
-            )
-
+            # Transfer rows from staging to target table
             self._create_connection()
 
             with self._conn.cursor() as curs:
-                curs.execute(query=insert_query)
+                curs.execute(query=transfer_query)
                 self._conn.commit()
 
             self._close_connection()
@@ -179,6 +179,58 @@ def test_get_dataframe_from_query_with_parameters():
     pd.testing.assert_frame_equal(left=actual, right=expected)
 
 
+def test_get_dataframe_in_chunks():
+    """The result of a query is retrieved in chunks, and other operations can be run in between chunks."""
+
+    db_connection = postgresql.DatabaseConnection()
+
+    chunks = []
+
+    for chunk in db_connection.get_dataframe_in_chunks(
+            query="SELECT example_integer, example_string FROM testing_schema.testing_table ORDER BY example_integer;",
+            chunk_size=1
+    ):
+        # Using the connection between chunks does not interrupt reading the rest of the result
+        db_connection.get_dataframe(query="SELECT 1;")
+        chunks.append(chunk)
+
+    expected_chunks = [
+        pd.DataFrame(columns=['example_integer', 'example_string'], data=[[1, 'First value']]),
+        pd.DataFrame(columns=['example_integer', 'example_string'], data=[[2, 'Second value']])
+    ]
+
+    assert len(chunks) == 2
+
+    for actual, expected in zip(chunks, expected_chunks):
+        pd.testing.assert_frame_equal(left=actual, right=expected)
+
+
+def test_listen_for_notifications():
+    """Notifications sent while listening are gathered into a batch, and an empty batch is yielded on timeout."""
+
+    db_connection = postgresql.DatabaseConnection()
+
+    notifications = db_connection.listen_for_notifications(channels=['testing_channel'], timeout=1, batch_window=0.5)
+
+    # The first batch marks the point from which notifications are received
+    assert next(notifications) == []
+
+    db_connection.execute_database_operation(
+        sql_command="""SELECT pg_notify('testing_channel', '{"id": 1}'),
+                              pg_notify('other_channel', '{"id": 2}'),
+                              pg_notify('testing_channel', '{"id": 3}');"""
+    )
+
+    assert next(notifications) == [
+        {'channel': 'testing_channel', 'payload': {'id': 1}},
+        {'channel': 'testing_channel', 'payload': {'id': 3}}
+    ]
+
+    assert next(notifications) == []
+
+    notifications.close()
+
+
 def test_get_min_or_max_from_column():
     """The minimum or maximum value from a column is returned."""
 
@@ -247,6 +299,32 @@ def test_upload_dataframe():
     pd.testing.assert_frame_equal(left=actual_df, right=expected_df)
 
 
+def test_copy_dataframe_to_table():
+    """Dataframe is appended to an existing table with COPY, with missing values stored as NULL."""
+
+    db_connection = postgresql.DatabaseConnection()
+
+    db_connection.execute_database_operation(
+        'CREATE TABLE testing_schema.copied_dataframe (col1 INT, col2 VARCHAR, col3 VARCHAR);'
+    )
+
+    # Columns are matched by name, so they do not need to be in the same order as the table
+    db_connection.copy_dataframe_to_table(
+        dataframe=pd.DataFrame(data={'col2': ['a, "quoted" value', None], 'col1': [1, 2]}),
+        table_name='copied_dataframe',
+        schema='testing_schema'
+    )
+
+    actual_df = db_connection.get_dataframe(query='SELECT * FROM testing_schema.copied_dataframe ORDER BY col1;')
+
+    # Tidy up
+    db_connection.execute_database_operation('DROP TABLE testing_schema.copied_dataframe;')
+
+    assert actual_df['col1'].tolist() == [1, 2]
+    assert actual_df['col2'].tolist() == ['a, "quoted" value', None]
+    assert actual_df['col3'].isnull().all()
+
+
 def test_upload_new_data_only_to_existing_table_inserts_new_rows_only():
     """Only new rows are inserted into an existing table."""
 
@@ -342,3 +420,47 @@ def test_upload_new_data_only_to_existing_table_raises_exception_with_different_
             schema='testing_schema',
             id_column='example_integer'
         )
+
+
+def test_upsert_dataframe_to_existing_table():
+    """New rows are inserted and existing rows which share the same ID are overwritten."""
+
+    db_connection = postgresql.DatabaseConnection()
+
+    # Table with a primary key so conflicting rows can be identified
+    db_connection.execute_database_operation(
+        "CREATE TABLE testing_schema.upsert_table (example_integer INT PRIMARY KEY, example_string VARCHAR);"
+        "INSERT INTO testing_schema.upsert_table VALUES (1, 'Original value');"
+    )
+
+    rows_to_upsert = pd.DataFrame(data={
+        'example_string': ['Overwritten value', 'New value'],
+        'example_integer': [1, 2]
+    })
+
+    db_connection.upsert_dataframe_to_existing_table(
+        dataframe=rows_to_upsert,
+        table_name='upsert_table',
+        schema='testing_schema',
+        id_column='example_integer'
+    )
+
+    expected_df = pd.DataFrame(data={
+        'example_integer': [1, 2],
+        'example_string': ['Overwritten value', 'New value']
+    })
+
+    db_connection._create_connection()
+    with db_connection._conn.cursor() as cursor:
+        cursor.execute('SELECT * FROM testing_schema.upsert_table ORDER BY example_integer;')
+
+        table_tuples = cursor.fetchall()
+        actual_df = pd.DataFrame(table_tuples, columns=['example_integer', 'example_string'])
+
+        # Tidy up
+        cursor.execute('DROP TABLE testing_schema.upsert_table;')
+        db_connection._conn.commit()
+
+    db_connection._close_connection()
+
+    pd.testing.assert_frame_equal(left=actual_df, right=expected_df)
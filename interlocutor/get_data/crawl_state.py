@@ -0,0 +1,330 @@
+"""Persist the progress of crawling article content so that an interrupted crawl can resume where it stopped."""
+
+# Standard libraries
+import os
+import socket
+from typing import Dict, Iterator
+
+# Third party libraries
+import pandas as pd
+from psycopg2 import sql as psy_sql
+
+# Internal imports
+from interlocutor.commons import metrics
+from interlocutor.database import postgresql
+
+
+class CrawlStateTracker:
+    """
+    Record the state of every article URL that needs crawling in the `crawl_state` table of a publication's schema.
+
+    Each URL moves from 'pending' to 'fetched' (a response was received) to 'parsed' (its content was extracted and
+    stored), or to 'failed' along with the error encountered. URLs which failed are attempted again on later runs, but
+    only after any URLs which have not been attempted yet, and only up to a maximum number of attempts.
+
+    The table also acts as a queue shared between crawler workers: each worker claims (leases) a batch of URLs at a
+    time, so several processes or containers can crawl the same publication in parallel without fetching a URL twice.
+    """
+
+    def __init__(self, schema: str, db_connection: postgresql.DatabaseConnection, worker_id: str = None):
+        """
+        Initialise attributes of class.
+
+        Parameters
+        ----------
+        schema : str
+            Name of the publication schema whose `crawl_state` table tracks progress e.g. 'daily_mail'.
+        db_connection : interlocutor.database.postgresql.DatabaseConnection
+            Connection to the database holding the crawl state.
+        worker_id : str (default None)
+            Name identifying this worker in the claims it makes. Defaults to the hostname and process ID.
+        """
+
+        self.worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}'
+        self._schema = schema
+        self._db_connection = db_connection
+        self._crawl_state_table = psy_sql.Identifier(schema, 'crawl_state')
+
+    def register_urls(self, source_table: str, id_column: str, url_column: str, priority_column: str = None) -> None:
+        """
+        Add any URLs which are not already being tracked. URLs whose content is already stored in the publication's
+        `article_content` table are registered as 'parsed' rather than 'pending', including URLs already being tracked
+        whose content has since been stored some other way (e.g. by an older crawler), so they are not crawled again.
+
+        Parameters
+        ----------
+        source_table : str
+            Table within the publication's schema listing the article URLs to crawl e.g. 'columnist_article_links'.
+        id_column : str
+            Column of `source_table` holding the unique identifier of each article, matching `article_content.id`.
+        url_column : str
+            Column of `source_table` holding the URL to crawl.
+        priority_column : str (default None)
+            Column of `source_table` holding when each article was published e.g. 'web_publication_timestamp'. Newer
+            articles are claimed first, and articles without one are claimed last.
+        """
+
+        sql_command = psy_sql.SQL("""
+            INSERT INTO {crawl_state} AS tracked
+                (article_id, url, priority, state, attempts, last_error, updated_timestamp)
+            SELECT
+                source.{id_column},
+                source.{url_column},
+                {priority},
+                CASE WHEN content.id IS NULL THEN 'pending' ELSE 'parsed' END,
+                0,
+                NULL,
+                NOW()
+            FROM {source_table} source
+                LEFT JOIN {content_table} content
+                    ON source.{id_column} = content.id
+            ON CONFLICT (article_id) DO UPDATE
+                SET state = 'parsed',
+                    last_error = NULL,
+                    updated_timestamp = NOW(),
+                    leased_by = NULL,
+                    lease_expires = NULL
+                WHERE EXCLUDED.state = 'parsed' AND tracked.state <> 'parsed';
+            """).format(
+            crawl_state=self._crawl_state_table,
+            id_column=psy_sql.Identifier(id_column),
+            url_column=psy_sql.Identifier(url_column),
+            priority=psy_sql.Identifier('source', priority_column) if priority_column else psy_sql.SQL('NULL'),
+            source_table=psy_sql.Identifier(self._schema, source_table),
+            content_table=psy_sql.Identifier(self._schema, 'article_content')
+        )
+
+        self._db_connection.execute_database_operation(sql_command=sql_command)
+
+    def claim_batch(
+            self,
+            batch_size: int = 20,
+            lease_seconds: int = 600,
+            max_attempts: int = 3,
+            retry_delay_seconds: int = 300
+    ) -> pd.DataFrame:
+        """
+        Claim a batch of URLs which still need crawling, so that no other worker crawls them at the same time. Rows
+        already locked by another worker's claim are skipped rather than waited on, and a claim lapses after
+        `lease_seconds` so the URLs of a worker which died are eventually picked up by others.
+
+        URLs which have never been attempted come first, so repeatedly failing URLs do not block the rest of the crawl,
+        followed by the most recently published (see `register_urls`).
+
+        Parameters
+        ----------
+        batch_size : int (default 20)
+            Maximum number of URLs to claim.
+        lease_seconds : int (default 600)
+            How long the claim lasts before other workers may claim the URLs.
+        max_attempts : int (default 3)
+            URLs which have been attempted this many times without being parsed are no longer retried.
+        retry_delay_seconds : int (default 300)
+            How long to wait after a URL failed before it may be claimed again.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The 'article_id' and 'url' of every article claimed, which is empty once there is nothing left to crawl.
+        """
+
+        sql_command = psy_sql.SQL("""
+            UPDATE {crawl_state} target
+            SET leased_by = %(worker_id)s,
+                lease_expires = NOW() + MAKE_INTERVAL(secs => %(lease_seconds)s)
+            FROM (
+                SELECT article_id
+                FROM {crawl_state}
+                WHERE (
+                        state = 'pending'
+                        OR (state = 'fetched' AND attempts < %(max_attempts)s)
+                        OR (
+                            state = 'failed'
+                            AND attempts < %(max_attempts)s
+                            AND updated_timestamp < NOW() - MAKE_INTERVAL(secs => %(retry_delay_seconds)s)
+                        )
+                    )
+                    AND (lease_expires IS NULL OR lease_expires < NOW())
+                ORDER BY attempts, priority DESC NULLS LAST, updated_timestamp
+                LIMIT %(batch_size)s
+                FOR UPDATE SKIP LOCKED
+            ) claimable
+            WHERE target.article_id = claimable.article_id
+            RETURNING target.article_id, target.url;
+            """).format(crawl_state=self._crawl_state_table)
+
+        return self._db_connection.execute_database_operation_returning_rows(
+            sql_command=sql_command,
+            params={
+                'worker_id': self.worker_id,
+                'lease_seconds': lease_seconds,
+                'max_attempts': max_attempts,
+                'retry_delay_seconds': retry_delay_seconds,
+                'batch_size': batch_size
+            }
+        )
+
+    def count_remaining(self, max_attempts: int = 3) -> int:
+        """
+        Count the URLs which still need crawling, whether or not they are currently claimed or waiting to be retried.
+
+        Parameters
+        ----------
+        max_attempts : int (default 3)
+            URLs which have been attempted this many times without being parsed are no longer counted.
+
+        Returns
+        -------
+        int
+            Number of URLs left to crawl.
+        """
+
+        query = psy_sql.SQL("""
+            SELECT COUNT(*) AS remaining
+            FROM {crawl_state}
+            WHERE state = 'pending' OR (state IN ('fetched', 'failed') AND attempts < %(max_attempts)s);
+            """).format(crawl_state=self._crawl_state_table)
+
+        df_remaining = self._db_connection.get_dataframe(query=query, query_params={'max_attempts': max_attempts})
+
+        return int(df_remaining['remaining'].iloc[0])
+
+    def claim_batches(
+            self,
+            batch_size: int = 20,
+            number_of_articles: int = None,
+            **claim_kwargs
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Claim batches of URLs one after another until there is nothing left to crawl.
+
+        Parameters
+        ----------
+        batch_size : int (default 20)
+            Number of URLs claimed at a time. Smaller batches spread work more evenly across workers.
+        number_of_articles : int (default None)
+            Maximum number of URLs to claim in total. URLs are claimed until none are left if not provided.
+        **claim_kwargs
+            Further arguments passed to `claim_batch` e.g. `lease_seconds`.
+
+        Yields
+        ------
+        pandas.DataFrame
+            The 'article_id' and 'url' of every article in the next batch claimed (see `claim_batch`), never empty.
+        """
+
+        articles_claimed = 0
+
+        while number_of_articles is None or articles_claimed < number_of_articles:
+            if number_of_articles is not None:
+                batch_size = min(batch_size, number_of_articles - articles_claimed)
+
+            df_batch = self.claim_batch(batch_size=batch_size, **claim_kwargs)
+
+            if df_batch.empty:
+                return
+
+            articles_claimed += len(df_batch)
+
+            yield df_batch
+
+    def claim_articles(self, batch_size: int = 20, number_of_articles: int = None, **claim_kwargs) -> Iterator[Dict]:
+        """
+        Claim batches of URLs one after another until there is nothing left to crawl, one article at a time.
+
+        Parameters
+        ----------
+        batch_size : int (default 20)
+            Number of URLs claimed at a time. Smaller batches spread work more evenly across workers.
+        number_of_articles : int (default None)
+            Maximum number of URLs to claim in total. URLs are claimed until none are left if not provided.
+        **claim_kwargs
+            Further arguments passed to `claim_batch` e.g. `lease_seconds`.
+
+        Yields
+        ------
+        dict
+            The 'article_id' and 'url' of the next article to crawl.
+        """
+
+        for df_batch in self.claim_batches(
+                batch_size=batch_size,
+                number_of_articles=number_of_articles,
+                **claim_kwargs
+        ):
+            yield from df_batch.to_dict(orient='records')
+
+    def _update_state(self, article_id: str, state: str, error: str = None) -> None:
+        """
+        Record the latest state of an article.
+
+        Parameters
+        ----------
+        article_id : str
+            Unique identifier of the article.
+        state : str ('fetched', 'parsed' or 'failed')
+            New state of the article.
+        error : str (default None)
+            Description of the error encountered, only relevant if the article failed.
+        """
+
+        sql_command = psy_sql.SQL("""
+            UPDATE {crawl_state}
+            SET state = %(state)s,
+                -- An attempt is counted once a response is received, or on failure if no response was received
+                attempts = attempts + CASE
+                    WHEN %(state)s = 'fetched' OR (%(state)s = 'failed' AND state <> 'fetched') THEN 1
+                    ELSE 0
+                END,
+                last_error = %(error)s,
+                updated_timestamp = NOW(),
+                -- The claim is released once the article has been parsed or has failed
+                leased_by = CASE WHEN %(state)s = 'fetched' THEN leased_by END,
+                lease_expires = CASE WHEN %(state)s = 'fetched' THEN lease_expires END
+            WHERE article_id = %(article_id)s;
+            """).format(crawl_state=self._crawl_state_table)
+
+        self._db_connection.execute_database_operation(
+            sql_command=sql_command,
+            params={'article_id': article_id, 'state': state, 'error': error}
+        )
+
+        metrics.ARTICLES_PROCESSED.inc(publication=self._schema, stage=state)
+
+    def mark_fetched(self, article_id: str) -> None:
+        """
+        Record that a response was received for an article, which counts as an attempt to crawl it.
+
+        Parameters
+        ----------
+        article_id : str
+            Unique identifier of the article.
+        """
+
+        self._update_state(article_id=article_id, state='fetched')
+
+    def mark_parsed(self, article_id: str) -> None:
+        """
+        Record that the content of an article has been extracted and stored.
+
+        Parameters
+        ----------
+        article_id : str
+            Unique identifier of the article.
+        """
+
+        self._update_state(article_id=article_id, state='parsed')
+
+    def mark_failed(self, article_id: str, error: Exception) -> None:
+        """
+        Record that an article could not be crawled, and why.
+
+        Parameters
+        ----------
+        article_id : str
+            Unique identifier of the article.
+        error : Exception
+            Exception raised while fetching or parsing the article.
+        """
+
+        self._update_state(article_id=article_id, state='failed', error=f'{type(error).__name__}: {error}')
@@ -1,9 +1,9 @@
 """Crawl the Daily Mail website and download article metadata/content."""
 
 # Standard libraries
+import argparse
 import hashlib
-import time
-from typing import Dict, List, Tuple
+from typing import Dict, List, Set, Tuple
 from urllib import parse
 
 # Third party libraries
@@ -13,7 +13,12 @@ import requests
 import tqdm
 
 # Internal imports
+from interlocutor.commons import rate_control, tracing
 from interlocutor.database import postgresql
+from interlocutor.get_data import crawl_state
+from interlocutor.get_data import feed_discovery
+from interlocutor.get_data import http_cache
+from interlocutor.pipeline import monitoring
 
 
 class ArticleDownloader:
@@ -21,14 +26,36 @@ class ArticleDownloader:
     Crawl the Daily Mail website and capture information about the articles in its Columnists section.
     """
 
-    def __init__(self):
+    def __init__(self, rate_controller: rate_control.RateController = None):
+        """
+        Parameters
+        ----------
+        rate_controller : interlocutor.commons.rate_control.RateController (default None)
+            Controls the rate of requests sent to the website. A controller with the default settings is used if not
+            provided.
+        """
 
         self._base_url = 'https://www.dailymail.co.uk'
         self._columnist_section_url = 'https://www.dailymail.co.uk/columnists/index.html'
+        self._feed_urls = [
+            'https://www.dailymail.co.uk/columnists/index.rss',
+            'https://www.dailymail.co.uk/debate/index.rss'
+        ]
         self._db_connection = postgresql.DatabaseConnection()
+        self._crawl_state = crawl_state.CrawlStateTracker(schema='daily_mail', db_connection=self._db_connection)
+        self._rate_controller = rate_controller or rate_control.RateController()
+        self._http_cache = http_cache.ConditionalGetCache(
+            schema='daily_mail',
+            db_connection=self._db_connection,
+            rate_controller=self._rate_controller
+        )
+        self._feed_discovery = feed_discovery.FeedDiscoverer(
+            feed_urls=self._feed_urls,
+            article_url_pattern=r'^https://www\.dailymail\.co\.uk/.+/article-\d+/',
+            rate_controller=self._rate_controller
+        )
 
-    @staticmethod
-    def _get_article_title_and_content(url) -> Tuple[str, str]:
+    def _get_article_title_and_content(self, url) -> Tuple[str, str]:
         """
         Extract the title and content of an article based on its URL.
 
@@ -43,9 +70,28 @@ class ArticleDownloader:
             Title of article and its text content.
         """
 
-        article_page = requests.get(url)
+        article_page = self._rate_controller.get(url)
+
+        return self._parse_article_title_and_content(article_page_content=article_page.content)
+
+    @staticmethod
+    @tracing.traced('daily_mail.parse_article')
+    def _parse_article_title_and_content(article_page_content: bytes) -> Tuple[str, str]:
+        """
+        Extract the title and content of an article from its html page.
+
+        Parameters
+        ----------
+        article_page_content : bytes
+            Raw html of the Daily Mail article page.
+
+        Returns
+        -------
+        tuple
+            Title of article and its text content.
+        """
 
-        article_soup = BeautifulSoup(markup=article_page.content, features="html.parser")
+        article_soup = BeautifulSoup(markup=article_page_content, features="html.parser")
 
         # Extract title, which needs parsing as it follows convention '<Author>: <Title> | Daily Mail Online'
         title = article_soup.find("title").getText()
@@ -69,10 +115,14 @@ class ArticleDownloader:
         Returns
         -------
         dict
-            Key: Columnist name, Value: URL for columnist's homepage.
+            Key: Columnist name, Value: URL for columnist's homepage. Empty if the page has not changed since it was
+            last crawled.
         """
 
-        columnists_homepage = requests.get(self._columnist_section_url)
+        columnists_homepage = self._http_cache.get(self._columnist_section_url)
+
+        if columnists_homepage is None:
+            return {}
 
         columnists_homepage_soup = BeautifulSoup(markup=columnists_homepage.content, features="html.parser")
 
@@ -96,26 +146,114 @@ class ArticleDownloader:
 
         return columnists
 
-    def _get_recent_article_links(self, homepage: str) -> List[str]:
+    def _get_recent_article_links(
+            self,
+            homepage: str,
+            known_article_ids: Set[str] = None,
+            max_pages: int = 1
+    ) -> List[str]:
         """
-        Extracts the links to recent articles published by a columnist.
+        Extracts the links to recent articles published by a columnist, paging back through their archive (newest
+        first) and stopping at the first page which includes an article that is already stored.
 
         Parameters
         ----------
         homepage : str
             URL to the columnist's homepage.
+        known_article_ids : set (default None)
+            IDs (hashed URLs) of the articles already stored in daily_mail.columnist_article_links.
+        max_pages : int (default 1)
+            Maximum number of archive pages to read. If None, pages are read until reaching a known article or the end
+            of the archive.
+
+        Returns
+        -------
+        list
+            URLs for the recent articles by columnist which are not already known, newest first. Empty if the homepage
+            has not changed since it was last crawled.
+        """
+
+        known_article_ids = known_article_ids or set()
+        article_links = {}
+        page_number = 1
+
+        while max_pages is None or page_number <= max_pages:
+
+            page_links = self._get_archive_page_article_links(homepage=homepage, page_number=page_number)
+
+            new_links = {}
+
+            for url in page_links:
+                article_id = hashlib.md5(url.encode('utf-8')).hexdigest()
+
+                if article_id not in known_article_ids and article_id not in article_links:
+                    new_links[article_id] = url
+
+            article_links.update(new_links)
+
+            # Older articles were discovered by a previous run if this page includes a known article, and the archive
+            # has run out if the page has no new articles
+            if len(new_links) < len(page_links) or not page_links:
+                break
+
+            page_number += 1
+
+        return list(article_links.values())
+
+    def _get_archive_page_article_links(self, homepage: str, page_number: int) -> List[str]:
+        """
+        Extracts the links to articles listed on one page of a columnist's archive.
+
+        Parameters
+        ----------
+        homepage : str
+            URL to the columnist's homepage, which is the first page of their archive.
+        page_number : int
+            Page of the archive, starting from 1 for the newest articles.
+
+        Returns
+        -------
+        list
+            URLs for the articles listed on the page. Empty if the page does not exist, or if it is the homepage and it
+            has not changed since it was last crawled.
+        """
+
+        if page_number == 1:
+            archive_page = self._http_cache.get(homepage)
+
+            if archive_page is None:
+                return []
+
+        else:
+            archive_page = self._rate_controller.get(homepage, params={'pageOffset': page_number})
+
+            if archive_page.status_code != 200:
+                return []
+
+        return self._parse_article_links(archive_page_content=archive_page.content)
+
+    @tracing.traced('daily_mail.parse_archive_page')
+    def _parse_article_links(self, archive_page_content: bytes) -> List[str]:
+        """
+        Extracts the links to articles from the HTML of a page in a columnist's archive.
+
+        Parameters
+        ----------
+        archive_page_content : bytes
+            Raw content of the archive page.
 
         Returns
         -------
         list
-            URLs for the most recent articles by columnist.
+            URLs for the articles listed on the page, in the order they appear.
         """
 
-        columnist_homepage = requests.get(homepage)
+        parsed_page = BeautifulSoup(markup=archive_page_content, features="html.parser")
 
-        parsed_homepage = BeautifulSoup(markup=columnist_homepage.content, features="html.parser")
+        articles_section = parsed_page.find("div", {"class": "columnist-archive-page link-box linkro-darkred"})
 
-        articles_section = parsed_homepage.find("div", {"class": "columnist-archive-page link-box linkro-darkred"})
+        if articles_section is None:
+            return []
 
         potential_articles = articles_section.findAll(name="a")
 
@@ -130,8 +268,9 @@ class ArticleDownloader:
                 article_links.append(parse.urljoin(base=self._base_url, url=href))
 
         # Avoid duplicates
-        return list(set(article_links))
+        return list(dict.fromkeys(article_links))
 
+    @tracing.traced('daily_mail.record_columnist_home_pages')
     def record_columnist_home_pages(self) -> None:
         """
         Crawl the name of columnists and their homepage, then write to postgres.
@@ -139,6 +278,12 @@ class ArticleDownloader:
 
         columnists_and_pages = self._get_columnist_homepages()
 
+        if not columnists_and_pages:
+            print('Page listing columnists has not changed since it was last crawled.')
+            self._http_cache.report_statistics()
+            self._rate_controller.report_statistics()
+            return
+
         df_columnists_and_pages = pd.DataFrame.from_dict(data=columnists_and_pages, orient='index').reset_index()
         df_columnists_and_pages.columns = ['columnist', 'homepage']
 
@@ -149,59 +294,106 @@ class ArticleDownloader:
             id_column='columnist'
         )
 
+        self._http_cache.save_validators()
+        self._http_cache.report_statistics()
+        self._rate_controller.report_statistics()
+
+    @tracing.traced('daily_mail.record_columnists_recent_article_content')
     def record_columnists_recent_article_content(self) -> None:
         """
         For all of the articles in daily_mail.columnist_recent_article_links table, extract the text content of those
-        articles and write to database.
+        articles and write to database. Progress is tracked in daily_mail.crawl_state so an interrupted crawl resumes
+        where it stopped, and articles which fail are retried on later runs without blocking the others. Several
+        workers can run this at once, each claiming different articles from the daily_mail.crawl_state queue.
         """
 
-        # Find articles that have not already been scraped
-        author_and_recent_article_links = self._db_connection.get_dataframe(
-            query="""
-            SELECT * 
-            FROM daily_mail.columnist_article_links 
-            WHERE article_id NOT IN (SELECT id FROM daily_mail.article_content);
-            """
+        # Track progress in the database so an interrupted crawl resumes where it stopped
+        self._crawl_state.register_urls(
+            source_table='columnist_article_links',
+            id_column='article_id',
+            url_column='url'
         )
 
-        for url in tqdm.tqdm(
+        # Claim articles in small batches so other crawler workers can share the work without fetching duplicates
+        for article in tqdm.tqdm(
                 desc='Daily Mail article content retrieved',
-                iterable=author_and_recent_article_links['url'].values,
-                total=len(author_and_recent_article_links['url'].values),
+                iterable=self._crawl_state.claim_articles(),
                 unit=' article'
         ):
-            title, content = self._get_article_title_and_content(url=url)
-
-            data_for_database = pd.DataFrame(data={
-                'id': [hashlib.md5(url.encode('utf-8')).hexdigest()],
-                'url': [url],
-                'title': [title],
-                'content': [content]
-            })
-
-            self._db_connection.upload_new_data_only_to_existing_table(
-                dataframe=data_for_database,
-                table_name='article_content',
-                schema='daily_mail',
-                id_column='id'
-            )
-
-    def record_columnists_recent_article_links(self) -> None:
+            article_id, url = article['article_id'], article['url']
+
+            try:
+                article_page = self._rate_controller.get(url)
+                article_page.raise_for_status()
+                self._crawl_state.mark_fetched(article_id)
+
+                title, content = self._parse_article_title_and_content(article_page_content=article_page.content)
+
+                data_for_database = pd.DataFrame(data={
+                    'id': [article_id],
+                    'url': [url],
+                    'title': [title],
+                    'content': [content]
+                })
+
+                self._db_connection.upload_new_data_only_to_existing_table(
+                    dataframe=data_for_database,
+                    table_name='article_content',
+                    schema='daily_mail',
+                    id_column='id'
+                )
+
+                self._crawl_state.mark_parsed(article_id)
+                tracing.count('articles')
+
+            # Record the failure (the page may have been unavailable or had an unexpected structure) but carry on with
+            # the rest of the batch
+            except (requests.exceptions.RequestException, AttributeError, KeyError, TypeError) as crawl_error:
+                print(f'Error retrieving contents for article {url}: {crawl_error}')
+                self._crawl_state.mark_failed(article_id=article_id, error=crawl_error)
+                tracing.count('failed_articles')
+
+    @tracing.traced('daily_mail.record_columnists_recent_article_links')
+    def record_columnists_recent_article_links(self, max_pages: int = None) -> None:
         """
         For all of the columnists in daily_mail.columnists table, extract the links to recent articles published by each
         columnist and write to database.
+
+        Each columnist's archive is read newest first until reaching an article which is already stored, so the first
+        run backfills the whole archive and later runs usually only read the first page.
+
+        Parameters
+        ----------
+        max_pages : int (default None)
+            Maximum number of archive pages to read per columnist. If None, pages are read until reaching a known
+            article or the end of the archive.
         """
 
         authors_and_homepage = self._db_connection.get_dataframe(table_name='columnists', schema='daily_mail')
         authors_and_homepage = authors_and_homepage.to_dict(orient='records')
 
+        # Load every stored article up front rather than checking the database for each link found
+        known_article_ids = set(self._db_connection.get_dataframe(
+            query='SELECT article_id FROM daily_mail.columnist_article_links;'
+        )['article_id'].values)
+
         for author_page in authors_and_homepage:
 
             author = author_page['columnist']
             homepage = author_page['homepage']
 
-            article_urls = self._get_recent_article_links(homepage)
+            article_urls = self._get_recent_article_links(
+                homepage=homepage,
+                known_article_ids=known_article_ids,
+                max_pages=max_pages
+            )
+
+            if not article_urls:
+                print(f'No new articles by columnist {author} since the last crawl.')
+                continue
+
             hashed_urls = [hashlib.md5(val.encode('utf-8')).hexdigest() for val in article_urls]
+            known_article_ids.update(hashed_urls)
 
             print(f'Gathering links for recent articles by Daily Mail columnist {author}')
             recent_articles = pd.DataFrame(data={
@@ -217,20 +409,80 @@ class ArticleDownloader:
                 id_column='article_id'
             )
 
-            # Be polite, do not bombard API with too many requests at once
-            time.sleep(0.5)
+        self._http_cache.save_validators()
+        self._http_cache.report_statistics()
+        self._rate_controller.report_statistics()
+
+    @tracing.traced('daily_mail.record_columnists_recent_article_links_from_feeds')
+    def record_columnists_recent_article_links_from_feeds(self) -> None:
+        """
+        For all of the columnists in daily_mail.columnists table, extract the links to recent articles published by each
+        columnist from the paper's RSS feeds and write to database.
+
+        An alternative to `record_columnists_recent_article_links` which reads a few compact feeds instead of every
+        columnist's homepage, at the cost of only finding articles which are still listed in the feeds.
+        """
+
+        columnists = self._db_connection.get_dataframe(table_name='columnists', schema='daily_mail')
+        columnists = columnists['columnist'].tolist()
+
+        article_links = self._feed_discovery.get_columnist_article_links(columnists=columnists)
+
+        if article_links:
+            print(f'Gathering links for {len(article_links)} recent articles by Daily Mail columnists from feeds')
+            recent_articles = pd.DataFrame(data={
+                'columnist': list(article_links.values()),
+                'article_id': [hashlib.md5(url.encode('utf-8')).hexdigest() for url in article_links],
+                'url': list(article_links)
+            })
+
+            self._db_connection.upload_new_data_only_to_existing_table(
+                dataframe=recent_articles,
+                table_name='columnist_article_links',
+                schema='daily_mail',
+                id_column='article_id'
+            )
+
+        else:
+            print('No articles by columnists found in feeds.')
+
+        self._rate_controller.report_statistics()
 
 
 if __name__ == '__main__':  # pragma: no cover (exclude from testing coverage report)
 
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--discovery',
+        choices=['homepages', 'feeds'],
+        default='homepages',
+        help="Find new articles by crawling each columnist's homepage, or from the paper's RSS feeds."
+    )
+    parser.add_argument(
+        '--metrics-port',
+        type=int,
+        help='Serve live metrics in the Prometheus text format on this port e.g. 9101 (not served by default)'
+    )
+    arguments = parser.parse_args()
+
+    tracing.start_run(run_name='daily_mail')
+
+    if arguments.metrics_port is not None:
+        monitoring.start_metrics_server(port=arguments.metrics_port)
+
     print('Initialising class for downloading article metadata and content from The Daily Mail')
     article_downloader = ArticleDownloader()
 
     print('Retrieving the names of columnists and their homepages')
     article_downloader.record_columnist_home_pages()
 
-    print('Retrieving the links to recent articles published by columnists')
-    article_downloader.record_columnists_recent_article_links()
+    if arguments.discovery == 'feeds':
+        print('Retrieving the links to recent articles published by columnists from RSS feeds')
+        article_downloader.record_columnists_recent_article_links_from_feeds()
+
+    else:
+        print('Retrieving the links to recent articles published by columnists')
+        article_downloader.record_columnists_recent_article_links()
 
     print('Retrieving the text content of recent articles')
     article_downloader.record_columnists_recent_article_content()
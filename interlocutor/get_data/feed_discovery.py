@@ -0,0 +1,177 @@
+"""Discover articles by columnists from a publication's RSS feeds and XML sitemaps, rather than crawling HTML pages."""
+
+# Standard libraries
+import contextlib
+import re
+from typing import BinaryIO, Dict, Iterator, List, Optional
+from xml.etree import ElementTree
+
+# Internal imports
+from interlocutor.commons import rate_control
+
+# Key: element holding one entry in the feed, Value: child element holding the entry's URL. RSS feeds list <item>
+# elements and sitemaps list <url> elements
+_ENTRY_URL_ELEMENTS = {'item': 'link', 'url': 'loc'}
+
+# Child elements of an RSS <item> which may name the writer e.g. <dc:creator> or <author>
+_AUTHOR_ELEMENTS = {'creator', 'author'}
+
+
+class FeedDiscoverer:
+    """
+    Read a publication's RSS feeds and XML sitemaps with a streaming parser, keeping the links to articles written by
+    known columnists. A handful of compact feeds replaces fetching and parsing every columnist's homepage.
+    """
+
+    def __init__(self, feed_urls: List[str], article_url_pattern: str, rate_controller: rate_control.RateController):
+        """
+        Initialise attributes of class.
+
+        Parameters
+        ----------
+        feed_urls : list
+            URLs of the RSS feeds and/or XML sitemaps to read.
+        article_url_pattern : str
+            Regular expression which the URL of an opinion/columnist article matches, so that links to other sections
+            of the website are ignored.
+        rate_controller : interlocutor.commons.rate_control.RateController
+            Controls the rate of requests sent to the website.
+        """
+
+        self._feed_urls = feed_urls
+        self._article_url_pattern = re.compile(article_url_pattern)
+        self._rate_controller = rate_controller
+
+    @staticmethod
+    def _get_local_name(tag: str) -> str:
+        """Remove the namespace from the tag of an XML element e.g. '{http://purl.org/dc/elements/1.1/}creator'."""
+
+        return tag.rsplit('}', 1)[-1]
+
+    @classmethod
+    def _parse_entries(cls, feed: BinaryIO) -> Iterator[Dict[str, Optional[str]]]:
+        """
+        Extract the URL and author of each entry in an RSS feed or XML sitemap, parsing the XML as it is read so the
+        whole document is never held in memory.
+
+        Parameters
+        ----------
+        feed : file-like object
+            Raw XML of the RSS feed or sitemap.
+
+        Yields
+        ------
+        dict
+            'url' of the entry, and its 'author' (None if the feed does not name one, as with sitemaps).
+        """
+
+        for _, element in ElementTree.iterparse(feed, events=('end',)):
+
+            entry_type = cls._get_local_name(element.tag)
+
+            if entry_type not in _ENTRY_URL_ELEMENTS:
+                continue
+
+            url = author = None
+
+            for child in element:
+                child_name = cls._get_local_name(child.tag)
+
+                if child_name == _ENTRY_URL_ELEMENTS[entry_type] and child.text:
+                    url = child.text.strip()
+
+                elif child_name in _AUTHOR_ELEMENTS and child.text:
+                    author = child.text.strip()
+
+            # Discard the entry once read so memory use does not grow with the size of the feed
+            element.clear()
+
+            if url:
+                yield {'url': url, 'author': author}
+
+    @staticmethod
+    def _normalise_name(name: str) -> str:
+        """Reduce a name to lowercase words joined by hyphens e.g. 'PETER HITCHENS:' -> 'peter-hitchens'."""
+
+        return '-'.join(re.findall(r'[a-z0-9]+', name.lower()))
+
+    @classmethod
+    def _match_columnist(cls, url: str, author: Optional[str], columnists: List[str]) -> Optional[str]:
+        """
+        Find which columnist wrote an article, based on the author named in the feed or failing that the URL (the
+        Daily Mail includes the columnist's name in their articles' URLs). Names must match whole words.
+
+        Parameters
+        ----------
+        url : str
+            URL of the article.
+        author : str
+            Author named in the feed, if any.
+        columnists : list
+            Names of the known columnists.
+
+        Returns
+        -------
+        str
+            Name of the columnist as given in `columnists`, or None if the article was not written by any of them.
+        """
+
+        # Hyphens are added at either end so names only match whole words e.g. 'ian-birrell' does not match
+        # 'brian-birrell'
+        normalised_author = f'-{cls._normalise_name(author)}-' if author else ''
+        normalised_url = f'-{cls._normalise_name(url)}-'
+
+        for columnist in columnists:
+            normalised_columnist = cls._normalise_name(columnist)
+
+            # Names with no letters or digits would match every article
+            if not normalised_columnist:
+                continue
+
+            normalised_columnist = f'-{normalised_columnist}-'
+
+            if normalised_columnist in normalised_author or normalised_columnist in normalised_url:
+                return columnist
+
+        return None
+
+    def get_columnist_article_links(self, columnists: List[str]) -> Dict[str, str]:
+        """
+        Read every feed and collect the links to articles written by known columnists.
+
+        Parameters
+        ----------
+        columnists : list
+            Names of the known columnists.
+
+        Returns
+        -------
+        dict
+            Key: URL of the article, Value: name of the columnist who wrote it, in the order they appear in the feeds.
+        """
+
+        article_links = {}
+
+        for feed_url in self._feed_urls:
+
+            # Streamed responses hold on to their connection until closed, including those which are not read
+            with contextlib.closing(self._rate_controller.get(feed_url, stream=True)) as feed:
+
+                if feed.status_code != 200:
+                    print(f'Unable to read feed {feed_url}: status code {feed.status_code}')
+                    continue
+
+                # Undo any compression applied in transit while reading the feed as a stream
+                feed.raw.decode_content = True
+
+                for entry in self._parse_entries(feed=feed.raw):
+
+                    if entry['url'] in article_links or not self._article_url_pattern.search(entry['url']):
+                        continue
+
+                    columnist = self._match_columnist(url=entry['url'], author=entry['author'], columnists=columnists)
+
+                    if columnist is not None:
+                        article_links[entry['url']] = columnist
+
+        return article_links
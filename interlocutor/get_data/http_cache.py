@@ -0,0 +1,155 @@
+"""Avoid re-downloading and re-parsing web pages which have not changed since they were last crawled."""
+
+# Standard libraries
+import time
+from typing import Dict, Union
+
+# Third party libraries
+import pandas as pd
+import requests
+
+# Internal imports
+from interlocutor.commons import metrics
+from interlocutor.commons import rate_control
+from interlocutor.database import postgresql
+
+
+class ConditionalGetCache:
+    """
+    Make conditional GET requests using the `ETag` and `Last-Modified` validators stored from previous crawls, so that
+    a server can reply with `304 Not Modified` instead of sending a page which has not changed.
+    """
+
+    def __init__(
+            self,
+            schema: str,
+            db_connection: postgresql.DatabaseConnection,
+            rate_controller: rate_control.RateController = None
+    ):
+        """
+        Initialise attributes of class.
+
+        Parameters
+        ----------
+        schema : str
+            Name of the publication schema whose `http_cache` table stores the validators e.g. 'daily_mail'.
+        db_connection : interlocutor.database.postgresql.DatabaseConnection
+            Connection to the database holding the validators.
+        rate_controller : interlocutor.commons.rate_control.RateController (default None)
+            Controls the rate at which requests are sent. Requests are sent immediately if not provided.
+        """
+
+        self._schema = schema
+        self._rate_controller = rate_controller
+        self._db_connection = db_connection
+        self._table_name = 'http_cache'
+
+        # Validators from previous runs and the ones captured during this run which still need to be saved
+        self._validators = self._load_validators()
+        self._new_validators = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.seconds_saved = 0.0
+
+    def _load_validators(self) -> Dict[str, Dict]:
+        """
+        Load all of the validators stored during previous crawls.
+
+        Returns
+        -------
+        dict
+            Key: URL of the page, Value: dictionary of the validators and size/time taken to download that page.
+        """
+
+        df_validators = self._db_connection.get_dataframe(table_name=self._table_name, schema=self._schema)
+
+        return df_validators.set_index('url').to_dict(orient='index')
+
+    def get(self, url: str) -> Union[requests.Response, None]:
+        """
+        Send a GET request for a page, including the validators from the previous time it was downloaded.
+
+        Parameters
+        ----------
+        url : str
+            URL of the page to be requested.
+
+        Returns
+        -------
+        requests.Response or None
+            Response from the server if the page has changed (or has never been downloaded before), otherwise None if
+            the server confirms the page is unchanged so parsing can be skipped entirely.
+        """
+
+        previous_validators = self._validators.get(url, {})
+
+        conditional_headers = {}
+
+        if previous_validators.get('etag'):
+            conditional_headers['If-None-Match'] = previous_validators['etag']
+
+        if previous_validators.get('last_modified'):
+            conditional_headers['If-Modified-Since'] = previous_validators['last_modified']
+
+        send_request = self._rate_controller.get if self._rate_controller else requests.get
+
+        start_time = time.perf_counter()
+        response = send_request(url, headers=conditional_headers)
+        seconds_taken = time.perf_counter() - start_time
+
+        if response.status_code == 304:
+            metrics.CACHE_LOOKUPS.inc(cache='http', result='hit')
+            self.hits += 1
+            self.bytes_saved += int(previous_validators.get('content_length') or 0)
+            self.seconds_saved += max(float(previous_validators.get('download_seconds') or 0) - seconds_taken, 0)
+
+            return None
+
+        metrics.CACHE_LOOKUPS.inc(cache='http', result='miss')
+        self.misses += 1
+
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+
+        if etag or last_modified:
+            self._new_validators[url] = {
+                'etag': etag,
+                'last_modified': last_modified,
+                'content_length': len(response.content),
+                'download_seconds': seconds_taken
+            }
+
+        return response
+
+    def report_statistics(self) -> None:
+        """Display how many requests were answered by the cache and how much was saved as a result."""
+
+        total_requests = self.hits + self.misses
+        hit_rate = self.hits / total_requests if total_requests else 0
+
+        print(f'HTTP cache for {self._schema}: {self.hits} hits, {self.misses} misses ({hit_rate:.0%} hit rate), '
+              f'{self.bytes_saved / 1e6:.2f} MB and {self.seconds_saved:.1f} seconds saved.')
+
+    def save_validators(self) -> None:
+        """
+        Write the validators captured during this run to the database. This should only be called once the content of
+        the pages has been stored, otherwise a later run could skip pages whose content was never recorded.
+        """
+
+        if not self._new_validators:
+            return
+
+        df_new_validators = pd.DataFrame.from_dict(data=self._new_validators, orient='index')
+        df_new_validators = df_new_validators.rename_axis('url').reset_index()
+
+        self._db_connection.upsert_dataframe_to_existing_table(
+            dataframe=df_new_validators,
+            table_name=self._table_name,
+            schema=self._schema,
+            id_column='url'
+        )
+
+        self._validators.update(self._new_validators)
+        self._new_validators = {}
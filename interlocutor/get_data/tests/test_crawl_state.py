@@ -0,0 +1,163 @@
+"""Testing the persisted progress of crawling article content."""
+
+# Third party libraries
+import pytest
+import requests
+
+# Internal imports
+from interlocutor.database import postgresql
+from interlocutor.get_data import crawl_state
+
+
+@pytest.mark.integration
+def test_crawl_state_resumes_and_retries_failures():
+    """
+    URLs are registered with the appropriate state, and failing URLs are retried after any others until they reach the
+    maximum number of attempts.
+    """
+
+    db_connection = postgresql.DatabaseConnection()
+    tracker = crawl_state.CrawlStateTracker(schema='daily_mail', db_connection=db_connection)
+
+    # The staging data contains one article which has had its content scraped and one which has not
+    scraped_article_id = '3587c1cb3b85d116d9573897437fc4db'
+    unscraped_article_id = 'f715796f2a4d8edb53fb92e733761483'
+
+    tracker.register_urls(source_table='columnist_article_links', id_column='article_id', url_column='url')
+
+    # Registering again does not duplicate or reset any progress
+    tracker.mark_failed(article_id=unscraped_article_id, error=requests.exceptions.ConnectionError('Timed out'))
+    tracker.register_urls(source_table='columnist_article_links', id_column='article_id', url_column='url')
+
+    states = db_connection.get_dataframe(
+        query="SELECT article_id, state, attempts, last_error FROM daily_mail.crawl_state ORDER BY article_id;"
+    ).set_index('article_id')
+
+    assert states.loc[scraped_article_id, 'state'] == 'parsed'
+    assert states.loc[unscraped_article_id, 'state'] == 'failed'
+    assert states.loc[unscraped_article_id, 'attempts'] == 1
+    assert states.loc[unscraped_article_id, 'last_error'] == 'ConnectionError: Timed out'
+
+    # Failed URLs are not retried straight away
+    assert tracker.claim_batch(max_attempts=2).empty
+
+    # But they are still attempted until they reach the maximum number of attempts
+    claimed = tracker.claim_batch(max_attempts=2, retry_delay_seconds=0)
+    assert claimed['article_id'].tolist() == [unscraped_article_id]
+
+    tracker.mark_fetched(article_id=unscraped_article_id)
+    tracker.mark_failed(article_id=unscraped_article_id, error=AttributeError('Unexpected page structure'))
+
+    assert tracker.claim_batch(max_attempts=2, retry_delay_seconds=0).empty
+
+    # Tidy up
+    db_connection.execute_database_operation('TRUNCATE TABLE daily_mail.crawl_state;')
+
+
+@pytest.mark.integration
+def test_register_urls_marks_articles_stored_elsewhere_as_parsed():
+    """
+    Articles already being tracked are marked as parsed once their content has been stored some other way, so they are
+    not crawled again.
+    """
+
+    db_connection = postgresql.DatabaseConnection()
+    tracker = crawl_state.CrawlStateTracker(schema='daily_mail', db_connection=db_connection)
+
+    # The staging data already holds the content of this article, although it was left failed by an earlier crawl
+    scraped_article_id = '3587c1cb3b85d116d9573897437fc4db'
+
+    db_connection.execute_database_operation(
+        sql_command="""
+            INSERT INTO daily_mail.crawl_state (article_id, url, state, attempts, last_error, updated_timestamp)
+            VALUES (%(article_id)s, 'https://article.one', 'failed', 1, 'ConnectionError: Timed out', NOW());
+            """,
+        params={'article_id': scraped_article_id}
+    )
+
+    tracker.register_urls(source_table='columnist_article_links', id_column='article_id', url_column='url')
+
+    states = db_connection.get_dataframe(
+        query="SELECT article_id, state, attempts, last_error FROM daily_mail.crawl_state;"
+    ).set_index('article_id')
+
+    assert states.loc[scraped_article_id, 'state'] == 'parsed'
+    assert states.loc[scraped_article_id, 'attempts'] == 1
+    assert states.loc[scraped_article_id, 'last_error'] is None
+    assert scraped_article_id not in tracker.claim_batch(retry_delay_seconds=0)['article_id'].tolist()
+
+    # Tidy up
+    db_connection.execute_database_operation('TRUNCATE TABLE daily_mail.crawl_state;')
+
+
+@pytest.mark.integration
+def test_workers_claim_different_articles_until_lease_expires():
+    """
+    Articles claimed by one worker cannot be claimed by another until they are released or the claim expires.
+    """
+
+    db_connection = postgresql.DatabaseConnection()
+    first_worker = crawl_state.CrawlStateTracker(schema='daily_mail', db_connection=db_connection, worker_id='first')
+    second_worker = crawl_state.CrawlStateTracker(schema='daily_mail', db_connection=db_connection, worker_id='second')
+
+    db_connection.execute_database_operation("""
+        INSERT INTO daily_mail.crawl_state (article_id, url, state, attempts, updated_timestamp)
+        VALUES ('aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa', 'https://article.one', 'pending', 0, NOW()),
+               ('bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb', 'https://article.two', 'pending', 0, NOW()),
+               ('cccccccccccccccccccccccccccccccc', 'https://article.three', 'pending', 0, NOW());
+        """)
+
+    first_claim = first_worker.claim_batch(batch_size=2)
+    second_claim = second_worker.claim_batch(batch_size=2)
+
+    # Every article is claimed exactly once
+    assert len(first_claim) == 2
+    assert len(second_claim) == 1
+    assert set(first_claim['article_id']).isdisjoint(second_claim['article_id'])
+    assert second_worker.claim_batch(batch_size=2).empty
+
+    # Parsed articles are released and not claimed again
+    second_worker.mark_parsed(article_id=second_claim['article_id'].iloc[0])
+    assert second_worker.claim_batch(batch_size=2).empty
+
+    # Once the first worker's claim expires its articles can be claimed by others
+    db_connection.execute_database_operation(
+        "UPDATE daily_mail.crawl_state SET lease_expires = NOW() - INTERVAL '1 second' WHERE leased_by = 'first';"
+    )
+    reclaimed = second_worker.claim_articles(batch_size=1)
+
+    assert sorted(article['article_id'] for article in reclaimed) == sorted(first_claim['article_id'])
+
+    # Tidy up
+    db_connection.execute_database_operation('TRUNCATE TABLE daily_mail.crawl_state;')
+
+
+@pytest.mark.integration
+def test_newest_articles_are_claimed_first():
+    """
+    Articles are claimed from the most recently published, with articles whose publication is unknown claimed last, but
+    always after any articles which have been attempted fewer times.
+    """
+
+    db_connection = postgresql.DatabaseConnection()
+    tracker = crawl_state.CrawlStateTracker(schema='daily_mail', db_connection=db_connection)
+
+    db_connection.execute_database_operation("""
+        INSERT INTO daily_mail.crawl_state (article_id, url, priority, state, attempts, updated_timestamp)
+        VALUES ('aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa', 'https://article.one', '2021-01-01', 'pending', 0, NOW()),
+               ('bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb', 'https://article.two', NULL, 'pending', 0, NOW()),
+               ('cccccccccccccccccccccccccccccccc', 'https://article.three', '2021-03-01', 'pending', 0, NOW()),
+               ('dddddddddddddddddddddddddddddddd', 'https://article.four', '2021-04-01', 'fetched', 1, NOW());
+        """)
+
+    claimed = [article['article_id'] for article in tracker.claim_articles(batch_size=1)]
+
+    assert claimed == [
+        'cccccccccccccccccccccccccccccccc',
+        'aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa',
+        'bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb',
+        'dddddddddddddddddddddddddddddddd'
+    ]
+
+    # Tidy up
+    db_connection.execute_database_operation('TRUNCATE TABLE daily_mail.crawl_state;')
@@ -1,6 +1,7 @@
 """Testing crawling the Daily Mail website and download article metadata/content."""
 
 # Standard libraries
+import hashlib
 import os
 import re
 
@@ -19,6 +20,7 @@ class MockAllColumnistsHomepage:
 
     def __init__(self):
         self.status_code = 200
+        self.headers = {}
 
         script_directory = os.path.dirname(os.path.abspath(__file__))
 
@@ -26,7 +28,7 @@ class MockAllColumnistsHomepage:
             self.content = mock_page.read()
 
 
-def mock_all_columnists_homepage(url=None):
+def mock_all_columnists_homepage(url=None, **kwargs):
     """Mock the HTTP request to the page listing the paper's columnists."""
 
     return MockAllColumnistsHomepage()
@@ -37,6 +39,7 @@ class MockArticlePage:
 
     def __init__(self):
         self.status_code = 200
+        self.headers = {}
 
         script_directory = os.path.dirname(os.path.abspath(__file__))
 
@@ -44,7 +47,7 @@ class MockArticlePage:
             self.content = mock_page.read()
 
 
-def mock_article(url=None):
+def mock_article(url=None, **kwargs):
     """Mock the HTTP request to an individual article."""
 
     return MockArticlePage()
@@ -55,6 +58,7 @@ class MockSpecificColumnistHomepage:
 
     def __init__(self):
         self.status_code = 200
+        self.headers = {}
 
         script_directory = os.path.dirname(os.path.abspath(__file__))
 
@@ -62,7 +66,7 @@ class MockSpecificColumnistHomepage:
             self.content = mock_page.read()
 
 
-def mock_specific_columnist_homepage(url=None):
+def mock_specific_columnist_homepage(url=None, **kwargs):
     """Mock the HTTP request to the homepage of a specific columnist."""
 
     return MockSpecificColumnistHomepage()
@@ -212,6 +216,48 @@ def test_get_recent_article_links(monkeypatch):
     assert sorted(actual_links) == sorted(expected_links)
 
 
+def test_get_recent_article_links_stops_at_known_article(monkeypatch):
+    """
+    Pages of a columnist's archive are read until one includes an article which is already stored, and only the new
+    articles are returned.
+    """
+
+    pages_requested = []
+
+    def mock_archive_page(url=None, **kwargs):
+        """Mock every page of the archive listing the same articles."""
+        pages_requested.append(url)
+        return mock_specific_columnist_homepage()
+
+    monkeypatch.setattr(requests, 'get', mock_archive_page)
+
+    article_downloader = daily_mail.ArticleDownloader()
+    all_links = article_downloader._get_recent_article_links(homepage='mock_url_so_required_argument_is_given')
+    pages_requested.clear()
+
+    # Reading is not limited to a number of pages but stops at the first page which adds nothing new
+    unbounded_links = article_downloader._get_recent_article_links(
+        homepage='mock_url_so_required_argument_is_given',
+        max_pages=None
+    )
+
+    assert unbounded_links == all_links
+    assert len(pages_requested) == 2
+
+    # Only the first page is read once it includes a known article
+    pages_requested.clear()
+    known_article_id = hashlib.md5(all_links[0].encode('utf-8')).hexdigest()
+
+    new_links = article_downloader._get_recent_article_links(
+        homepage='mock_url_so_required_argument_is_given',
+        known_article_ids={known_article_id},
+        max_pages=None
+    )
+
+    assert new_links == all_links[1:]
+    assert len(pages_requested) == 1
+
+
 @pytest.mark.integration
 def test_record_columnist_home_pages(monkeypatch):
     """Columnist names and their home page are pulled correctly and stored in postgres."""
@@ -305,6 +351,7 @@ def test_record_columnists_recent_article_content():
             query='DELETE FROM daily_mail.article_content WHERE url NOT IN %(original_urls)s',
             vars={'original_urls': tuple(original_urls)}
         )
+        curs.execute('TRUNCATE TABLE daily_mail.crawl_state;')
 
         db_connection._conn.commit()
 
@@ -0,0 +1,115 @@
+"""Testing discovering articles by columnists from RSS feeds and XML sitemaps."""
+
+# Standard libraries
+import io
+import os
+
+# Third party libraries
+import requests
+
+# Internal imports
+from interlocutor.commons import rate_control
+from interlocutor.get_data import feed_discovery
+
+
+class MockFeed:
+    """Mock a streamed request call to an RSS feed or XML sitemap."""
+
+    def __init__(self, filename: str, status_code: int = 200):
+        self.status_code = status_code
+        self.headers = {}
+        self.closed = False
+
+        script_directory = os.path.dirname(os.path.abspath(__file__))
+
+        with open(file=f'{script_directory}/{filename}', mode='rb') as mock_feed:
+            self.raw = io.BytesIO(mock_feed.read())
+
+    def close(self):
+        """Release the connection of the streamed response."""
+        self.closed = True
+
+
+def test_parse_entries():
+    """The URL and author of every entry are extracted from both RSS feeds and sitemaps."""
+
+    rss_entries = list(feed_discovery.FeedDiscoverer._parse_entries(feed=MockFeed('mock_i_news_rss_feed.xml').raw))
+    sitemap_entries = list(
+        feed_discovery.FeedDiscoverer._parse_entries(feed=MockFeed('mock_daily_mail_sitemap.xml').raw)
+    )
+
+    assert len(rss_entries) == 4
+    assert rss_entries[0] == {
+        'url': 'https://inews.co.uk/opinion/columnists/dry-january-continue-february-sobriety-alcohol-moderation-'
+               'lessons-856131',
+        'author': 'Sarah Carson'
+    }
+
+    # Sitemaps do not name the author
+    assert len(sitemap_entries) == 4
+    assert all(entry['author'] is None for entry in sitemap_entries)
+
+
+def test_match_columnist():
+    """Columnists are matched by whole words of the author or URL, and names without any words never match."""
+
+    match_columnist = feed_discovery.FeedDiscoverer._match_columnist
+    url = 'https://www.dailymail.co.uk/debate/article-9021775/BRIAN-BIRRELL-Lockdown.html'
+
+    assert match_columnist(url=url, author=None, columnists=['Ian Birrell', 'Brian Birrell']) == 'Brian Birrell'
+    assert match_columnist(url=url, author='Brian Birrell', columnists=['Ian Birrell']) is None
+    assert match_columnist(url=url, author='Ian Birrell', columnists=['...', 'Ian Birrell']) == 'Ian Birrell'
+    assert match_columnist(url=url, author=None, columnists=['...', 'Ian']) is None
+
+
+def test_get_columnist_article_links(monkeypatch):
+    """
+    Only links to opinion articles written by known columnists are kept, matching columnists by the author named in
+    the feed or by the URL, and feeds which cannot be read are skipped. Every response is closed.
+    """
+
+    feeds = {
+        'https://inews.co.uk/category/opinion/feed': MockFeed('mock_i_news_rss_feed.xml'),
+        'https://www.dailymail.co.uk/google-news-sitemap.xml': MockFeed('mock_daily_mail_sitemap.xml'),
+        'https://inews.co.uk/missing/feed': MockFeed('mock_i_news_rss_feed.xml', status_code=404),
+    }
+
+    def mock_feed(url=None, **kwargs):
+        """Mock the HTTP request to each feed."""
+        return feeds[url]
+
+    monkeypatch.setattr(requests, 'get', mock_feed)
+
+    rate_controller = rate_control.RateController(max_requests_per_second=1000, initial_requests_per_second=1000)
+
+    i_news_discoverer = feed_discovery.FeedDiscoverer(
+        feed_urls=['https://inews.co.uk/category/opinion/feed', 'https://inews.co.uk/missing/feed'],
+        article_url_pattern=r'^https://inews\.co\.uk/opinion/',
+        rate_controller=rate_controller
+    )
+
+    daily_mail_discoverer = feed_discovery.FeedDiscoverer(
+        feed_urls=['https://www.dailymail.co.uk/google-news-sitemap.xml'],
+        article_url_pattern=r'^https://www\.dailymail\.co\.uk/.+/article-\d+/',
+        rate_controller=rate_controller
+    )
+
+    i_news_links = i_news_discoverer.get_columnist_article_links(columnists=['Fiona Mountford', 'Sarah Carson'])
+    daily_mail_links = daily_mail_discoverer.get_columnist_article_links(
+        columnists=['Baz Bamigboye', 'Peter Hitchens']
+    )
+
+    assert i_news_links == {
+        'https://inews.co.uk/opinion/columnists/dry-january-continue-february-sobriety-alcohol-moderation-lessons-'
+        '856131': 'Sarah Carson',
+        'https://inews.co.uk/opinion/theatres-reopening-plan-lockdown-856240': 'Fiona Mountford'
+    }
+
+    assert daily_mail_links == {
+        'https://www.dailymail.co.uk/debate/article-9021775/PETER-HITCHENS-20-years-time-Eton-just-pricey-Bog-Lane-'
+        'comprehensive.html': 'Peter Hitchens',
+        'https://www.dailymail.co.uk/tvshowbiz/article-9019127/BAZ-BAMIGBOYE-West-End-stars-return-stage-'
+        'December.html': 'Baz Bamigboye'
+    }
+
+    assert all(feed.closed for feed in feeds.values())
@@ -0,0 +1,96 @@
+"""Testing the conditional GET cache which avoids re-downloading and re-parsing unchanged web pages."""
+
+# Third party libraries
+import pandas as pd
+import requests
+
+# Internal imports
+from interlocutor.get_data import http_cache
+
+
+class MockDatabaseConnection:
+    """Mock the database connection so validators are stored in memory rather than postgres."""
+
+    def __init__(self, stored_validators: pd.DataFrame):
+        self.stored_validators = stored_validators
+        self.upserted_validators = None
+
+    def get_dataframe(self, table_name: str = None, schema: str = None) -> pd.DataFrame:
+        """Return the validators stored from a previous run."""
+        return self.stored_validators
+
+    def upsert_dataframe_to_existing_table(self, dataframe: pd.DataFrame, **kwargs) -> None:
+        """Capture the validators which would be written to the database."""
+        self.upserted_validators = dataframe
+
+
+class MockResponse:
+    """Mock a response from a web server."""
+
+    def __init__(self, status_code: int, headers: dict = None, content: bytes = b''):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = content
+
+
+def test_get_sends_validators_and_short_circuits_on_not_modified(monkeypatch):
+    """Stored validators are sent with the request and None is returned when the page has not changed."""
+
+    stored_validators = pd.DataFrame(data={
+        'url': ['https://unchanged.page'],
+        'etag': ['"abc123"'],
+        'last_modified': ['Wed, 21 Oct 2015 07:28:00 GMT'],
+        'content_length': [5000],
+        'download_seconds': [100.0]
+    })
+
+    headers_sent = {}
+
+    def mock_get(url, headers=None):
+        """Mock a server which confirms the page has not changed."""
+        headers_sent.update(headers)
+        return MockResponse(status_code=304)
+
+    monkeypatch.setattr(requests, 'get', mock_get)
+
+    cache = http_cache.ConditionalGetCache(
+        schema='mock_schema',
+        db_connection=MockDatabaseConnection(stored_validators=stored_validators)
+    )
+
+    assert cache.get('https://unchanged.page') is None
+
+    assert headers_sent == {'If-None-Match': '"abc123"', 'If-Modified-Since': 'Wed, 21 Oct 2015 07:28:00 GMT'}
+    assert cache.hits == 1
+    assert cache.misses == 0
+    assert cache.bytes_saved == 5000
+    assert cache.seconds_saved > 0
+
+
+def test_get_returns_and_records_changed_pages(monkeypatch):
+    """Pages which have changed are returned and their new validators saved."""
+
+    empty_validators = pd.DataFrame(columns=['url', 'etag', 'last_modified', 'content_length', 'download_seconds'])
+
+    def mock_get(url, headers=None):
+        """Mock a server which returns a new version of the page."""
+        return MockResponse(status_code=200, headers={'ETag': '"new"'}, content=b'<html></html>')
+
+    monkeypatch.setattr(requests, 'get', mock_get)
+
+    mock_db_connection = MockDatabaseConnection(stored_validators=empty_validators)
+    cache = http_cache.ConditionalGetCache(schema='mock_schema', db_connection=mock_db_connection)
+
+    response = cache.get('https://changed.page')
+
+    assert response.content == b'<html></html>'
+    assert cache.hits == 0
+    assert cache.misses == 1
+
+    cache.save_validators()
+
+    saved = mock_db_connection.upserted_validators
+
+    assert saved['url'].tolist() == ['https://changed.page']
+    assert saved['etag'].tolist() == ['"new"']
+    assert saved['content_length'].tolist() == [13]
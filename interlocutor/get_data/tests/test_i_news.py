@@ -1,6 +1,8 @@
 """Testing for crawling The i website and download article metadata/content."""
 
 # Standard libraries
+import hashlib
+import io
 import os
 import re
 
@@ -19,6 +21,7 @@ class MockAllColumnistsHomepage:
 
     def __init__(self):
         self.status_code = 200
+        self.headers = {}
 
         script_directory = os.path.dirname(os.path.abspath(__file__))
 
@@ -26,7 +29,7 @@ class MockAllColumnistsHomepage:
             self.content = mock_page.read()
 
 
-def mock_all_columnists_homepage(url=None):
+def mock_all_columnists_homepage(url=None, **kwargs):
     """Mock the HTTP request to the page listing the paper's columnists."""
 
     return MockAllColumnistsHomepage()
@@ -37,6 +40,7 @@ class MockArticlePage:
 
     def __init__(self):
         self.status_code = 200
+        self.headers = {}
 
         script_directory = os.path.dirname(os.path.abspath(__file__))
 
@@ -44,7 +48,7 @@ class MockArticlePage:
             self.content = mock_page.read()
 
 
-def mock_article(url=None):
+def mock_article(url=None, **kwargs):
     """Mock the HTTP request to an individual article."""
 
     return MockArticlePage()
@@ -55,6 +59,7 @@ class MockSpecificColumnistHomepage:
 
     def __init__(self):
         self.status_code = 200
+        self.headers = {}
 
         script_directory = os.path.dirname(os.path.abspath(__file__))
 
@@ -62,7 +67,7 @@ class MockSpecificColumnistHomepage:
             self.content = mock_page.read()
 
 
-def mock_specific_columnist_homepage(url=None):
+def mock_specific_columnist_homepage(url=None, **kwargs):
     """Mock the HTTP request to the homepage of a specific columnist."""
 
     return MockSpecificColumnistHomepage()
@@ -177,6 +182,48 @@ def test_get_recent_article_links(monkeypatch):
     assert sorted(actual_links) == sorted(expected_links)
 
 
+def test_get_recent_article_links_stops_at_known_article(monkeypatch):
+    """
+    Pages of a columnist's archive are read until one includes an article which is already stored, and only the new
+    articles are returned.
+    """
+
+    pages_requested = []
+
+    def mock_archive_page(url=None, **kwargs):
+        """Mock every page of the archive listing the same articles."""
+        pages_requested.append(url)
+        return mock_specific_columnist_homepage()
+
+    monkeypatch.setattr(requests, 'get', mock_archive_page)
+
+    article_downloader = i_news.ArticleDownloader()
+    all_links = article_downloader._get_recent_article_links(homepage='mock_url_so_required_argument_is_given')
+    pages_requested.clear()
+
+    # Reading is not limited to a number of pages but stops at the first page which adds nothing new
+    unbounded_links = article_downloader._get_recent_article_links(
+        homepage='mock_url_so_required_argument_is_given',
+        max_pages=None
+    )
+
+    assert unbounded_links == all_links
+    assert len(pages_requested) == 2
+
+    # Only the first page is read once it includes a known article
+    pages_requested.clear()
+    known_article_id = hashlib.md5(all_links[0].encode('utf-8')).hexdigest()
+
+    new_links = article_downloader._get_recent_article_links(
+        homepage='mock_url_so_required_argument_is_given',
+        known_article_ids={known_article_id},
+        max_pages=None
+    )
+
+    assert new_links == all_links[1:]
+    assert len(pages_requested) == 1
+
+
 @pytest.mark.integration
 def test_record_columnist_home_pages(monkeypatch):
     """Columnist names and their home page are pulled correctly and stored in postgres."""
@@ -250,6 +297,7 @@ def test_record_columnists_recent_article_content():
             query='DELETE FROM i_news.article_content WHERE url NOT IN %(original_urls)s',
             vars={'original_urls': tuple(original_urls)}
         )
+        curs.execute('TRUNCATE TABLE i_news.crawl_state;')
 
         db_connection._conn.commit()
 
@@ -314,3 +362,59 @@ def test_record_columnists_recent_article_links():
     expected_columnists = df_expected_columnists['columnist'].unique().tolist()
 
     assert table_after_extracting['columnist'].unique().tolist() == expected_columnists
+
+
+@pytest.mark.integration
+def test_record_columnists_recent_article_links_from_feeds(monkeypatch):
+    """Links to articles by known i News columnists are read from the RSS feed and stored in database."""
+
+    script_directory = os.path.dirname(os.path.abspath(__file__))
+
+    class MockFeed:
+        """Mock a streamed request call to the i News opinion RSS feed."""
+
+        def __init__(self):
+            self.status_code = 200
+            self.headers = {}
+
+            with open(file=f'{script_directory}/mock_i_news_rss_feed.xml', mode='rb') as mock_feed:
+                self.raw = io.BytesIO(mock_feed.read())
+
+    monkeypatch.setattr(requests, 'get', lambda url=None, **kwargs: MockFeed())
+
+    article_downloader = i_news.ArticleDownloader()
+    article_downloader.record_columnists_recent_article_links_from_feeds()
+
+    db_connection = postgresql.DatabaseConnection()
+    db_connection._create_connection()
+
+    with db_connection._conn.cursor() as curs:
+        curs.execute('SELECT * FROM i_news.columnist_article_links;')
+
+        table_tuples = curs.fetchall()
+        table_after_extracting = pd.DataFrame(table_tuples, columns=['columnist', 'article_id', 'url'])
+
+        # Tidy up and return table to its original form
+        original_data = pd.read_csv('Docker/db/staging_data/i_news.columnist_article_links.csv')
+        original_urls = original_data['url'].values
+
+        curs.execute(
+            query='DELETE FROM i_news.columnist_article_links WHERE url NOT IN %(original_urls)s',
+            vars={'original_urls': tuple(original_urls)}
+        )
+
+        db_connection._conn.commit()
+
+    feed_articles = table_after_extracting[table_after_extracting['url'].isin([
+        'https://inews.co.uk/opinion/columnists/dry-january-continue-february-sobriety-alcohol-moderation-lessons-'
+        '856131',
+        'https://inews.co.uk/opinion/theatres-reopening-plan-lockdown-856240'
+    ])]
+
+    # Opinion articles by known columnists are stored, but not letters or news articles
+    assert sorted(feed_articles['columnist'].tolist()) == ['Fiona Mountford', 'Sarah Carson']
+    assert not table_after_extracting['url'].str.contains('letters-vaccine-rollout|covid-cases-fall').any()
+    assert all(
+        article_id == hashlib.md5(url.encode('utf-8')).hexdigest()
+        for article_id, url in zip(feed_articles['article_id'], feed_articles['url'])
+    )
@@ -199,6 +199,7 @@ def test_record_opinion_articles_content():
             query="DELETE FROM the_guardian.article_content WHERE id IN (%(new_ids_pulled)s);",
             vars={'new_ids_pulled': tuple(new_ids_pulled)}
         )
+        curs.execute('TRUNCATE TABLE the_guardian.crawl_state;')
 
         db_connection._conn.commit()
     db_connection._close_connection()
@@ -347,3 +348,74 @@ def test_record_opinion_articles_metadata(monkeypatch, publication_start_timesta
     db_connection._close_connection()
 
     pd.testing.assert_frame_equal(actual_metadata, expected_metadata)
+
+
+@pytest.mark.integration
+def test_record_opinion_articles_metadata_including_content(monkeypatch):
+    """
+    In bulk mode, the body of each article is requested alongside its metadata and both are saved to postgres without
+    making any calls for individual articles.
+    """
+
+    params_requested = []
+
+    def mock_api_call(url: str, params: dict) -> Dict[str, Any]:
+        """Mock functionality of making Guardian API call which includes the body of each article."""
+
+        params_requested.append(params)
+
+        return {
+            'response': {
+                'status': 'ok',
+                'total': 1,
+                'pages': 1,
+                'results': [
+                    {
+                        'id': 'commentisfree/2020/oct/04/johnson-is-a-poor-prime-minister',
+                        'type': 'article',
+                        'sectionId': 'commentisfree',
+                        'sectionName': 'Opinion',
+                        'webPublicationDate': '2020-10-04T10:35:19Z',
+                        'webTitle': 'Are Tory MPs really so surprised that Boris Johnson is a poor prime minister?',
+                        'webUrl': 'https://www.theguardian.com/commentisfree/2020/oct/04/poor-prime-minister',
+                        'apiUrl': 'https://content.guardianapis.com/commentisfree/2020/oct/04/poor-prime-minister',
+                        'fields': {'body': '<p>First paragraph.</p> <p>Second paragraph.</p>'},
+                        'isHosted': False,
+                        'pillarId': 'pillar/opinion',
+                        'pillarName': 'Opinion'
+                    }
+                ]
+            }
+        }
+
+    article_downloader = the_guardian.ArticleDownloader()
+    monkeypatch.setattr(article_downloader, "_call_api_and_display_exceptions", mock_api_call)
+
+    article_downloader.record_opinion_articles_metadata(
+        publication_start_timestamp='2020-01-01T01:01:00Z',
+        include_content=True
+    )
+
+    # Every page of results asked for the body of its articles
+    assert all(params.get('show-fields') == 'body' for params in params_requested)
+
+    expected_id = '7d2669e5a86f5a5eb16862f691482fe3'
+
+    db_connection = postgresql.DatabaseConnection()
+    db_connection._create_connection()
+
+    with db_connection._conn.cursor() as curs:
+        curs.execute(
+            query='SELECT id, content FROM the_guardian.article_content WHERE id = %(id)s;',
+            vars={'id': expected_id}
+        )
+        actual_content = curs.fetchall()
+
+        # Tidy up and revert to original tables by deleting newly inserted rows
+        curs.execute(query='DELETE FROM the_guardian.article_content WHERE id = %(id)s;', vars={'id': expected_id})
+        curs.execute(query='DELETE FROM the_guardian.article_metadata WHERE id = %(id)s;', vars={'id': expected_id})
+
+        db_connection._conn.commit()
+    db_connection._close_connection()
+
+    assert actual_content == [(expected_id, 'First paragraph. Second paragraph.')]
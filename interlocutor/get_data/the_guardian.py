@@ -1,21 +1,23 @@
 """Interact with The Guardian API and download article metadata/content."""
 
 # Standard libraries
+import argparse
+from concurrent import futures
 import hashlib
 import os
-import time
-from typing import Any, Dict, List, Union
+from typing import Any, Dict, Iterator, List, Union
 
 # Third party libraries
 from bs4 import BeautifulSoup
-import numpy as np
 import pandas as pd
 import requests
 import tqdm
 
 # Internal imports
-from interlocutor.commons import commons
+from interlocutor.commons import rate_control, tracing
 from interlocutor.database import postgresql
+from interlocutor.get_data import crawl_state
+from interlocutor.pipeline import monitoring
 
 
 class ArticleDownloader:
@@ -23,11 +25,24 @@ class ArticleDownloader:
     Call The Guardian API to capture information about the articles in its Opinion section.
     """
 
-    def __init__(self):
+    def __init__(self, requests_per_second: float = 2, rate_controller: rate_control.RateController = None):
+        """
+        Parameters
+        ----------
+        requests_per_second : float (default 2)
+            Number of calls made to the API each second to begin with, shared between every request this class makes
+            (including those made concurrently). The rate then adapts to how quickly and successfully the API responds.
+        rate_controller : interlocutor.commons.rate_control.RateController (default None)
+            Controls the rate of calls made to the API, overriding `requests_per_second` if provided.
+        """
 
         self._api_key = os.getenv('GUARDIAN_API_KEY')
         self._db_connection = postgresql.DatabaseConnection()
+        self._crawl_state = crawl_state.CrawlStateTracker(schema='the_guardian', db_connection=self._db_connection)
         self._opinion_section_url = 'https://content.guardianapis.com/commentisfree/commentisfree'
+        self._rate_controller = rate_controller or rate_control.RateController(
+            initial_requests_per_second=requests_per_second
+        )
 
     def _call_api_and_display_exceptions(self, url: str, params: dict = None) -> Dict[str, Any]:
         """
@@ -68,7 +83,7 @@ class ArticleDownloader:
 
         # Call API but capture any exceptions, which can sometimes be masked by requests library otherwise
         try:
-            api_response = requests.get(url=url, params=payload)
+            api_response = self._rate_controller.get(url=url, params=payload)
             api_response.raise_for_status()
 
             return api_response.json()
@@ -95,12 +110,48 @@ class ArticleDownloader:
 
         api_response = self._call_api_and_display_exceptions(url=article_api_url, params={'show-fields': 'body'})
 
+        return self._extract_article_content(api_response)
+
+    def _extract_article_content(self, api_response: Dict[str, Any]) -> str:
+        """
+        Retrieve the text content of an article from the API response for that article.
+
+        Parameters
+        ----------
+        api_response : dict
+            Dictionary version of the API response object for an individual article, requested with the
+            'show-fields' parameter set to 'body'.
+
+        Returns
+        -------
+        str
+            Raw text content of the article.
+        """
+
         article_content_html = api_response['response']['content']['fields']['body']
 
+        return self._convert_html_to_text(article_content_html)
+
+    @staticmethod
+    @tracing.traced('the_guardian.parse_article')
+    def _convert_html_to_text(article_content_html: str) -> str:
+        """
+        Strip the html tags from the body of an article returned by the API.
+
+        Parameters
+        ----------
+        article_content_html : str
+            Body of the article as html e.g. '<p>First paragraph.</p> <p>Second paragraph.</p>'
+
+        Returns
+        -------
+        str
+            Raw text content of the article.
+        """
+
         soup = BeautifulSoup(markup=article_content_html, features='html.parser')
-        article_content_text = soup.get_text(separator=" ", strip=True)
 
-        return article_content_text
+        return soup.get_text(separator=" ", strip=True)
 
     def _get_latest_opinion_articles_datetime_reached(self, data_type: str) -> Union[str, None]:
         """
@@ -137,13 +188,44 @@ class ArticleDownloader:
 
         return most_recent
 
+    def _claim_articles_with_metadata(self, number_of_articles: int = None) -> Iterator[Dict]:
+        """
+        Claim articles whose content needs retrieving along with their metadata, loading the metadata of each batch
+        claimed in one query.
+
+        Parameters
+        ----------
+        number_of_articles : int (default None)
+            Maximum number of articles to claim. Articles are claimed until none are left if not provided.
+
+        Yields
+        ------
+        dict
+            The 'id', 'guardian_id', 'web_publication_timestamp' and 'api_url' of the next article.
+        """
+
+        # Claim articles in small batches so other crawler workers can share the work without fetching duplicates
+        for df_claimed in self._crawl_state.claim_batches(number_of_articles=number_of_articles):
+            yield from self._db_connection.get_dataframe(
+                query="""
+                      SELECT id, guardian_id, web_publication_timestamp, api_url
+                      FROM the_guardian.article_metadata
+                      WHERE id IN %(article_ids)s
+                      ORDER BY web_publication_timestamp DESC
+                      """,
+                query_params={'article_ids': tuple(df_claimed['article_id'])}
+            ).to_dict(orient='records')
+
+    @tracing.traced('the_guardian.record_opinion_articles_content')
     def record_opinion_articles_content(self, number_of_articles: int = 100) -> None:
         """
         Save a dataframe to postgres storing the content of of articles appearing in The Guardian Opinion section
         (https://www.theguardian.com/uk/commentisfree).
 
-        Storing all of the text can be expensive so iterate through a specified number of articles, working backwards
-        from the most recently published articles that have not yet had their content pulled.
+        Storing all of the text can be expensive so iterate through a specified number of articles that have not yet
+        had their content pulled. Progress is tracked in the_guardian.crawl_state as each article is saved, so an
+        interrupted run resumes where it stopped, and articles which fail are retried on later runs without blocking
+        the others. Several workers can run this at once, each claiming different articles from the crawl state queue.
 
         Dataframe contains one row per article in The Guardian Opinion section that has already been crawled to extract
         its metadata.
@@ -154,145 +236,252 @@ class ArticleDownloader:
             Number of articles to iterate through and extract their contents.
         """
 
-        # Retrieve the articles which have already not yet had their contents pulled
-        sql_query = """
-                    SELECT id, guardian_id, web_publication_timestamp, api_url
-                    FROM the_guardian.article_metadata
-                    WHERE id NOT IN (SELECT id FROM the_guardian.article_content)
-                    ORDER BY web_publication_timestamp DESC
-                    LIMIT %(number_of_articles)s
-                    """
-
-        articles_to_crawl = self._db_connection.get_dataframe(
-            query=sql_query,
-            query_params={'number_of_articles': number_of_articles}
+        # The most recently published articles are retrieved first
+        self._crawl_state.register_urls(
+            source_table='article_metadata',
+            id_column='id',
+            url_column='api_url',
+            priority_column='web_publication_timestamp'
         )
 
-        article_urls = articles_to_crawl['api_url'].values
-
-        counter = 0
-        articles_to_crawl['content'] = np.nan
-
-        for article_url in tqdm.tqdm(
+        for article in tqdm.tqdm(
                 desc='Guardian article content retrieved',
-                iterable=article_urls,
-                total=len(article_urls),
+                iterable=self._claim_articles_with_metadata(number_of_articles=number_of_articles),
+                total=number_of_articles,
                 unit=' article'
         ):
 
             try:
-                article_content = self._get_article_content(article_url)
-                articles_to_crawl.iloc[counter, -1] = article_content
-
-                counter += 1
+                api_response = self._call_api_and_display_exceptions(
+                    url=article['api_url'],
+                    params={'show-fields': 'body'}
+                )
+                self._crawl_state.mark_fetched(article['id'])
 
-            except requests.exceptions.RequestException as request_exception:
-                print(f'Error retrieving contents for article {article_url}')
-                print('\nSaving article content already pulled to the_guardian.article_content')
+                article['content'] = self._extract_article_content(api_response)
 
                 self._db_connection.upload_new_data_only_to_existing_table(
-                    dataframe=articles_to_crawl.dropna(),
+                    dataframe=pd.DataFrame(data=[article]),
                     table_name='article_content',
                     schema='the_guardian',
                     id_column='id'
                 )
 
-                raise request_exception
-
-            # Be polite, do not bombard API with too many requests at once
-            time.sleep(0.5)
-
-        print('\nSaving article content to the_guardian.article_content')
-
-        self._db_connection.upload_new_data_only_to_existing_table(
-            dataframe=articles_to_crawl.dropna(),
-            table_name='article_content',
-            schema='the_guardian',
-            id_column='id'
-        )
-
-    # The Guardian API only allows you to progress through a certain number of pages, so retry and pick up from latest
-    # article reached if the method hits an HTTP error.
-    @commons.retry(total_attempts=5, exceptions_to_check=requests.exceptions.HTTPError)
-    def record_opinion_articles_metadata(self, publication_start_timestamp: str = None) -> None:
+                self._crawl_state.mark_parsed(article['id'])
+                tracing.count('articles')
+
+            # Record the failure but carry on with the rest of the batch
+            except (requests.exceptions.RequestException, KeyError) as crawl_error:
+                print(f'Error retrieving contents for article {article["api_url"]}')
+                self._crawl_state.mark_failed(article_id=article['id'], error=crawl_error)
+                tracing.count('failed_articles')
+
+        self._rate_controller.report_statistics()
+
+    @tracing.traced('the_guardian.record_opinion_articles_metadata')
+    def record_opinion_articles_metadata(
+            self,
+            publication_start_timestamp: str = None,
+            include_content: bool = False,
+            max_workers: int = 4,
+            total_attempts: int = 5
+    ) -> None:
         """
         Save a dataframe to postgres storing all articles appearing in The Guardian Opinion section
         (https://www.theguardian.com/uk/commentisfree) and how they can be accessed via the API.
 
         Dataframe contains one row per article in The Guardian Opinion section detailing metadata about the article.
 
+        Pages of results are fetched concurrently (within the rate budget shared by every call this class makes) and
+        written to postgres as soon as each one arrives.
+
         Parameters
         ----------
         publication_start_timestamp : str (default None)
             How far back in time to crawl article metadata, which should be in a timestamp format that the Guardian API
             expects e.g. '2002-02-25T01:53:00Z'. If not provided, the most recent article that has already been pulled
             is used as the starting point.
-        """
+        include_content : bool (default False)
+            Whether to also request the body of every article as part of each page of results, and save it to
+            the_guardian.article_content alongside the metadata. This bulk mode retrieves the content of up to 200
+            articles per API call, rather than making one call per article via `record_opinion_articles_content`.
+        max_workers : int (default 4)
+            Number of pages which can be requested at the same time.
+        total_attempts : int (default 5)
+            The Guardian API only allows you to progress through a certain number of pages, so if some pages still fail
+            after being retried individually, crawl again (up to this many times in total) from the latest article
+            reached without any gaps before it.
 
-        # Only a certain number of articles can be pulled with each call (max 200 articles), so calculate how many
-        # pages have to be called to cover all articles
-        page_size = 200
+        Raises
+        ------
+        requests.exceptions.RequestException
+            If pages are still failing after `total_attempts` crawls.
+        """
 
         if publication_start_timestamp:
             most_recent_datetime = publication_start_timestamp
         else:
             most_recent_datetime = self._get_latest_opinion_articles_datetime_reached(data_type='metadata')
 
-        # Display helpful statement if user has provided a starting point or it could be found from existing data
-        if most_recent_datetime:
-            print(f'Articles published on or after {most_recent_datetime} will be processed.')
+        for attempt_number in range(1, total_attempts + 1):
 
-        opinion_section_metadata = self._call_api_and_display_exceptions(
-            url=self._opinion_section_url,
-            params={'page-size': page_size, 'from-date': most_recent_datetime}
+            # Display helpful statement if user has provided a starting point or it could be found from existing data
+            if most_recent_datetime:
+                print(f'Articles published on or after {most_recent_datetime} will be processed.')
+
+            resume_datetime = self._record_opinion_articles_pages(
+                from_datetime=most_recent_datetime,
+                include_content=include_content,
+                max_workers=max_workers
+            )
+
+            if resume_datetime is None:
+                print('\nAll articles processed and saved to the_guardian.metadata postgres table.')
+                self._rate_controller.report_statistics()
+                return
+
+            print(f'Some pages could not be retrieved on attempt {attempt_number} of {total_attempts} total attempts.')
+
+            most_recent_datetime = resume_datetime
+
+        raise requests.exceptions.RetryError(f'Pages of articles published after {most_recent_datetime} could not '
+                                             f'be retrieved after {total_attempts} attempts.')
+
+    def _record_opinion_articles_pages(
+            self,
+            from_datetime: Union[str, None],
+            include_content: bool,
+            max_workers: int
+    ) -> Union[str, None]:
+        """
+        Request every page of the Opinion section (oldest first) published on or after a point in time, writing each
+        page to postgres as soon as it arrives.
+
+        Parameters
+        ----------
+        from_datetime : str or None
+            Only retrieve articles published on or after this timestamp e.g. '2002-02-25T01:53:00Z'.
+        include_content : bool
+            Whether to also request and save the body of every article.
+        max_workers : int
+            Number of pages which can be requested at the same time.
+
+        Returns
+        -------
+        str or None
+            None if every page was saved. Otherwise, the publication timestamp of the latest article reached without
+            any failed pages before it, which is where a later crawl should start from so no articles are missed.
+
+        Raises
+        ------
+        requests.exceptions.RequestException
+            If the first page cannot be retrieved, as nothing could be saved.
+        """
+
+        # Only a certain number of articles can be pulled with each call (max 200 articles)
+        page_params = {'page-size': 200, 'order-by': 'oldest', 'from-date': from_datetime}
+
+        if include_content:
+            page_params['show-fields'] = 'body'
+
+        # The first page also reveals how many pages have to be called to cover all articles
+        first_page = self._call_api_for_page(page_index=1, page_params=page_params)
+        total_pages = first_page['response']['pages']
+
+        if total_pages == 0:
+            print('No article metadata pulled.')
+            return None
+
+        latest_datetime_per_page = {1: self._write_page_to_postgres(first_page)}
+        failed_pages = []
+
+        with tqdm.tqdm(desc='API pages processed', total=total_pages, initial=1, unit=' page') as progress_bar, \
+                futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+            page_requests = {
+                executor.submit(self._call_api_for_page, page_index=page_index, page_params=page_params): page_index
+                for page_index in range(2, total_pages + 1)
+            }
+
+            # Write to postgres from this thread only, as the database connection is not shared between threads
+            for completed_request in futures.as_completed(page_requests):
+                page_index = page_requests[completed_request]
+
+                try:
+                    latest_datetime_per_page[page_index] = self._write_page_to_postgres(completed_request.result())
+                except requests.exceptions.RequestException as request_error:
+                    print(f'Error making API request on Page {page_index} of {total_pages}')
+                    print(f'Exception: {request_error}')
+                    failed_pages.append(page_index)
+
+                progress_bar.update()
+
+        if not failed_pages:
+            return None
+
+        # Articles are ordered oldest first, so resume from the last page before the first gap
+        last_page_without_gaps = min(failed_pages) - 1
+
+        return max(
+            (
+                latest_datetime_per_page[page_index]
+                for page_index in range(1, last_page_without_gaps + 1)
+                if latest_datetime_per_page[page_index] is not None
+            ),
+            default=from_datetime
         )
-        total_pages = opinion_section_metadata['response']['pages']
 
-        # Call API to record remaining articles
-        opinion_articles_metadata_per_api_call = []
+    def _call_api_for_page(self, page_index: int, page_params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Request a single page of articles from the Opinion section (retries are handled by the rate controller).
+
+        Parameters
+        ----------
+        page_index : int
+            Which page of results to request (starting from 1).
+        page_params : dict
+            Parameters shared by the requests for every page e.g. {'page-size': 200, 'order-by': 'oldest'}
 
-        for page_index in tqdm.tqdm(
-                desc='API pages processed',
-                iterable=range(1, (total_pages + 1)),
-                total=total_pages,
-                unit=' page'
-        ):
+        Returns
+        -------
+        Dict[str, Any]
+            Dictionary version of the API response object.
+        """
 
-            try:
-                opinion_articles_metadata_json = self._call_api_and_display_exceptions(
-                    url=self._opinion_section_url,
-                    params={
-                        'page': page_index,
-                        'page-size': page_size,
-                        'order-by': 'oldest',
-                        'from-date': most_recent_datetime
-                    }
-                )
+        return self._call_api_and_display_exceptions(
+            url=self._opinion_section_url,
+            params={'page': page_index, **page_params}
+        )
 
-                opinion_articles_metadata_df = pd.DataFrame.from_dict(
-                    data=opinion_articles_metadata_json['response']['results']
-                )
+    def _write_page_to_postgres(self, api_response: Dict[str, Any]) -> Union[str, None]:
+        """
+        Save the articles from a single page of API results to postgres.
 
-                opinion_articles_metadata_per_api_call.append(opinion_articles_metadata_df)
+        Parameters
+        ----------
+        api_response : dict
+            Dictionary version of the API response object for one page of results.
+
+        Returns
+        -------
+        str or None
+            Latest publication timestamp of the articles on the page e.g. '2020-08-25T06:00:46Z', or None if the page
+            was empty.
+        """
 
-                # Be polite, do not bombard API with too many requests at once
-                time.sleep(0.5)
+        page_results = api_response['response']['results']
 
-            # Break the loop if an error is encountered, but save the progress made
-            except requests.exceptions.RequestException as request_error:
-                print(f'Error making API request on Page {page_index} of {total_pages}')
-                print(f'Exception: {request_error}')
-                print('\nSaving metadata already pulled to the_guardian.metadata postgres table.')
-                self._write_metadata_to_postgres(metadata_per_api_call=opinion_articles_metadata_per_api_call)
+        if len(page_results) == 0:
+            return None
 
-                raise request_error
+        self._write_metadata_to_postgres(metadata_per_api_call=[pd.DataFrame.from_dict(data=page_results)])
 
-        print('\nAll articles processed, saving data to the_guardian.metadata postgres table.')
-        self._write_metadata_to_postgres(metadata_per_api_call=opinion_articles_metadata_per_api_call)
+        return max(article['webPublicationDate'] for article in page_results)
 
     def _write_metadata_to_postgres(self, metadata_per_api_call: List[pd.DataFrame]) -> None:
         """
-        Prepare the data gathered from each API call and write to postgres.
+        Prepare the data gathered from each API call and write to postgres. If the body of each article was requested
+        alongside its metadata (found in the 'fields' column), the article content is also saved.
 
         Parameters
         ----------
@@ -336,6 +525,12 @@ class ArticleDownloader:
         # Ensure no duplicates exist
         all_opinion_articles.drop_duplicates(subset='id', inplace=True)
 
+        # Article bodies are only present if they were requested from the API
+        article_fields = None
+
+        if 'fields' in all_opinion_articles.columns:
+            article_fields = all_opinion_articles.pop('fields')
+
         self._db_connection.upload_new_data_only_to_existing_table(
             dataframe=all_opinion_articles,
             table_name='article_metadata',
@@ -343,14 +538,47 @@ class ArticleDownloader:
             id_column='id'
         )
 
+        if article_fields is not None:
+            # Some content types (e.g. interactive pieces) have no body
+            article_bodies = [fields.get('body') if isinstance(fields, dict) else None for fields in article_fields]
+
+            content_columns = ['id', 'guardian_id', 'web_publication_timestamp', 'api_url']
+            articles_content = all_opinion_articles[content_columns].copy()
+            articles_content['content'] = [
+                self._convert_html_to_text(body) if body else None for body in article_bodies
+            ]
+
+            self._db_connection.upload_new_data_only_to_existing_table(
+                dataframe=articles_content.dropna(),
+                table_name='article_content',
+                schema='the_guardian',
+                id_column='id'
+            )
+
 
 if __name__ == '__main__':  # pragma: no cover (exclude from testing coverage report)
 
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--metrics-port',
+        type=int,
+        help='Serve live metrics in the Prometheus text format on this port e.g. 9101 (not served by default)'
+    )
+    arguments = parser.parse_args()
+
+    tracing.start_run(run_name='the_guardian')
+
+    if arguments.metrics_port is not None:
+        monitoring.start_metrics_server(port=arguments.metrics_port)
+
     print('Initialising class for downloading article metadata and content from The Guardian')
     article_downloader = ArticleDownloader()
 
-    print('Retrieving metadata')
-    article_downloader.record_opinion_articles_metadata(publication_start_timestamp='2020-06-01T00:00:00Z')
+    print('Retrieving metadata and article content')
+    article_downloader.record_opinion_articles_metadata(
+        publication_start_timestamp='2020-06-01T00:00:00Z',
+        include_content=True
+    )
 
-    print('Retrieving article content')
+    print('Retrieving article content for any articles whose metadata was pulled without their content')
     article_downloader.record_opinion_articles_content()
@@ -0,0 +1,395 @@
+"""Detect articles which are near-duplicates of one another e.g. syndicated or lightly re-edited columns."""
+
+# Standard libraries
+import collections
+import re
+from typing import Dict, List, Set, Tuple, Union
+import zlib
+
+# Third party libraries
+import numpy as np
+import pandas as pd
+from psycopg2 import sql as psy_sql
+import tqdm
+
+# Internal imports
+from interlocutor.commons import tracing
+from interlocutor.database import postgresql
+from interlocutor.pipeline import processing_state
+from interlocutor.pipeline import publications
+
+
+class MinHasher:
+    """
+    Summarise the set of word shingles (overlapping sequences of words) in a text with a MinHash signature, so that
+    the proportion of matching values between two signatures estimates the Jaccard similarity of the two texts.
+    """
+
+    # Mersenne prime used for the universal hash functions, small enough that no intermediate value overflows 64 bits
+    _prime = 2 ** 31 - 1
+
+    def __init__(self, number_of_permutations: int = 128, shingle_size: int = 5, seed: int = 42):
+        """
+        Initialise attributes of class.
+
+        Parameters
+        ----------
+        number_of_permutations : int (default 128)
+            Length of the signature. Longer signatures estimate similarity more accurately but take longer to compute.
+        shingle_size : int (default 5)
+            Number of consecutive words in each shingle.
+        seed : int (default 42)
+            Seed for the random hash functions. Signatures are only comparable if they were computed with the same seed.
+        """
+
+        self._shingle_size = shingle_size
+
+        random_state = np.random.RandomState(seed)
+        self._hash_multipliers = random_state.randint(1, self._prime, size=(number_of_permutations, 1), dtype=np.int64)
+        self._hash_offsets = random_state.randint(0, self._prime, size=(number_of_permutations, 1), dtype=np.int64)
+
+    def _get_shingle_hashes(self, text: str) -> np.ndarray:
+        """
+        Hash every distinct shingle in a text.
+
+        Parameters
+        ----------
+        text : str
+            Text to be shingled.
+
+        Returns
+        -------
+        numpy.ndarray
+            Hash of every distinct shingle, empty if the text has no words.
+        """
+
+        words = re.findall(r'\w+', (text or '').lower())
+
+        if not words:
+            return np.array([], dtype=np.int64)
+
+        shingles = {
+            ' '.join(words[start:start + self._shingle_size])
+            for start in range(max(len(words) - self._shingle_size + 1, 1))
+        }
+
+        return np.array([zlib.crc32(shingle.encode('utf-8')) for shingle in shingles], dtype=np.int64)
+
+    def get_signature(self, text: str) -> Union[np.ndarray, None]:
+        """
+        Compute the MinHash signature of a text.
+
+        Parameters
+        ----------
+        text : str
+            Text to be summarised.
+
+        Returns
+        -------
+        numpy.ndarray or None
+            Minimum value of each hash function across all of the shingles, or None if the text has no words.
+        """
+
+        shingle_hashes = self._get_shingle_hashes(text)
+
+        if shingle_hashes.size == 0:
+            return None
+
+        # Every row applies a different hash function to every shingle
+        permuted_hashes = (self._hash_multipliers * shingle_hashes + self._hash_offsets) % self._prime
+
+        return permuted_hashes.min(axis=1)
+
+    @staticmethod
+    def estimate_similarity(first_signature: np.ndarray, second_signature: np.ndarray) -> float:
+        """
+        Estimate the Jaccard similarity of two texts from their signatures.
+
+        Parameters
+        ----------
+        first_signature : numpy.ndarray
+            Signature of the first text.
+        second_signature : numpy.ndarray
+            Signature of the second text.
+
+        Returns
+        -------
+        float
+            Proportion of matching values in the two signatures, between 0 and 1.
+        """
+
+        return float(np.mean(first_signature == second_signature))
+
+
+class LshIndex:
+    """
+    Locality-sensitive hashing index of MinHash signatures. Signatures are split into bands, and any two signatures
+    sharing an identical band become candidates, so similar signatures can be found without comparing every pair.
+    """
+
+    def __init__(self, number_of_bands: int = 16):
+        """
+        Initialise attributes of class.
+
+        Parameters
+        ----------
+        number_of_bands : int (default 16)
+            Number of bands each signature is split into. More bands find less similar candidates. With 128
+            permutations, 16 bands of 8 values make texts with a similarity above roughly 0.7 likely to be candidates.
+        """
+
+        self._number_of_bands = number_of_bands
+        self._buckets: List[Dict[bytes, List[str]]] = [collections.defaultdict(list) for _ in range(number_of_bands)]
+
+    def _get_band_keys(self, signature: np.ndarray) -> List[bytes]:
+        """Split a signature into bands, each represented by its raw bytes."""
+
+        return [band.tobytes() for band in np.array_split(signature.astype(np.int64), self._number_of_bands)]
+
+    def add(self, article_id: str, signature: np.ndarray) -> None:
+        """
+        Add a signature to the index.
+
+        Parameters
+        ----------
+        article_id : str
+            Unique identifier of the article.
+        signature : numpy.ndarray
+            MinHash signature of the article content.
+        """
+
+        for band_number, band_key in enumerate(self._get_band_keys(signature)):
+            self._buckets[band_number][band_key].append(article_id)
+
+    def get_candidates(self, signature: np.ndarray) -> Set[str]:
+        """
+        Find the articles in the index which share at least one band with a signature.
+
+        Parameters
+        ----------
+        signature : numpy.ndarray
+            MinHash signature to look up.
+
+        Returns
+        -------
+        set
+            IDs of candidate near-duplicate articles.
+        """
+
+        candidates = set()
+
+        for band_number, band_key in enumerate(self._get_band_keys(signature)):
+            candidates.update(self._buckets[band_number].get(band_key, []))
+
+        return candidates
+
+
+class NearDuplicateDetector:
+    """
+    Build an index of MinHash signatures for the content of every article as it is ingested, and record any article
+    which is a near-duplicate of one indexed before it in encoded_articles.near_duplicate_articles. Near-duplicates are
+    then skipped by preprocessing, encoding, and the similarity calculations.
+    """
+
+    def __init__(self, similarity_threshold: float = 0.8, number_of_permutations: int = 128, number_of_bands: int = 16):
+        """
+        Initialise attributes of class.
+
+        Parameters
+        ----------
+        similarity_threshold : float (default 0.8)
+            Estimated Jaccard similarity of word shingles above which two articles are classed as near-duplicates.
+        number_of_permutations : int (default 128)
+            Length of each MinHash signature.
+        number_of_bands : int (default 16)
+            Number of bands used by the locality-sensitive hashing index.
+        """
+
+        self._similarity_threshold = similarity_threshold
+        self._min_hasher = MinHasher(number_of_permutations=number_of_permutations)
+        self._number_of_bands = number_of_bands
+        self._db_connection = postgresql.DatabaseConnection()
+        self._processing_state = processing_state.ProcessingState(db_connection=self._db_connection)
+
+        # Recorded against each article indexed, as signatures of different lengths cannot be compared
+        self._version = f'minhash-{number_of_permutations}'
+
+        self._publication_schemas = publications.get_schemas()
+
+    def _load_index(self) -> Tuple[LshIndex, Dict[str, np.ndarray], Dict[str, str]]:
+        """
+        Load every signature computed previously into an index, along with the duplicates already found.
+
+        Returns
+        -------
+        tuple
+            Index of existing signatures, mapping of article ID to signature, and mapping of each known near-duplicate
+            to the original article it duplicates.
+        """
+
+        lsh_index = LshIndex(number_of_bands=self._number_of_bands)
+        signatures = {}
+
+        df_signatures = self._db_connection.get_dataframe(table_name='minhash_signatures', schema='encoded_articles')
+
+        for article_id, signature in zip(df_signatures['id'].values, df_signatures['signature'].values):
+            signatures[article_id] = np.array(signature, dtype=np.int64)
+            lsh_index.add(article_id=article_id, signature=signatures[article_id])
+
+        df_duplicates = self._db_connection.get_dataframe(
+            table_name='near_duplicate_articles',
+            schema='encoded_articles'
+        )
+
+        duplicate_of = dict(zip(df_duplicates['id'].values, df_duplicates['duplicate_of_id'].values))
+
+        return lsh_index, signatures, duplicate_of
+
+    def _load_unindexed_articles(self, backlogs: Dict[str, psy_sql.Composable]) -> pd.DataFrame:
+        """
+        Load the content of every article ingested since the last run which does not yet have a signature.
+
+        Parameters
+        ----------
+        backlogs : dict[str, psycopg2.sql.Composable]
+            Subquery selecting the ids of the articles ingested since the last run from each publication (see
+            `interlocutor.pipeline.processing_state.ProcessingState.get_backlog`).
+
+        Returns
+        -------
+        pandas.DataFrame
+            The 'id', 'publication' (schema), and 'content' of each article.
+        """
+
+        all_articles = []
+
+        for schema, backlog in backlogs.items():
+
+            sql_query = psy_sql.SQL("""
+                SELECT content.id, %(publication)s AS publication, content.content
+                FROM {content_table} AS content
+                WHERE content.id IN ({backlog})
+                  AND NOT EXISTS (SELECT 1 FROM encoded_articles.minhash_signatures AS signatures
+                                  WHERE signatures.id = content.id);
+                """).format(content_table=psy_sql.Identifier(schema, 'article_content'), backlog=backlog)
+
+            all_articles.append(self._db_connection.get_dataframe(
+                query=sql_query,
+                query_params={'publication': schema}
+            ))
+
+        return pd.concat(all_articles, ignore_index=True)
+
+    @tracing.traced('deduplication.index_new_articles')
+    def index_new_articles(self, publications: List[str] = None) -> None:
+        """
+        Compute signatures for articles ingested since the last run which have not been indexed yet, compare each one
+        against the articles already indexed (including those earlier in the same run), and save the signatures and any
+        near-duplicates found.
+
+        A near-duplicate is recorded against the original article of its cluster, so chains of lightly re-edited copies
+        all point to the same article.
+
+        Parameters
+        ----------
+        publications : list[str] (default None)
+            Schemas of the publications whose new articles are indexed. Defaults to every publication. Articles are
+            always compared against the articles already indexed from every publication.
+        """
+
+        backlogs, horizons = {}, {}
+
+        for schema in publications or self._publication_schemas:
+            backlogs[schema], horizons[schema] = self._processing_state.get_backlog(
+                stage='deduplicated',
+                upstream_stage='ingested',
+                publication=schema
+            )
+
+        lsh_index, signatures, duplicate_of = self._load_index()
+        new_articles = self._load_unindexed_articles(backlogs=backlogs)
+
+        new_signatures = []
+        new_duplicates = []
+
+        for article in tqdm.tqdm(
+                desc='Articles indexed for near-duplicates',
+                iterable=new_articles.to_dict(orient='records'),
+                total=len(new_articles),
+                unit=' article'
+        ):
+
+            signature = self._min_hasher.get_signature(article['content'])
+
+            # Articles without any words cannot be compared
+            if signature is None:
+                continue
+
+            best_match, best_similarity = None, self._similarity_threshold
+
+            for candidate_id in lsh_index.get_candidates(signature):
+                similarity = self._min_hasher.estimate_similarity(signature, signatures[candidate_id])
+
+                if similarity >= best_similarity:
+                    best_match, best_similarity = candidate_id, similarity
+
+            if best_match is not None:
+                original_id = duplicate_of.get(best_match, best_match)
+                duplicate_of[article['id']] = original_id
+
+                new_duplicates.append({
+                    'id': article['id'],
+                    'duplicate_of_id': original_id,
+                    'estimated_similarity': best_similarity
+                })
+
+            signatures[article['id']] = signature
+            lsh_index.add(article_id=article['id'], signature=signature)
+
+            new_signatures.append({
+                'id': article['id'],
+                'publication': article['publication'],
+                'signature': signature.tolist()
+            })
+
+        print(f'{len(new_duplicates)} near-duplicates found among {len(new_signatures)} newly indexed articles.')
+
+        # Only articles without a signature were loaded, so everything here is new
+        if new_signatures:
+            self._db_connection.upload_dataframe(
+                dataframe=pd.DataFrame(data=new_signatures),
+                table_name='minhash_signatures',
+                schema='encoded_articles',
+                if_exists='append',
+                index=False
+            )
+
+        if new_duplicates:
+            self._db_connection.upload_dataframe(
+                dataframe=pd.DataFrame(data=new_duplicates),
+                table_name='near_duplicate_articles',
+                schema='encoded_articles',
+                if_exists='append',
+                index=False
+            )
+
+        # Articles without any words are marked too, so they are not loaded again
+        for schema, horizon in horizons.items():
+            self._processing_state.mark_processed(
+                stage='deduplicated',
+                publication=schema,
+                article_ids=new_articles.loc[new_articles['publication'] == schema, 'id'].tolist(),
+                version=self._version
+            )
+            self._processing_state.advance_watermark(stage='deduplicated', publication=schema, horizon=horizon)
+
+
+if __name__ == '__main__':  # pragma: no cover (exclude from testing coverage report)
+
+    tracing.start_run(run_name='deduplication')
+
+    print('Initialising class for detecting near-duplicate articles')
+    near_duplicate_detector = NearDuplicateDetector()
+
+    print('Indexing new articles and recording any near-duplicates')
+    near_duplicate_detector.index_new_articles()
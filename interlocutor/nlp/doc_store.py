@@ -0,0 +1,129 @@
+"""Store the spaCy parse of each article so it can be filtered again without re-parsing the text."""
+
+# Standard libraries
+from typing import TYPE_CHECKING, Iterator, List, Tuple
+
+# Third party libraries
+import pandas as pd
+from psycopg2 import sql as psy_sql
+
+# Internal imports
+from interlocutor.database import postgresql
+
+# spaCy takes seconds to import, so it is only imported by the methods which use it
+if TYPE_CHECKING:
+    import spacy
+
+
+class SpacyDocStore:
+    """
+    Persist a compact `DocBin` serialisation of each article's spaCy `Doc` in postgres (preprocessing.spacy_docs), so
+    that changing which tokens are kept (e.g. keeping numbers, or adding custom stop words) only requires re-filtering
+    the stored docs rather than passing the whole corpus through spaCy again.
+
+    The text of every token and its lemma are stored. Lexical attributes such as `is_stop` and `is_punct` come from the
+    vocabulary the docs are loaded with, so changes to stop words are picked up when the docs are re-filtered.
+    """
+
+    def __init__(self, db_connection: postgresql.DatabaseConnection, vocab: 'spacy.vocab.Vocab'):
+        """
+        Initialise attributes of class.
+
+        Parameters
+        ----------
+        db_connection : interlocutor.database.postgresql.DatabaseConnection
+            Connection to the database holding the docs.
+        vocab : spacy.vocab.Vocab
+            Vocabulary of the spaCy pipeline which parsed the docs, used when loading them again.
+        """
+
+        self._db_connection = db_connection
+        self._vocab = vocab
+        self._schema = 'preprocessing'
+        self._table_name = 'spacy_docs'
+        self._attributes = ['LEMMA']
+
+    def save(self, article_ids: List[str], publication: str, documents: List['spacy.tokens.Doc']) -> None:
+        """
+        Store the docs for articles, replacing any docs already stored for them.
+
+        Parameters
+        ----------
+        article_ids : list
+            Unique identifier of each article.
+        publication : str
+            Schema of the publication the articles belong to e.g. 'daily_mail'.
+        documents : list
+            spaCy doc of each article, in the same order as `article_ids`.
+        """
+
+        if not article_ids:
+            return
+
+        from spacy.tokens import DocBin
+
+        serialised_docs = []
+
+        for document in documents:
+            doc_bin = DocBin(attrs=self._attributes)
+            doc_bin.add(document)
+            serialised_docs.append(doc_bin.to_bytes())
+
+        self._db_connection.execute_database_operation(
+            sql_command=psy_sql.SQL("DELETE FROM {table} WHERE id IN %(article_ids)s;").format(
+                table=psy_sql.Identifier(self._schema, self._table_name)
+            ),
+            params={'article_ids': tuple(article_ids)}
+        )
+
+        # Appended directly rather than via a staging table, which would store the serialised docs as text
+        self._db_connection.upload_dataframe(
+            dataframe=pd.DataFrame(data={
+                'id': article_ids,
+                'publication': publication,
+                'doc_bin': serialised_docs
+            }),
+            table_name=self._table_name,
+            schema=self._schema,
+            if_exists='append',
+            index=False
+        )
+
+    def iterate_docs(
+            self,
+            publication: str,
+            chunk_size: int = 500
+    ) -> Iterator[Tuple[List[str], List['spacy.tokens.Doc']]]:
+        """
+        Load the stored docs of a publication's articles, a chunk at a time.
+
+        Parameters
+        ----------
+        publication : str
+            Schema of the publication e.g. 'daily_mail'.
+        chunk_size : int (default 500)
+            Maximum number of docs loaded at one time.
+
+        Yields
+        ------
+        tuple
+            Unique identifiers of the articles in the chunk, and their spaCy docs in the same order.
+        """
+
+        from spacy.tokens import DocBin
+
+        doc_query = psy_sql.SQL("SELECT id, doc_bin FROM {table} WHERE publication = %(publication)s;").format(
+            table=psy_sql.Identifier(self._schema, self._table_name)
+        )
+
+        for stored_docs in self._db_connection.get_dataframe_in_chunks(
+                query=doc_query,
+                query_params={'publication': publication},
+                chunk_size=chunk_size
+        ):
+            documents = [
+                next(DocBin().from_bytes(bytes(doc_bin)).get_docs(self._vocab))
+                for doc_bin in stored_docs['doc_bin']
+            ]
+
+            yield stored_docs['id'].tolist(), documents
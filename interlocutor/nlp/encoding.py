@@ -1,17 +1,24 @@
 """Encode/embed text so it is represented in a form which can be used by machine learning algorithms."""
 
 # Standard libaries
-from typing import Dict, List
+import hashlib
+from typing import TYPE_CHECKING, Dict, List
 
 # Third party libraries
 import numpy as np
 import pandas as pd
 from psycopg2 import sql as psy_sql
-from sklearn.feature_extraction import text as sklearn_text
-from sklearn.metrics import pairwise
 
 # Internal imports
+from interlocutor.commons import tracing
 from interlocutor.database import postgresql
+from interlocutor.nlp import lemma_dictionary
+from interlocutor.pipeline import processing_state
+from interlocutor.pipeline import publications
+
+# scipy and scikit-learn take seconds to import, so they are only imported by the methods which use them
+if TYPE_CHECKING:
+    from scipy import sparse
 
 
 class TfidfEncoder:
@@ -30,22 +37,26 @@ class TfidfEncoder:
 
         self._db_connection = postgresql.DatabaseConnection()
         self._use_existing_vocab = use_existing_vocab
+        self._lemma_dictionary = lemma_dictionary.LemmaDictionary(db_connection=self._db_connection)
+        self._processing_state = processing_state.ProcessingState(db_connection=self._db_connection)
+
+        # Publications whose articles are encoded
+        self._publications = publications.get_schemas()
 
-    def _analyse_and_overwrite_existing_vocabulary(self, preprocessed_content: List[str]) -> None:
+    @tracing.traced('encoding.build_vocabulary')
+    def _analyse_and_overwrite_existing_vocabulary(self, token_ids: List[np.ndarray]) -> None:
         """
         Capture all of the distinct words appearing across the preprocessed version of articles and save to database.
 
         Parameters
         ----------
-        preprocessed_content : list[str]
-            Preprocessed version of content for each article.
+        token_ids : list[numpy.ndarray]
+            Lemma id of every word in the preprocessed version of each article (see `_get_token_ids`).
         """
 
-        vectoriser = sklearn_text.TfidfVectorizer()
-        vectoriser.fit(preprocessed_content)
-
-        # Extract all of the unique words found
-        words = vectoriser.get_feature_names()
+        # Extract all of the unique words found, sorted in the same order as sklearn's vectorisers
+        unique_token_ids = np.unique(np.concatenate([np.empty(0, dtype=int)] + token_ids))
+        words = sorted(self._lemma_dictionary.get_lemmas(unique_token_ids))
         new_vocabulary = pd.DataFrame(data={'word': words, 'feature_matrix_index': range(len(words))})
 
         # Replace existing data
@@ -59,49 +70,103 @@ class TfidfEncoder:
             index=False,
         )
 
-    def _calculate_similarities(self) -> pd.DataFrame:
+    @tracing.traced('encoding.calculate_similarities')
+    def _calculate_similarities(self, article_ids: List[str] = None) -> pd.DataFrame:
         """
         Load the encoded version of every article and save how similar they are to one another (using cosine
         similarity).
 
+        Parameters
+        ----------
+        article_ids : list[str] (default None)
+            Articles to score against every article, so that only their rows of the matrix are calculated. Every article
+            is scored if not set.
+
         Returns
         -------
         pandas.DataFrame
-            Matrix showing the similarity of every article relative to one another.
+            Matrix showing the similarity of every article (or each of `article_ids`) relative to every article.
         """
 
+        from sklearn.metrics import pairwise
+
+        # Collapse near-duplicates onto their original article, in case they were encoded before they were detected
         df_encoded_articles = self._db_connection.get_dataframe(
-            table_name='tfidf_representation',
-            schema='encoded_articles'
+            query="""
+                  SELECT * FROM encoded_articles.tfidf_representation AS encoded
+                  WHERE NOT EXISTS (SELECT 1 FROM encoded_articles.near_duplicate_articles AS duplicate
+                                    WHERE duplicate.id = encoded.id);
+                  """
         ).set_index('id')
 
         # Pandas loads the array column 'encoded' as a string e.g. "[0.0, 0.6, 0.8]" which needs translating to an array
         encoded_representations = np.array(df_encoded_articles['encoded'].tolist())
 
+        scored_articles = np.ones(len(df_encoded_articles), dtype=bool) if article_ids is None else \
+            df_encoded_articles.index.isin(article_ids)
+
+        with tracing.span('encoding.cosine_similarity'):
+            similarities = pairwise.cosine_similarity(encoded_representations[scored_articles], encoded_representations)
+
         return pd.DataFrame(
-            index=df_encoded_articles.index,
+            index=df_encoded_articles.index[scored_articles],
             columns=df_encoded_articles.index,
-            data=pairwise.cosine_similarity(encoded_representations)
+            data=similarities
         )
 
-    def encode_articles(self) -> None:
+    @tracing.traced('encoding.encode_articles')
+    def encode_articles(self) -> List[str]:
         """
-        Represent articles as tf-idf matrix and save to database. Only runs on articles which have not already been
-        encoded if using an existing vocabulary, otherwise will fit and re-encode all articles.
+        Represent articles as tf-idf matrix and save to database. Only runs on articles which have been preprocessed
+        since the last run if using an existing vocabulary (see `interlocutor.pipeline.processing_state`), otherwise
+        will fit and re-encode all articles.
+
+        Returns
+        -------
+        list[str]
+            IDs of the articles encoded.
         """
 
-        # Retrieve all of the preprocessed version of articles
-        preprocessed_content = self._load_all_articles_bow_preprocessed_content()
+        from sklearn.feature_extraction import text as sklearn_text
+
+        backlogs, horizons = {}, {}
+
+        for publication in self._publications:
+            backlogs[publication], horizons[publication] = self._processing_state.get_backlog(
+                stage='encoded',
+                upstream_stage='preprocessed',
+                publication=publication
+            )
+
+        # Retrieve the preprocessed version of articles, as the lemma id of each word
+        preprocessed_content = self._load_all_articles_bow_preprocessed_content(
+            backlogs=backlogs if self._use_existing_vocab else None
+        )
+
+        # Nothing is waiting to be encoded (e.g. a worker catching up while idle), so only move the watermarks on
+        if preprocessed_content.empty:
+            for publication in self._publications:
+                self._processing_state.advance_watermark(
+                    stage='encoded',
+                    publication=publication,
+                    horizon=horizons[publication]
+                )
+
+            return []
+
+        token_ids = self._get_token_ids(preprocessed_content)
+        tracing.count('articles', len(preprocessed_content))
 
         # If a new vocabulary needs to be established, then analyse all texts
         if not self._use_existing_vocab:
-            self._analyse_and_overwrite_existing_vocabulary(preprocessed_content['processed_content'].values)
+            self._analyse_and_overwrite_existing_vocabulary(token_ids)
 
-        # Create a vectoriser using either the pre-existing vocabulary or a new one which has been extracted
+        # Encode using either the pre-existing vocabulary or a new one which has been extracted
         vocabulary = self._load_vocabulary()
-        vectoriser = sklearn_text.TfidfVectorizer(vocabulary=vocabulary)
+        vocabulary_counts = self._count_vocabulary(token_ids=token_ids, vocabulary=vocabulary)
 
-        encoded_articles_matrix = vectoriser.fit_transform(preprocessed_content['processed_content'].values)
+        with tracing.span('encoding.tfidf_transform'):
+            encoded_articles_matrix = sklearn_text.TfidfTransformer().fit_transform(vocabulary_counts)
 
         encoded_articles_dataframe = pd.DataFrame(
             # postgresql has a maximum number of columns which would be exceeded with two many words as columns,
@@ -119,6 +184,13 @@ class TfidfEncoder:
         if not self._use_existing_vocab:
             self._db_connection.execute_database_operation('TRUNCATE TABLE encoded_articles.tfidf_representation;')
 
+        # Otherwise only replace articles which are encoded again (e.g. after their preprocessed content changed)
+        elif not encoded_articles_dataframe.empty:
+            self._db_connection.execute_database_operation(
+                sql_command="DELETE FROM encoded_articles.tfidf_representation WHERE id IN %(article_ids)s;",
+                params={'article_ids': tuple(encoded_articles_dataframe['id'])}
+            )
+
         self._db_connection.upload_dataframe(
             dataframe=encoded_articles_dataframe,
             table_name='tfidf_representation',
@@ -127,42 +199,145 @@ class TfidfEncoder:
             index=False
         )
 
-    def _load_all_articles_bow_preprocessed_content(self) -> pd.DataFrame:
+        # The vocabulary identifies which version of the encoding each article has
+        vocabulary_version = hashlib.md5(' '.join(sorted(vocabulary)).encode('utf-8')).hexdigest()
+
+        for publication in self._publications:
+            self._processing_state.mark_processed(
+                stage='encoded',
+                publication=publication,
+                article_ids=preprocessed_content.loc[preprocessed_content['publication'] == publication, 'id'].tolist(),
+                version=vocabulary_version
+            )
+            self._processing_state.advance_watermark(
+                stage='encoded',
+                publication=publication,
+                horizon=horizons[publication]
+            )
+
+        return preprocessed_content['id'].tolist()
+
+    @tracing.traced('encoding.get_token_ids')
+    def _get_token_ids(self, preprocessed_content: pd.DataFrame) -> List[np.ndarray]:
         """
-        Read the bag of words preprocessed content from all of the articles available.
+        Gather the lemma id of every word in each article, converting the preprocessed content of articles whose lemma
+        ids were not stored when they were preprocessed.
+
+        Parameters
+        ----------
+        preprocessed_content : pandas.DataFrame
+            Preprocessed version of each article (see `_load_all_articles_bow_preprocessed_content`).
 
         Returns
         -------
-        pandas.DataFrame
-            ID for all articles alongside a preprocessed version of their text content.
+        list[numpy.ndarray]
+            Lemma ids of each article, in the same order.
         """
 
-        # Placeholder dataframe to store the article content
-        all_preprocessed_content = pd.DataFrame(columns=['id', 'processed_content'])
+        token_ids = preprocessed_content['token_ids'].tolist()
+        missing_token_ids = [position for position, ids in enumerate(token_ids) if not isinstance(ids, list)]
 
-        # Append preprocessed content from each publication
-        for publication in ['daily_mail', 'the_guardian']:
+        converted_token_ids = self._lemma_dictionary.encode(
+            [preprocessed_content['processed_content'].iloc[position] for position in missing_token_ids]
+        )
 
-            # If using an existing vocabulary, only pull the articles which have not yet been encoded
-            if self._use_existing_vocab:
+        for position, ids in zip(missing_token_ids, converted_token_ids):
+            token_ids[position] = ids
 
-                sql_query = psy_sql.SQL("""
-                    SELECT * FROM {source_schema_and_table}
-                    WHERE id NOT IN (SELECT id FROM encoded_articles.tfidf_representation);
-                    """).format(
-                    source_schema_and_table=psy_sql.Identifier(publication, 'article_content_bow_preprocessed')
-                )
+        return [np.asarray(ids, dtype=int) for ids in token_ids]
 
-                publication_content = self._db_connection.get_dataframe(query=sql_query)
+    @tracing.traced('encoding.count_vocabulary')
+    def _count_vocabulary(self, token_ids: List[np.ndarray], vocabulary: Dict[str, int]) -> 'sparse.csr_matrix':
+        """
+        Count how many times each word in the vocabulary appears in each article, directly from their lemma ids.
 
-            # Otherwise re-load all articles to encode again
-            else:
-                publication_content = self._db_connection.get_dataframe(
-                    table_name='article_content_bow_preprocessed',
-                    schema=publication
-                )
+        Parameters
+        ----------
+        token_ids : list[numpy.ndarray]
+            Lemma ids of each article (see `_get_token_ids`).
+        vocabulary : dict[str, int]
+            Mapping of word and its corresponding index in the feature matrix.
+
+        Returns
+        -------
+        scipy.sparse.csr_matrix
+            Count of each word (column) in each article (row). Words outside of the vocabulary are not counted.
+        """
+
+        from scipy import sparse
+
+        all_token_ids = np.concatenate([np.empty(0, dtype=int)] + token_ids)
+        lemma_ids = self._lemma_dictionary.lemma_ids
 
-            all_preprocessed_content = pd.concat([all_preprocessed_content, publication_content])
+        # Feature matrix index of every lemma id, or -1 if the lemma is not in the vocabulary
+        lemma_id_to_feature = np.full(max([all_token_ids.max(initial=-1)] + list(lemma_ids.values())) + 1, -1)
+
+        for word, feature_matrix_index in vocabulary.items():
+            if word in lemma_ids:
+                lemma_id_to_feature[lemma_ids[word]] = feature_matrix_index
+
+        features = lemma_id_to_feature[all_token_ids]
+        articles = np.repeat(np.arange(len(token_ids)), [len(ids) for ids in token_ids])
+        in_vocabulary = features >= 0
+
+        # Repeated (article, feature) pairs are summed when building the matrix
+        return sparse.csr_matrix(
+            (np.ones(in_vocabulary.sum()), (articles[in_vocabulary], features[in_vocabulary])),
+            shape=(len(token_ids), len(vocabulary))
+        )
+
+    def _load_all_articles_bow_preprocessed_content(
+            self,
+            backlogs: Dict[str, psy_sql.Composable] = None
+    ) -> pd.DataFrame:
+        """
+        Read the bag of words preprocessed content from all of the articles available.
+
+        Parameters
+        ----------
+        backlogs : dict[str, psycopg2.sql.Composable] (default None)
+            Subquery selecting the ids of the articles waiting to be encoded from each publication (see
+            `interlocutor.pipeline.processing_state.ProcessingState.get_backlog`), so that only those are loaded.
+            Every article is loaded if not set.
+
+        Returns
+        -------
+        pandas.DataFrame
+            ID and publication (schema) for all articles alongside the lemma ids of their preprocessed content
+            (`token_ids`). The preprocessed text (`processed_content`) is only loaded for articles without lemma ids.
+        """
+
+        # Placeholder dataframe to store the article content
+        all_preprocessed_content = pd.DataFrame(columns=['id', 'publication', 'processed_content', 'token_ids'])
+
+        # Append preprocessed content from each publication (near-duplicates of other articles are skipped)
+        for publication in self._publications:
+
+            # If using an existing vocabulary, only pull the articles waiting to be encoded, otherwise re-load all
+            # articles to encode again
+            backlog_condition = psy_sql.SQL('bow.id IN ({backlog})').format(
+                backlog=backlogs[publication]
+            ) if backlogs else psy_sql.SQL('TRUE')
+
+            sql_query = psy_sql.SQL("""
+                SELECT bow.id,
+                       {publication} AS publication,
+                       CASE WHEN token_ids.token_ids IS NULL THEN bow.processed_content END AS processed_content,
+                       token_ids.token_ids
+                FROM {source_schema_and_table} AS bow
+                LEFT JOIN preprocessing.bow_token_ids AS token_ids ON bow.id = token_ids.id
+                WHERE {backlog_condition}
+                  AND NOT EXISTS (SELECT 1 FROM encoded_articles.near_duplicate_articles AS duplicate
+                                  WHERE duplicate.id = bow.id);
+                """).format(
+                publication=psy_sql.Literal(publication),
+                source_schema_and_table=psy_sql.Identifier(publication, 'article_content_bow_preprocessed'),
+                backlog_condition=backlog_condition
+            )
+
+            publication_content = self._db_connection.get_dataframe(query=sql_query)
+
+            all_preprocessed_content = pd.concat([all_preprocessed_content, publication_content], ignore_index=True)
 
         return all_preprocessed_content
 
@@ -182,7 +357,8 @@ class TfidfEncoder:
 
         return df_existing_vocab['feature_matrix_index'].to_dict()
 
-    def store_most_similar_articles(self, similarity_threshold: float) -> None:
+    @tracing.traced('encoding.store_most_similar_articles')
+    def store_most_similar_articles(self, similarity_threshold: float, article_ids: List[str] = None) -> None:
         """
         Analyse the similarity score between all articles, and save the mapping for every article where we can find
         another similar one in the database.
@@ -192,6 +368,10 @@ class TfidfEncoder:
         similarity_threshold : float in interval [0,1)
             Cosine similarity score which the two articles must exceed to be classed as similar.
             Has to fall between 0 and 1.
+        article_ids : list[str] (default None)
+            Articles (e.g. those just encoded) to score against every article, so that only the pairs including them
+            are replaced. Every article is scored against one another if not set, which grows quadratically with the
+            number of articles.
 
         Raises
         ------
@@ -202,36 +382,50 @@ class TfidfEncoder:
         if not 0 <= similarity_threshold < 1:
             raise ValueError("similarity_threshold should be between 0 <= threshold < 1")
 
-        df_similarity = self._calculate_similarities()
-
-        df_similarity_array = df_similarity.values
+        if article_ids is not None and not article_ids:
+            return
 
-        # Index (positioning) of every article in the matrix
-        article_index_mapping = dict((index, title) for index, title in enumerate(df_similarity.index))
+        df_similarity = self._calculate_similarities(article_ids=article_ids)
 
-        # Index (positioning) of every score which exceeds the threshold
-        indices_above_threshold = np.argwhere(df_similarity_array > similarity_threshold)
+        df_similarity_array = df_similarity.values
 
-        # Store the pairs of articles which have a suitable similarity
-        df_above_threshold = pd.DataFrame(columns=['id', 'similar_article_id'], data=indices_above_threshold)
+        # Row and column position of every score which exceeds the threshold
+        rows_above_threshold, columns_above_threshold = np.nonzero(df_similarity_array > similarity_threshold)
 
-        # Retrieve the actual similarity score by using the row and column position in the original matrix for each pair
-        df_above_threshold['similarity_score'] = \
-            df_similarity_array[indices_above_threshold[:, 0], indices_above_threshold[:, 1]]
+        # Store the pairs of articles which have a suitable similarity, replacing positions with the article ids so they
+        # are more usable
+        df_above_threshold = pd.DataFrame(data={
+            'id': df_similarity.index.values[rows_above_threshold],
+            'similar_article_id': df_similarity.columns.values[columns_above_threshold],
+            'similarity_score': df_similarity_array[rows_above_threshold, columns_above_threshold]
+        })
 
         # Remove instances where the article is paired with itself
         df_above_threshold = df_above_threshold[df_above_threshold['id'] != df_above_threshold['similar_article_id']]
 
-        # Replace indices with the article id so it is more usable
-        df_above_threshold[['id', 'similar_article_id']] = \
-            df_above_threshold[['id', 'similar_article_id']].replace(article_index_mapping)
+        if article_ids is None:
+            # Wipe and replace each time as every article is evaluated against one another
+            self._db_connection.execute_database_operation("TRUNCATE TABLE encoded_articles.tfidf_similar_articles;")
 
-        # Wipe and replace each time as every article is evaluated against one another. For a more scalable solution, a
-        # graph database may prove more effective so articles do not have to be repeatedly scored against one another
-        self._db_connection.execute_database_operation("TRUNCATE TABLE encoded_articles.tfidf_similar_articles;")
+        else:
+            # Pairs are stored both ways round, as they are when every article is scored against one another
+            df_above_threshold = pd.concat([
+                df_above_threshold,
+                df_above_threshold.rename(columns={'id': 'similar_article_id', 'similar_article_id': 'id'})
+            ], ignore_index=True).drop_duplicates(subset=['id', 'similar_article_id'])
+
+            self._db_connection.execute_database_operation(
+                sql_command="""
+                            DELETE FROM encoded_articles.tfidf_similar_articles
+                            WHERE id IN %(article_ids)s OR similar_article_id IN %(article_ids)s;
+                            """,
+                params={'article_ids': tuple(article_ids)}
+            )
+
+        tracing.count('similar_pairs', len(df_above_threshold))
 
         self._db_connection.upload_dataframe(
-            dataframe=df_above_threshold,
+            dataframe=df_above_threshold[['id', 'similar_article_id', 'similarity_score']],
             table_name='tfidf_similar_articles',
             schema='encoded_articles',
             if_exists='append',
@@ -241,6 +435,8 @@ class TfidfEncoder:
 
 if __name__ == '__main__':
 
+    tracing.start_run(run_name='encoding')
+
     print('Initialising class for encoding articles using tf-idf')
     tfidf_encoder = TfidfEncoder(use_existing_vocab=False)
 
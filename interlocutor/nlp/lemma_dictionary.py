@@ -0,0 +1,155 @@
+"""Represent preprocessed text compactly as the integer id of each of its lemmas."""
+
+# Standard libraries
+from typing import Dict, Iterable, List
+
+# Third party libraries
+from psycopg2 import sql as psy_sql
+
+# Internal imports
+from interlocutor.database import postgresql
+
+
+class LemmaDictionary:
+    """
+    Persistent mapping between every lemma seen in preprocessed text and an integer id (preprocessing.lemma_dictionary),
+    used to store each article as an array of lemma ids so the encoder can count them without tokenising text again.
+
+    Preprocessed text is split into lemmas with the same analyser `sklearn.feature_extraction.text.TfidfVectorizer`
+    uses by default (lowercase words of two or more characters), so counting the ids gives exactly the same matrix as
+    vectorising the text. Ids are never reassigned, so arrays stored by earlier runs remain valid as the dictionary
+    grows.
+    """
+
+    def __init__(self, db_connection: postgresql.DatabaseConnection = None):
+        """
+        Initialise attributes of class.
+
+        Parameters
+        ----------
+        db_connection : interlocutor.database.postgresql.DatabaseConnection (default None)
+            Connection to the database holding the dictionary. The dictionary is only kept in memory if not provided.
+        """
+
+        self._db_connection = db_connection
+        self._schema = 'preprocessing'
+        self._table_name = 'lemma_dictionary'
+        self._analyser = None
+
+        self._lemma_ids = self._load_lemma_ids() if db_connection else {}
+        self._lemmas = {lemma_id: lemma for lemma, lemma_id in self._lemma_ids.items()}
+
+    def _analyse(self, text: str) -> List[str]:
+        """
+        Split preprocessed text into lemmas. scikit-learn is only imported the first time, as it takes seconds to import
+        and the dictionary is created by every preprocessor and encoder.
+
+        Parameters
+        ----------
+        text : str
+            Preprocessed text.
+
+        Returns
+        -------
+        list[str]
+            Every lemma in the text, in the order they appear.
+        """
+
+        if self._analyser is None:
+            from sklearn.feature_extraction import text as sklearn_text
+            self._analyser = sklearn_text.TfidfVectorizer().build_analyzer()
+
+        return self._analyser(text)
+
+    @property
+    def lemma_ids(self) -> Dict[str, int]:
+        """Mapping of every lemma in the dictionary to its id."""
+
+        return self._lemma_ids
+
+    def _load_lemma_ids(self) -> Dict[str, int]:
+        """Load every lemma stored in the database and its id."""
+
+        df_dictionary = self._db_connection.get_dataframe(table_name=self._table_name, schema=self._schema)
+
+        return dict(zip(df_dictionary['lemma'], df_dictionary['lemma_id'].astype(int)))
+
+    def _add_lemmas(self, lemmas: List[str]) -> None:
+        """
+        Assign ids to lemmas which are not yet in the dictionary.
+
+        Ids are assigned by the database when connected, so that preprocessors running at the same time agree on them.
+
+        Parameters
+        ----------
+        lemmas : list[str]
+            Distinct lemmas missing from the dictionary.
+        """
+
+        if self._db_connection is None:
+            new_lemma_ids = {lemma: len(self._lemma_ids) + position for position, lemma in enumerate(lemmas)}
+
+        else:
+            table = psy_sql.Identifier(self._schema, self._table_name)
+
+            self._db_connection.execute_database_operation(
+                sql_command=psy_sql.SQL(
+                    "INSERT INTO {table} (lemma) SELECT UNNEST(%(lemmas)s) ON CONFLICT (lemma) DO NOTHING;"
+                ).format(table=table),
+                params={'lemmas': lemmas}
+            )
+
+            df_new_lemmas = self._db_connection.get_dataframe(
+                query=psy_sql.SQL("SELECT lemma, lemma_id FROM {table} WHERE lemma = ANY(%(lemmas)s);").format(
+                    table=table
+                ),
+                query_params={'lemmas': lemmas}
+            )
+
+            new_lemma_ids = dict(zip(df_new_lemmas['lemma'], df_new_lemmas['lemma_id'].astype(int)))
+
+        self._lemma_ids.update(new_lemma_ids)
+        self._lemmas.update({lemma_id: lemma for lemma, lemma_id in new_lemma_ids.items()})
+
+    def encode(self, processed_texts: List[str]) -> List[List[int]]:
+        """
+        Convert preprocessed texts to the id of each of their lemmas, adding any new lemmas to the dictionary.
+
+        Parameters
+        ----------
+        processed_texts : list[str]
+            Bag of words preprocessed texts (see `interlocutor.nlp.preprocessing.BagOfWordsPreprocessor`).
+
+        Returns
+        -------
+        list[list[int]]
+            Id of every lemma in each text, in the order they appear.
+        """
+
+        analysed_texts = [self._analyse(text) for text in processed_texts]
+
+        unknown_lemmas = list(dict.fromkeys(
+            lemma for lemmas in analysed_texts for lemma in lemmas if lemma not in self._lemma_ids
+        ))
+
+        if unknown_lemmas:
+            self._add_lemmas(unknown_lemmas)
+
+        return [[self._lemma_ids[lemma] for lemma in lemmas] for lemmas in analysed_texts]
+
+    def get_lemmas(self, lemma_ids: Iterable[int]) -> List[str]:
+        """
+        Look up the lemma for each id.
+
+        Parameters
+        ----------
+        lemma_ids : iterable of int
+            Ids assigned by the dictionary.
+
+        Returns
+        -------
+        list[str]
+            Lemma of each id, in the same order.
+        """
+
+        return [self._lemmas[int(lemma_id)] for lemma_id in lemma_ids]
@@ -0,0 +1,166 @@
+"""Preprocess text quickly by looking up the output spaCy produced for each word when it was previously seen."""
+
+# Standard libraries
+from typing import Callable, Dict, List
+
+# Third party libraries
+import pandas as pd
+from psycopg2 import sql as psy_sql
+
+# Internal imports
+from interlocutor.commons import metrics
+from interlocutor.commons import tracing
+from interlocutor.database import postgresql
+
+
+class LookupLemmatiser:
+    """
+    Fast path for bag of words preprocessing, which only passes words through spaCy the first time they are seen.
+
+    spaCy's tokenizer splits text on whitespace and then tokenises each whitespace-delimited chunk (e.g. "don't," or
+    "high-profile") on its own, and with the tagger disabled each token's lemma, stop word and punctuation flags depend
+    only on its text. The preprocessed output of a text is therefore the output of each of its chunks joined together,
+    so a table mapping chunks to their output (learned from spaCy, and grown as new chunks are seen) reproduces the full
+    pipeline while skipping spaCy for every chunk seen before.
+    """
+
+    def __init__(
+            self,
+            preprocess_texts: Callable[[List[str]], List[str]],
+            pipeline_fingerprint: str = None,
+            db_connection: postgresql.DatabaseConnection = None
+    ):
+        """
+        Initialise attributes of class.
+
+        Parameters
+        ----------
+        preprocess_texts : callable
+            Full spaCy preprocessing (see `interlocutor.nlp.preprocessing.BagOfWordsPreprocessor._preprocess_texts`),
+            used for chunks which are not yet in the table.
+        pipeline_fingerprint : str (default None)
+            Hash identifying the configuration of the preprocessing pipeline. Entries learned from a different pipeline
+            are discarded.
+        db_connection : interlocutor.database.postgresql.DatabaseConnection (default None)
+            Connection to the database holding the table (preprocessing.token_lookup). The table is only kept in memory
+            if not provided.
+        """
+
+        self._preprocess_texts = preprocess_texts
+        self._pipeline_fingerprint = pipeline_fingerprint
+        self._db_connection = db_connection
+        self._schema = 'preprocessing'
+        self._table_name = 'token_lookup'
+
+        self._lookup = self._load_lookup() if db_connection else {}
+
+        # Chunks learned during this run which still need to be saved
+        self._new_entries = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def number_of_chunks_known(self) -> int:
+        """Number of distinct chunks of text in the table."""
+
+        return len(self._lookup)
+
+    def _load_lookup(self) -> Dict[str, str]:
+        """
+        Load the table learned from previous runs of the same preprocessing pipeline, discarding entries learned from
+        any other pipeline.
+
+        Returns
+        -------
+        dict
+            Key: whitespace-delimited chunk of text, Value: its preprocessed output (empty if every token is removed).
+        """
+
+        table = psy_sql.Identifier(self._schema, self._table_name)
+
+        self._db_connection.execute_database_operation(
+            sql_command=psy_sql.SQL(
+                "DELETE FROM {table} WHERE pipeline_fingerprint != %(pipeline_fingerprint)s;"
+            ).format(table=table),
+            params={'pipeline_fingerprint': self._pipeline_fingerprint}
+        )
+
+        df_lookup = self._db_connection.get_dataframe(
+            query=psy_sql.SQL("SELECT token, processed_content FROM {table};").format(table=table)
+        )
+
+        return dict(zip(df_lookup['token'], df_lookup['processed_content'].fillna('')))
+
+    @tracing.traced('preprocessing.lookup_lemmatiser')
+    def preprocess_texts(self, texts: List[str]) -> List[str]:
+        """
+        Remove stop words and punctuation, then lemmatise and make everything lowercase, giving the same output as the
+        full spaCy pipeline.
+
+        Parameters
+        ----------
+        texts : list[str]
+            Raw texts to be preprocessed.
+
+        Returns
+        -------
+        list[str]
+            List of preprocessed version of all the texts.
+        """
+
+        chunked_texts = [text.split() for text in texts]
+
+        # Learn every chunk which has not been seen before with a single pass through spaCy
+        unknown_chunks = list(dict.fromkeys(
+            chunk for chunks in chunked_texts for chunk in chunks if chunk not in self._lookup
+        ))
+
+        number_of_chunks = sum(len(chunks) for chunks in chunked_texts)
+        self.misses += len(unknown_chunks)
+        self.hits += number_of_chunks - len(unknown_chunks)
+        metrics.CACHE_LOOKUPS.inc(number_of_chunks - len(unknown_chunks), cache='lookup_lemmatiser', result='hit')
+        metrics.CACHE_LOOKUPS.inc(len(unknown_chunks), cache='lookup_lemmatiser', result='miss')
+
+        if unknown_chunks:
+            learned_entries = dict(zip(unknown_chunks, self._preprocess_texts(unknown_chunks)))
+            self._lookup.update(learned_entries)
+            self._new_entries.update(learned_entries)
+
+        processed_texts = []
+
+        for chunks in chunked_texts:
+            processed_chunks = (self._lookup[chunk] for chunk in chunks)
+            processed_texts.append(' '.join(processed for processed in processed_chunks if processed))
+
+        return processed_texts
+
+    def save_new_entries(self) -> None:
+        """Write the chunks learned since the last save to the database, so later runs can look them up."""
+
+        if not self._new_entries or self._db_connection is None:
+            return
+
+        df_new_entries = pd.DataFrame(data={
+            'token': list(self._new_entries.keys()),
+            'pipeline_fingerprint': self._pipeline_fingerprint,
+            'processed_content': list(self._new_entries.values())
+        })
+
+        self._db_connection.upload_new_data_only_to_existing_table(
+            dataframe=df_new_entries,
+            table_name=self._table_name,
+            schema=self._schema,
+            id_column='token'
+        )
+
+        self._new_entries = {}
+
+    def report_statistics(self) -> None:
+        """Display how many chunks of text were looked up rather than passed through spaCy."""
+
+        total_chunks = self.hits + self.misses
+        hit_rate = self.hits / total_chunks if total_chunks else 0
+
+        print(f'Lookup lemmatiser: {self.hits} chunks looked up, {self.misses} passed through spaCy '
+              f'({hit_rate:.0%} hit rate), {self.number_of_chunks_known} chunks known.')
@@ -0,0 +1,259 @@
+"""Measure how quickly spaCy preprocesses articles with different settings, and choose the fastest for this host."""
+
+# Standard libraries
+import argparse
+import datetime
+import itertools
+import multiprocessing
+import socket
+import time
+from typing import TYPE_CHECKING, Dict, List, Sequence
+
+# Third party libraries
+import pandas as pd
+from psycopg2 import sql as psy_sql
+
+# Internal imports
+from interlocutor.database import postgresql
+from interlocutor.pipeline import publications
+
+# spaCy takes seconds to import, so it is only imported when the pipeline is benchmarked
+if TYPE_CHECKING:
+    import spacy
+
+
+class SpacyPipelineTuner:
+    """
+    Benchmark spaCy's throughput (documents per second) on a sample of articles across batch sizes and process counts,
+    and store the fastest settings for the host in preprocessing.spacy_settings.
+
+    Starting worker processes has a fixed cost (each one needs its own copy of the model), which is measured separately
+    from the throughput once they are running. This lets `get_number_of_processors` fall back to a single process when
+    there are too few texts for the extra processes to pay for their start up.
+    """
+
+    def __init__(self, spacy_nlp: 'spacy.language.Language', db_connection: postgresql.DatabaseConnection):
+        """
+        Initialise attributes of class.
+
+        Parameters
+        ----------
+        spacy_nlp : spacy.language.Language
+            spaCy pipeline to be tuned. Can be None if the tuner is only used to load the stored settings.
+        db_connection : interlocutor.database.postgresql.DatabaseConnection
+            Connection to the database holding the settings.
+        """
+
+        self._spacy_nlp = spacy_nlp
+        self._db_connection = db_connection
+        self._schema = 'preprocessing'
+        self._table_name = 'spacy_settings'
+        self._host = socket.gethostname()
+
+    def load_sample_texts(self, sample_size: int = 200) -> List[str]:
+        """
+        Retrieve the content of articles from across the publications to benchmark against.
+
+        Parameters
+        ----------
+        sample_size : int (default 200)
+            Number of articles in the sample. Articles are reused if the database holds fewer than this.
+
+        Returns
+        -------
+        list[str]
+            Content of each article in the sample.
+        """
+
+        article_query = psy_sql.SQL(' UNION ALL ').join(
+            psy_sql.SQL("SELECT content FROM {table}").format(table=psy_sql.Identifier(schema, 'article_content'))
+            for schema in publications.get_schemas()
+        ) + psy_sql.SQL(" LIMIT %(sample_size)s;")
+
+        articles = self._db_connection.get_dataframe(query=article_query, query_params={'sample_size': sample_size})
+        texts = articles['content'].dropna().tolist()
+
+        if not texts:
+            raise ValueError('No article content found to benchmark against.')
+
+        return list(itertools.islice(itertools.cycle(texts), sample_size))
+
+    def _time_pipe(self, texts: List[str], batch_size: int, number_of_processors: int) -> float:
+        """Seconds taken for spaCy to process every text with the given settings."""
+
+        start_time = time.perf_counter()
+
+        for _ in self._spacy_nlp.pipe(texts=texts, batch_size=batch_size, n_process=number_of_processors):
+            pass
+
+        return time.perf_counter() - start_time
+
+    def benchmark(
+            self,
+            texts: List[str],
+            batch_sizes: Sequence[int] = (1, 5, 20, 50, 100),
+            processor_counts: Sequence[int] = None
+    ) -> pd.DataFrame:
+        """
+        Measure the throughput of every combination of batch size and number of processes.
+
+        Parameters
+        ----------
+        texts : list[str]
+            Sample of texts to process.
+        batch_sizes : sequence of int (default (1, 5, 20, 50, 100))
+            Batch sizes to try.
+        processor_counts : sequence of int (default None)
+            Numbers of processes to try. Defaults to 1, 2, 4, ... up to the number of CPUs on the host.
+
+        Returns
+        -------
+        pandas DataFrame
+            One row per combination, with the `batch_size`, `number_of_processors`, the seconds taken to start the
+            processes (`startup_seconds`) and the documents per second once started (`docs_per_second`).
+        """
+
+        if processor_counts is None:
+            processor_counts = sorted({min(2 ** power, multiprocessing.cpu_count()) for power in range(8)})
+
+        results = []
+
+        for batch_size, number_of_processors in itertools.product(batch_sizes, processor_counts):
+
+            # Processing a single tiny text per process is dominated by the time taken to start them
+            startup_seconds = self._time_pipe(
+                texts=['.'] * number_of_processors,
+                batch_size=1,
+                number_of_processors=number_of_processors
+            ) if number_of_processors > 1 else 0
+
+            total_seconds = self._time_pipe(
+                texts=texts,
+                batch_size=batch_size,
+                number_of_processors=number_of_processors
+            )
+
+            results.append({
+                'batch_size': batch_size,
+                'number_of_processors': number_of_processors,
+                'startup_seconds': startup_seconds,
+                'docs_per_second': len(texts) / max(total_seconds - startup_seconds, 1e-9)
+            })
+
+            print(f"batch size {batch_size}, {number_of_processors} process(es): "
+                  f"{results[-1]['docs_per_second']:.1f} docs/second after {startup_seconds:.2f} seconds start up")
+
+        return pd.DataFrame(data=results)
+
+    def tune(self, texts: List[str], **benchmark_kwargs) -> Dict:
+        """
+        Benchmark the settings (see `benchmark`) and store the fastest for this host.
+
+        Parameters
+        ----------
+        texts : list[str]
+            Sample of texts to process.
+        **benchmark_kwargs
+            Further arguments passed to `benchmark` e.g. `batch_sizes`.
+
+        Returns
+        -------
+        dict
+            Settings stored for the host (see `load_settings`).
+        """
+
+        df_results = self.benchmark(texts=texts, **benchmark_kwargs)
+
+        fastest_single_process = df_results[df_results['number_of_processors'] == 1].nlargest(1, 'docs_per_second')
+        fastest_overall = df_results.nlargest(1, 'docs_per_second')
+
+        settings = {
+            'host': self._host,
+            'batch_size': int(fastest_overall['batch_size'].iloc[0]),
+            'number_of_processors': int(fastest_overall['number_of_processors'].iloc[0]),
+            'docs_per_second': float(fastest_overall['docs_per_second'].iloc[0]),
+            'startup_seconds': float(fastest_overall['startup_seconds'].iloc[0]),
+            'single_process_batch_size': int(fastest_single_process['batch_size'].iloc[0]),
+            'single_process_docs_per_second': float(fastest_single_process['docs_per_second'].iloc[0]),
+            'tuned_timestamp': datetime.datetime.utcnow()
+        }
+
+        self._db_connection.upsert_dataframe_to_existing_table(
+            dataframe=pd.DataFrame(data=[settings]),
+            table_name=self._table_name,
+            schema=self._schema,
+            id_column='host'
+        )
+
+        return settings
+
+    def load_settings(self) -> Dict:
+        """
+        Retrieve the settings stored for this host by `tune`.
+
+        Returns
+        -------
+        dict
+            Fastest `batch_size` and `number_of_processors`, the `docs_per_second` achieved with them and the
+            `startup_seconds` taken to start the processes, as well as the fastest `single_process_batch_size` and its
+            `single_process_docs_per_second`. None if this host has not been tuned.
+        """
+
+        df_settings = self._db_connection.get_dataframe(
+            query=psy_sql.SQL("SELECT * FROM {table} WHERE host = %(host)s;").format(
+                table=psy_sql.Identifier(self._schema, self._table_name)
+            ),
+            query_params={'host': self._host}
+        )
+
+        return df_settings.to_dict(orient='records')[0] if not df_settings.empty else None
+
+    @staticmethod
+    def get_number_of_processors(settings: Dict, number_of_texts: int) -> int:
+        """
+        Decide whether processing a number of texts is faster with the tuned number of processes, once the time taken
+        to start them is included, or with a single process.
+
+        Parameters
+        ----------
+        settings : dict
+            Settings stored for the host (see `load_settings`).
+        number_of_texts : int
+            Number of texts about to be processed.
+
+        Returns
+        -------
+        int
+            Number of processes to use.
+        """
+
+        if settings['number_of_processors'] == 1:
+            return 1
+
+        single_process_seconds = number_of_texts / settings['single_process_docs_per_second']
+        multiple_process_seconds = settings['startup_seconds'] + number_of_texts / settings['docs_per_second']
+
+        return settings['number_of_processors'] if multiple_process_seconds < single_process_seconds else 1
+
+
+if __name__ == '__main__':  # pragma: no cover (exclude from testing coverage report)
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sample-size', type=int, default=200, help='Number of articles to benchmark against')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 5, 20, 50, 100])
+    arguments = parser.parse_args()
+
+    from spacy import load as load_spacy_model
+
+    tuner = SpacyPipelineTuner(
+        spacy_nlp=load_spacy_model(name='en_core_web_sm', disable=['ner', 'parser', 'tagger', 'textcat']),
+        db_connection=postgresql.DatabaseConnection()
+    )
+
+    tuned_settings = tuner.tune(
+        texts=tuner.load_sample_texts(sample_size=arguments.sample_size),
+        batch_sizes=arguments.batch_sizes
+    )
+
+    print(f"Fastest settings for {tuned_settings['host']}: batch size {tuned_settings['batch_size']} with "
+          f"{tuned_settings['number_of_processors']} process(es), {tuned_settings['docs_per_second']:.1f} docs/second.")
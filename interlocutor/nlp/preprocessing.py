@@ -1,16 +1,36 @@
 """Tidying and preprocessing text data."""
 
 # Standard library imports
+import argparse
 import collections
-from typing import List
+from concurrent import futures
+import hashlib
+import inspect
+import json
+import time
+from typing import TYPE_CHECKING, Dict, Iterator, List
 
 # Third party imports
+import pandas as pd
 from psycopg2 import sql as psy_sql
-import spacy
 import tqdm
 
 # Internal imports
+from interlocutor.commons import tracing
 from interlocutor.database import postgresql
+from interlocutor.nlp import doc_store
+from interlocutor.nlp import lemma_dictionary
+from interlocutor.nlp import lookup_lemmatiser
+from interlocutor.nlp import pipeline_tuning
+from interlocutor.nlp import preprocessing_cache
+from interlocutor.pipeline import processing_state
+from interlocutor.pipeline import publications
+
+# spaCy takes seconds to import, so it is only imported once a preprocessor is created
+if TYPE_CHECKING:
+    import multiprocessing
+
+    import spacy
 
 
 class BagOfWordsPreprocessor:
@@ -20,71 +40,447 @@ class BagOfWordsPreprocessor:
 
     def __init__(
             self,
-            batch_size: int = 1,
-            number_of_processors: int = 1,
+            batch_size: int = None,
+            number_of_processors: int = None,
+            chunk_size: int = 500,
+            use_cache: bool = True,
+            cache_max_entries: int = 500000,
+            use_lookup_lemmatiser: bool = False,
+            store_docs: bool = False,
     ):
         """
         Initialise attributes of class.
 
         Parameters
         ----------
-        batch_size : int (default 1)
-            The number of texts to process at one time.
+        batch_size : int (default None)
+            The number of texts to process at one time. If not set, the fastest settings found for this host by
+            `interlocutor.nlp.pipeline_tuning` are used (or 1 if it has not been tuned).
 
-        number_of_processors : int (default 1)
+        number_of_processors : int (default None)
             Number of processors used to to process texts in parallel. If set to -1, it will use all available CPUs
-            (equivalent of `multiprocessing.cpu_count()`.
+            (equivalent of `multiprocessing.cpu_count()`. If not set, the tuned number is used whenever there are
+            enough texts for starting the other processes to pay off, and a single processor otherwise.
+
+        chunk_size : int (default 500)
+            The number of articles read from the database, preprocessed and written back at one time. Peak memory use
+            is set by this rather than the number of articles waiting to be preprocessed.
+
+        use_cache : bool (default True)
+            Whether to reuse the preprocessed version of any text which has been preprocessed before by an identical
+            pipeline (stored in preprocessing.bow_cache), rather than passing it through spaCy again.
+
+        cache_max_entries : int (default 500000)
+            Maximum number of entries kept in the cache, evicting the least recently used ones first.
+
+        use_lookup_lemmatiser : bool (default False)
+            Whether to use the fast path which looks up the output learned for each word the previous times it was seen
+            (stored in preprocessing.token_lookup), and only passes new words through spaCy. The output is identical.
+
+        store_docs : bool (default False)
+            Whether to store the spaCy doc of every article preprocessed (in preprocessing.spacy_docs), so that the
+            articles can be re-filtered by `refilter_all_article_content` without parsing them again. Every article is
+            passed through spaCy when enabled, bypassing the cache and lookup lemmatiser.
         """
 
-        self._batch_size = batch_size
-        self._number_of_processors = number_of_processors
-        self._spacy_nlp = spacy.load(name='en_core_web_sm', disable=['ner', 'parser', 'tagger', 'textcat'])
+        self._chunk_size = chunk_size
+        self._spacy_model = 'en_core_web_sm'
+        self._disabled_components = ['ner', 'parser', 'tagger', 'textcat']
+        self._loaded_spacy_nlp = None
         self._db_connection = postgresql.DatabaseConnection()
 
-        self._daily_mail_db = {
-            'schema': 'daily_mail',
-            'raw_content': 'recent_article_content',
-            'processed_content': 'recent_article_content_bow_processed'
-        }
+        self._tuned_settings = pipeline_tuning.SpacyPipelineTuner(
+            spacy_nlp=None,
+            db_connection=self._db_connection
+        ).load_settings() if batch_size is None else None
 
-        self._guardian_db = {
-            'schema': 'the_guardian',
-            'raw_content': 'article_content',
-            'processed_content': 'article_content_bow_processed'
-        }
+        if self._tuned_settings is not None:
+            print(f"Using settings tuned for {self._tuned_settings['host']}: "
+                  f"batch size {self._tuned_settings['batch_size']} with "
+                  f"{number_of_processors or self._tuned_settings['number_of_processors']} process(es)")
+
+        self._batch_size = batch_size or 1
+        self._number_of_processors = number_of_processors
 
-    def preprocess_all_article_content(self) -> None:
+        self._pipeline_fingerprint = self._get_pipeline_fingerprint()
+        self._cache = preprocessing_cache.PreprocessingCache(
+            pipeline_fingerprint=self._pipeline_fingerprint,
+            db_connection=self._db_connection,
+            max_entries=cache_max_entries
+        ) if use_cache else None
+        self._lookup_lemmatiser = lookup_lemmatiser.LookupLemmatiser(
+            preprocess_texts=self._preprocess_texts,
+            pipeline_fingerprint=self._pipeline_fingerprint,
+            db_connection=self._db_connection
+        ) if use_lookup_lemmatiser else None
+        self._doc_store = doc_store.SpacyDocStore(
+            db_connection=self._db_connection,
+            vocab=self._spacy_nlp.vocab
+        ) if store_docs else None
+        self._lemma_dictionary = lemma_dictionary.LemmaDictionary(db_connection=self._db_connection)
+        self._processing_state = processing_state.ProcessingState(db_connection=self._db_connection)
+
+        # Publications whose articles are preprocessed
+        self._schemas = publications.get_schemas()
+
+    @tracing.traced('preprocessing.preprocess_all_article_content')
+    def preprocess_all_article_content(self, schemas: List[str] = None) -> Dict[str, int]:
         """
         Extract all of the content from articles (which have not already been preprocessed), transform the text,
         and then upload to database.
+
+        Only articles deduplicated since the last run are read (see `interlocutor.pipeline.processing_state`). They are
+        streamed from the database in chunks of `chunk_size`, and each chunk is uploaded before the next is read, so an
+        interrupted run keeps the chunks already uploaded and later runs carry on from there.
+
+        Parameters
+        ----------
+        schemas : list[str] (default None)
+            Schemas of the publications to preprocess e.g. ['daily_mail']. Defaults to every publication in
+            `interlocutor.pipeline.publications`; any others are ignored.
+
+        Returns
+        -------
+        dict[str, int]
+            Number of articles preprocessed from each publication.
         """
 
-        for schema in ['daily_mail', 'the_guardian']:
+        number_of_articles = {}
+
+        for schema in [schema for schema in self._schemas if schemas is None or schema in schemas]:
+
+            number_of_articles[schema] = 0
 
             print(f'Preprocessing articles from {schema}')
 
-            # Extract articles which have not already been processed
+            backlog, horizon = self._processing_state.get_backlog(
+                stage='preprocessed',
+                upstream_stage='deduplicated',
+                publication=schema
+            )
+
+            # Extract articles checked for near-duplicates since the last run which have not already been processed
+            # (e.g. by a worker), skipping near-duplicates of other articles
             sql_query = psy_sql.SQL(
-                string="""SELECT id, content
-                          FROM {raw_content}
-                          WHERE id NOT IN (SELECT ID FROM {processed_content})
+                string="""SELECT content.id, content.content
+                          FROM {raw_content} AS content
+                          WHERE content.id IN ({backlog})
+                            AND NOT EXISTS (SELECT 1 FROM {processed_content} AS processed
+                                            WHERE processed.id = content.id)
+                            AND NOT EXISTS (SELECT 1 FROM encoded_articles.near_duplicate_articles AS duplicate
+                                            WHERE duplicate.id = content.id)
                           """).format(
                 raw_content=psy_sql.Identifier(schema, 'article_content'),
+                backlog=backlog,
                 processed_content=psy_sql.Identifier(schema, 'article_content_bow_preprocessed')
             )
 
-            articles = self._db_connection.get_dataframe(query=sql_query)
+            with tqdm.tqdm(desc='Documents processed', unit=' document') as progress_bar:
+
+                for articles in self._db_connection.get_dataframe_in_chunks(
+                        query=sql_query,
+                        chunk_size=self._chunk_size
+                ):
+                    self._preprocess_and_upload_articles(articles=articles, schema=schema)
+                    progress_bar.update(len(articles))
+                    number_of_articles[schema] += len(articles)
+
+            self._processing_state.advance_watermark(stage='preprocessed', publication=schema, horizon=horizon)
+
+        if self._cache is not None:
+            self._cache.evict()
+            self._cache.report_statistics()
+
+        if self._lookup_lemmatiser is not None:
+            self._lookup_lemmatiser.report_statistics()
+
+        return number_of_articles
 
-            articles['processed_content'] = self._preprocess_texts(articles['content'].values)
-            articles.drop(columns='content', inplace=True)  # Only retain processed content
+    def preprocess_article_content(self, schema: str, article_ids: List[str]) -> None:
+        """
+        Preprocess specific articles (e.g. ones which have just been inserted) and upload them to the database, skipping
+        any which have already been preprocessed, have not been checked for near-duplicates yet, or are near-duplicates
+        of other articles.
+
+        Parameters
+        ----------
+        schema : str
+            Schema of the publication the articles belong to e.g. 'daily_mail'. Articles from publications which are
+            not preprocessed are ignored.
+        article_ids : list[str]
+            Unique identifier of each article.
+        """
 
-            self._db_connection.upload_new_data_only_to_existing_table(
-                dataframe=articles,
-                table_name='article_content_bow_preprocessed',
-                schema=schema,
-                id_column='id'
+        if schema not in self._schemas or not article_ids:
+            return
+
+        sql_query = psy_sql.SQL(
+            string="""SELECT content.id, content.content
+                      FROM {raw_content} AS content
+                      WHERE content.id IN %(article_ids)s
+                        AND EXISTS (SELECT 1 FROM pipeline.processing_state AS state
+                                    WHERE state.stage = 'deduplicated' AND state.article_id = content.id)
+                        AND NOT EXISTS (SELECT 1 FROM {processed_content} AS processed
+                                        WHERE processed.id = content.id)
+                        AND NOT EXISTS (SELECT 1 FROM encoded_articles.near_duplicate_articles AS duplicate
+                                        WHERE duplicate.id = content.id)
+                      """).format(
+            raw_content=psy_sql.Identifier(schema, 'article_content'),
+            processed_content=psy_sql.Identifier(schema, 'article_content_bow_preprocessed')
+        )
+
+        articles = self._db_connection.get_dataframe(query=sql_query, query_params={'article_ids': tuple(article_ids)})
+
+        if not articles.empty:
+            self._preprocess_and_upload_articles(articles=articles, schema=schema)
+
+    def _preprocess_and_upload_articles(self, articles: pd.DataFrame, schema: str) -> None:
+        """
+        Preprocess the content of articles, upload it to the publication's table of preprocessed content, and mark the
+        articles as preprocessed.
+
+        Parameters
+        ----------
+        articles : pandas DataFrame
+            Unique identifier (`id`) and raw content (`content`) of each article. The content is replaced with the
+            preprocessed content (`processed_content`).
+        schema : str
+            Schema of the publication the articles belong to e.g. 'daily_mail'.
+        """
+
+        if self._doc_store is not None:
+            articles['processed_content'] = self._preprocess_texts_and_store_docs(
+                article_ids=articles['id'].tolist(),
+                texts=articles['content'].tolist(),
+                publication=schema
             )
+        else:
+            articles['processed_content'] = self._preprocess_texts_with_cache(articles['content'].tolist())
+
+        articles.drop(columns='content', inplace=True)  # Only retain processed content
+
+        self._db_connection.upload_new_data_only_to_existing_table(
+            dataframe=articles,
+            table_name='article_content_bow_preprocessed',
+            schema=schema,
+            id_column='id'
+        )
+
+        self._upload_token_ids(articles=articles, publication=schema)
+
+        self._processing_state.mark_processed(
+            stage='preprocessed',
+            publication=schema,
+            article_ids=articles['id'].tolist(),
+            version=self._pipeline_fingerprint
+        )
+
+        if self._lookup_lemmatiser is not None:
+            self._lookup_lemmatiser.save_new_entries()
+
+    @tracing.traced('preprocessing.refilter_all_article_content')
+    def refilter_all_article_content(self) -> None:
+        """
+        Regenerate the preprocessed content of every article with a stored spaCy doc (see `store_docs`), applying the
+        current rules for which tokens are kept without parsing the articles again. Existing preprocessed content is
+        overwritten, and the articles are marked as preprocessed again so they are encoded again.
+        """
+
+        stored_docs = self._doc_store or doc_store.SpacyDocStore(
+            db_connection=self._db_connection,
+            vocab=self._spacy_nlp.vocab
+        )
+
+        for schema in self._schemas:
+
+            print(f'Re-filtering stored docs from {schema}')
+
+            with tqdm.tqdm(desc='Documents re-filtered', unit=' document') as progress_bar:
+
+                for article_ids, documents in stored_docs.iterate_docs(
+                        publication=schema,
+                        chunk_size=self._chunk_size
+                ):
+                    articles = pd.DataFrame(data={
+                        'id': article_ids,
+                        'processed_content': [self._filter_document(document) for document in documents]
+                    })
+
+                    self._db_connection.upsert_dataframe_to_existing_table(
+                        dataframe=articles,
+                        table_name='article_content_bow_preprocessed',
+                        schema=schema,
+                        id_column='id'
+                    )
+
+                    self._upload_token_ids(articles=articles, publication=schema)
+
+                    self._processing_state.mark_processed(
+                        stage='preprocessed',
+                        publication=schema,
+                        article_ids=article_ids,
+                        version=self._pipeline_fingerprint
+                    )
+
+                    progress_bar.update(len(articles))
+
+    def _upload_token_ids(self, articles: pd.DataFrame, publication: str) -> None:
+        """
+        Store the preprocessed content of articles as arrays of lemma ids (see
+        `interlocutor.nlp.lemma_dictionary.LemmaDictionary`) in preprocessing.bow_token_ids, replacing any arrays
+        already stored for them, so the encoder can count lemmas without tokenising the text again.
+
+        Parameters
+        ----------
+        articles : pandas DataFrame
+            Unique identifier (`id`) and preprocessed content (`processed_content`) of each article.
+        publication : str
+            Schema of the publication the articles belong to e.g. 'daily_mail'.
+        """
+
+        if articles.empty:
+            return
+
+        self._db_connection.execute_database_operation(
+            sql_command="DELETE FROM preprocessing.bow_token_ids WHERE id IN %(article_ids)s;",
+            params={'article_ids': tuple(articles['id'])}
+        )
+
+        # Appended directly rather than via a staging table, which would store the arrays as text
+        self._db_connection.upload_dataframe(
+            dataframe=pd.DataFrame(data={
+                'id': articles['id'].values,
+                'publication': publication,
+                'token_ids': self._lemma_dictionary.encode(articles['processed_content'].tolist())
+            }),
+            table_name='bow_token_ids',
+            schema='preprocessing',
+            if_exists='append',
+            index=False
+        )
+
+    @property
+    def _spacy_nlp(self) -> 'spacy.language.Language':
+        """
+        spaCy pipeline, which is only loaded the first time it is needed, so a preprocessor which finds every text in
+        the cache or lookup lemmatiser never pays for loading the model.
+        """
+
+        if self._loaded_spacy_nlp is None:
+            import spacy
+            self._loaded_spacy_nlp = spacy.load(name=self._spacy_model, disable=self._disabled_components)
+
+        return self._loaded_spacy_nlp
+
+    def _get_pipeline_fingerprint(self) -> str:
+        """
+        Identify the configuration of the preprocessing pipeline, so that cached output is only reused if it would be
+        reproduced exactly.
+
+        The configuration is read from the model's package metadata and the language defaults, which gives the same
+        values as the loaded pipeline without loading the model.
+
+        Returns
+        -------
+        str
+            MD5 hash of the spaCy version, model and its version, enabled pipeline components, stop words, and the code
+            deciding which tokens are kept and how they are transformed.
+        """
+
+        import spacy
+
+        model_meta = spacy.util.get_model_meta(spacy.util.get_package_path(self._spacy_model))
+
+        configuration = {
+            'spacy_version': spacy.__version__,
+            'model': f"{model_meta['lang']}_{model_meta['name']}-{model_meta['version']}",
+            'pipeline': [name for name in model_meta['pipeline'] if name not in self._disabled_components],
+            'stop_words': sorted(spacy.util.get_lang_class(model_meta['lang']).Defaults.stop_words),
+            'token_rules': (
+                inspect.getsource(BagOfWordsPreprocessor._token_should_be_deleted)
+                + inspect.getsource(BagOfWordsPreprocessor._filter_document)
+            )
+        }
+
+        return hashlib.md5(json.dumps(configuration, sort_keys=True).encode('utf-8')).hexdigest()
+
+    @tracing.traced('preprocessing.preprocess_texts_with_cache')
+    def _preprocess_texts_with_cache(self, texts: List[str]) -> List[str]:
+        """
+        Preprocess texts (see `_preprocess_texts`), reusing the cached output for any text which has been preprocessed
+        before and caching the output for the rest. The rest are preprocessed by the lookup lemmatiser if enabled.
+
+        Parameters
+        ----------
+        texts : list[str]
+            Raw texts to be preprocessed.
 
+        Returns
+        -------
+        list[str]
+            List of preprocessed version of all the texts.
+        """
+
+        if self._lookup_lemmatiser is not None:
+            preprocess_texts = self._lookup_lemmatiser.preprocess_texts
+        else:
+            preprocess_texts = self._preprocess_texts
+
+        if self._cache is None:
+            return preprocess_texts(texts)
+
+        cache_keys = [self._cache.get_cache_key(text) for text in texts]
+        processed_texts = self._cache.get_many(cache_keys)
+
+        # Identical texts which are not in the cache only need to be preprocessed once
+        texts_to_process = {key: text for key, text in zip(cache_keys, texts) if key not in processed_texts}
+        tracing.count('cached_texts', len(texts) - len(texts_to_process))
+
+        newly_processed_texts = dict(zip(
+            texts_to_process.keys(),
+            preprocess_texts(list(texts_to_process.values()))
+        ))
+
+        self._cache.put_many(newly_processed_texts)
+        processed_texts.update(newly_processed_texts)
+
+        return [processed_texts[key] for key in cache_keys]
+
+    def _pipe(self, texts: List[str]) -> Iterator['spacy.tokens.Doc']:
+        """
+        Parse texts with spaCy, using the tuned settings if available and switching to a single process when there are
+        too few texts for the time taken to start more processes to be recovered.
+
+        Parameters
+        ----------
+        texts : list[str]
+            Raw texts to be parsed.
+
+        Yields
+        ------
+        spacy.tokens.Doc
+            Parsed version of each text, in the same order.
+        """
+
+        batch_size, number_of_processors = self._batch_size, self._number_of_processors
+
+        if self._tuned_settings is not None and number_of_processors is None:
+            number_of_processors = pipeline_tuning.SpacyPipelineTuner.get_number_of_processors(
+                settings=self._tuned_settings,
+                number_of_texts=len(texts)
+            )
+
+        number_of_processors = number_of_processors or 1
+
+        if self._tuned_settings is not None:
+            if number_of_processors == 1:
+                batch_size = self._tuned_settings['single_process_batch_size']
+            else:
+                batch_size = self._tuned_settings['batch_size']
+
+        yield from self._spacy_nlp.pipe(texts=texts, batch_size=batch_size, n_process=number_of_processors)
+
+    @tracing.traced('preprocessing.spacy')
     def _preprocess_texts(self, texts: List[str]) -> List[str]:
         """
         Remove stop words and punctuation, then lemmatise and make everything lowercase.
@@ -96,29 +492,58 @@ class BagOfWordsPreprocessor:
         """
 
         transformed_texts = collections.deque()
+        tracing.count('texts', len(texts))
 
-        for document in tqdm.tqdm(
-                desc='Documents processed',
-                iterable=self._spacy_nlp.pipe(
-                    texts=texts,
-                    batch_size=self._batch_size,
-                    n_process=self._number_of_processors
-                ),
-                total=len(texts),
-                unit=' document'
-        ):
-            processed_doc = [
-                token.lemma_.lower() for token in document if not self._token_should_be_deleted(token)
-            ]
+        for document in self._pipe(texts):
+            transformed_texts.append(self._filter_document(document))
 
-            processed_doc = ' '.join(processed_doc)
+        return list(transformed_texts)
 
-            transformed_texts.append(processed_doc)
+    @tracing.traced('preprocessing.spacy_and_store_docs')
+    def _preprocess_texts_and_store_docs(self, article_ids: List[str], texts: List[str], publication: str) -> List[str]:
+        """
+        Preprocess texts (see `_preprocess_texts`), storing the spaCy doc of each one so it can be re-filtered later.
 
-        return list(transformed_texts)
+        Parameters
+        ----------
+        article_ids : list[str]
+            Unique identifier of the article each text belongs to.
+        texts : list[str]
+            Raw texts to be preprocessed.
+        publication : str
+            Schema of the publication the articles belong to e.g. 'daily_mail'.
+
+        Returns
+        -------
+        list[str]
+            List of preprocessed version of all the texts.
+        """
+
+        documents = list(self._pipe(texts))
+
+        self._doc_store.save(article_ids=article_ids, publication=publication, documents=documents)
+
+        return [self._filter_document(document) for document in documents]
+
+    def _filter_document(self, document: 'spacy.tokens.Doc') -> str:
+        """
+        Keep the lowercased lemma of each token in a parsed document which should not be deleted.
+
+        Parameters
+        ----------
+        document : spacy.tokens.Doc
+            Text parsed by spaCy.
+
+        Returns
+        -------
+        str
+            Preprocessed version of the text.
+        """
+
+        return ' '.join(token.lemma_.lower() for token in document if not self._token_should_be_deleted(token))
 
     @staticmethod
-    def _token_should_be_deleted(token: spacy.tokens.Token) -> bool:
+    def _token_should_be_deleted(token: 'spacy.tokens.Token') -> bool:
         """
         Check whether the token matches any of the criteria suggesting it should be deleted e.g. it is a stop word,
         punctuation, or whitespace.
@@ -137,10 +562,179 @@ class BagOfWordsPreprocessor:
         return bool(token.is_punct or token.is_space or token.is_stop)
 
 
-if __name__ == '__main__':
+# Preprocessor created once in each process of the pool used by `preprocess_publications_in_parallel`, so the spaCy
+# model is loaded once per process rather than once per publication
+_process_preprocessor = None
+
+
+def _initialise_process(preprocessor_arguments: Dict) -> None:
+    """Create the preprocessor used by every publication preprocessed in this process of the pool."""
+
+    global _process_preprocessor
+    _process_preprocessor = BagOfWordsPreprocessor(number_of_processors=1, **preprocessor_arguments)
+
+
+def _preprocess_publication(schema: str) -> Dict:
+    """
+    Preprocess the new articles of a publication with this process's preprocessor, timing how long it takes and
+    returning the spans traced along the way so they can be added to the run of the process running the pool.
+    """
+
+    start = time.perf_counter()
+
+    # Named like the stage of the orchestrator, so it can be profiled the same way however the publication is run
+    with tracing.span(f'preprocess:{schema}'):
+        number_of_articles = _process_preprocessor.preprocess_all_article_content(schemas=[schema]).get(schema, 0)
+
+    return {
+        'publication': schema,
+        'articles': number_of_articles,
+        'seconds': time.perf_counter() - start,
+        'spans': tracing.get_tracer().take_spans()
+    }
+
+
+def create_preprocessing_pool(
+        max_workers: int,
+        mp_context: 'multiprocessing.context.BaseContext' = None,
+        **preprocessor_arguments
+) -> futures.ProcessPoolExecutor:
+    """
+    Create a pool of processes to preprocess publications in (see `preprocess_in_pool`). Each process loads the spaCy
+    model once and keeps it for every publication it is given.
+
+    Parameters
+    ----------
+    max_workers : int
+        Maximum number of processes in the pool.
+    mp_context : multiprocessing.context.BaseContext (default None)
+        How the processes are started e.g. `multiprocessing.get_context('spawn')` when other threads are running.
+        Defaults to the platform's default.
+    **preprocessor_arguments
+        Passed to `BagOfWordsPreprocessor` in each process e.g. `store_docs=True`.
+
+    Returns
+    -------
+    concurrent.futures.ProcessPoolExecutor
+        Pool of processes, which are only started once publications are given to it.
+    """
+
+    return futures.ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=mp_context,
+        initializer=_initialise_process,
+        initargs=(preprocessor_arguments,)
+    )
 
-    print('Initialising class for preprocessing text in preparation for bag of words algorithms')
-    bow_preprocessor = BagOfWordsPreprocessor(batch_size=5, number_of_processors=-1)
 
-    print('Preprocess all articles')
-    bow_preprocessor.preprocess_all_article_content()
+def preprocess_in_pool(pool: futures.ProcessPoolExecutor, schema: str) -> Dict:
+    """
+    Preprocess the new articles of a publication in a process of the pool, waiting until it has finished.
+
+    Parameters
+    ----------
+    pool : concurrent.futures.ProcessPoolExecutor
+        Pool created by `create_preprocessing_pool`.
+    schema : str
+        Schema of the publication e.g. 'daily_mail'.
+
+    Returns
+    -------
+    dict
+        The `publication`, number of `articles` preprocessed, the `seconds` taken, and the `spans` traced in the
+        process (see `interlocutor.commons.tracing.Tracer.take_spans`), within a span named 'preprocess:<schema>'.
+    """
+
+    return pool.submit(_preprocess_publication, schema).result()
+
+
+def preprocess_publications_in_parallel(
+        schemas: List[str] = None,
+        max_workers: int = None,
+        **preprocessor_arguments
+) -> pd.DataFrame:
+    """
+    Preprocess the new articles of every publication at the same time, each in its own process.
+
+    spaCy holds the GIL while it parses, so publications are preprocessed in a pool of processes rather than threads.
+    Each process loads the spaCy model once and keeps it for every publication it is given, and parses with a single
+    process itself (with the single process batch size tuned for the host, see `interlocutor.nlp.pipeline_tuning`),
+    since the pool already provides the parallelism.
+
+    Parameters
+    ----------
+    schemas : list[str] (default None)
+        Schemas of the publications to preprocess e.g. ['daily_mail']. Defaults to every publication in
+        `interlocutor.pipeline.publications`.
+    max_workers : int (default None)
+        Maximum number of processes in the pool. Defaults to one per publication.
+    **preprocessor_arguments
+        Passed to `BagOfWordsPreprocessor` in each process e.g. `store_docs=True`.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Number of `articles` preprocessed from each `publication`, the `seconds` taken, and `articles_per_second`. The
+        spans traced in each process are added to the run of this process (see `interlocutor.commons.tracing`).
+    """
+
+    schemas = schemas or publications.get_schemas()
+
+    with create_preprocessing_pool(max_workers=max_workers or len(schemas), **preprocessor_arguments) as executor:
+        publication_results = list(executor.map(_preprocess_publication, schemas))
+
+    for publication_result in publication_results:
+        tracing.get_tracer().merge_spans(publication_result.pop('spans'))
+
+    throughput = pd.DataFrame(data=publication_results)
+
+    throughput['articles_per_second'] = throughput['articles'] / throughput['seconds']
+
+    print('Preprocessing throughput by publication')
+    print(throughput.round(2).to_string(index=False))
+
+    return throughput
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--store-docs',
+        action='store_true',
+        help='Store the spaCy doc of each article preprocessed so it can be re-filtered later'
+    )
+    parser.add_argument(
+        '--refilter',
+        action='store_true',
+        help='Regenerate the preprocessed content of articles from their stored spaCy docs instead of preprocessing'
+    )
+    parser.add_argument(
+        '--publications',
+        nargs='+',
+        choices=publications.get_schemas(),
+        help='Publications to preprocess (defaults to all of them)'
+    )
+    parser.add_argument(
+        '--max-workers',
+        type=int,
+        help='Maximum number of publications preprocessed at once (defaults to all of them)'
+    )
+    arguments = parser.parse_args()
+
+    tracing.start_run(run_name='preprocessing')
+
+    if arguments.refilter:
+        print('Initialising class for preprocessing text in preparation for bag of words algorithms')
+        bow_preprocessor = BagOfWordsPreprocessor(store_docs=arguments.store_docs)
+
+        print('Re-filter all articles with stored docs')
+        bow_preprocessor.refilter_all_article_content()
+
+    else:
+        print('Preprocess all articles, with a process for each publication')
+        preprocess_publications_in_parallel(
+            schemas=arguments.publications,
+            max_workers=arguments.max_workers,
+            store_docs=arguments.store_docs
+        )
@@ -0,0 +1,171 @@
+"""Avoid preprocessing the same text again when it has already been preprocessed with an identical pipeline."""
+
+# Standard libraries
+import datetime
+import hashlib
+from typing import Dict, List
+
+# Third party libraries
+import pandas as pd
+from psycopg2 import sql as psy_sql
+
+# Internal imports
+from interlocutor.commons import metrics
+from interlocutor.database import postgresql
+
+
+class PreprocessingCache:
+    """
+    Persistent cache of preprocessed text, keyed by a hash of the raw text and a fingerprint of the preprocessing
+    pipeline which produced it. Changing the pipeline changes the fingerprint, so entries produced by an older pipeline
+    are never returned and are evicted first. Beyond that, the least recently used entries are evicted once the cache
+    holds more than `max_entries`.
+    """
+
+    def __init__(
+            self,
+            pipeline_fingerprint: str,
+            db_connection: postgresql.DatabaseConnection,
+            max_entries: int = 500000
+    ):
+        """
+        Initialise attributes of class.
+
+        Parameters
+        ----------
+        pipeline_fingerprint : str
+            Hash identifying the configuration of the preprocessing pipeline (see
+            `interlocutor.nlp.preprocessing.BagOfWordsPreprocessor._get_pipeline_fingerprint`).
+        db_connection : interlocutor.database.postgresql.DatabaseConnection
+            Connection to the database holding the cache.
+        max_entries : int (default 500000)
+            Maximum number of entries retained when the cache is evicted.
+        """
+
+        self._pipeline_fingerprint = pipeline_fingerprint
+        self._db_connection = db_connection
+        self._max_entries = max_entries
+        self._schema = 'preprocessing'
+        self._table_name = 'bow_cache'
+
+        self.hits = 0
+        self.misses = 0
+
+    def get_cache_key(self, text: str) -> str:
+        """
+        Identify the entry for a text preprocessed by this pipeline.
+
+        Parameters
+        ----------
+        text : str
+            Raw text before preprocessing.
+
+        Returns
+        -------
+        str
+            MD5 hash of the pipeline fingerprint and the text.
+        """
+
+        return hashlib.md5(f'{self._pipeline_fingerprint}:{text}'.encode('utf-8')).hexdigest()
+
+    def get_many(self, cache_keys: List[str]) -> Dict[str, str]:
+        """
+        Look up previously preprocessed text, marking the entries found as recently used.
+
+        Parameters
+        ----------
+        cache_keys : list
+            Keys of the entries to look up (see `get_cache_key`).
+
+        Returns
+        -------
+        dict
+            Key: cache key, Value: preprocessed text, for the entries which are in the cache.
+        """
+
+        unique_keys = set(cache_keys)
+
+        if not unique_keys:
+            return {}
+
+        # Reading and refreshing when the entries were last used happens in a single statement
+        lookup_query = psy_sql.SQL(
+            """UPDATE {table}
+               SET last_used = %(last_used)s
+               WHERE cache_key IN %(cache_keys)s
+               RETURNING cache_key, processed_content;"""
+        ).format(table=psy_sql.Identifier(self._schema, self._table_name))
+
+        cached_entries = self._db_connection.execute_database_operation_returning_rows(
+            sql_command=lookup_query,
+            params={'cache_keys': tuple(unique_keys), 'last_used': datetime.datetime.utcnow()}
+        )
+
+        cached_texts = dict(zip(cached_entries['cache_key'], cached_entries['processed_content']))
+
+        self.hits += len(cached_texts)
+        self.misses += len(unique_keys) - len(cached_texts)
+        metrics.CACHE_LOOKUPS.inc(len(cached_texts), cache='preprocessing', result='hit')
+        metrics.CACHE_LOOKUPS.inc(len(unique_keys) - len(cached_texts), cache='preprocessing', result='miss')
+
+        return cached_texts
+
+    def put_many(self, processed_texts: Dict[str, str]) -> None:
+        """
+        Store newly preprocessed text.
+
+        Parameters
+        ----------
+        processed_texts : dict
+            Key: cache key (see `get_cache_key`), Value: preprocessed text.
+        """
+
+        if not processed_texts:
+            return
+
+        df_entries = pd.DataFrame(data={
+            'cache_key': list(processed_texts.keys()),
+            'pipeline_fingerprint': self._pipeline_fingerprint,
+            'processed_content': list(processed_texts.values()),
+            'last_used': datetime.datetime.utcnow()
+        })
+
+        self._db_connection.upsert_dataframe_to_existing_table(
+            dataframe=df_entries,
+            table_name=self._table_name,
+            schema=self._schema,
+            id_column='cache_key'
+        )
+
+    def evict(self) -> None:
+        """
+        Remove the entries produced by other preprocessing pipelines, then the least recently used entries beyond
+        `max_entries`.
+        """
+
+        table = psy_sql.Identifier(self._schema, self._table_name)
+
+        self._db_connection.execute_database_operation(
+            sql_command=psy_sql.SQL(
+                "DELETE FROM {table} WHERE pipeline_fingerprint != %(pipeline_fingerprint)s;"
+            ).format(table=table),
+            params={'pipeline_fingerprint': self._pipeline_fingerprint}
+        )
+
+        self._db_connection.execute_database_operation(
+            sql_command=psy_sql.SQL(
+                """DELETE FROM {table}
+                   WHERE cache_key IN (
+                       SELECT cache_key FROM {table} ORDER BY last_used DESC OFFSET %(max_entries)s
+                   );"""
+            ).format(table=table),
+            params={'max_entries': self._max_entries}
+        )
+
+    def report_statistics(self) -> None:
+        """Display how many texts were found in the cache rather than preprocessed again."""
+
+        total_lookups = self.hits + self.misses
+        hit_rate = self.hits / total_lookups if total_lookups else 0
+
+        print(f'Preprocessing cache: {self.hits} hits, {self.misses} misses ({hit_rate:.0%} hit rate).')
@@ -0,0 +1,88 @@
+"""Testing the detection of articles which are near-duplicates of one another."""
+
+# Third party libraries
+import pandas as pd
+import pytest
+
+# Internal imports
+from interlocutor.database import postgresql
+from interlocutor.nlp import deduplication
+from interlocutor.pipeline import processing_state
+
+
+ORIGINAL_TEXT = (
+    'The government has announced a new plan to build thousands of homes across the north of England over the next '
+    'decade, promising that every new development will include green spaces, schools and improved transport links for '
+    'the families who move there. Ministers say the first sites will be chosen by the end of the year, with building '
+    'work starting shortly afterwards and the first residents moving in within three years. Local councils will be '
+    'given extra funding to speed up planning decisions, and developers who fail to start work quickly could lose '
+    'their permission to build. Critics argue the plan does not go far enough to address the housing crisis, pointing '
+    'out that similar promises have been made by previous governments without the homes ever being built.'
+)
+
+# The same column lightly re-edited by another publication
+RE_EDITED_TEXT = ORIGINAL_TEXT.replace('Critics argue', 'Opponents argue')
+
+UNRELATED_TEXT = (
+    'Football fans were left stunned on Saturday afternoon when the league leaders were beaten at home by a side '
+    'which had not won a single match all season, ending an unbeaten run stretching back more than a year.'
+)
+
+
+def test_signatures_estimate_similarity():
+    """Signatures of near-duplicate texts mostly match, whereas those of unrelated texts do not."""
+
+    min_hasher = deduplication.MinHasher()
+
+    original_signature = min_hasher.get_signature(ORIGINAL_TEXT)
+
+    assert min_hasher.estimate_similarity(original_signature, min_hasher.get_signature(ORIGINAL_TEXT)) == 1
+    assert min_hasher.estimate_similarity(original_signature, min_hasher.get_signature(RE_EDITED_TEXT)) > 0.8
+    assert min_hasher.estimate_similarity(original_signature, min_hasher.get_signature(UNRELATED_TEXT)) < 0.1
+
+    assert min_hasher.get_signature('') is None
+
+
+def test_lsh_index_finds_near_duplicate_candidates():
+    """Only articles similar to the one being looked up are returned as candidates."""
+
+    min_hasher = deduplication.MinHasher()
+    lsh_index = deduplication.LshIndex()
+
+    lsh_index.add(article_id='original', signature=min_hasher.get_signature(ORIGINAL_TEXT))
+    lsh_index.add(article_id='unrelated', signature=min_hasher.get_signature(UNRELATED_TEXT))
+
+    assert lsh_index.get_candidates(min_hasher.get_signature(RE_EDITED_TEXT)) == {'original'}
+
+
+@pytest.mark.integration
+def test_index_new_articles(monkeypatch):
+    """Signatures of new articles are saved, and near-duplicates are recorded against the original article."""
+
+    def mock_unindexed_articles(backlogs):
+        """Mock articles ingested from different publications."""
+
+        return pd.DataFrame(data={
+            'id': ['original', 're_edited', 'unrelated'],
+            'publication': ['daily_mail', 'i_news', 'the_guardian'],
+            'content': [ORIGINAL_TEXT, RE_EDITED_TEXT, UNRELATED_TEXT]
+        })
+
+    near_duplicate_detector = deduplication.NearDuplicateDetector()
+    monkeypatch.setattr(near_duplicate_detector, '_load_unindexed_articles', mock_unindexed_articles)
+
+    near_duplicate_detector.index_new_articles()
+
+    db_connection = postgresql.DatabaseConnection()
+
+    indexed_articles = db_connection.get_dataframe(table_name='minhash_signatures', schema='encoded_articles')
+    near_duplicates = db_connection.get_dataframe(table_name='near_duplicate_articles', schema='encoded_articles')
+
+    # Tidy up
+    db_connection.execute_database_operation('TRUNCATE TABLE encoded_articles.minhash_signatures;')
+    db_connection.execute_database_operation('TRUNCATE TABLE encoded_articles.near_duplicate_articles;')
+    processing_state.ProcessingState(db_connection=db_connection).rewind(stage='deduplicated')
+
+    assert sorted(article_id.strip() for article_id in indexed_articles['id']) == ['original', 're_edited', 'unrelated']
+    assert [article_id.strip() for article_id in near_duplicates['id']] == ['re_edited']
+    assert [article_id.strip() for article_id in near_duplicates['duplicate_of_id']] == ['original']
@@ -10,10 +10,12 @@ import os
 import numpy as np
 import pandas as pd
 import pytest
+from sklearn.feature_extraction import text as sklearn_text
 
 # Internal imports
 from interlocutor.nlp import encoding
 from interlocutor.database import postgresql
+from interlocutor.pipeline import processing_state
 
 
 class TestTfidfEncoder:
@@ -36,7 +38,7 @@ class TestTfidfEncoder:
         monkeypatch.setattr(tfidf_encoder, '_load_all_articles_bow_preprocessed_content', mock_preprocessed_content)
 
         tfidf_encoder._analyse_and_overwrite_existing_vocabulary(
-            mock_preprocessed_content()['processed_content'].values
+            tfidf_encoder._get_token_ids(mock_preprocessed_content().assign(token_ids=None))
         )
 
         # # Query the table to see if the new rows were inserted correctly
@@ -113,6 +115,51 @@ class TestTfidfEncoder:
 
         pd.testing.assert_frame_equal(actual_similarity, expected_similarity, check_names=False)
 
+    def test_calculate_similarities_of_some_articles(self, monkeypatch):
+        """Only the rows of the given articles are calculated, scoring them against every article."""
+
+        tfidf_encoder = encoding.TfidfEncoder()
+        monkeypatch.setattr(
+            tfidf_encoder._db_connection,
+            'get_dataframe',
+            lambda **kwargs: pd.DataFrame(
+                columns=['id', 'encoded'],
+                data=[['article_1', [1, 0]], ['article_2', [1, 1]], ['article_3', [0, 1]]]
+            )
+        )
+
+        actual_similarity = tfidf_encoder._calculate_similarities(article_ids=['article_3'])
+
+        expected_similarity = pd.DataFrame(
+            columns=['id', 'article_1', 'article_2', 'article_3'],
+            data=[['article_3', 0.0, 0.70710, 1.0]]
+        ).set_index('id')
+
+        pd.testing.assert_frame_equal(actual_similarity, expected_similarity, check_names=False)
+
+    @pytest.mark.integration
+    def test_count_vocabulary(self):
+        """Counting lemma ids gives the same tf-idf matrix as vectorising the preprocessed text."""
+
+        preprocessed_content = pd.DataFrame(data={
+            'id': ['article_1', 'article_2', 'article_3'],
+            'processed_content': ['cat sit mat cat', 'dog chase cat a £5', ''],
+            'token_ids': None
+        })
+        vocabulary = {'cat': 0, 'chase': 1, 'mat': 2, 'zebra': 3}
+
+        tfidf_encoder = encoding.TfidfEncoder()
+        token_ids = tfidf_encoder._get_token_ids(preprocessed_content)
+
+        actual_tfidf = sklearn_text.TfidfTransformer().fit_transform(
+            tfidf_encoder._count_vocabulary(token_ids=token_ids, vocabulary=vocabulary)
+        )
+        expected_tfidf = sklearn_text.TfidfVectorizer(vocabulary=vocabulary).fit_transform(
+            preprocessed_content['processed_content']
+        )
+
+        np.testing.assert_almost_equal(actual=actual_tfidf.toarray(), desired=expected_tfidf.toarray())
+
     @pytest.mark.parametrize("use_existing_vocab", [True, False])
     @pytest.mark.integration
     def test_encode_articles(self, use_existing_vocab):
@@ -129,8 +176,9 @@ class TestTfidfEncoder:
             cursor.execute("TRUNCATE TABLE encoded_articles.tfidf_representation;")
             db_connection._conn.commit()
 
-        # Load what we are expecting to see, which is the tf-idf representation of the only article which has already
-        # been bag-of-words preprocessed in the staging data: daily_mail.article_content_bow_preprocessed
+        # Load what we are expecting to see, which is the tf-idf representation of the only articles which have already
+        # been bag-of-words preprocessed in the staging data: daily_mail.article_content_bow_preprocessed and
+        # i_news.article_content_bow_preprocessed (which have identical content)
         script_directory = os.path.dirname(os.path.abspath(__file__))
 
         # Load expected tf-idf representation of the mock article. The csv files have been calculated following the
@@ -187,22 +235,54 @@ class TestTfidfEncoder:
             db_connection._conn.commit()
         db_connection._close_connection()
 
+        processing_state.ProcessingState(db_connection=db_connection).rewind(stage='encoded')
+
         # The encoded values is loaded from the csv as a string, so convert back to an array
         expected_tfidf_vector = np.array(ast.literal_eval(expected_tfidf['encoded'][0]))
 
-        assert actual_tfidf.index == expected_tfidf.index
+        assert actual_tfidf.index.equals(expected_tfidf.index)
 
         np.testing.assert_almost_equal(actual=actual_tfidf['encoded'][0], desired=expected_tfidf_vector, decimal=6)
 
+    def test_encode_articles_with_empty_backlog(self, monkeypatch):
+        """Nothing is encoded when no articles are waiting, but the watermarks still move on past the backlog."""
+
+        tfidf_encoder = encoding.TfidfEncoder(use_existing_vocab=True)
+        advanced_watermarks = {}
+
+        monkeypatch.setattr(
+            tfidf_encoder._processing_state,
+            'get_backlog',
+            lambda stage, upstream_stage, publication: (None, f'horizon_{publication}')
+        )
+        monkeypatch.setattr(
+            tfidf_encoder._processing_state,
+            'advance_watermark',
+            lambda stage, publication, horizon: advanced_watermarks.update({(stage, publication): horizon})
+        )
+        monkeypatch.setattr(
+            tfidf_encoder,
+            '_load_all_articles_bow_preprocessed_content',
+            lambda backlogs: pd.DataFrame(columns=['id', 'publication', 'processed_content', 'token_ids'])
+        )
+
+        assert tfidf_encoder.encode_articles() == []
+        assert advanced_watermarks == {
+            ('encoded', publication): f'horizon_{publication}' for publication in tfidf_encoder._publications
+        }
+
     @pytest.mark.parametrize("use_existing_vocab", [False, True])
     @pytest.mark.integration
     def test_load_all_articles_bow_preprocessed_content(self, use_existing_vocab):
         """The bag of words preprocessed version of all articles from every publication is loaded correctly."""
 
-        # Staging data only exists for the daily mail, so only one article should be retrieved
-        expected_content = pd.DataFrame(
-            data={'id': ['3587c1cb3b85d116d9573897437fc4db'], 'processed_content': ['some preprocessed content']}
-        )
+        # Staging data only exists for the daily mail and i news, so only one article from each should be retrieved
+        expected_content = pd.DataFrame(data={
+            'id': ['3587c1cb3b85d116d9573897437fc4db', 'fe79aefa1bd60228b8201cb0468d8eb5'],
+            'publication': ['daily_mail', 'i_news'],
+            'processed_content': ['some preprocessed content', 'some preprocessed content'],
+            'token_ids': [None, None]
+        })
 
         tfidf_encoder = encoding.TfidfEncoder(use_existing_vocab=use_existing_vocab)
         actual_content = tfidf_encoder._load_all_articles_bow_preprocessed_content()
@@ -293,6 +373,31 @@ class TestTfidfEncoder:
 
         pd.testing.assert_frame_equal(actual_article_pairs, expected_article_pairs)
 
+    @pytest.mark.integration
+    def test_store_most_similar_articles_of_some_articles(self):
+        """Only the pairs including the given articles are replaced, leaving the pairs of other articles."""
+
+        tfidf_encoder = encoding.TfidfEncoder()
+        tfidf_encoder.store_most_similar_articles(similarity_threshold=0.5)
+
+        # At a higher threshold article 3 is no longer similar to article 4, whose pairs with it are removed
+        tfidf_encoder.store_most_similar_articles(
+            similarity_threshold=0.8,
+            article_ids=['article_3_8350295550de7d587bc323']
+        )
+
+        db_connection = postgresql.DatabaseConnection()
+        actual_article_pairs = db_connection.get_dataframe(
+            query="SELECT TRIM(id) AS id, TRIM(similar_article_id) AS similar_article_id "
+                  "FROM encoded_articles.tfidf_similar_articles ORDER BY id;"
+        )
+        db_connection.execute_database_operation("TRUNCATE TABLE encoded_articles.tfidf_similar_articles;")
+
+        assert actual_article_pairs.values.tolist() == [
+            ['article_1_d36c525d1679623119fd7a', 'article_2_4b2a76b9719d911017c592'],
+            ['article_2_4b2a76b9719d911017c592', 'article_1_d36c525d1679623119fd7a']
+        ]
+
     @pytest.mark.parametrize('similarity_threshold', [-1, 1, 2])
     def test_store_most_similar_articles_expects_appropriate_threshold(self, similarity_threshold):
         """Exception is raised if similarity threshold is not between 0 and 1."""
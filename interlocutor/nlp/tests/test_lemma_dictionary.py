@@ -0,0 +1,17 @@
+"""Testing the representation of preprocessed text as integer lemma ids."""
+
+# Internal imports
+from interlocutor.nlp import lemma_dictionary
+
+
+def test_encode():
+    """Lemmas are given the same id every time they appear, and new lemmas are added as they are seen."""
+
+    dictionary = lemma_dictionary.LemmaDictionary()
+
+    # Words with fewer than two characters are dropped, matching sklearn's tf-idf vectoriser
+    assert dictionary.encode(['cat sit mat cat', 'dog chase cat a £5', '']) == [[0, 1, 2, 0], [3, 4, 0], []]
+    assert dictionary.encode(['Zebra chase cat']) == [[5, 4, 0]]
+
+    assert dictionary.lemma_ids == {'cat': 0, 'sit': 1, 'mat': 2, 'dog': 3, 'chase': 4, 'zebra': 5}
+    assert dictionary.get_lemmas([5, 0]) == ['zebra', 'cat']
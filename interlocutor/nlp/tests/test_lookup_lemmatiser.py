@@ -0,0 +1,31 @@
+"""Testing the fast path for preprocessing, which looks up the output learned for each chunk of text."""
+
+# Internal imports
+from interlocutor.nlp import lookup_lemmatiser
+
+
+def test_preprocess_texts_only_passes_unknown_chunks_to_spacy():
+    """Each chunk of text is only preprocessed in full the first time it is seen, then looked up."""
+
+    texts_preprocessed_in_full = []
+
+    def mock_preprocess_texts(texts):
+        """Mock the full pipeline by removing 'the' and punctuation, and lowercasing everything else."""
+        texts_preprocessed_in_full.extend(texts)
+        return [' '.join(word for word in text.lower().strip('!.,').split('-') if word != 'the') for text in texts]
+
+    lemmatiser = lookup_lemmatiser.LookupLemmatiser(preprocess_texts=mock_preprocess_texts)
+
+    first_output = lemmatiser.preprocess_texts(['The Cats sat on the mat.', 'the\n\nCats  ran!'])
+
+    assert first_output == ['cats sat on mat', 'cats ran']
+    assert texts_preprocessed_in_full == ['The', 'Cats', 'sat', 'on', 'the', 'mat.', 'ran!']
+
+    texts_preprocessed_in_full.clear()
+
+    second_output = lemmatiser.preprocess_texts(['Cats sat on the high-profile mat.', ''])
+
+    assert second_output == ['cats sat on high profile mat', '']
+    assert texts_preprocessed_in_full == ['high-profile']
+    assert (lemmatiser.hits, lemmatiser.misses) == (7, 8)
+    assert lemmatiser.number_of_chunks_known == 8
@@ -0,0 +1,65 @@
+"""Testing the benchmark choosing the fastest spaCy settings for the host."""
+
+# Third party imports
+import pytest
+import spacy
+
+# Internal imports
+from interlocutor.database import postgresql
+from interlocutor.nlp import pipeline_tuning
+
+
+def test_benchmark():
+    """Throughput is measured for every combination of batch size and number of processes."""
+
+    tuner = pipeline_tuning.SpacyPipelineTuner(spacy_nlp=spacy.blank('en'), db_connection=None)
+
+    df_results = tuner.benchmark(texts=['The cats sat on the mat.'] * 20, batch_sizes=(1, 10), processor_counts=(1,))
+
+    assert df_results[['batch_size', 'number_of_processors']].values.tolist() == [[1, 1], [10, 1]]
+    assert (df_results['startup_seconds'] == 0).all()
+    assert (df_results['docs_per_second'] > 0).all()
+
+
+@pytest.mark.parametrize('number_of_texts, expected_number_of_processors', [
+    (10, 1),  # 0.1 seconds with one process, 2.025 seconds with four
+    (500, 4),  # 5 seconds with one process, 3.25 seconds with four
+])
+def test_get_number_of_processors(number_of_texts, expected_number_of_processors):
+    """A single process is used when there are too few texts for the time taken to start more to be recovered."""
+
+    settings = {
+        'batch_size': 50,
+        'number_of_processors': 4,
+        'docs_per_second': 400,
+        'startup_seconds': 2,
+        'single_process_batch_size': 20,
+        'single_process_docs_per_second': 100
+    }
+
+    assert pipeline_tuning.SpacyPipelineTuner.get_number_of_processors(
+        settings=settings,
+        number_of_texts=number_of_texts
+    ) == expected_number_of_processors
+
+
+@pytest.mark.integration
+def test_tune():
+    """The fastest settings are stored for the host and loaded again."""
+
+    tuner = pipeline_tuning.SpacyPipelineTuner(
+        spacy_nlp=spacy.blank('en'),
+        db_connection=postgresql.DatabaseConnection()
+    )
+
+    tuned_settings = tuner.tune(
+        texts=tuner.load_sample_texts(sample_size=10),
+        batch_sizes=(1, 5),
+        processor_counts=(1,)
+    )
+    loaded_settings = tuner.load_settings()
+
+    assert tuned_settings['number_of_processors'] == loaded_settings['number_of_processors'] == 1
+    assert tuned_settings['batch_size'] == loaded_settings['batch_size']
+    assert loaded_settings['batch_size'] in (1, 5)
+    assert loaded_settings['host'] == tuned_settings['host']
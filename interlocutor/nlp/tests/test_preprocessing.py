@@ -6,7 +6,8 @@ import pytest
 
 # Internal imports
 from interlocutor.database import postgresql
-from interlocutor.nlp import preprocessing
+from interlocutor.nlp import deduplication, lookup_lemmatiser, preprocessing
+from interlocutor.pipeline import processing_state
 
 
 class TestBagOfWordsPreprocessor:
@@ -16,6 +17,9 @@ class TestBagOfWordsPreprocessor:
     def test_preprocess_all_article_content(self):
         """Article content is preprocessed and uploaded to database."""
 
+        # Only articles checked for near-duplicates are preprocessed
+        deduplication.NearDuplicateDetector().index_new_articles()
+
         preprocessor = preprocessing.BagOfWordsPreprocessor()
         preprocessor.preprocess_all_article_content()
 
@@ -64,12 +68,56 @@ class TestBagOfWordsPreprocessor:
 
             # Tidy up and delete newly inserted rows
             # (those that don't exist in the staging data Docker/db/staging_data/daily_mail.columnists.csv)
-            curs.execute("TRUNCATE TABLE the_guardian.article_content_bow_preprocessed;")
+            curs.execute(
+                "TRUNCATE TABLE the_guardian.article_content_bow_preprocessed, encoded_articles.minhash_signatures, "
+                "encoded_articles.near_duplicate_articles;"
+            )
 
             db_connection._conn.commit()
 
+        state = processing_state.ProcessingState(db_connection=db_connection)
+        state.rewind(stage='preprocessed')
+        state.rewind(stage='deduplicated')
+
         pd.testing.assert_frame_equal(actual_guardian, expected_guardian)
 
+    @pytest.mark.integration
+    def test_refilter_all_article_content(self, monkeypatch):
+        """Articles with stored spaCy docs are re-filtered with new rules without being parsed again."""
+
+        deduplication.NearDuplicateDetector().index_new_articles()
+
+        preprocessor = preprocessing.BagOfWordsPreprocessor(use_cache=False, store_docs=True)
+        preprocessor.preprocess_all_article_content()
+
+        # Numbers are now removed as well, and parsing would fail if it were attempted
+        monkeypatch.setattr(
+            preprocessing.BagOfWordsPreprocessor,
+            '_token_should_be_deleted',
+            staticmethod(lambda token: bool(token.is_punct or token.is_space or token.is_stop or token.like_num))
+        )
+        monkeypatch.setattr(preprocessor._spacy_nlp, 'pipe', None)
+
+        preprocessor.refilter_all_article_content()
+
+        db_connection = postgresql.DatabaseConnection()
+        actual_guardian = db_connection.get_dataframe(
+            query="SELECT processed_content FROM the_guardian.article_content_bow_preprocessed;"
+        )
+
+        # Tidy up and delete newly inserted rows
+        db_connection.execute_database_operation(
+            "TRUNCATE TABLE the_guardian.article_content_bow_preprocessed, preprocessing.spacy_docs, "
+            "encoded_articles.minhash_signatures, encoded_articles.near_duplicate_articles;"
+        )
+        state = processing_state.ProcessingState(db_connection=db_connection)
+        state.rewind(stage='preprocessed')
+        state.rewind(stage='deduplicated')
+
+        first_ten_words = ' '.join(actual_guardian['processed_content'].iloc[0].split()[:10])
+
+        assert first_ten_words.startswith('margaret thatcher britain female prime minister resign november')
+
     def test_preprocess_texts(self):
         """
         Texts are transformed appropriately i.e. stop words and punctuation are removed, then words are lemmatised and
@@ -97,3 +145,60 @@ class TestBagOfWordsPreprocessor:
         preprocessor = preprocessing.BagOfWordsPreprocessor()
 
         assert preprocessor._preprocess_texts(input_texts) == expected_output
+
+    def test_lookup_lemmatiser_matches_spacy(self):
+        """
+        The lookup lemmatiser gives exactly the same output as the full spaCy pipeline, both while it is learning and
+        once every chunk of text is known.
+        """
+
+        input_texts = [
+            'This is a text which contains some stop words',
+            'This text Contains some UPPERCASING ',
+            'This text contains some high-profile punctuation! ...',
+            'This text contains multiple spaces    in      it which need removing',
+            'This text contains some words that require lemmatisation as we are playing with the processor class',
+            'This text contains some contractions shan\'t it. Alicia\'s thinking so too',
+            'New lines\nand\ttabs, "quotes", (brackets), e-mail addresses like someone@example.com and £5.50 prices',
+            'The U.S. and U.K. governments met at 10:30am on 1st January... didn\'t they?',
+            '',
+        ]
+
+        preprocessor = preprocessing.BagOfWordsPreprocessor(use_cache=False)
+        lemmatiser = lookup_lemmatiser.LookupLemmatiser(preprocess_texts=preprocessor._preprocess_texts)
+
+        expected_output = preprocessor._preprocess_texts(input_texts)
+
+        assert lemmatiser.preprocess_texts(input_texts) == expected_output
+        assert lemmatiser.preprocess_texts(input_texts) == expected_output
+        assert lemmatiser.misses == lemmatiser.number_of_chunks_known
+
+
+def test_preprocess_publications_in_parallel(monkeypatch):
+    """Each publication is preprocessed in the pool by a preprocessor created once per process."""
+
+    class MockPreprocessor:
+        """Mock preprocessor which counts how many times it has been created in each process."""
+
+        instances_created = 0
+
+        def __init__(self, **kwargs):
+            MockPreprocessor.instances_created += 1
+            self._kwargs = kwargs
+
+        def preprocess_all_article_content(self, schemas):
+            assert self._kwargs == {'number_of_processors': 1, 'store_docs': True}
+            return {schemas[0]: len(schemas[0]) * MockPreprocessor.instances_created}
+
+    monkeypatch.setattr(preprocessing, 'BagOfWordsPreprocessor', MockPreprocessor)
+
+    throughput = preprocessing.preprocess_publications_in_parallel(
+        schemas=['the_guardian', 'daily_mail', 'i_news'],
+        max_workers=1,
+        store_docs=True
+    )
+
+    # The only process in the pool created a single preprocessor, which it used for every publication
+    assert throughput['publication'].tolist() == ['the_guardian', 'daily_mail', 'i_news']
+    assert throughput['articles'].tolist() == [12, 10, 6]
+    assert (throughput['articles_per_second'] > 0).all()
@@ -0,0 +1,70 @@
+"""Testing the cache of text which has already been preprocessed."""
+
+# Third party libraries
+import pytest
+
+# Internal imports
+from interlocutor.database import postgresql
+from interlocutor.nlp import preprocessing_cache
+
+
+@pytest.mark.integration
+def test_cached_text_is_only_returned_for_the_same_pipeline():
+    """Text stored by one pipeline is found again by that pipeline, but not by a pipeline with another fingerprint."""
+
+    db_connection = postgresql.DatabaseConnection()
+
+    cache = preprocessing_cache.PreprocessingCache(pipeline_fingerprint='a' * 32, db_connection=db_connection)
+    other_pipeline_cache = preprocessing_cache.PreprocessingCache(
+        pipeline_fingerprint='b' * 32,
+        db_connection=db_connection
+    )
+
+    cache_key = cache.get_cache_key('The cats were running')
+
+    try:
+        assert cache.get_many([cache_key]) == {}
+
+        cache.put_many({cache_key: 'cat run'})
+
+        assert cache.get_many([cache_key, cache_key]) == {cache_key: 'cat run'}
+        assert other_pipeline_cache.get_many([other_pipeline_cache.get_cache_key('The cats were running')]) == {}
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    finally:
+        db_connection.execute_database_operation('TRUNCATE TABLE preprocessing.bow_cache;')
+
+
+@pytest.mark.integration
+def test_evict():
+    """Entries from other pipelines are evicted, followed by the least recently used entries beyond the size limit."""
+
+    db_connection = postgresql.DatabaseConnection()
+
+    old_pipeline_cache = preprocessing_cache.PreprocessingCache(
+        pipeline_fingerprint='a' * 32,
+        db_connection=db_connection
+    )
+    cache = preprocessing_cache.PreprocessingCache(
+        pipeline_fingerprint='b' * 32,
+        db_connection=db_connection,
+        max_entries=2
+    )
+
+    try:
+        old_pipeline_cache.put_many({old_pipeline_cache.get_cache_key('old text'): 'old text'})
+
+        for text in ['first text', 'second text', 'third text']:
+            cache.put_many({cache.get_cache_key(text): text})
+
+        # Using the first entry means the second is now the least recently used
+        cache.get_many([cache.get_cache_key('first text')])
+
+        cache.evict()
+
+        remaining_entries = db_connection.get_dataframe(query='SELECT processed_content FROM preprocessing.bow_cache;')
+
+        assert sorted(remaining_entries['processed_content']) == ['first text', 'third text']
+
+    finally:
+        db_connection.execute_database_operation('TRUNCATE TABLE preprocessing.bow_cache;')
@@ -0,0 +1,110 @@
+"""Testing the workers which preprocess and encode articles as soon as they are inserted."""
+
+# Third party imports
+import psycopg2
+import pytest
+
+# Internal imports
+from interlocutor.nlp import workers
+
+
+def test_worker_must_implement_processing():
+    """A worker which does not implement how to process notifications cannot be created."""
+
+    class IncompleteWorker(workers.PipelineWorker):
+        channel = 'article_content_inserted'
+
+        def _catch_up(self):
+            pass
+
+    with pytest.raises(TypeError, match='_process'):
+        IncompleteWorker()
+
+
+def test_worker_waits_longer_to_reconnect_after_each_failure(monkeypatch):
+    """While the database is unavailable, the wait before listening again doubles after each failure, up to a cap."""
+
+    class MockDatabaseConnection:
+        """Mock a database which refuses every connection."""
+
+        def listen_for_notifications(self, **kwargs):
+            raise psycopg2.OperationalError('could not connect to server')
+            yield  # pylint: disable=unreachable
+
+    class IdleWorker(workers.PipelineWorker):
+        channel = 'article_content_inserted'
+
+        def _catch_up(self):
+            pass
+
+        def _process(self, notifications):
+            pass
+
+    class StopWorker(Exception):
+        """Stop the worker once it has waited enough times."""
+
+    waits = []
+
+    def mock_sleep(seconds):
+        waits.append(seconds)
+
+        if len(waits) == 8:
+            raise StopWorker
+
+    monkeypatch.setattr(workers.postgresql, 'DatabaseConnection', MockDatabaseConnection)
+    monkeypatch.setattr(workers.time, 'sleep', mock_sleep)
+
+    with pytest.raises(StopWorker):
+        IdleWorker().run()
+
+    assert waits == [10, 20, 40, 80, 160, 300, 300, 300]
+
+
+@pytest.mark.integration
+def test_preprocessing_worker_run(monkeypatch):
+    """
+    The worker catches up once it is listening and whenever it times out, then checks each batch of new articles for
+    near-duplicates before preprocessing them by publication.
+    """
+
+    def mock_listen_for_notifications(**kwargs):
+        """Mock listening and timing out once, followed by one batch of articles inserted into two publications."""
+
+        yield []
+        yield []
+        yield [
+            {'channel': 'article_content_inserted', 'payload': {'schema': 'daily_mail', 'id': 'article_1'}},
+            {'channel': 'article_content_inserted', 'payload': {'schema': 'the_guardian', 'id': 'article_2'}},
+            {'channel': 'article_content_inserted', 'payload': {'schema': 'daily_mail', 'id': 'article_3'}}
+        ]
+
+    calls = []
+
+    worker = workers.PreprocessingWorker()
+
+    monkeypatch.setattr(worker._db_connection, 'listen_for_notifications', mock_listen_for_notifications)
+    monkeypatch.setattr(
+        worker._near_duplicate_detector,
+        'index_new_articles',
+        lambda publications=None: calls.append(('deduplicate', publications))
+    )
+    monkeypatch.setattr(
+        worker._preprocessor,
+        'preprocess_all_article_content',
+        lambda: calls.append('catch up')
+    )
+    monkeypatch.setattr(
+        worker._preprocessor,
+        'preprocess_article_content',
+        lambda schema, article_ids: calls.append((schema, article_ids))
+    )
+
+    worker.run(max_batches=1)
+
+    assert calls == [
+        ('deduplicate', None), 'catch up',
+        ('deduplicate', None), 'catch up',
+        ('deduplicate', ['daily_mail', 'the_guardian']),
+        ('daily_mail', ['article_1', 'article_3']),
+        ('the_guardian', ['article_2'])
+    ]
@@ -0,0 +1,256 @@
+"""Long-running workers which preprocess and encode articles as soon as they are inserted into the database."""
+
+# Standard libraries
+import abc
+import argparse
+import collections
+import time
+from typing import Dict, List
+
+# Third party libraries
+import psycopg2
+
+# Internal imports
+from interlocutor.commons import tracing
+from interlocutor.database import postgresql
+from interlocutor.nlp import deduplication, encoding, preprocessing
+from interlocutor.pipeline import monitoring
+
+# Longest wait between attempts to listen again while the database is unavailable
+_MAX_RECONNECT_SECONDS = 300
+
+
+class PipelineWorker(abc.ABC):
+    """
+    Listen for notifications sent by the database triggers on a channel (see the PIPELINE NOTIFICATIONS section of
+    Docker/db/01_init.sql) and process them in micro-batches, rather than polling for new work.
+
+    Notifications are not queued while nothing is listening, so any work missed is caught up on when the worker starts
+    listening, including after it reconnects to the database. Subclasses set the channel and implement `_catch_up` and
+    `_process`.
+    """
+
+    channel = None
+
+    def __init__(self, timeout: float = 60, batch_window: float = 1):
+        """
+        Initialise attributes of class.
+
+        Parameters
+        ----------
+        timeout : float (default 60)
+            Seconds to wait for a notification at a time.
+        batch_window : float (default 1)
+            Seconds to keep gathering notifications after the first one arrives, so articles inserted together are
+            processed together.
+        """
+
+        self._db_connection = postgresql.DatabaseConnection()
+        self._timeout = timeout
+        self._batch_window = batch_window
+
+    @abc.abstractmethod
+    def _catch_up(self) -> None:
+        """Process any work which was missed while the worker was not listening."""
+
+    @abc.abstractmethod
+    def _process(self, notifications: List[Dict]) -> None:
+        """
+        Process a micro-batch of notifications.
+
+        Parameters
+        ----------
+        notifications : list[dict]
+            Channel and payload of each notification (see
+            `interlocutor.database.postgresql.DatabaseConnection.listen_for_notifications`).
+        """
+
+    def run(self, max_batches: int = None) -> None:
+        """
+        Catch up on any work missed, then process each micro-batch of notifications as they arrive, catching up again
+        whenever no notification arrives within the timeout.
+
+        Parameters
+        ----------
+        max_batches : int (default None)
+            Number of micro-batches to process before stopping. Runs until interrupted if not provided.
+        """
+
+        batches_processed = 0
+        failed_connections = 0
+
+        while True:
+            try:
+                for batch_number, notifications in enumerate(self._db_connection.listen_for_notifications(
+                        channels=[self.channel],
+                        timeout=self._timeout,
+                        batch_window=self._batch_window
+                )):
+                    # The first batch is empty and marks the point from which notifications will be received
+                    if batch_number == 0:
+                        failed_connections = 0
+                        print(f'Listening on {self.channel}, catching up on anything missed')
+                        self._catch_up()
+
+                    elif notifications:
+                        self._process(notifications)
+                        batches_processed += 1
+
+                        if max_batches is not None and batches_processed >= max_batches:
+                            return
+
+                    # Work left out of a batch (e.g. behind a transaction still open when it ran) is not notified
+                    # again, so the backlog is checked again whenever nothing arrives before the timeout
+                    else:
+                        self._catch_up()
+
+            except psycopg2.OperationalError as error:
+                # Wait longer after each failure in a row, so a database which is down is not flooded with attempts
+                failed_connections += 1
+                seconds_to_wait = min(
+                    postgresql.SECONDS_BETWEEN_CONNECTION_ATTEMPTS * 2 ** (failed_connections - 1),
+                    _MAX_RECONNECT_SECONDS
+                )
+                print(f'Lost connection to the database ({error}), listening again in {seconds_to_wait} seconds')
+                time.sleep(seconds_to_wait)
+
+
+class PreprocessingWorker(PipelineWorker):
+    """
+    Preprocess articles as soon as their content is inserted, once they have been checked for near-duplicates of the
+    articles before them.
+    """
+
+    channel = 'article_content_inserted'
+
+    def __init__(self, timeout: float = 60, batch_window: float = 1):
+        """
+        Initialise attributes of class.
+
+        Parameters
+        ----------
+        timeout : float (default 60)
+            Seconds to wait for a notification at a time.
+        batch_window : float (default 1)
+            Seconds to keep gathering notifications after the first one arrives.
+        """
+
+        super().__init__(timeout=timeout, batch_window=batch_window)
+
+        # Loaded once, as loading the spaCy model is much slower than preprocessing a handful of articles
+        self._preprocessor = preprocessing.BagOfWordsPreprocessor()
+        self._near_duplicate_detector = deduplication.NearDuplicateDetector()
+
+    def _catch_up(self) -> None:
+        """Check every new article for near-duplicates, then preprocess every article which has not been yet."""
+
+        self._near_duplicate_detector.index_new_articles()
+        self._preprocessor.preprocess_all_article_content()
+
+    def _process(self, notifications: List[Dict]) -> None:
+        """
+        Check the newly inserted articles for near-duplicates, then preprocess them.
+
+        Parameters
+        ----------
+        notifications : list[dict]
+            Notification of each inserted article, with its schema and id as the payload.
+        """
+
+        article_ids_by_schema = collections.defaultdict(list)
+
+        for notification in notifications:
+            article_ids_by_schema[notification['payload']['schema']].append(notification['payload']['id'])
+
+        # Preprocessing reads from deduplication, so near-duplicates are found before anything is preprocessed
+        self._near_duplicate_detector.index_new_articles(publications=list(article_ids_by_schema))
+
+        for schema, article_ids in article_ids_by_schema.items():
+            print(f'Preprocessing {len(article_ids)} new article(s) from {schema}')
+            self._preprocessor.preprocess_article_content(schema=schema, article_ids=article_ids)
+
+
+class EncodingWorker(PipelineWorker):
+    """Encode articles and find similar articles as soon as their preprocessed content is inserted."""
+
+    channel = 'article_content_preprocessed'
+
+    def __init__(self, timeout: float = 60, batch_window: float = 1, similarity_threshold: float = 0):
+        """
+        Initialise attributes of class.
+
+        Parameters
+        ----------
+        timeout : float (default 60)
+            Seconds to wait for a notification at a time.
+        batch_window : float (default 1)
+            Seconds to keep gathering notifications after the first one arrives.
+        similarity_threshold : float in interval [0,1) (default 0)
+            Cosine similarity score which two articles must exceed to be classed as similar.
+        """
+
+        super().__init__(timeout=timeout, batch_window=batch_window)
+
+        self._similarity_threshold = similarity_threshold
+
+    def _encode_and_store_similar_articles(self) -> None:
+        """Encode every article which has not been encoded yet, then find the articles similar to each of them."""
+
+        # Created each time so the latest vocabulary and lemma dictionary are used
+        tfidf_encoder = encoding.TfidfEncoder(use_existing_vocab=True)
+        encoded_article_ids = tfidf_encoder.encode_articles()
+
+        # Only the new articles are scored against the rest, so each batch takes time in proportion to the number of
+        # articles rather than its square
+        tfidf_encoder.store_most_similar_articles(
+            similarity_threshold=self._similarity_threshold,
+            article_ids=encoded_article_ids
+        )
+
+    def _catch_up(self) -> None:
+        """Encode every article which has not been encoded yet."""
+
+        self._encode_and_store_similar_articles()
+
+    def _process(self, notifications: List[Dict]) -> None:
+        """
+        Encode the newly preprocessed articles.
+
+        Parameters
+        ----------
+        notifications : list[dict]
+            Notification of each preprocessed article, with its schema and id as the payload.
+        """
+
+        print(f'Encoding {len(notifications)} newly preprocessed article(s)')
+        self._encode_and_store_similar_articles()
+
+
+if __name__ == '__main__':  # pragma: no cover (exclude from testing coverage report)
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('stage', choices=['preprocessing', 'encoding'], help='Stage of the pipeline to run')
+    parser.add_argument(
+        '--batch-window',
+        type=float,
+        default=1,
+        help='Seconds to keep gathering new articles after the first one arrives'
+    )
+    parser.add_argument(
+        '--metrics-port',
+        type=int,
+        help='Serve live metrics in the Prometheus text format on this port e.g. 9101 (not served by default)'
+    )
+    arguments = parser.parse_args()
+
+    tracing.start_run(run_name=f'{arguments.stage}_worker')
+
+    if arguments.metrics_port is not None:
+        monitoring.start_metrics_server(port=arguments.metrics_port)
+
+    if arguments.stage == 'preprocessing':
+        worker = PreprocessingWorker(batch_window=arguments.batch_window)
+    else:
+        worker = EncodingWorker(batch_window=arguments.batch_window)
+
+    worker.run()
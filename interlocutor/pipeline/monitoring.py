@@ -0,0 +1,57 @@
+"""Serve the metrics of long-running processes (crawlers, workers and the orchestrator) with the depth of each queue."""
+
+# Standard libraries
+import functools
+
+# Internal imports
+from interlocutor.commons import metrics
+from interlocutor.database import postgresql
+from interlocutor.get_data import crawl_state
+from interlocutor.pipeline import processing_state
+from interlocutor.pipeline import publications
+
+
+def record_queue_depths(db_connection: postgresql.DatabaseConnection) -> None:
+    """
+    Set the `interlocutor_queue_depth` metric of every publication in the registry: the URLs left to crawl and the size
+    of the backlog of each stage. Registered as a collector of the metrics server of long-running processes, so the
+    queues are measured each time the metrics are scraped.
+
+    Parameters
+    ----------
+    db_connection : interlocutor.database.postgresql.DatabaseConnection
+        Connection to the database holding the crawl and processing state.
+    """
+
+    df_backlog_sizes = processing_state.ProcessingState(db_connection=db_connection).get_backlog_sizes()
+    backlog_sizes = df_backlog_sizes.set_index(['publication', 'stage'])['backlog'].to_dict()
+
+    for schema in publications.get_schemas():
+        crawl_state_tracker = crawl_state.CrawlStateTracker(schema=schema, db_connection=db_connection)
+        metrics.QUEUE_DEPTH.set(crawl_state_tracker.count_remaining(), publication=schema, queue='crawl')
+
+        # Stages which have caught up have no rows, so their queue is empty rather than missing
+        for stage in processing_state.UPSTREAM_STAGES:
+            metrics.QUEUE_DEPTH.set(backlog_sizes.get((schema, stage), 0), publication=schema, queue=stage)
+
+
+def start_metrics_server(port: int) -> metrics.MetricsServer:
+    """
+    Serve the metrics of a long-running process (see `interlocutor.commons.metrics`), along with the depth of every
+    queue of the pipeline measured whenever the metrics are scraped.
+
+    Parameters
+    ----------
+    port : int
+        Port to serve the metrics on e.g. 9101.
+
+    Returns
+    -------
+    interlocutor.commons.metrics.MetricsServer
+        The running server.
+    """
+
+    return metrics.start_server(
+        port=port,
+        collectors=[functools.partial(record_queue_depths, db_connection=postgresql.DatabaseConnection())]
+    )
@@ -0,0 +1,490 @@
+"""Run the whole pipeline (ingest, deduplicate, preprocess, encode, find similar articles) as a DAG of stages."""
+
+# Standard libraries
+import argparse
+from concurrent import futures
+import functools
+import multiprocessing
+import time
+import traceback
+from typing import Callable, Dict, List
+
+# Third party libraries
+import pandas as pd
+
+# Internal imports
+from interlocutor.commons import tracing
+from interlocutor.get_data import daily_mail, i_news, the_guardian
+from interlocutor.nlp import deduplication, encoding, preprocessing
+from interlocutor.pipeline import monitoring
+from interlocutor.pipeline import publications as publication_registry
+
+
+class Stage:
+    """
+    Unit of work in the pipeline, which can start as soon as every stage it depends on has succeeded and every stage
+    it waits for has finished.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            run: Callable[[], None],
+            dependencies: List[str] = None,
+            lock: str = None,
+            waits_for: List[str] = None
+    ):
+        """
+        Initialise attributes of class.
+
+        Parameters
+        ----------
+        name : str
+            Unique name of the stage e.g. 'preprocess:daily_mail'.
+        run : callable
+            Function carrying out the work, called without any arguments.
+        dependencies : list[str] (default None)
+            Names of the stages which must succeed before this one starts.
+        lock : str (default None)
+            Stages sharing a lock never run at the same time, e.g. because they update the same index.
+        waits_for : list[str] (default None)
+            Names of the stages which must finish before this one starts, whether they succeed, fail or are skipped.
+        """
+
+        self.name = name
+        self.run = run
+        self.dependencies = dependencies or []
+        self.lock = lock
+        self.waits_for = waits_for or []
+
+    @property
+    def upstream(self) -> List[str]:
+        """Names of every stage which must finish before this one starts."""
+
+        return self.dependencies + self.waits_for
+
+
+class PipelineOrchestrator:
+    """
+    Run stages concurrently, starting each one as soon as its dependencies have succeeded and the stages it waits for
+    have finished (and its lock is free), and time every stage so the critical path of the run can be reported.
+
+    If a stage fails, the stages depending on it are skipped but every other stage still runs, including those which
+    only wait for it.
+    """
+
+    def __init__(self, stages: List[Stage], max_workers: int = 4):
+        """
+        Initialise attributes of class.
+
+        Parameters
+        ----------
+        stages : list[Stage]
+            Every stage in the pipeline.
+        max_workers : int (default 4)
+            Maximum number of stages running at the same time.
+
+        Raises
+        ------
+        ValueError
+            If stage names are not unique, a stage depends on a stage which does not exist, or the dependencies contain
+            a cycle.
+        """
+
+        self._stages = {stage.name: stage for stage in stages}
+        self._max_workers = max_workers
+
+        if len(self._stages) != len(stages):
+            raise ValueError('Every stage must have a unique name.')
+
+        self._check_dependencies()
+
+    def _check_dependencies(self) -> None:
+        """Make sure every dependency exists and the stages can be ordered so each runs after its dependencies."""
+
+        for stage in self._stages.values():
+            unknown_dependencies = set(stage.upstream) - set(self._stages)
+
+            if unknown_dependencies:
+                raise ValueError(f'Stage {stage.name} depends on unknown stages: {sorted(unknown_dependencies)}')
+
+        # Repeatedly remove stages whose dependencies have all been removed; anything left over is part of a cycle
+        remaining_stages = dict(self._stages)
+
+        while remaining_stages:
+            orderable_stages = [
+                name for name, stage in remaining_stages.items()
+                if not set(stage.upstream) & set(remaining_stages)
+            ]
+
+            if not orderable_stages:
+                raise ValueError(f'The dependencies of these stages contain a cycle: {sorted(remaining_stages)}')
+
+            for name in orderable_stages:
+                del remaining_stages[name]
+
+    @staticmethod
+    def _run_stage(stage: Stage, stage_times: Dict[str, Dict], pipeline_start: float) -> None:
+        """
+        Run a stage within a span named after it (see `interlocutor.commons.tracing`), recording when it started and
+        finished relative to the start of the pipeline.
+        """
+
+        start_seconds = time.perf_counter() - pipeline_start
+
+        try:
+            with tracing.span(stage.name):
+                stage.run()
+        finally:
+            stage_times[stage.name] = {
+                'start_seconds': start_seconds,
+                'end_seconds': time.perf_counter() - pipeline_start
+            }
+
+    def run(self) -> pd.DataFrame:
+        """
+        Run every stage, respecting their dependencies and locks.
+
+        Returns
+        -------
+        pandas DataFrame
+            One row per stage with its `status` ('succeeded', 'failed', or 'skipped' if a dependency did not succeed),
+            and the `start_seconds`, `end_seconds`, and `duration_seconds` of the stages which ran, measured from the
+            start of the pipeline.
+        """
+
+        pipeline_start = time.perf_counter()
+        statuses = {name: 'pending' for name in self._stages}
+        stage_times = {}
+        running_stages = {}
+        held_locks = set()
+
+        with futures.ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+
+            while True:
+
+                # Skip stages which can never run, including those downstream of other skipped stages
+                newly_skipped = True
+
+                while newly_skipped:
+                    newly_skipped = False
+
+                    for name, stage in self._stages.items():
+                        if statuses[name] == 'pending' and any(
+                                statuses[dependency] in ('failed', 'skipped') for dependency in stage.dependencies
+                        ):
+                            statuses[name] = 'skipped'
+                            newly_skipped = True
+
+                # Start every stage whose dependencies have succeeded, whose other upstream stages have finished, and
+                # whose lock is free
+                for name, stage in self._stages.items():
+                    if statuses[name] == 'pending' \
+                            and all(statuses[dependency] == 'succeeded' for dependency in stage.dependencies) \
+                            and all(statuses[other] not in ('pending', 'running') for other in stage.waits_for) \
+                            and stage.lock not in held_locks:
+
+                        print(f'Starting stage {name}')
+                        statuses[name] = 'running'
+
+                        if stage.lock is not None:
+                            held_locks.add(stage.lock)
+
+                        running_stages[executor.submit(self._run_stage, stage, stage_times, pipeline_start)] = stage
+
+                if not running_stages:
+                    break
+
+                finished, _ = futures.wait(running_stages, return_when=futures.FIRST_COMPLETED)
+
+                for future in finished:
+                    stage = running_stages.pop(future)
+                    held_locks.discard(stage.lock)
+
+                    try:
+                        future.result()
+                        statuses[stage.name] = 'succeeded'
+                        print(f'Finished stage {stage.name}')
+
+                    except Exception:  # pylint: disable=broad-except
+                        # Report the failure and carry on with the stages which do not depend on it
+                        statuses[stage.name] = 'failed'
+                        print(f'Stage {stage.name} failed:\n{traceback.format_exc()}')
+
+        timings = pd.DataFrame(
+            data=[{'stage': name, 'status': statuses[name], **stage_times.get(name, {})} for name in self._stages],
+            columns=['stage', 'status', 'start_seconds', 'end_seconds']
+        )
+        timings['duration_seconds'] = timings['end_seconds'] - timings['start_seconds']
+
+        return timings
+
+    def get_critical_path(self, timings: pd.DataFrame) -> pd.DataFrame:
+        """
+        Trace the chain of stages which determined how long the pipeline took, working back from the stage which
+        finished last through whichever of its dependencies (or the stages it waits for) finished last.
+
+        Parameters
+        ----------
+        timings : pandas DataFrame
+            Timings of a run of the pipeline (see `run`).
+
+        Returns
+        -------
+        pandas DataFrame
+            One row per stage on the critical path in the order they ran, with the seconds between the previous stage
+            on the path finishing and this one starting (`waiting_seconds`, e.g. waiting for a lock or a free worker),
+            the `duration_seconds` of the stage, and the share of the pipeline's total time spent in the stage
+            (`share_of_total`). The waiting and duration times add up to the total time of the pipeline.
+        """
+
+        stage_times = timings.dropna(subset=['end_seconds']).set_index('stage')
+
+        if stage_times.empty:
+            return pd.DataFrame(columns=['stage', 'waiting_seconds', 'duration_seconds', 'share_of_total'])
+
+        critical_path = [stage_times['end_seconds'].idxmax()]
+
+        while True:
+            dependencies = [
+                dependency for dependency in self._stages[critical_path[-1]].upstream
+                if dependency in stage_times.index
+            ]
+
+            if not dependencies:
+                break
+
+            critical_path.append(max(dependencies, key=lambda dependency: stage_times.loc[dependency, 'end_seconds']))
+
+        critical_path.reverse()
+
+        breakdown = stage_times.loc[critical_path, ['start_seconds', 'duration_seconds']].reset_index()
+        previous_end_seconds = stage_times.loc[critical_path, 'end_seconds'].shift(1, fill_value=0).values
+        total_seconds = stage_times['end_seconds'].max()
+
+        breakdown['waiting_seconds'] = breakdown['start_seconds'] - previous_end_seconds
+        breakdown['share_of_total'] = breakdown['duration_seconds'] / total_seconds if total_seconds else 0
+
+        return breakdown[['stage', 'waiting_seconds', 'duration_seconds', 'share_of_total']]
+
+    def report(self, timings: pd.DataFrame) -> None:
+        """
+        Display how long each stage took and the critical path of the run.
+
+        Parameters
+        ----------
+        timings : pandas DataFrame
+            Timings of a run of the pipeline (see `run`).
+        """
+
+        print(f"Pipeline finished in {timings['end_seconds'].max():.1f} seconds")
+        print(timings.round(2).to_string(index=False))
+
+        print('Critical path')
+        print(self.get_critical_path(timings).round(2).to_string(index=False))
+
+
+def _ingest_the_guardian(publication_start_timestamp: str) -> None:
+    """Download the metadata and content of opinion articles from The Guardian."""
+
+    article_downloader = the_guardian.ArticleDownloader()
+    article_downloader.record_opinion_articles_metadata(
+        publication_start_timestamp=publication_start_timestamp,
+        include_content=True
+    )
+    article_downloader.record_opinion_articles_content()
+
+
+def _ingest_columnists(downloader_module, discovery: str) -> None:
+    """Download the recent articles of every columnist with the publication's downloader module (e.g. daily_mail)."""
+
+    article_downloader = downloader_module.ArticleDownloader()
+    article_downloader.record_columnist_home_pages()
+
+    if discovery == 'feeds':
+        article_downloader.record_columnists_recent_article_links_from_feeds()
+    else:
+        article_downloader.record_columnists_recent_article_links()
+
+    article_downloader.record_columnists_recent_article_content()
+
+
+def _deduplicate(publication: str) -> None:
+    """Index the new articles of a publication and record any near-duplicates."""
+
+    deduplication.NearDuplicateDetector().index_new_articles(publications=[publication])
+
+
+def _preprocess(publication: str, preprocessing_pool: futures.ProcessPoolExecutor) -> None:
+    """
+    Preprocess the new articles of a publication in a process of the pool, as spaCy holds the GIL while it parses and
+    so would keep the other stages' threads waiting.
+    """
+
+    spans = preprocessing.preprocess_in_pool(pool=preprocessing_pool, schema=publication)['spans']
+
+    # The stage's own span already times the publication, so only the spans within it are added to this run
+    spans['spans'].pop(f'preprocess:{publication}', None)
+    tracing.get_tracer().merge_spans(spans)
+
+
+def _encode(use_existing_vocab: bool) -> None:
+    """Encode the preprocessed articles with tf-idf."""
+
+    encoding.TfidfEncoder(use_existing_vocab=use_existing_vocab).encode_articles()
+
+
+def _store_similar_articles(similarity_threshold: float) -> None:
+    """Find and store the pairs of encoded articles which are similar to one another."""
+
+    encoding.TfidfEncoder().store_most_similar_articles(similarity_threshold=similarity_threshold)
+
+
+def build_pipeline(
+        preprocessing_pool: futures.ProcessPoolExecutor,
+        publications: List[str] = None,
+        discovery: str = 'homepages',
+        guardian_start_timestamp: str = '2020-06-01T00:00:00Z',
+        use_existing_vocab: bool = False,
+        similarity_threshold: float = 0
+) -> List[Stage]:
+    """
+    Define the stages of the pipeline. Each publication is ingested, deduplicated and preprocessed independently of the
+    others, after which every article is encoded and compared to find similar articles. Encoding waits for every
+    publication to be preprocessed, but still runs if some of them fail, so one broken website does not hold up the
+    rest.
+
+    Parameters
+    ----------
+    preprocessing_pool : concurrent.futures.ProcessPoolExecutor
+        Pool of processes the publications are preprocessed in (see
+        `interlocutor.nlp.preprocessing.create_preprocessing_pool`), each loading the spaCy model once. The caller owns
+        the pool and shuts it down once the pipeline has run. Processes should be spawned rather than forked, as
+        forking while other stages' threads are running can deadlock them.
+    publications : list[str] (default None)
+        Schemas of the publications to include. Defaults to every publication in
+        `interlocutor.pipeline.publications`.
+    discovery : str (default 'homepages')
+        How the Daily Mail and i News find new articles: 'homepages' or 'feeds'.
+    guardian_start_timestamp : str (default '2020-06-01T00:00:00Z')
+        Earliest publication time of The Guardian's articles to download.
+    use_existing_vocab : bool (default False)
+        Whether to encode with the existing vocabulary rather than building it again from every article.
+    similarity_threshold : float in interval [0,1) (default 0)
+        Cosine similarity score which two articles must exceed to be classed as similar.
+
+    Returns
+    -------
+    list[Stage]
+        Every stage in the pipeline.
+    """
+
+    ingest_functions = {
+        'the_guardian': functools.partial(_ingest_the_guardian, publication_start_timestamp=guardian_start_timestamp),
+        'daily_mail': functools.partial(_ingest_columnists, downloader_module=daily_mail, discovery=discovery),
+        'i_news': functools.partial(_ingest_columnists, downloader_module=i_news, discovery=discovery)
+    }
+
+    publications = publications or publication_registry.get_schemas()
+
+    stages = []
+
+    for publication in publications:
+        stages.extend([
+            Stage(name=f'ingest:{publication}', run=ingest_functions[publication]),
+
+            # Every run compares new articles against the whole index, so they must not overlap
+            Stage(
+                name=f'deduplicate:{publication}',
+                run=functools.partial(_deduplicate, publication=publication),
+                dependencies=[f'ingest:{publication}'],
+                lock='near_duplicate_index'
+            ),
+
+            Stage(
+                name=f'preprocess:{publication}',
+                run=functools.partial(_preprocess, publication=publication, preprocessing_pool=preprocessing_pool),
+                dependencies=[f'deduplicate:{publication}']
+            )
+        ])
+
+    stages.append(Stage(
+        name='encode',
+        run=functools.partial(_encode, use_existing_vocab=use_existing_vocab),
+        waits_for=[stage.name for stage in stages if stage.name.startswith('preprocess:')]
+    ))
+
+    stages.append(Stage(
+        name='similarity',
+        run=functools.partial(_store_similar_articles, similarity_threshold=similarity_threshold),
+        dependencies=['encode']
+    ))
+
+    return stages
+
+
+def _parse_arguments() -> argparse.Namespace:
+    """Read the pipeline settings from the command line."""
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--publications',
+        nargs='+',
+        choices=publication_registry.get_schemas(),
+        help='Publications to include (defaults to all of them)'
+    )
+    parser.add_argument(
+        '--discovery',
+        choices=['homepages', 'feeds'],
+        default='homepages',
+        help="Find new columnist articles by crawling each columnist's homepage, or from the paper's RSS feeds."
+    )
+    parser.add_argument(
+        '--use-existing-vocabulary',
+        action='store_true',
+        help='Encode with the existing vocabulary rather than building it again'
+    )
+    parser.add_argument('--similarity-threshold', type=float, default=0)
+    parser.add_argument('--max-workers', type=int, default=4, help='Maximum number of stages running at once')
+    parser.add_argument(
+        '--metrics-port',
+        type=int,
+        help='Serve live metrics in the Prometheus text format on this port e.g. 9101 (not served by default)'
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':  # pragma: no cover (exclude from testing coverage report)
+
+    arguments = _parse_arguments()
+
+    tracing.start_run(run_name='orchestrator')
+
+    if arguments.metrics_port is not None:
+        monitoring.start_metrics_server(port=arguments.metrics_port)
+
+    publications_to_run = arguments.publications or publication_registry.get_schemas()
+
+    # Processes are spawned rather than forked, as forking while other stages' threads are running can deadlock them
+    with preprocessing.create_preprocessing_pool(
+            max_workers=len(publications_to_run),
+            mp_context=multiprocessing.get_context('spawn')
+    ) as pool:
+        orchestrator = PipelineOrchestrator(
+            stages=build_pipeline(
+                publications=publications_to_run,
+                discovery=arguments.discovery,
+                use_existing_vocab=arguments.use_existing_vocabulary,
+                similarity_threshold=arguments.similarity_threshold,
+                preprocessing_pool=pool
+            ),
+            max_workers=arguments.max_workers
+        )
+
+        pipeline_timings = orchestrator.run()
+
+    orchestrator.report(pipeline_timings)
+
+    if (pipeline_timings['status'] != 'succeeded').any():
+        raise SystemExit(1)
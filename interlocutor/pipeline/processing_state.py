@@ -0,0 +1,205 @@
+"""Track which stages of the pipeline each article has been through, so every stage can find its backlog cheaply."""
+
+# Standard libraries
+import datetime
+from typing import List, Tuple
+
+# Third party libraries
+import pandas as pd
+from psycopg2 import sql as psy_sql
+
+# Internal imports
+from interlocutor.commons import metrics
+from interlocutor.database import postgresql
+
+# Stage whose output each stage processes
+UPSTREAM_STAGES = {'deduplicated': 'ingested', 'preprocessed': 'deduplicated', 'encoded': 'preprocessed'}
+
+
+class ProcessingState:
+    """
+    Record of every article which has completed each stage of the pipeline (pipeline.processing_state), alongside how
+    far each stage has read the articles completed by the stage before it (pipeline.watermarks).
+
+    Rather than comparing every article against everything already processed (`WHERE id NOT IN (...)`), a stage reads
+    its backlog as an indexed range of the stage before it: the articles marked since its watermark. Watermarks are
+    transaction ids rather than timestamps or sequence numbers, and only advance to the oldest transaction still running
+    when the backlog was read, so articles marked by a transaction which commits late are picked up by the next run
+    rather than skipped.
+
+    Articles are marked as `ingested` by a trigger on each article_content table, and as `deduplicated`, `preprocessed`
+    and `encoded` by the stage itself once it has stored its output.
+    """
+
+    def __init__(self, db_connection: postgresql.DatabaseConnection):
+        """
+        Initialise attributes of class.
+
+        Parameters
+        ----------
+        db_connection : interlocutor.database.postgresql.DatabaseConnection
+            Connection to the database holding the processing state.
+        """
+
+        self._db_connection = db_connection
+
+    def get_backlog(self, stage: str, upstream_stage: str, publication: str) -> Tuple[psy_sql.Composable, str]:
+        """
+        Find the articles from a publication which have completed the stage before this one since it last advanced
+        its watermark.
+
+        Parameters
+        ----------
+        stage : str
+            Name of the stage looking for work e.g. 'preprocessed'.
+        upstream_stage : str
+            Name of the stage whose output it processes e.g. 'ingested'.
+        publication : str
+            Schema of the publication e.g. 'daily_mail'.
+
+        Returns
+        -------
+        psycopg2.sql.Composable
+            Subquery selecting the `article_id` of every article in the backlog, e.g. to be used in
+            `WHERE id IN ({backlog})`. It reads a range of the index on pipeline.processing_state.
+        str
+            Transaction horizon to pass to `advance_watermark` once the backlog has been processed.
+        """
+
+        watermark_range = self._db_connection.get_dataframe(
+            query="""
+                  SELECT COALESCE(
+                             (SELECT transaction_id FROM pipeline.watermarks
+                              WHERE stage = %(stage)s AND publication = %(publication)s),
+                             '0'::XID8
+                         )::TEXT AS watermark,
+                         pg_snapshot_xmin(pg_current_snapshot())::TEXT AS horizon;
+                  """,
+            query_params={'stage': stage, 'publication': publication}
+        ).iloc[0]
+
+        backlog = psy_sql.SQL("""
+            SELECT article_id FROM pipeline.processing_state
+            WHERE stage = {upstream_stage}
+              AND publication = {publication}
+              AND transaction_id >= {watermark}::XID8
+              AND transaction_id < {horizon}::XID8
+            """).format(
+            upstream_stage=psy_sql.Literal(upstream_stage),
+            publication=psy_sql.Literal(publication),
+            watermark=psy_sql.Literal(watermark_range['watermark']),
+            horizon=psy_sql.Literal(watermark_range['horizon'])
+        )
+
+        return backlog, watermark_range['horizon']
+
+    def get_backlog_sizes(self) -> pd.DataFrame:
+        """
+        Count the articles in the backlog of every stage in `UPSTREAM_STAGES`, for every publication, in one query.
+        Unlike `get_backlog`, articles marked by transactions which are still running are counted too.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The 'stage', 'publication' and size of the 'backlog' of each stage with a non-empty backlog.
+        """
+
+        return self._db_connection.get_dataframe(
+            query="""
+                  SELECT stages.stage, upstream.publication, COUNT(*) AS backlog
+                  FROM UNNEST(%(stages)s::TEXT[], %(upstream_stages)s::TEXT[]) AS stages (stage, upstream_stage)
+                  JOIN pipeline.processing_state upstream ON upstream.stage = stages.upstream_stage
+                  LEFT JOIN pipeline.watermarks watermarks
+                      ON watermarks.stage = stages.stage AND watermarks.publication = upstream.publication
+                  WHERE upstream.transaction_id >= COALESCE(watermarks.transaction_id, '0'::XID8)
+                  GROUP BY stages.stage, upstream.publication;
+                  """,
+            query_params={'stages': list(UPSTREAM_STAGES), 'upstream_stages': list(UPSTREAM_STAGES.values())}
+        )
+
+    def mark_processed(self, stage: str, publication: str, article_ids: List[str], version: str = None) -> None:
+        """
+        Record that articles have completed a stage, in bulk. Articles which had already completed it are marked
+        again, so they reappear in the backlog of the stages after it (e.g. after their preprocessed content changes).
+
+        Parameters
+        ----------
+        stage : str
+            Name of the stage e.g. 'preprocessed'.
+        publication : str
+            Schema of the publication the articles belong to e.g. 'daily_mail'.
+        article_ids : list[str]
+            Unique identifier of each article.
+        version : str (default None)
+            Version of the stage which processed the articles e.g. the fingerprint of the preprocessing pipeline.
+        """
+
+        if not article_ids:
+            return
+
+        self._db_connection.execute_database_operation(
+            sql_command="""
+                        INSERT INTO pipeline.processing_state
+                            (stage, article_id, publication, version, processed_timestamp)
+                        SELECT %(stage)s, UNNEST(%(article_ids)s), %(publication)s, %(version)s, %(processed_timestamp)s
+                        ON CONFLICT (stage, article_id) DO UPDATE
+                            SET version = EXCLUDED.version,
+                                processed_timestamp = EXCLUDED.processed_timestamp,
+                                transaction_id = pg_current_xact_id();
+                        """,
+            params={
+                'stage': stage,
+                'publication': publication,
+                'article_ids': list(article_ids),
+                'version': version,
+                'processed_timestamp': datetime.datetime.now()
+            }
+        )
+
+        metrics.ARTICLES_PROCESSED.inc(len(article_ids), publication=publication, stage=stage)
+
+    def advance_watermark(self, stage: str, publication: str, horizon: str) -> None:
+        """
+        Record that a stage has processed its backlog from a publication, so the next backlog starts after it.
+
+        Parameters
+        ----------
+        stage : str
+            Name of the stage e.g. 'preprocessed'.
+        publication : str
+            Schema of the publication e.g. 'daily_mail'.
+        horizon : str
+            Transaction horizon returned by `get_backlog` alongside the backlog which has been processed.
+        """
+
+        self._db_connection.execute_database_operation(
+            sql_command="""
+                        INSERT INTO pipeline.watermarks (stage, publication, transaction_id, updated_timestamp)
+                        VALUES (%(stage)s, %(publication)s, %(horizon)s::XID8, %(updated_timestamp)s)
+                        ON CONFLICT (stage, publication) DO UPDATE
+                            SET transaction_id = EXCLUDED.transaction_id,
+                                updated_timestamp = EXCLUDED.updated_timestamp;
+                        """,
+            params={
+                'stage': stage,
+                'publication': publication,
+                'horizon': horizon,
+                'updated_timestamp': datetime.datetime.now()
+            }
+        )
+
+    def rewind(self, stage: str) -> None:
+        """
+        Move the watermarks of a stage back to the start, so every article completed by the stage before it is in its
+        backlog again (e.g. after the stage's output has been deleted).
+
+        Parameters
+        ----------
+        stage : str
+            Name of the stage e.g. 'preprocessed'.
+        """
+
+        self._db_connection.execute_database_operation(
+            sql_command="DELETE FROM pipeline.watermarks WHERE stage = %(stage)s;",
+            params={'stage': stage}
+        )
@@ -0,0 +1,45 @@
+"""Registry of the publications whose articles flow through the pipeline."""
+
+# Standard libraries
+from typing import List
+
+
+class Publication:
+    """Publication whose articles are ingested, deduplicated, preprocessed, and encoded."""
+
+    def __init__(self, schema: str, name: str):
+        """
+        Initialise attributes of class.
+
+        Parameters
+        ----------
+        schema : str
+            Database schema holding the publication's tables e.g. 'daily_mail'. Every publication stores its raw
+            content in `article_content` and its bag of words preprocessed content in
+            `article_content_bow_preprocessed`.
+        name : str
+            Name of the publication as displayed to readers e.g. 'Daily Mail'.
+        """
+
+        self.schema = schema
+        self.name = name
+
+
+PUBLICATIONS = [
+    Publication(schema='the_guardian', name='The Guardian'),
+    Publication(schema='daily_mail', name='Daily Mail'),
+    Publication(schema='i_news', name='i News')
+]
+
+
+def get_schemas() -> List[str]:
+    """
+    List the schema of every publication in the registry.
+
+    Returns
+    -------
+    list[str]
+        Schema of each publication e.g. ['the_guardian', 'daily_mail', 'i_news'].
+    """
+
+    return [publication.schema for publication in PUBLICATIONS]
@@ -0,0 +1,209 @@
+"""Testing the orchestrator which runs the stages of the pipeline as a DAG."""
+
+# Standard libraries
+import threading
+import time
+
+# Third party libraries
+import pytest
+
+# Internal imports
+from interlocutor.nlp import preprocessing
+from interlocutor.pipeline import orchestrator
+
+
+def _sleep_stage(name, seconds, dependencies=None, lock=None, events=None):
+    """Stage which sleeps, recording when it starts and finishes in `events`."""
+
+    def run():
+        events.append(('start', name))
+        time.sleep(seconds)
+        events.append(('end', name))
+
+    return orchestrator.Stage(name=name, run=run, dependencies=dependencies, lock=lock)
+
+
+def test_run_starts_stages_as_soon_as_dependencies_succeed():
+    """Independent stages run concurrently, and each stage starts once its own dependencies have finished."""
+
+    events = []
+
+    stages = [
+        _sleep_stage('ingest:fast', 0.1, events=events),
+        _sleep_stage('ingest:slow', 0.4, events=events),
+        _sleep_stage('preprocess:fast', 0.1, dependencies=['ingest:fast'], events=events),
+        _sleep_stage('encode', 0.1, dependencies=['preprocess:fast', 'ingest:slow'], events=events)
+    ]
+
+    timings = orchestrator.PipelineOrchestrator(stages=stages).run().set_index('stage')
+
+    assert (timings['status'] == 'succeeded').all()
+
+    # Preprocessing the fast publication does not wait for the slow one to be ingested
+    assert events.index(('start', 'preprocess:fast')) < events.index(('end', 'ingest:slow'))
+    assert events.index(('start', 'encode')) > events.index(('end', 'ingest:slow'))
+
+    # The whole pipeline takes as long as its longest chain (ingest:slow -> encode), not the sum of the stages
+    assert timings['end_seconds'].max() < 0.65
+
+
+def test_run_never_overlaps_stages_sharing_a_lock():
+    """Stages with the same lock run one after another even though they do not depend on each other."""
+
+    events = []
+    running = []
+    overlaps = []
+
+    def run():
+        running.append(threading.get_ident())
+        overlaps.append(len(running) > 1)
+        time.sleep(0.1)
+        running.pop()
+
+    stages = [orchestrator.Stage(name=f'deduplicate:{number}', run=run, lock='index') for number in range(3)]
+    stages.append(_sleep_stage('ingest', 0.1, events=events))
+
+    timings = orchestrator.PipelineOrchestrator(stages=stages).run()
+
+    assert (timings['status'] == 'succeeded').all()
+    assert overlaps == [False, False, False]
+
+
+def test_run_skips_stages_downstream_of_a_failure():
+    """A failed stage causes every stage depending on it to be skipped, while the other stages still run."""
+
+    def fail():
+        raise RuntimeError('Website unavailable')
+
+    events = []
+
+    stages = [
+        orchestrator.Stage(name='ingest:broken', run=fail),
+        _sleep_stage('preprocess:broken', 0, dependencies=['ingest:broken'], events=events),
+        _sleep_stage('encode', 0, dependencies=['preprocess:broken'], events=events),
+        _sleep_stage('ingest:working', 0, events=events)
+    ]
+
+    timings = orchestrator.PipelineOrchestrator(stages=stages).run().set_index('stage')
+
+    assert timings['status'].to_dict() == {
+        'ingest:broken': 'failed',
+        'preprocess:broken': 'skipped',
+        'encode': 'skipped',
+        'ingest:working': 'succeeded'
+    }
+    assert events == [('start', 'ingest:working'), ('end', 'ingest:working')]
+
+
+def test_run_waits_for_stages_whether_or_not_they_succeed():
+    """A stage waiting for others starts once they have all finished, even if some of them failed or were skipped."""
+
+    def fail():
+        raise RuntimeError('Website unavailable')
+
+    events = []
+
+    stages = [
+        orchestrator.Stage(name='ingest:broken', run=fail),
+        _sleep_stage('preprocess:broken', 0, dependencies=['ingest:broken'], events=events),
+        _sleep_stage('preprocess:working', 0.2, events=events),
+        orchestrator.Stage(
+            name='encode',
+            run=lambda: events.append(('start', 'encode')),
+            waits_for=['preprocess:broken', 'preprocess:working']
+        )
+    ]
+
+    pipeline = orchestrator.PipelineOrchestrator(stages=stages)
+    timings = pipeline.run()
+
+    assert timings.set_index('stage')['status'].to_dict() == {
+        'ingest:broken': 'failed',
+        'preprocess:broken': 'skipped',
+        'preprocess:working': 'succeeded',
+        'encode': 'succeeded'
+    }
+    assert events == [('start', 'preprocess:working'), ('end', 'preprocess:working'), ('start', 'encode')]
+    assert pipeline.get_critical_path(timings)['stage'].tolist() == ['preprocess:working', 'encode']
+
+
+@pytest.mark.parametrize('stages, error_message', [
+    (
+        [orchestrator.Stage(name='a', run=print), orchestrator.Stage(name='a', run=print)],
+        'unique name'
+    ),
+    (
+        [orchestrator.Stage(name='a', run=print, dependencies=['missing'])],
+        'unknown stages'
+    ),
+    (
+        [orchestrator.Stage(name='a', run=print, waits_for=['missing'])],
+        'unknown stages'
+    ),
+    (
+        [
+            orchestrator.Stage(name='a', run=print, dependencies=['b']),
+            orchestrator.Stage(name='b', run=print, dependencies=['a']),
+            orchestrator.Stage(name='c', run=print)
+        ],
+        'cycle'
+    )
+])
+def test_invalid_stages_raise_exception(stages, error_message):
+    """Stages which cannot be run as a DAG are rejected."""
+
+    with pytest.raises(ValueError, match=error_message):
+        orchestrator.PipelineOrchestrator(stages=stages)
+
+
+def test_get_critical_path():
+    """The critical path follows the dependency which finished last back from the stage which finished last."""
+
+    events = []
+
+    stages = [
+        _sleep_stage('ingest:fast', 0.05, events=events),
+        _sleep_stage('ingest:slow', 0.3, events=events),
+        _sleep_stage('preprocess:fast', 0.05, dependencies=['ingest:fast'], events=events),
+        _sleep_stage('preprocess:slow', 0.05, dependencies=['ingest:slow'], events=events),
+        _sleep_stage('encode', 0.1, dependencies=['preprocess:fast', 'preprocess:slow'], events=events)
+    ]
+
+    pipeline = orchestrator.PipelineOrchestrator(stages=stages)
+    timings = pipeline.run()
+
+    critical_path = pipeline.get_critical_path(timings)
+
+    assert critical_path['stage'].tolist() == ['ingest:slow', 'preprocess:slow', 'encode']
+    assert critical_path['waiting_seconds'].sum() + critical_path['duration_seconds'].sum() == pytest.approx(
+        timings['end_seconds'].max()
+    )
+
+
+def test_build_pipeline():
+    """Each publication is ingested, deduplicated and preprocessed before every article is encoded and compared."""
+
+    with preprocessing.create_preprocessing_pool(max_workers=1) as pool:
+        stages = {
+            stage.name: stage
+            for stage in orchestrator.build_pipeline(preprocessing_pool=pool, publications=['daily_mail', 'i_news'])
+        }
+
+    assert list(stages) == [
+        'ingest:daily_mail', 'deduplicate:daily_mail', 'preprocess:daily_mail',
+        'ingest:i_news', 'deduplicate:i_news', 'preprocess:i_news',
+        'encode', 'similarity'
+    ]
+    assert stages['preprocess:i_news'].dependencies == ['deduplicate:i_news']
+    # Encoding goes ahead with whichever publications were preprocessed, even if others failed
+    assert stages['encode'].dependencies == []
+    assert stages['encode'].waits_for == ['preprocess:daily_mail', 'preprocess:i_news']
+    assert stages['deduplicate:daily_mail'].lock == stages['deduplicate:i_news'].lock is not None
+
+    # Publications are preprocessed in a shared pool of processes rather than the orchestrator's threads
+    assert stages['preprocess:daily_mail'].run.keywords['preprocessing_pool'] \
+        is stages['preprocess:i_news'].run.keywords['preprocessing_pool'] \
+        is pool
+
+    # The definition is a valid DAG
+    orchestrator.PipelineOrchestrator(stages=list(stages.values()))
@@ -0,0 +1,68 @@
+"""Testing the record of which stages of the pipeline each article has been through."""
+
+# Third party libraries
+import pytest
+
+# Internal imports
+from interlocutor.database import postgresql
+from interlocutor.pipeline import processing_state
+
+
+def _get_backlog_ids(state, db_connection):
+    """Ids of the articles in the backlog of the mock downstream stage, along with the horizon returned."""
+
+    backlog, horizon = state.get_backlog(stage='downstream', upstream_stage='upstream', publication='testing_schema')
+
+    article_ids = db_connection.get_dataframe(query=backlog)['article_id'].str.strip()
+
+    return sorted(article_ids), horizon
+
+
+@pytest.mark.integration
+def test_backlog_follows_watermark():
+    """
+    A stage's backlog holds the articles marked by the stage before it since its watermark was last advanced, including
+    articles marked again.
+    """
+
+    db_connection = postgresql.DatabaseConnection()
+    state = processing_state.ProcessingState(db_connection=db_connection)
+
+    state.mark_processed(stage='upstream', publication='testing_schema', article_ids=['article_1', 'article_2'])
+
+    first_backlog, horizon = _get_backlog_ids(state, db_connection)
+    state.advance_watermark(stage='downstream', publication='testing_schema', horizon=horizon)
+
+    processed_backlog, _ = _get_backlog_ids(state, db_connection)
+
+    state.mark_processed(
+        stage='upstream',
+        publication='testing_schema',
+        article_ids=['article_1', 'article_3'],
+        version='version_2'
+    )
+
+    second_backlog, _ = _get_backlog_ids(state, db_connection)
+
+    state.rewind(stage='downstream')
+
+    rewound_backlog, _ = _get_backlog_ids(state, db_connection)
+
+    versions = db_connection.get_dataframe(
+        query="""
+              SELECT article_id, version FROM pipeline.processing_state
+              WHERE publication = 'testing_schema'
+              ORDER BY article_id;
+              """
+    )
+
+    # Tidy up
+    db_connection.execute_database_operation(
+        "DELETE FROM pipeline.processing_state WHERE publication = 'testing_schema';"
+    )
+
+    assert first_backlog == ['article_1', 'article_2']
+    assert processed_backlog == []
+    assert second_backlog == ['article_1', 'article_3']
+    assert rewound_backlog == ['article_1', 'article_2', 'article_3']
+    assert versions['version'].tolist() == ['version_2', None, 'version_2']
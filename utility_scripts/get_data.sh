@@ -1,2 +1,3 @@
 docker exec -it recommender_prd python /usr/src/app/interlocutor/get_data/the_guardian.py
 docker exec -it recommender_prd python /usr/src/app/interlocutor/get_data/daily_mail.py
+docker exec -it recommender_prd python /usr/src/app/interlocutor/nlp/deduplication.py
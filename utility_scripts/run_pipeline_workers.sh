@@ -0,0 +1,2 @@
+docker exec -d recommender_prd python /usr/src/app/interlocutor/nlp/workers.py preprocessing --metrics-port 9101
+docker exec -d recommender_prd python /usr/src/app/interlocutor/nlp/workers.py encoding --metrics-port 9102